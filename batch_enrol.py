@@ -1,138 +1,402 @@
-import os, glob, json, sys, uuid, argparse
+# batch_enrol.py
+# ------------------------------------------------------------
+# Bulk enrolment from a folder of student photos:
+#   <root>/<student name>/*.jpg|jpeg|png|bmp
+#
+#   python batch_enrol.py --root vision/data/dataset --workers 8 [--db]
+#
+# Pipeline:
+#   hash      sha1 of every file (thread pool); files whose hash is already
+#             in the manifest (same embedder + prep) are not touched again
+#   prepare   worker processes: imread, largest Haar face on a 320 px copy
+#             (enrol photos have big faces; falls back to vision.faces, the
+#             /api/identify detector), 112x112 crop (aligned with
+#             FACE_ALIGN=1, vision/align.py) -> small pickles back
+#   embed     main process: ArcFace on batches of --batch crops while the
+#             workers keep decoding
+#   manifest  <out dir>/batch_enrol_manifest.jsonl, one line per file
+#             {sha1, path, student, status, emb}, fsync'ed after every
+#             batch: a crash loses at most one batch, a re-run resumes
+#   gallery   per student: mean embedding of the files currently in its
+#             folder; gallery.json is written once, atomically
+#   --db      the same students upserted into Postgres students(id, name,
+#             embedding) in one transaction (DB_URI); rows are matched by
+#             name so the gallery ids are the server's student ids
+# ------------------------------------------------------------
+
+from __future__ import annotations
+import os
+import sys
+import json
+import time
+import uuid
+import base64
+import hashlib
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
 import numpy as np
 import cv2
 
-# ---------- Embedder selection (uses your repo first) ----------
-def _import_embedder():
-    try:
-        from vision.auto_enrol import face_embedding_bgr
-        print("[batch] Using vision.auto_enrol.face_embedding_bgr")
-        return face_embedding_bgr
-    except Exception:
-        pass
-    try:
-        from vision.auto_enrol import EmbedFactory
-        ef = EmbedFactory()
-        def _factory(img_bgr): return ef.embed_bgr(img_bgr)
-        print("[batch] Using vision.auto_enrol.EmbedFactory")
-        return _factory
-    except Exception:
-        pass
-    try:
-        import face_recognition
-        def _fr_backend(img_bgr):
-            rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-            boxes = face_recognition.face_locations(rgb, model="hog")
-            if not boxes: return None
-            encs = face_recognition.face_encodings(rgb, boxes)
-            return encs[0] if encs else None
-        print("[batch] Using face_recognition fallback")
-        return _fr_backend
-    except Exception:
-        print("[batch] ERROR: no embedding backend available.", file=sys.stderr)
-        sys.exit(1)
+from vision.faces import get_cascade, find_largest_face_bbox
+from vision.align import align_face, ENABLED as ALIGN_ENABLED
 
-EMBED = _import_embedder()
+try:
+    import psycopg2
+    import psycopg2.extras
+except Exception:
+    psycopg2 = None
 
-def _l2(v): 
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+EMBED_BATCH = 32
+CROP_SIZE = 112                  # ArcFace input size; the worker resizes so results pickle small
+MIN_FACE = 40                    # same floor as /api/identify
+DETECT_SIDE = 320                # fast pass: long side of the detection copy ...
+DETECT_MIN = 48                  # ... and min face there (~15% of the photo)
+# bump when prepare() changes: cached embeddings are recomputed
+PREP_VERSION = "haar320-align-1" if ALIGN_ENABLED else "haar320-crop-1"
+MANIFEST_NAME = "batch_enrol_manifest.jsonl"
+PROGRESS_EVERY_S = 5.0
+
+
+def _l2(v):
     n = np.linalg.norm(v) + 1e-9
     return v / n
 
-def _embed(img):
-    try:
-        emb = EMBED(img)
-        if emb is None: return None
-        return _l2(np.array(emb, dtype=np.float32))
-    except Exception:
-        return None
 
-def _avg(embs):
-    return _l2(np.mean(np.stack(embs), axis=0)) if len(embs) > 1 else embs[0]
+# -------------------- scan + hash --------------------
+def scan(root: Path) -> List[Tuple[str, Path]]:
+    """(student name, image path) for every image under root/<student>/."""
+    out = []
+    for student in sorted(os.listdir(root)):
+        folder = root / student
+        if not folder.is_dir():
+            continue
+        for p in sorted(folder.iterdir()):
+            if p.suffix.lower() in IMAGE_EXTS and p.is_file():
+                out.append((student, p))
+    return out
+
+
+def file_sha1(path: Path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# -------------------- prepare (worker processes) --------------------
+def _init_worker():
+    cv2.setNumThreads(1)   # parallelism comes from the pool
+
+
+def _largest_face(img) -> Optional[Tuple[int, int, int, int]]:
+    """Haar on a DETECT_SIDE copy (~10x faster than find_largest_face_bbox), else the full search."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    h, w = gray.shape[:2]
+    s = DETECT_SIDE / max(h, w)
+    small = cv2.resize(gray, (max(1, int(w * s)), max(1, int(h * s))),
+                       interpolation=cv2.INTER_AREA if s < 1 else cv2.INTER_LINEAR)
+    faces = get_cascade().detectMultiScale(cv2.equalizeHist(small), scaleFactor=1.1, minNeighbors=4,
+                                        minSize=(DETECT_MIN, DETECT_MIN))
+    if not len(faces):
+        return find_largest_face_bbox(img)
+    x, y, fw, fh = max(faces, key=lambda b: b[2] * b[3])
+    return int(x / s), int(y / s), int((x + fw) / s), int((y + fh) / s)
+
+
+def prepare(job):
+    """(sha1, path, student) -> (sha1, path, student, status, crop or None)."""
+    sha1, path, student = job
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        return sha1, path, student, "unreadable", None
+    bbox = _largest_face(img)
+    if bbox is None:
+        return sha1, path, student, "no_face", None
+    h, w = img.shape[:2]
+    x1, y1, x2, y2 = max(0, bbox[0]), max(0, bbox[1]), min(w, bbox[2]), min(h, bbox[3])
+    if x2 - x1 < MIN_FACE or y2 - y1 < MIN_FACE:
+        return sha1, path, student, "small_face", None
+    crop = cv2.resize(img[y1:y2, x1:x2], (CROP_SIZE, CROP_SIZE))
+    return sha1, path, student, "ok", align_face(img, (x1, y1, x2, y2), fallback=crop)
+
+
+# -------------------- manifest --------------------
+class Manifest:
+    """Append-only JSONL checkpoint keyed by file sha1; line 1 is the embedder header."""
+
+    def __init__(self, path: Path, embedder: str, dim: int):
+        self.path = path
+        self.header = {"manifest": 1, "embedder": embedder, "dim": int(dim), "prep": PREP_VERSION}
+        self.entries: Dict[str, dict] = {}
+        fresh = True
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            try:
+                header = json.loads(lines[0]) if lines else None
+            except ValueError:
+                header = None
+            if header == self.header:
+                fresh = False
+                for line in lines[1:]:
+                    try:
+                        e = json.loads(line)
+                    except ValueError:
+                        continue   # torn last line from a crash
+                    self.entries[e["sha1"]] = e
+            else:
+                stale = path.with_name(path.name + ".stale")
+                os.replace(path, stale)
+                print(f"[batch] manifest was made with {header}, moved to {stale.name}; re-embedding all")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = open(path, "a", encoding="utf-8")
+        if fresh:
+            self._write(self.header)
 
+    def _write(self, obj: dict) -> None:
+        self._f.write(json.dumps(obj, separators=(",", ":")) + "\n")
+
+    def add(self, sha1: str, path: str, student: str, status: str, emb: Optional[np.ndarray] = None) -> None:
+        e = {"sha1": sha1, "path": path, "student": student, "status": status}
+        if emb is not None:
+            e["emb"] = base64.b64encode(np.asarray(emb, np.float32).tobytes()).decode("ascii")
+        self.entries[sha1] = e
+        self._write(e)
+
+    def embedding(self, sha1: str) -> Optional[np.ndarray]:
+        e = self.entries.get(sha1)
+        if not e or e.get("status") != "ok" or "emb" not in e:
+            return None
+        return np.frombuffer(base64.b64decode(e["emb"]), np.float32)
+
+    def checkpoint(self) -> None:
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def compact(self, keep) -> None:
+        """Rewrite with one line per live file (drops removed files and superseded lines)."""
+        self._f.close()
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps(self.header, separators=(",", ":")) + "\n")
+            for sha1 in keep:
+                if sha1 in self.entries:
+                    f.write(json.dumps(self.entries[sha1], separators=(",", ":")) + "\n")
+        os.replace(tmp, self.path)
+
+
+# -------------------- gallery --------------------
 def _load_gallery(path):
     if not os.path.exists(path): return {"students": []}
     with open(path, "r", encoding="utf-8") as f:
         try: return json.load(f)
-        except: return {"students": []}
+        except ValueError: return {"students": []}
+
 
 def _save_gallery(path, data):
+    """tmp file + os.replace: a reader (run_loop, GalleryIndex import) never sees half a file."""
     os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
 
-def _upsert(gal, name, emb):
+def _upsert(gal, name, emb, sid=None):
     entry = next((s for s in gal["students"] if s.get("name") == name), None)
     if entry is None:
-        gal["students"].append({
-            "name": name,
-            "emb": emb.tolist(),
-            "id": str(uuid.uuid4())
-        })
-        print(f"[batch] Added {name}")
-    else:
-        entry["emb"] = emb.tolist()
-        print(f"[batch] Updated {name}")
+        gal["students"].append({"name": name, "emb": emb.tolist(), "id": sid or str(uuid.uuid4())})
+        return "added"
+    entry["emb"] = emb.tolist()
+    if sid and entry.get("id") != sid:
+        entry["id"] = sid
+    return "updated"
+
+
+# -------------------- Postgres --------------------
+def db_upsert(students: Dict[str, np.ndarray]) -> Dict[str, str]:
+    """
+    Upsert name -> embedding into students in one transaction; returns name -> id.
+    Existing rows are matched by name, new ones get the next Sxxx ids (table locked
+    against the server minting ids at the same time); a stored name is only
+    filled in when empty, as in server/services/enrol_bulk.py.
+    """
+    if psycopg2 is None:
+        raise RuntimeError("psycopg2 not installed")
+    uri = (os.getenv("DB_URI") or "").strip()
+    if not uri:
+        raise RuntimeError("DB_URI is not set")
+    conn = psycopg2.connect(uri, connect_timeout=10)
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("LOCK TABLE students IN SHARE ROW EXCLUSIVE MODE")
+                cur.execute("SELECT id, name FROM students WHERE name = ANY(%s) ORDER BY last_seen_ts NULLS FIRST",
+                            (list(students),))
+                ids = {name: sid for sid, name in cur.fetchall()}   # most recently seen row wins
+                cur.execute("SELECT id FROM students WHERE id LIKE 'S%%' "
+                            "ORDER BY CAST(SUBSTRING(id from 2) AS INTEGER) DESC LIMIT 1")
+                row = cur.fetchone()
+                next_num = int(row[0][1:]) + 1 if row else 1
+                for name in students:
+                    if name not in ids:
+                        ids[name] = f"S{next_num:03d}"
+                        next_num += 1
+                rows = [(ids[name], name, json.dumps(emb.tolist())) for name, emb in students.items()]
+                psycopg2.extras.execute_values(
+                    cur,
+                    "INSERT INTO students (id, name, embedding) VALUES %s "
+                    "ON CONFLICT (id) DO UPDATE SET "
+                    "name = CASE WHEN students.name IS NULL OR TRIM(students.name) = '' "
+                    "THEN EXCLUDED.name ELSE students.name END, "
+                    "embedding = EXCLUDED.embedding",
+                    rows, page_size=500,
+                )
+    finally:
+        conn.close()
+    return ids
+
 
+# -------------------- main --------------------
 def main():
-    parser = argparse.ArgumentParser(description="Batch enrol faces into gallery.json")
-    # Defaults wired for Option A
+    parser = argparse.ArgumentParser(description="Batch enrol faces into gallery.json (and Postgres)")
     parser.add_argument("--root", default="vision/data/dataset",
                         help="Root folder containing subfolders per student (default: vision/data/dataset)")
     parser.add_argument("--out", default="vision/data/gallery.json",
                         help="Gallery output JSON (default: vision/data/gallery.json)")
     parser.add_argument("--update-only", action="store_true",
                         help="Only update existing students; skip adding new names")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="decode/face-detect processes (default: cores - 1)")
+    parser.add_argument("--batch", type=int, default=EMBED_BATCH, help="crops per ArcFace call")
+    parser.add_argument("--manifest", default=None,
+                        help=f"checkpoint file (default: {MANIFEST_NAME} next to --out)")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="re-process files recorded as unreadable / no face")
+    parser.add_argument("--db", action="store_true", help="also upsert into the Postgres students table (DB_URI)")
+    parser.add_argument("--allow-cheap", action="store_true",
+                        help="enrol with the CHEAP fallback embedder if ArcFace cannot load")
     args = parser.parse_args()
 
-    root = args.root
+    root = Path(args.root)
     out_path = args.out
-
-    if not os.path.isdir(root):
+    if not root.is_dir():
         print(f"[batch] ERROR: dataset root not found: {root}", file=sys.stderr)
         sys.exit(1)
 
+    t_start = time.perf_counter()
+    files = scan(root)
     gal = _load_gallery(out_path)
+    if args.update_only:
+        existing = {s.get("name") for s in gal["students"]}
+        skipped = sorted({st for st, _ in files if st not in existing})
+        for st in skipped:
+            print(f"[batch] Skipping new student (update-only): {st}")
+        files = [(st, p) for st, p in files if st in existing]
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        hashes = list(ex.map(file_sha1, [p for _, p in files]))
+    print(f"[batch] {len(files)} images in {len({st for st, _ in files})} folders, "
+          f"hashed in {time.perf_counter() - t_start:.1f}s")
 
-    # loop each student folder (subdir name becomes student 'name')
-    for student_name in sorted(os.listdir(root)):
-        folder = os.path.join(root, student_name)
-        if not os.path.isdir(folder): 
-            continue
+    from vision.auto_enrol import EmbedFactory
+    factory = EmbedFactory()
+    impl = factory.get_impl()
+    if impl.name == "CHEAP" and not args.allow_cheap:
+        print("[batch] ERROR: ArcFace model not available (CHEAP fallback); pass --allow-cheap to enrol anyway",
+              file=sys.stderr)
+        sys.exit(1)
+    print(f"[batch] Using {impl.name} emb_dim={impl.emb_dim}")
 
-        if args.update_only:
-            exists = any(s.get("name") == student_name for s in gal["students"])
-            if not exists:
-                print(f"[batch] Skipping new student (update-only): {student_name}")
-                continue
-
-        # collect images
-        patterns = ["*.jpg", "*.jpeg", "*.png", "*.bmp"]
-        paths = []
-        for pat in patterns:
-            paths += glob.glob(os.path.join(folder, pat))
-        if not paths:
-            print(f"[batch] WARN: No images for {student_name}, skipping.")
+    manifest_path = Path(args.manifest) if args.manifest else Path(out_path).resolve().parent / MANIFEST_NAME
+    manifest = Manifest(manifest_path, impl.name, impl.emb_dim)
+
+    todo, queued = [], set()
+    for (student, p), sha1 in zip(files, hashes):
+        e = manifest.entries.get(sha1)
+        if sha1 in queued or (e and (e["status"] == "ok" or not args.retry_failed)):
             continue
+        queued.add(sha1)
+        todo.append((sha1, str(p), student))
+    print(f"[batch] {len(files) - len(todo)} unchanged (manifest), {len(todo)} to process")
+
+    counts: Dict[str, int] = {}
+    done = 0
+    t_embed = time.perf_counter()
+    next_progress = t_embed + PROGRESS_EVERY_S
+
+    def flush(batch):
+        results = factory.embed_batch([crop for *_, crop in batch])
+        for (sha1, path, student, _, _), res in zip(batch, results):
+            status = "ok" if res.ok else "embed_failed"
+            manifest.add(sha1, path, student, status, res.emb if res.ok else None)
+            counts[status] = counts.get(status, 0) + 1
+        manifest.checkpoint()
+        batch.clear()
 
-        embs = []
-        for p in paths:
-            img = cv2.imread(p, cv2.IMREAD_COLOR)
-            if img is None:
-                print(f"[batch] WARN: unreadable image: {p}")
-                continue
-            emb = _embed(img)
-            if emb is not None:
-                embs.append(emb)
+    if todo:
+        # spawn: workers must not inherit the ONNX session (and it is the only start method on Windows)
+        ctx = mp.get_context("spawn")
+        with ctx.Pool(max(1, args.workers), initializer=_init_worker) as pool:
+            batch = []
+            for sha1, path, student, status, crop in pool.imap_unordered(prepare, todo, chunksize=8):
+                done += 1
+                if status != "ok":
+                    manifest.add(sha1, path, student, status)
+                    counts[status] = counts.get(status, 0) + 1
+                    print(f"[batch] WARN: {status}: {path}")
+                else:
+                    batch.append((sha1, path, student, status, crop))
+                    if len(batch) >= args.batch:
+                        flush(batch)
+                if time.perf_counter() >= next_progress:
+                    rate = done / (time.perf_counter() - t_embed)
+                    print(f"[batch] {done}/{len(todo)} images ({rate:.0f} img/s)")
+                    next_progress = time.perf_counter() + PROGRESS_EVERY_S
+            if batch:
+                flush(batch)
+        manifest.checkpoint()
+        dt = time.perf_counter() - t_embed
+        print(f"[batch] processed {done} images in {dt:.1f}s ({done / max(dt, 1e-9):.0f} img/s): {counts}")
 
+    # per-student mean over the files that are in the folders now
+    embs_by_student: Dict[str, List[np.ndarray]] = {}
+    for (student, _), sha1 in zip(files, hashes):
+        emb = manifest.embedding(sha1)
+        if emb is not None:
+            embs_by_student.setdefault(student, []).append(emb)
+    manifest.compact(dict.fromkeys(hashes))
+
+    students: Dict[str, np.ndarray] = {}
+    for student in sorted({st for st, _ in files}):
+        embs = embs_by_student.get(student)
         if not embs:
-            print(f"[batch] WARN: No embeddings for {student_name}, skipping.")
+            print(f"[batch] WARN: No embeddings for {student}, skipping.")
             continue
+        students[student] = _l2(np.mean(np.stack(embs), axis=0)).astype(np.float32)
 
-        avg = _avg(embs)
-        _upsert(gal, student_name, avg)
+    ids: Dict[str, str] = {}
+    if args.db and students:
+        try:
+            ids = db_upsert(students)
+        except Exception as e:
+            print(f"[batch] ERROR: database upsert failed ({e}); gallery not written, "
+                  f"re-run resumes from {manifest_path.name}", file=sys.stderr)
+            sys.exit(1)
+        print(f"[batch] Upserted {len(students)} students into Postgres")
 
+    changes = {"added": 0, "updated": 0}
+    for name, emb in students.items():
+        changes[_upsert(gal, name, emb, ids.get(name))] += 1
     _save_gallery(out_path, gal)
-    print(f"[batch] Done. Wrote {out_path}")
+    print(f"[batch] Done. {changes['added']} added, {changes['updated']} updated; wrote {out_path} "
+          f"in {time.perf_counter() - t_start:.1f}s")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,90 @@
+# benchmarks/fixtures.py
+# ------------------------------------------------------------
+# Deterministic synthetic inputs shared by the load test and the
+# micro-benchmarks (same seed -> same bytes, no binary fixtures).
+# ------------------------------------------------------------
+
+from __future__ import annotations
+import cv2
+import numpy as np
+
+JPEG_QUALITY = 50   # extension/content.js JPEG_QUALITY = 0.5
+TARGET = 512        # extension/content.js capture size
+EMB_DIM = 512       # ArcFace
+
+
+def synthetic_face_jpeg(seed: int, size: int = TARGET) -> bytes:
+    """A cartoon face that Haar picks up; seed varies geometry and tone."""
+    rng = np.random.default_rng(seed)
+    img = np.full((size, size, 3), rng.integers(40, 90, 3), np.uint8)
+    img = cv2.add(img, rng.integers(0, 25, img.shape, dtype=np.uint8))
+
+    cx, cy = size // 2 + int(rng.integers(-30, 30)), size // 2 + int(rng.integers(-20, 20))
+    fw, fh = int(size * rng.uniform(0.20, 0.26)), int(size * rng.uniform(0.27, 0.33))
+    skin = tuple(int(v) for v in rng.integers([120, 140, 170], [170, 190, 230]))
+    cv2.ellipse(img, (cx, cy), (fw, fh), 0, 0, 360, skin, -1)
+
+    ex, ey = int(fw * 0.42), int(fh * 0.25)
+    for sx in (-1, 1):
+        cv2.ellipse(img, (cx + sx * ex, cy - ey), (int(fw * 0.16), int(fh * 0.08)), 0, 0, 360, (250, 250, 250), -1)
+        cv2.circle(img, (cx + sx * ex, cy - ey), int(fw * 0.07), (30, 30, 30), -1)
+        cv2.line(img, (cx + sx * ex - int(fw * 0.18), cy - ey - int(fh * 0.15)),
+                 (cx + sx * ex + int(fw * 0.18), cy - ey - int(fh * 0.17)), (40, 40, 60), 4)
+    cv2.line(img, (cx, cy - int(fh * 0.1)), (cx - int(fw * 0.08), cy + int(fh * 0.2)), (90, 110, 150), 3)
+    cv2.ellipse(img, (cx, cy + int(fh * 0.45)), (int(fw * 0.35), int(fh * 0.1)), 0, 0, 180, (60, 60, 150), 4)
+
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    return buf.tobytes()
+
+
+def synthetic_face_bgr(seed: int, size: int = TARGET) -> np.ndarray:
+    """Decoded version of synthetic_face_jpeg (what the server sees after imdecode)."""
+    buf = np.frombuffer(synthetic_face_jpeg(seed, size), np.uint8)
+    return cv2.imdecode(buf, cv2.IMREAD_COLOR)
+
+
+def camera_frame_bgr(seed: int = 0, w: int = 640, h: int = 480) -> np.ndarray:
+    """A 640x480 run_loop-style frame with one synthetic face pasted in."""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(30, 120, (h, w, 3), dtype=np.uint8)
+    face = synthetic_face_bgr(seed, size=min(h, w) - 80)
+    y0, x0 = (h - face.shape[0]) // 2, (w - face.shape[1]) // 2
+    frame[y0:y0 + face.shape[0], x0:x0 + face.shape[1]] = face
+    return frame
+
+
+def classroom_frame_bgr(seed: int = 0, faces: int = 4, w: int = 1920, h: int = 1080, size: int = 200):
+    """(frame, face boxes): textured wide frame with `faces` synthetic faces on a grid."""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(30, 150, (h, w, 3), dtype=np.uint8)
+    cols = max(1, int(np.ceil(np.sqrt(faces * w / h))))
+    boxes = []
+    for k in range(faces):
+        x0 = (k % cols) * (w // cols) + 20
+        y0 = (k // cols) * (h // max(1, (faces + cols - 1) // cols)) + 20
+        x0, y0 = min(x0, w - size), min(y0, h - size)
+        frame[y0:y0 + size, x0:x0 + size] = synthetic_face_bgr(seed + k, size=size)
+        # Haar box is roughly the inner face ellipse
+        boxes.append((x0 + size // 5, y0 + size // 5, x0 + size - size // 5, y0 + size - size // 5))
+    return frame, boxes
+
+
+def synthetic_gallery(n: int, dim: int = EMB_DIM, seed: int = 0) -> dict:
+    """{"students":[{"name","emb","id"}]} in the vision/data/gallery.json format."""
+    rng = np.random.default_rng(seed)
+    embs = rng.standard_normal((n, dim)).astype(np.float32)
+    embs /= np.linalg.norm(embs, axis=1, keepdims=True)
+    return {
+        "students": [
+            {"name": f"Student_{i + 1:05d}", "emb": embs[i].tolist(), "id": f"id-{i}"}
+            for i in range(n)
+        ]
+    }
+
+
+def random_boxes(n: int, seed: int = 0, w: int = 1920, h: int = 1080, size: int = 60):
+    """n non-degenerate xyxy boxes spread over a lecture-hall frame."""
+    rng = np.random.default_rng(seed)
+    xs = rng.integers(0, w - size, n)
+    ys = rng.integers(0, h - size, n)
+    return [(int(x), int(y), int(x + size), int(y + size)) for x, y in zip(xs, ys)]
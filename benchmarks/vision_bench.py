@@ -0,0 +1,406 @@
+# benchmarks/vision_bench.py
+# ------------------------------------------------------------
+# Micro-benchmarks for the vision hot paths.
+#
+#   python benchmarks/vision_bench.py                       # run all, save results/<git sha>.json
+#   python benchmarks/vision_bench.py --only gallery        # regex filter on case names
+#   python benchmarks/vision_bench.py --save results/base.json
+#   python benchmarks/vision_bench.py --compare results/base.json --fail-over 1.20
+#
+# Per case we record per-call latency (mean/p50/p95/min), throughput and
+# allocations per call (tracemalloc, measured in a separate pass so it
+# does not skew the timings). Cases whose model/deps are missing are
+# reported as skipped instead of failing the run.
+# ------------------------------------------------------------
+
+from __future__ import annotations
+import os
+import re
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+RESULTS_DIR = BENCH_DIR / "results"
+for p in (str(ROOT), str(ROOT / "vision"), str(BENCH_DIR)):
+    if p not in sys.path:
+        sys.path.insert(0, p)
+
+from fixtures import synthetic_face_bgr, camera_frame_bgr, classroom_frame_bgr, synthetic_gallery, random_boxes, EMB_DIM
+
+GALLERY_SIZES = (10, 100, 1000, 10000)
+TRACK_SIZES = (5, 20, 50, 100)
+
+CASES = []   # (name, setup) ; setup() -> zero-arg callable
+
+
+def case(name):
+    def deco(setup):
+        CASES.append((name, setup))
+        return setup
+    return deco
+
+
+class Skip(Exception):
+    pass
+
+
+# ---------- models ----------
+_detector = None
+_arcface = None
+
+
+def _get_detector():
+    global _detector
+    if _detector is None:
+        try:
+            from vision.detector import Detector
+            _detector = Detector()
+        except Exception as e:
+            raise Skip(f"detector unavailable: {e}")
+    return _detector
+
+
+def _get_arcface():
+    global _arcface
+    if _arcface is None:
+        try:
+            from vision.auto_enrol import ArcFaceONNX, EmbedFactory
+            _arcface = ArcFaceONNX(EmbedFactory().model_path)
+        except Exception as e:
+            raise Skip(f"arcface unavailable: {e}")
+    return _arcface
+
+
+@case("detector.predict_states[640x480]")
+def _():
+    det, frame = _get_detector(), camera_frame_bgr(0)
+    return lambda: det.predict_states(frame)
+
+
+@case("detector.predict_states[512x512]")
+def _():
+    det, frame = _get_detector(), synthetic_face_bgr(1)
+    return lambda: det.predict_states(frame)
+
+
+@case("arcface.embed[112]")
+def _():
+    emb, crop = _get_arcface(), synthetic_face_bgr(2, size=112)
+    return lambda: emb.embed(crop)
+
+
+@case("arcface.embed[256]")
+def _():
+    emb, crop = _get_arcface(), synthetic_face_bgr(3, size=256)
+    return lambda: emb.embed(crop)
+
+
+# ---------- detector preprocessing (no model needed) ----------
+def _letterbox_case(frame):
+    try:
+        from vision.detector import Letterbox
+    except Exception as e:
+        raise Skip(f"detector module unavailable: {e}")
+    lb = Letterbox(512)
+    return lambda: lb(frame)
+
+
+@case("detector.Letterbox[640x480]")
+def _():
+    return _letterbox_case(camera_frame_bgr(0))
+
+
+@case("detector.Letterbox[1280x720]")
+def _():
+    return _letterbox_case(camera_frame_bgr(0, w=1280, h=720))
+
+
+# ---------- face finding ----------
+@case("faces.find_largest_face_bbox[512x512]")
+def _():
+    from vision.faces import find_largest_face_bbox
+    img = synthetic_face_bgr(4)
+    return lambda: find_largest_face_bbox(img)
+
+
+@case("faces.find_largest_face_bbox[640x480]")
+def _():
+    from vision.faces import find_largest_face_bbox
+    img = camera_frame_bgr(5)
+    return lambda: find_largest_face_bbox(img)
+
+
+# ---------- ROI detection (full frame vs around tracks) ----------
+def _haar():
+    import cv2
+    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+    if cascade.empty():
+        raise Skip("haarcascade not found")
+    return cascade
+
+
+@case("roi.haar_full[1080p 4 faces]")
+def _():
+    import cv2
+    frame, _ = classroom_frame_bgr(0)
+    gray, cascade = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), _haar()
+    return lambda: cascade.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=5, minSize=(70, 70))
+
+
+@case("roi.haar_rois[1080p 4 faces]")
+def _():
+    import cv2
+    from vision.roi import RoiScheduler, haar_rois
+    frame, boxes = classroom_frame_bgr(0)
+    gray, cascade = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), _haar()
+    sched = RoiScheduler()
+    sched.plan(gray, boxes)               # first call is the periodic full pass
+    rois = sched.plan(gray, boxes).rois
+    return lambda: haar_rois(cascade, gray, rois, scaleFactor=1.2, minNeighbors=5, minSize=(70, 70))
+
+
+@case("roi.RoiScheduler.plan[1080p 4 faces]")
+def _():
+    import cv2
+    from vision.roi import RoiScheduler
+    frame, boxes = classroom_frame_bgr(0)
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    sched = RoiScheduler(full_every=10 ** 9)
+    return lambda: sched.plan(gray, boxes)
+
+
+@case("roi.yolo_mosaic[1080p 4 faces]")
+def _():
+    from vision.roi import expand_box, yolo_mosaic
+    det = _get_detector()
+    frame, boxes = classroom_frame_bgr(0)
+    rois = [expand_box(b, 0.6, frame.shape[1], frame.shape[0]) for b in boxes]
+    return lambda: yolo_mosaic(det, frame, rois, det.imgsz)
+
+
+@case("detector.predict_states[1080p]")
+def _():
+    det = _get_detector()
+    frame, _ = classroom_frame_bgr(0)
+    return lambda: det.predict_states(frame)
+
+
+# ---------- tracking ----------
+def _tracker_case(make, n, moving=False):
+    frames = [random_boxes(n, seed=0)]
+    for k in range(1, 30):
+        if moving:
+            # lecture hall: everyone drifts a few px per frame, half of them
+            # towards each other so neighbouring boxes overlap and cross
+            frames.append([(x1 + (4 if j % 2 else -4) * k, y1 + k % 2, x2 + (4 if j % 2 else -4) * k, y2 + k % 2)
+                           for j, (x1, y1, x2, y2) in enumerate(frames[0])])
+        else:
+            # small jitter so most tracks match frame to frame
+            frames.append([(x1 + k % 3, y1 + k % 2, x2 + k % 3, y2 + k % 2) for x1, y1, x2, y2 in frames[0]])
+    state = {"t": make(), "i": 0}
+
+    def step():
+        state["t"].update(frames[state["i"] % len(frames)])
+        state["i"] += 1
+    return step
+
+
+for _n in TRACK_SIZES:
+    @case(f"tracker.Tracker.update[{_n}]")
+    def _(n=_n):
+        from vision.tracker import Tracker
+        return _tracker_case(lambda: Tracker(max_dist=60, ttl=30), n)
+
+    @case(f"tracker.Tracker.update[{_n} moving]")
+    def _(n=_n):
+        from vision.tracker import Tracker
+        return _tracker_case(lambda: Tracker(max_dist=60, ttl=30), n, moving=True)
+
+    @case(f"tracker.hungarian[{_n}x{_n}]")
+    def _(n=_n):
+        from vision.tracker import hungarian
+        cost = np.random.default_rng(n).random((n, n))
+        return lambda: hungarian(cost)
+
+
+# ---------- stabilizer ----------
+def _pending_case(pe_cls, as_list):
+    rng = np.random.default_rng(0)
+    base = rng.standard_normal(EMB_DIM).astype(np.float32)
+    embs = []
+    for k in range(16):
+        e = base + 0.05 * rng.standard_normal(EMB_DIM).astype(np.float32)
+        e /= np.linalg.norm(e)
+        embs.append(e.tolist() if as_list else e)
+    pe = pe_cls(min_hits=10 ** 9)   # never "confirm" so every call does the full work
+    state = {"i": 0}
+
+    def step():
+        i = state["i"]
+        pe.step(i * 100, (100, 100, 120, 120), embs[i % len(embs)])
+        state["i"] += 1
+    return step
+
+
+@case("stabilizer.PendingEnroll.step")
+def _():
+    from vision.stabilizer import PendingEnroll
+    return _pending_case(PendingEnroll, as_list=True)
+
+
+@case("run_loop.PendingEnroll.step")
+def _():
+    import run_loop
+    return _pending_case(run_loop.PendingEnroll, as_list=False)
+
+
+# ---------- gallery scans ----------
+for _n in GALLERY_SIZES:
+    @case(f"gallery.best_match[{_n}]")
+    def _(n=_n):
+        import run_loop
+        g = synthetic_gallery(n)
+        q = np.asarray(g["students"][n // 2]["emb"], dtype=np.float32)
+        return lambda: run_loop.best_match(q, g)
+
+    @case(f"gallery.best_match_raw[{_n}]")
+    def _(n=_n):
+        import run_loop
+        g = synthetic_gallery(n)
+        q = np.asarray(g["students"][n // 2]["emb"], dtype=np.float32)
+        return lambda: run_loop.best_match_raw(q, g)
+
+    @case(f"gallery.GalleryIndex.best[{_n}]")
+    def _(n=_n):
+        from gallery_index import GalleryIndex
+        g = synthetic_gallery(n)
+        gi = GalleryIndex.from_students(g["students"])
+        q = np.asarray(g["students"][n // 2]["emb"], dtype=np.float32)
+        return lambda: gi.best(q)
+
+    @case(f"gallery.GalleryIndex.merge[{_n}]")
+    def _(n=_n):
+        from gallery_index import GalleryIndex
+        g = synthetic_gallery(n)
+        gi = GalleryIndex.from_students(g["students"])   # no base: merges never hit the disk
+        name = g["students"][n // 2]["name"]
+        q = np.asarray(g["students"][n // 2]["emb"], dtype=np.float32)
+        return lambda: gi.merge(name, q, alpha=0.15)
+
+
+# ---------- runner ----------
+def measure(fn, min_time=1.0, min_calls=5, max_calls=100000, warmup=2):
+    for _ in range(warmup):
+        fn()
+
+    times = []
+    t_end = time.perf_counter() + min_time
+    while (len(times) < min_calls or time.perf_counter() < t_end) and len(times) < max_calls:
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+
+    # allocations: a short separate pass under tracemalloc
+    n_alloc = max(1, min(len(times), 20))
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    for _ in range(n_alloc):
+        fn()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    diff = after.compare_to(before, "filename")
+    alloc_blocks = sum(max(0, d.count_diff) for d in diff)
+
+    arr = np.asarray(times) * 1e6  # us
+    return {
+        "calls": int(arr.size),
+        "mean_us": round(float(arr.mean()), 2),
+        "p50_us": round(float(np.percentile(arr, 50)), 2),
+        "p95_us": round(float(np.percentile(arr, 95)), 2),
+        "min_us": round(float(arr.min()), 2),
+        "ops_per_s": round(1e6 / float(arr.mean()), 2),
+        "peak_bytes": int(peak),
+        "retained_blocks_per_call": round(alloc_blocks / n_alloc, 2),
+    }
+
+
+def git_sha():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return "nogit"
+
+
+def compare(results, baseline_path, fail_over):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        base = json.load(f)["cases"]
+    worst = 0.0
+    print(f"\n[bench] vs {baseline_path}  (ratio = now / baseline, p50)")
+    for name, r in results.items():
+        b = base.get(name)
+        if "p50_us" not in r or not b or "p50_us" not in b:
+            continue
+        ratio = r["p50_us"] / max(b["p50_us"], 1e-9)
+        worst = max(worst, ratio)
+        flag = "  REGRESSION" if ratio > fail_over else ""
+        print(f"  {name:45s} {b['p50_us']:11.1f} -> {r['p50_us']:11.1f} us  x{ratio:5.2f}{flag}")
+    return worst <= fail_over
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Vision hot-path micro-benchmarks")
+    ap.add_argument("--only", default="", help="regex on case names")
+    ap.add_argument("--min-time", type=float, default=1.0, help="seconds per case")
+    ap.add_argument("--save", default="", help="output JSON (default results/<git sha>.json)")
+    ap.add_argument("--compare", default="", help="baseline JSON to compare against")
+    ap.add_argument("--fail-over", type=float, default=1.20, help="max allowed p50 ratio vs baseline")
+    args = ap.parse_args()
+
+    pat = re.compile(args.only) if args.only else None
+    results = {}
+    for name, setup in CASES:
+        if pat and not pat.search(name):
+            continue
+        try:
+            fn = setup()
+        except Skip as e:
+            print(f"[bench] skip {name}: {e}")
+            results[name] = {"skipped": str(e)}
+            continue
+        r = measure(fn, min_time=args.min_time)
+        results[name] = r
+        print(f"[bench] {name:45s} p50={r['p50_us']:11.1f} us  p95={r['p95_us']:11.1f} us  "
+              f"{r['ops_per_s']:10.1f}/s  peak={r['peak_bytes'] / 1024:8.1f} KiB")
+
+    out = {
+        "commit": git_sha(),
+        "ts": time.time(),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpu_count": os.cpu_count()},
+        "cases": results,
+    }
+    save = Path(args.save) if args.save else RESULTS_DIR / f"{out['commit']}.json"
+    save.parent.mkdir(parents=True, exist_ok=True)
+    with open(save, "w", encoding="utf-8") as f:
+        json.dump(out, f, indent=2)
+    print(f"[bench] wrote {save}")
+
+    if args.compare:
+        return 0 if compare(results, args.compare, args.fail_over) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,609 @@
+# server/blueprints/inference.py
+# ------------------------------------------------------------
+# Model endpoints: /api/infer, /api/identify, /api/identify_multi and
+# bulk roster enrolment (/api/classes/<class_id>/enrol_bulk).
+# Role: inference (the only role that loads the models)
+# ------------------------------------------------------------
+
+from __future__ import annotations
+import os
+import json
+import time
+import logging
+from flask import Blueprint, request, jsonify, session
+from server.services import metrics
+from server.services import enrol_bulk
+
+from server.core import (
+    AMBIG_THR, NEW_CONFIRM_FRAMES, NEW_CONFIRM_WINDOW_S, PENDING_STATE, SIM_THRESHOLD, connect,
+    cos_sim, cv2, get_detector, get_embedder, log_identify, log_infer, merge_embedding_into,
+    mint_next_student_id, now_iso, np, pfloat, pint, run_blocking, socketio, vision_align, vision_faces,
+)
+
+bp = Blueprint("inference", __name__)
+
+# -------------------- API: Infer (state only) --------------------
+@bp.post("/api/infer")
+def api_infer():
+    f = request.files.get("frame")
+    if not f:
+        return jsonify({"ok": False, "error": "no frame"}), 400
+
+    with metrics.stage("infer", "decode"):
+        file_bytes = np.frombuffer(f.read(), np.uint8)
+        img = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
+    if img is None:
+        return jsonify({"ok": False, "error": "bad image"}), 400
+
+    det = get_detector()
+    try:
+        with metrics.stage("infer", "model"), metrics.model("detector"):
+            dets = run_blocking(det.predict_states, img)
+    except Exception as e:
+        log_infer.warning("infer failed", extra={"error": repr(e)})
+        return jsonify({"ok": False, "state": "Unknown", "state_score": 0.0, "bbox": None, "error": str(e)}), 200
+
+    log_infer.debug("infer dets", extra={"n": len(dets or []), "dets": dets})
+
+    if not dets:
+        return jsonify({"ok": True, "state": "Unknown", "state_score": 0.0, "bbox": None})
+
+    # --- normalize to list ---
+    if isinstance(dets, dict):
+        dets = [dets]
+
+    def to_bucket(label: str) -> str:
+        s = (label or "").strip().lower()
+        # map many possible model outputs -> Drowsy
+        if ("drow" in s) or ("sleep" in s) or ("yawn" in s) or ("close" in s) or ("fatigue" in s) or ("tired" in s):
+            return "Drowsy"
+        if ("awake" in s) or ("alert" in s) or ("normal" in s) or ("open" in s):
+            return "Awake"
+        return "Unknown"
+
+    # find best Awake / Drowsy candidate (by score)
+    best_awake = None
+    best_drowsy = None
+    best_any = None
+
+    for d in dets:
+        if "score" not in d:
+            continue
+        if best_any is None or d["score"] > best_any["score"]:
+            best_any = d
+
+        bucket = to_bucket(d.get("label", ""))
+        if bucket == "Awake":
+            if best_awake is None or d["score"] > best_awake["score"]:
+                best_awake = d
+        elif bucket == "Drowsy":
+            if best_drowsy is None or d["score"] > best_drowsy["score"]:
+                best_drowsy = d
+
+    if best_any is None:
+        return jsonify({"ok": True, "state": "Unknown", "state_score": 0.0, "bbox": None})
+
+    # --- decision rules ---
+    # Make Drowsy easier to show (because models often bias to Awake)
+    DROWSY_MIN = 0.55
+    MARGIN = 0.08  # if drowsy is close to awake, prefer drowsy
+
+    chosen = best_any
+    if best_drowsy and best_drowsy["score"] >= DROWSY_MIN:
+        if (best_awake is None) or (best_drowsy["score"] >= best_awake["score"] - MARGIN):
+            chosen = best_drowsy
+
+    # bbox safely (some models might not return xyxy)
+    bbox = None
+    if chosen.get("xyxy") and len(chosen["xyxy"]) == 4:
+        x1, y1, x2, y2 = chosen["xyxy"]
+        bbox = {"x": int(x1), "y": int(y1), "w": int(x2 - x1), "h": int(y2 - y1)}
+
+    # output normalized state label
+    state = to_bucket(chosen.get("label", ""))
+    score = float(chosen.get("score", 0.0))
+
+    return jsonify({"ok": True, "state": state, "state_score": score, "bbox": bbox})
+
+# -------------------- API: Identify (single face) --------------------
+@bp.post("/api/identify")
+def api_identify():
+    """
+    Expect: multipart/form-data with frame=<jpeg>
+    Return: { ok, student_id, name, sim, bbox, pending }
+            - pending=True while confirming a NEW face
+    """
+
+    # ---------- 1) Get uploaded image & decode safely ----------
+    file = (
+        request.files.get("frame")
+        or request.files.get("image")
+        or request.files.get("file")
+    )
+    if file is None:
+        log_identify.info("no file field", extra={
+            "content_type": request.content_type, "files": list(request.files.keys()),
+        })
+        return jsonify(ok=False, error="no frame"), 400
+
+    data = file.read()
+    if log_identify.isEnabledFor(logging.DEBUG):
+        log_identify.debug("identify request", extra={
+            "bytes": len(data), "content_type": request.content_type, "form": dict(request.form),
+        })
+
+    if not data:
+        log_identify.info("empty image data")
+        return jsonify(ok=False, error="empty image"), 400
+
+    with metrics.stage("identify", "decode"):
+        arr = np.frombuffer(data, np.uint8)
+        img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+
+    if img is None:
+        # Save debug file so we can inspect what was received
+        ts = int(time.time())
+        debug_path = os.path.join(
+            os.path.dirname(__file__),
+            f"debug_bad_frame_{ts}.jpg",
+        )
+        with open(debug_path, "wb") as f:
+            f.write(data)
+        log_identify.warning("imdecode failed", extra={"debug_path": debug_path})
+        return jsonify(ok=False, error="bad image"), 400
+
+    # ---------- 2) Find largest face ----------
+    with metrics.stage("identify", "detect"):
+        bbox = vision_faces.find_largest_face_bbox(img)
+    if not bbox:
+        return jsonify(
+            {
+                "ok": True,
+                "student_id": None,
+                "name": None,
+                "sim": pfloat(0.0),
+                "bbox": None,
+                "pending": False,
+            }
+        )
+
+    x1, y1, x2, y2 = bbox
+    w, h = x2 - x1, y2 - y1
+    bbox_json = {"x": pint(x1), "y": pint(y1), "w": pint(w), "h": pint(h)}
+
+    # ---------- 3) Basic quality checks ----------
+    MIN_FACE_W = 40
+    MIN_FACE_H = 40
+    if w < MIN_FACE_W or h < MIN_FACE_H:
+        # Optional: Print why we failed so you can see it in logs
+        log_identify.debug("face too small", extra={"w": w, "h": h})
+        return jsonify(
+            {
+                "ok": True,
+                "student_id": None,
+                "name": None,
+                "sim": pfloat(0.0),
+                "bbox": bbox_json,
+                "pending": True,
+            }
+        )
+
+    with metrics.stage("identify", "blur_check"):
+        face_gray = cv2.cvtColor(img[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+        blur_var = cv2.Laplacian(face_gray, cv2.CV_64F).var()
+    if blur_var < 5:
+        # too blurry
+        return jsonify(
+            {
+                "ok": True,
+                "student_id": None,
+                "name": None,
+                "sim": pfloat(0.0),
+                "bbox": bbox_json,
+                "pending": True,
+            }
+        )
+
+    # ---------- 4) Align + embed face ----------
+    with metrics.stage("identify", "align"):
+        face = vision_align.align_face(img, bbox, fallback=img[y1:y2, x1:x2])
+    emb_factory = get_embedder()
+    with metrics.stage("identify", "embed"), metrics.model("arcface"):
+        res = run_blocking(emb_factory.embed, face)
+    if not res.ok:
+        return jsonify(
+            {
+                "ok": True,
+                "student_id": None,
+                "name": None,
+                "sim": pfloat(0.0),
+                "bbox": bbox_json,
+                "pending": False,
+            }
+        )
+
+    q = np.asarray(res.emb, dtype=np.float32)
+
+    # ---------- 5) Compare with existing students ----------
+    with metrics.stage("identify", "gallery_load"):
+        conn = connect()
+        cur = conn.cursor()
+        # -------------------- Restrict matching by class (via session_id) --------------------
+        session_id = request.args.get("session_id", type=int)
+        class_id = None
+
+        if session_id:
+            try:
+                r_sess = cur.execute(
+                    "SELECT class_id FROM sessions WHERE id=?",
+                    (session_id,),
+                ).fetchone()
+
+                if r_sess:
+                    # works for sqlite3.Row (dict-like) OR tuple
+                    try:
+                        class_id = r_sess["class_id"]
+                    except Exception:
+                        class_id = r_sess[0]
+
+                    # normalize empty/None
+                    if class_id is None:
+                        class_id = None
+
+            except Exception as e:
+                log_identify.warning("failed to resolve class_id", extra={"session_id": session_id, "error": str(e)})
+                class_id = None
+
+        # If we have class_id, only compare against students enrolled in that class
+        if class_id:
+            rows = cur.execute(
+                """
+                SELECT
+                s.id AS id,
+                COALESCE(e.display_name, s.name) AS name,
+                s.embedding AS embedding
+                FROM enrollments e
+                JOIN students s ON s.id = e.student_id
+                WHERE e.class_id = ?
+                """,
+                (class_id,),
+            ).fetchall()
+        else:
+            # fallback: old behavior (all students)
+            rows = cur.execute("SELECT id, name, embedding FROM students").fetchall()
+
+    best_sid, best_name, best_sim = None, None, -1.0
+    metrics.gallery_scan("identify", len(rows))
+    with metrics.stage("identify", "match"):
+        for r in rows:
+            if not r["embedding"]:
+                continue
+            try:
+                v = np.asarray(json.loads(r["embedding"]), dtype=np.float32)
+                s = cos_sim(q, v)
+                if s > best_sim:
+                    best_sid, best_name, best_sim = r["id"], r["name"], s
+            except Exception:
+                pass
+
+    sim_val = float(best_sim if best_sim is not None else 0.0)
+
+    # ---------- 6) Known face above threshold ----------
+    if best_sid and sim_val >= SIM_THRESHOLD:
+        with metrics.stage("identify", "merge_write"):
+            try:
+                merge_embedding_into(conn, best_sid, q)
+            except Exception:
+                pass
+            try:
+                cur.execute(
+                    "UPDATE students SET last_seen_ts=? WHERE id=?",
+                    (now_iso(), best_sid),
+                )
+                conn.commit()
+            except Exception:
+                pass
+        conn.close()
+        return jsonify(
+            {
+                "ok": True,
+                "pending": False,
+                "student_id": best_sid,
+                "name": best_name,
+                "sim": sim_val,
+                "bbox": bbox_json,
+            }
+        )
+
+    # ---------- 7) If session_id/class_id is present, DO NOT create new student ----------
+    if class_id:
+        conn.close()
+        return jsonify(
+            {
+                "ok": True,
+                "pending": False,
+                "student_id": None,
+                "name": "Unknown",
+                "sim": sim_val,
+                "bbox": bbox_json,
+            }
+        )
+
+    # ---------- 8) Handle NEW face with pending window (only when class_id is NOT known) ----------
+    t = time.time()
+    camera_id = (request.form.get("camera_id") or "MEET_TAB").strip()
+    st = PENDING_STATE.setdefault(camera_id, {"n": 0, "t0": t})
+    if t - st["t0"] > NEW_CONFIRM_WINDOW_S:
+        st["n"] = 0
+        st["t0"] = t
+    st["n"] += 1
+
+    if st["n"] >= NEW_CONFIRM_FRAMES:
+        # Confirm as a new student
+        new_id = mint_next_student_id()
+        try:
+            cur.execute(
+                "INSERT INTO students(id, name, embedding, last_seen_ts) "
+                "VALUES (?,?,?,?)",
+                (new_id, None, json.dumps(q.tolist()), now_iso()),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        PENDING_STATE.pop(camera_id, None)
+
+        return jsonify(
+            {
+                "ok": True,
+                "pending": False,
+                "student_id": new_id,
+                "name": None,
+                "sim": sim_val,
+                "bbox": bbox_json,
+            }
+        )
+
+    # Still pending (face seen but not enough frames yet)
+    conn.close()
+    return jsonify(
+        {
+            "ok": True,
+            "pending": True,
+            "student_id": None,
+            "name": None,
+            "sim": sim_val,
+            "bbox": bbox_json,
+        }
+    )
+
+# -------------------- API: Identify Multi (multi-person) --------------------
+@bp.post("/api/identify_multi")
+def api_identify_multi():
+    """
+    multipart/form-data: frame=<jpeg>
+    -> { ok, faces: [ {student_id, name, sim, bbox:{x,y,w,h}, pending} ] }
+    Processes ALL detected faces, not just the largest.
+    """
+    f = request.files.get("frame")
+    if not f:
+        return jsonify({"ok": False, "error": "no frame"}), 400
+
+    with metrics.stage("identify_multi", "decode"):
+        file_bytes = np.frombuffer(f.read(), np.uint8)
+        img = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
+    if img is None:
+        return jsonify({"ok": False, "error": "bad image"}), 400
+
+    t_detect = time.perf_counter()
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    gray = cv2.equalizeHist(gray)
+
+    h, w = gray.shape[:2]
+    if max(h, w) < 640:
+        scale = 640.0 / max(h, w)
+        gray = cv2.resize(gray, (int(w * scale), int(h * scale)))
+
+    cascade = cv2.CascadeClassifier(
+        cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+    )
+
+    params_list = [
+        dict(scaleFactor=1.03, minNeighbors=3, minSize=(32, 32)),
+        dict(scaleFactor=1.05, minNeighbors=3, minSize=(40, 40)),
+        dict(scaleFactor=1.08, minNeighbors=3, minSize=(50, 50)),
+        dict(scaleFactor=1.10, minNeighbors=4, minSize=(60, 60)),
+    ]
+    faces = []
+    for p in params_list:
+        fs = cascade.detectMultiScale(gray, **p)
+        if len(fs):
+            faces = fs
+            break
+    metrics.observe_stage("identify_multi", "detect", time.perf_counter() - t_detect)
+
+    out = []
+    if not len(faces):
+        return jsonify({"ok": True, "faces": out})
+
+    emb_factory = get_embedder()
+    conn = connect(); cur = conn.cursor()
+    rows = cur.execute("SELECT id, name, embedding FROM students").fetchall()
+
+    def best_match(qvec):
+        metrics.gallery_scan("identify_multi", len(rows))
+        best_sid, best_name, best_sim = None, None, -1.0
+        for r in rows:
+            if not r["embedding"]:
+                continue
+            try:
+                v = np.asarray(json.loads(r["embedding"]), dtype=np.float32)
+                s = cos_sim(qvec, v)
+                if s > best_sim:
+                    best_sid, best_name, best_sim = r["id"], r["name"], s
+            except Exception:
+                continue
+        return best_sid, best_name, float(best_sim)
+
+    MIN_FACE = 48
+    for (x, y, w, h) in faces:
+        bbox_json = {"x": int(x), "y": int(y), "w": int(w), "h": int(h)}
+        if w < MIN_FACE or h < MIN_FACE:
+            out.append(
+                {
+                    "student_id": None,
+                    "name": None,
+                    "sim": 0.0,
+                    "bbox": bbox_json,
+                    "pending": True,
+                }
+            )
+            continue
+
+        crop = img[y:y+h, x:x+w]
+        face_gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        if cv2.Laplacian(face_gray, cv2.CV_64F).var() < 40:
+            out.append(
+                {
+                    "student_id": None,
+                    "name": None,
+                    "sim": 0.0,
+                    "bbox": bbox_json,
+                    "pending": True,
+                }
+            )
+            continue
+
+        with metrics.stage("identify_multi", "align"):
+            face = vision_align.align_face(img, (x, y, x + w, y + h), fallback=crop)
+        with metrics.stage("identify_multi", "embed"), metrics.model("arcface"):
+            res = run_blocking(emb_factory.embed, face)
+        if not res.ok:
+            out.append(
+                {
+                    "student_id": None,
+                    "name": None,
+                    "sim": 0.0,
+                    "bbox": bbox_json,
+                    "pending": False,
+                }
+            )
+            continue
+
+        q = np.asarray(res.emb, dtype=np.float32)
+        with metrics.stage("identify_multi", "match"):
+            best_sid, best_name, best_sim = best_match(q)
+        sim_val = float(best_sim if best_sim is not None else 0.0)
+
+        if sim_val >= AMBIG_THR and sim_val < SIM_THRESHOLD:
+            out.append(
+                {
+                    "student_id": None,
+                    "name": None,
+                    "sim": sim_val,
+                    "bbox": bbox_json,
+                    "pending": True,
+                }
+            )
+        elif best_sid and sim_val >= SIM_THRESHOLD:
+            try:
+                merge_embedding_into(conn, best_sid, q)
+            except Exception:
+                pass
+            out.append(
+                {
+                    "student_id": best_sid,
+                    "name": best_name,
+                    "sim": sim_val,
+                    "bbox": bbox_json,
+                    "pending": False,
+                }
+            )
+        else:
+            out.append(
+                {
+                    "student_id": None,
+                    "name": None,
+                    "sim": sim_val,
+                    "bbox": bbox_json,
+                    "pending": False,
+                }
+            )
+
+    conn.close()
+    return jsonify({"ok": True, "faces": out})
+
+
+# -------------------- API: Bulk roster enrolment --------------------
+def _class_access(class_id):
+    """None if the logged-in user may manage class_id, else an error response."""
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+    conn = connect()
+    if conn is None:
+        return jsonify({"ok": False, "error": "database unavailable"}), 503
+    try:
+        row = conn.execute("SELECT owner_user_id FROM classes WHERE id=?", (class_id,)).fetchone()
+    finally:
+        conn.close()
+    if not row:
+        return jsonify({"ok": False, "error": "Class not found."}), 404
+    if session.get("role") != "admin" and row["owner_user_id"] != session["user_id"]:
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+    return None
+
+
+@bp.post("/api/classes/<class_id>/enrol_bulk")
+def api_enrol_bulk(class_id):
+    """
+    multipart/form-data:
+      roster=<csv>   columns: name (required), email, student_id, photo
+                     (file name(s) in the upload, ';'-separated)
+      photos=<zip>   and/or several photos=<image>; without a photo column a
+                     row takes files / folders named after its student_id,
+                     email or name
+    202 { ok, job_id, total_photos, unmatched_photos, status_url }
+    Progress: GET /api/classes/<class_id>/enrol_bulk/<job_id>
+    """
+    denied = _class_access(class_id)
+    if denied:
+        return denied
+
+    roster = request.files.get("roster")
+    if not roster:
+        return jsonify({"ok": False, "error": "roster CSV is required"}), 400
+    try:
+        rows = enrol_bulk.parse_roster(roster.read())
+        photos = enrol_bulk.read_photos([(f.filename or "", f.read()) for f in request.files.getlist("photos")])
+    except enrol_bulk.BulkEnrolError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    unmatched = enrol_bulk.match_photos(rows, photos)
+    for path in unmatched:
+        photos.pop(path, None)
+    total = sum(len(r["files"]) for r in rows)
+
+    job_id = enrol_bulk.create_job(connect, class_id, total, session["user_id"])
+    enrol_bulk.start(
+        socketio.start_background_task,
+        connect=connect, get_embedder=get_embedder, run_blocking=run_blocking,
+        job_id=job_id, class_id=class_id, rows=rows, photos=photos,
+    )
+    return jsonify({
+        "ok": True,
+        "job_id": job_id,
+        "rows": len(rows),
+        "total_photos": total,
+        "unmatched_photos": unmatched[:50],
+        "status_url": f"/api/classes/{class_id}/enrol_bulk/{job_id}",
+    }), 202
+
+
+@bp.get("/api/classes/<class_id>/enrol_bulk/<job_id>")
+def api_enrol_bulk_status(class_id, job_id):
+    denied = _class_access(class_id)
+    if denied:
+        return denied
+    job = enrol_bulk.get_job(connect, class_id, job_id)
+    if job is None:
+        return jsonify({"ok": False, "error": "job not found"}), 404
+    return jsonify({"ok": True, **job})
@@ -0,0 +1,575 @@
+# server/blueprints/ingest.py
+# ------------------------------------------------------------
+# Extension / vision-loop ingest: events, sightings, seen list,
+# session start (from Meet) and stop. Role: ingest
+# ------------------------------------------------------------
+
+from __future__ import annotations
+import os
+import sys
+import time
+import json
+from datetime import datetime, timezone, timedelta
+from flask import Blueprint, request, jsonify
+from psycopg2 import Error as PgError, InterfaceError as PgInterfaceError, OperationalError as PgOperationalError
+
+from server.core import (
+    LIVE, SEEN, _now, auto_mark_absent_students, compute_engagement_for_session, connect,
+    exec_retry, get_open_session_id, mark_attendance_if_needed, now_iso, update_live,
+)
+
+bp = Blueprint("ingest", __name__)
+
+# -------------------- API: Auto session_from_meet --------------------
+@bp.post("/api/auto/session_from_meet")
+def api_auto_session_from_meet():
+    data = request.get_json(force=True, silent=True) or {}
+
+    class_id = (data.get("course_id") or "CS101").strip()
+    meet_url = (data.get("meet_url") or "").strip()
+    title = (data.get("title") or "").strip() or f"Meet - {class_id}"
+
+    conn = connect()
+    cur = conn.cursor()
+
+    # ✅ Postgres uses %s placeholders (NOT ?)
+    row = cur.execute(
+        """
+        SELECT id
+        FROM sessions
+        WHERE class_id=%s AND platform_link=%s AND end_ts IS NULL
+        ORDER BY start_ts DESC
+        LIMIT 1
+        """,
+        (class_id, meet_url),
+    ).fetchone()
+
+    if row:
+        session_id = row["id"]
+        conn.close()
+        return jsonify({"ok": True, "session_id": session_id})
+
+    # ✅ Allow students to create session too
+    # ✅ Postgres: get inserted id via RETURNING
+    row2 = cur.execute(
+        """
+        INSERT INTO sessions(name, start_ts, class_id, platform_link)
+        VALUES (%s, %s, %s, %s)
+        RETURNING id
+        """,
+        (title, now_iso(), class_id, meet_url),
+    ).fetchone()
+
+    session_id = row2["id"]
+
+    conn.commit()
+    conn.close()
+    return jsonify({"ok": True, "session_id": session_id})
+
+# -------------------- API: Stop session --------------------
+@bp.post("/stop")
+def api_session_stop():
+    """
+    Called by the extension when the lecturer clicks Stop.
+    Payload (JSON or Beacon body):
+      { "session_id": <id> }  (optional)
+    If session_id is missing, we just close the latest open session.
+    """
+    data = None
+    try:
+        # For normal fetch/post
+        data = request.get_json(silent=True)
+    except Exception:
+        data = None
+
+    if not data:
+        # For sendBeacon, body is raw bytes, but Flask already parsed if possible;
+        # if not, we just close the latest open session.
+        data = {}
+
+    sid = data.get("session_id")
+    try:
+        sid = int(sid) if sid is not None else None
+    except Exception:
+        sid = None
+
+    conn = connect(); cur = conn.cursor()
+
+    # If no id given, use latest open session (if any)
+    if not sid:
+        row = cur.execute(
+            "SELECT id FROM sessions WHERE end_ts IS NULL "
+            "ORDER BY start_ts DESC LIMIT 1"
+        ).fetchone()
+        if row:
+            sid = row["id"]
+        else:
+            conn.close()
+            return jsonify({"ok": True, "session_id": None})
+
+    cur.execute(
+        "UPDATE sessions SET end_ts=? WHERE id=? AND end_ts IS NULL",
+        (now_iso(), sid),
+    )
+    conn.commit()
+    conn.close()
+
+    LIVE.close_session(sid)
+
+    # --- ADDED: Auto-mark Absentees ---
+    auto_mark_absent_students(sid)
+
+    # NEW: aggregate raw events into engagement_summary
+    try:
+        compute_engagement_for_session(sid)
+    except Exception as e:
+        print("[engagement_summary] compute failed:", e, file=sys.stderr)
+
+    return jsonify({"ok": True, "session_id": sid})
+
+# -------------------- API: Sighting (Python vision loop) --------------------
+@bp.post("/api/sighting")
+def api_sighting():
+    """Called by vision/run_loop.py for every sighting (throttled there)."""
+    data = request.get_json(force=True, silent=True) or {}
+    course_id = data.get("course_id", "CS101")
+    name      = data.get("name", "UNKNOWN")
+    score     = float(data.get("score", 0.0))
+    camera_id = data.get("camera_id", "CAM1")
+    ts        = float(data.get("ts", _now()))
+
+    # Drop unknowns so they never show up in /api/seen
+    if name.upper() == "UNKNOWN" or name.lower().startswith("unknown"):
+        return jsonify({"ok": True, "ignored": "unknown"}), 200
+
+    key = (course_id, name)
+    row = SEEN.get(key)
+    if row is None:
+        row = {
+            "first_seen": ts,
+            "last_seen": ts,
+            "count": 1,
+            "camera_id": camera_id,
+            "score": score,
+        }
+        SEEN[key] = row
+    else:
+        row["last_seen"] = ts
+        row["count"] += 1
+        row["camera_id"] = camera_id
+        row["score"] = score
+
+    conn = connect(); cur = conn.cursor()
+
+    session_id = (data.get("session_id") if isinstance(data, dict) else None)
+    try:
+        session_id = int(session_id) if session_id is not None else None
+    except Exception:
+        session_id = None
+
+    if session_id:
+        r = cur.execute(
+            "SELECT id FROM sessions WHERE id=?", (session_id,)
+        ).fetchone()
+        if not r:
+            session_id = None
+    if not session_id:
+        session_id = get_open_session_id(conn)
+        if not session_id:
+            cur.execute(
+                "INSERT INTO sessions(name, start_ts) VALUES(?,?)",
+                ("Auto Session", now_iso()),
+            )
+            session_id = cur.lastrowid
+
+    # Find or create student by NAME
+    row2 = cur.execute(
+        "SELECT id FROM students WHERE name=?", (name,)
+    ).fetchone()
+    if row2:
+        sid = row2["id"]
+    else:
+        row_max = cur.execute(
+            "SELECT id FROM students WHERE id LIKE 'S%%' "
+            "ORDER BY CAST(SUBSTR(id,2) AS INTEGER) DESC LIMIT 1"
+        ).fetchone()
+        next_num = (int(row_max["id"][1:]) + 1) if row_max else 1
+        sid = f"S{next_num:03d}"
+        cur.execute(
+            "INSERT INTO students(id, name, embedding, last_seen_ts) "
+            "VALUES(?,?,?,?)",
+            (sid, name, None, datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()),
+        )
+
+    value = {
+        "score": score,
+        "camera_id": camera_id,
+        "from": "python_loop",
+    }
+    exec_retry(
+        cur,
+        "INSERT INTO events(session_id, student_id, type, value, ts) "
+        "VALUES(?,?,?,?,?)",
+        (
+            session_id,
+            sid,
+            "sighting",
+            json.dumps(value),
+            datetime.fromtimestamp(ts, tz=timezone.utc).isoformat(),
+        ),
+    )
+
+    try:
+        mark_attendance_if_needed(
+            conn, session_id, sid, now_iso()
+        )
+    except Exception as e:
+        print("[attendance] mark failed:", e, file=sys.stderr)
+
+    conn.commit(); conn.close()
+
+    update_live(
+        session_id, sid, name, "sighting", value,
+        datetime.fromtimestamp(ts, tz=timezone.utc).isoformat(), ts,
+        class_id=course_id,
+    )
+
+    return jsonify({"ok": True})
+
+# -------------------- API: Seen --------------------
+@bp.get("/api/seen")
+def api_seen():
+    """Return a flat list for the dashboard."""
+    course = request.args.get("course_id", "CS101")
+    rows = []
+    for (course_id, name), v in SEEN.items():
+        if course_id != course:
+            continue
+        rows.append(
+            {
+                "name": name,
+                "camera_id": v.get("camera_id"),
+                "score": round(float(v.get("score", 0.0)), 3),
+                "count": int(v.get("count", 0)),
+                "first_seen": v.get("first_seen"),
+                "last_seen": v.get("last_seen"),
+            }
+        )
+    rows.sort(key=lambda r: r["last_seen"], reverse=True)
+    return jsonify({"ok": True, "rows": rows})
+
+@bp.post("/api/reset_seen")
+def api_reset_seen():
+    """Clear memory (handy for testing)."""
+    SEEN.clear()
+    return jsonify({"ok": True})
+
+# -------------------- API: Events --------------------
+@bp.get("/api/events")
+def recent_events():
+    """
+    Query params:
+      limit=1000
+      student_id=S001
+      session_id=5
+      type=awake
+      since_minutes=10
+    """
+    limit = int(request.args.get("limit", 100))
+    student_id = request.args.get("student_id")
+    session_id = request.args.get("session_id")
+    etype = request.args.get("type")
+    since_minutes = request.args.get("since_minutes")
+
+    q = "SELECT id, session_id, student_id, type, value, ts FROM events WHERE 1=1"
+    args = []
+
+    if student_id:
+        q += " AND student_id=?"; args.append(student_id)
+    if session_id:
+        q += " AND session_id=?"; args.append(session_id)
+    if etype:
+        q += " AND type=?"; args.append(etype)
+    if since_minutes:
+        try:
+            mins = int(since_minutes)
+            cutoff = (
+                datetime.now(timezone.utc) - timedelta(minutes=mins)
+            ).isoformat()
+            q += " AND ts >= ?"; args.append(cutoff)
+        except Exception:
+            pass
+
+    q += " ORDER BY id DESC LIMIT ?"
+    args.append(limit)
+
+    conn = connect(); cur = conn.cursor()
+    rows = cur.execute(q, args).fetchall()
+    conn.close()
+
+    out = []
+    for r in rows:
+        try:
+            val = json.loads(r["value"]) if r["value"] else None
+        except Exception:
+            val = None
+        out.append(
+            {
+                "id": r["id"],
+                "session_id": r["session_id"],
+                "student_id": r["student_id"],
+                "type": r["type"],
+                "value": val,
+                "ts": r["ts"],
+            }
+        )
+    return jsonify({"ok": True, "events": out})
+
+def _ingest_event(cur, data, lookups):
+    """
+    Validate + store one extension/vision event on an open cursor.
+    Returns (body, status, live); live holds update_live() args (after commit).
+    lookups caches session/enrollment rows across a bulk batch.
+    """
+    required = ["course_id", "camera_id", "name", "ts"]
+    missing = [k for k in required if k not in data]
+    if missing:
+        return {"ok": False, "error": f"missing fields: {', '.join(missing)}"}, 400, None
+
+    # Malformed fields are this event's 400, never an exception: in a bulk batch
+    # an exception is a 5xx, which the poster retries forever
+    try:
+        course_id    = str(data.get("course_id") or "").strip()
+        student_id   = str(data.get("student_id") or "").strip()
+        display_name = str(data.get("name") or "").strip()
+        is_lecturer  = bool(data.get("is_lecturer"))
+
+        state        = str(data.get("state") or "").strip() or None
+        state_score  = float(data.get("state_score", 0.0) or 0.0)
+        score        = float(data.get("score", 0.0) or 0.0)
+        bbox         = data.get("bbox") or {}
+        bbox_xywh    = {k: int(bbox.get(k, 0)) for k in ("x", "y", "w", "h")}
+        ts_epoch     = float(data.get("ts", time.time()))
+        ts_iso       = datetime.fromtimestamp(ts_epoch, tz=timezone.utc).isoformat()
+        raw_type     = str(data.get("type") or "").strip().lower()
+    except (TypeError, ValueError, AttributeError, OverflowError, OSError):
+        return {"ok": False, "error": "invalid_field"}, 400, None
+
+    # Ignore unknown face labels
+    if not student_id and (
+        display_name.upper() == "UNKNOWN"
+        or display_name.lower().startswith("unknown")
+    ):
+        return {"ok": True, "ignored": "unknown"}, 200, None
+
+    # Student events MUST include student_id
+    if not is_lecturer and not student_id:
+        return {"ok": False, "error": "student_id_required"}, 400, None
+
+    # Lecturer can omit student_id
+    if is_lecturer and not student_id:
+        student_id = "LECTURER"
+
+    # Decide events.type
+    if raw_type:
+        etype = raw_type
+    elif state:
+        etype = "drowsy" if state.lower() == "drowsy" else "awake"
+    else:
+        etype = "sighting"
+
+    value = {
+        "score": score,
+        "state": state,
+        "state_score": state_score,
+        "camera_id": data.get("camera_id"),
+        "bbox": bbox_xywh,
+        "name": display_name,
+        "raw_type": raw_type,
+        "raw_value": data.get("value"),
+        "is_lecturer": is_lecturer,
+    }
+
+    # --- Session handling ---
+    session_id = data.get("session_id")
+    try:
+        session_id = int(session_id) if session_id is not None else None
+    except Exception:
+        session_id = None
+    if session_id is not None and not 0 < session_id < 2 ** 31:
+        return {"ok": False, "error": "invalid_session_id"}, 400, None
+
+    sessions = lookups.setdefault("sessions", {})
+    if session_id is not None:
+        key = ("id", session_id)
+        if key not in sessions:
+            srow = cur.execute(
+                "SELECT id, class_id FROM sessions WHERE id=?",
+                (session_id,),
+            ).fetchone()
+            sessions[key] = (srow["class_id"] or "") if srow else None
+
+        if sessions[key] is None:
+            return {"ok": False, "error": "invalid_session_id"}, 400, None
+
+        if sessions[key] != course_id:
+            return {"ok": False, "error": "session_course_mismatch"}, 400, None
+
+    else:
+        key = ("open", course_id)
+        if key not in sessions:
+            # Find latest open session for THIS class
+            srow = cur.execute(
+                "SELECT id FROM sessions WHERE end_ts IS NULL AND class_id=? "
+                "ORDER BY start_ts DESC LIMIT 1",
+                (course_id,),
+            ).fetchone()
+
+            # None: create one (safe fallback), but only once the event is accepted
+            sessions[key] = srow["id"] if srow else None
+        session_id = sessions[key]
+
+    # --- Enrollment guard ---
+    if not is_lecturer:
+        enrolled_cache = lookups.setdefault("enrolled", {})
+        ekey = (course_id, student_id)
+        if ekey not in enrolled_cache:
+            enrolled_cache[ekey] = cur.execute(
+                "SELECT 1 FROM enrollments WHERE class_id=? AND student_id=? LIMIT 1",
+                (course_id, student_id),
+            ).fetchone() is not None
+
+        if not enrolled_cache[ekey]:
+            return {"ok": False, "error": "student_not_enrolled"}, 403, None
+
+    if session_id is None:
+        cur.execute(
+            "INSERT INTO sessions(name, start_ts, class_id) VALUES(?,?,?)",
+            ("Auto Session", now_iso(), course_id),
+        )
+        session_id = sessions[("open", course_id)] = cur.lastrowid
+
+    # Update last_seen for real students
+    if not is_lecturer:
+        try:
+            cur.execute(
+                "UPDATE students SET last_seen_ts=? WHERE id=?",
+                (ts_iso, student_id),
+            )
+        except Exception:
+            pass
+
+    exec_retry(
+        cur,
+        "INSERT INTO events(session_id, student_id, type, value, ts) "
+        "VALUES(?,?,?,?,?)",
+        (session_id, student_id, etype, json.dumps(value), ts_iso),
+    )
+    event_id = cur.lastrowid
+
+    # Attendance marking only for students + only when verified
+    if not is_lecturer:
+        try:
+            if etype == "verified":
+                mark_attendance_if_needed(session_id, student_id, ts_iso)
+        except Exception as e:
+            print("[attendance] mark failed:", e, file=sys.stderr)
+
+    live = (session_id, student_id, display_name, etype, value, ts_iso, ts_epoch, course_id)
+    return {"ok": True, "event_id": event_id, "session_id": session_id}, 200, live
+
+
+@bp.post("/api/events")
+def create_event():
+    """
+    Called by extension for each detection state.
+    Payload (JSON):
+      {
+        course_id, camera_id, name, student_id?, score?,
+        state?, state_score?, bbox?, ts?, type?, value?, is_lecturer?, session_id?
+      }
+    """
+    data = request.get_json(force=True, silent=True) or {}
+
+    conn = connect()
+    cur = conn.cursor()
+    body, status, live = _ingest_event(cur, data, {})
+    if status != 200 or live is None:
+        conn.close()
+        return jsonify(body), status
+
+    conn.commit()
+    conn.close()
+
+    session_id, student_id, display_name, etype, value, ts_iso, ts_epoch, course_id = live
+    update_live(session_id, student_id, display_name, etype, value, ts_iso, ts_epoch,
+                class_id=course_id)
+
+    return jsonify(body)
+
+
+BULK_MAX_EVENTS = int(os.getenv("BULK_MAX_EVENTS", "500"))
+
+@bp.post("/api/events/bulk")
+def create_events_bulk():
+    """
+    Batched /api/events for the vision loop's background poster.
+    Payload: {"events": [<same object as POST /api/events>, ...]}
+    One connection + one commit for the batch; session/enrollment lookups
+    are cached per batch. Answers 200 with a result per event (in order);
+    a failing or malformed event gets its own 4xx result and does not
+    reject the others: each event runs under a SAVEPOINT, so a statement
+    it breaks only rolls back that event (422 event_failed). 5xx (lost
+    connection) means nothing was stored and the whole batch can be retried.
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    events = data.get("events")
+    if not isinstance(events, list):
+        return jsonify({"ok": False, "error": "events must be a list"}), 400
+    if len(events) > BULK_MAX_EVENTS:
+        return jsonify({"ok": False, "error": f"too many events (max {BULK_MAX_EVENTS})"}), 413
+
+    conn = connect()
+    if not conn:
+        return jsonify({"ok": False, "error": "Database not ready"}), 503
+    cur = conn.cursor()
+    lookups, results, lives = {}, [], []
+    try:
+        for ev in events:
+            if not isinstance(ev, dict):
+                results.append({"ok": False, "status": 400, "error": "event must be an object"})
+                continue
+            saved = {k: dict(v) for k, v in lookups.items()}
+            cur.execute("SAVEPOINT bulk_event")
+            try:
+                body, status, live = _ingest_event(cur, ev, lookups)
+            except (PgOperationalError, PgInterfaceError):
+                raise   # the connection, not this event: 5xx, the batch is retried
+            except (TypeError, ValueError, AttributeError, KeyError, PgError) as e:
+                # this event only: undo its writes (and a session it created)
+                cur.execute("ROLLBACK TO SAVEPOINT bulk_event")
+                lookups.clear()
+                lookups.update(saved)
+                if isinstance(e, PgError):
+                    print("[bulk] event failed:", e, file=sys.stderr)
+                    body, status, live = {"ok": False, "error": "event_failed"}, 422, None
+                else:   # bad data, not the DB
+                    body, status, live = {"ok": False, "error": f"invalid_event: {e}"[:200]}, 400, None
+            else:
+                cur.execute("RELEASE SAVEPOINT bulk_event")
+            results.append({**body, "status": status})
+            if live is not None:
+                lives.append(live)
+        conn.commit()
+    except Exception as e:
+        print("[bulk] batch failed:", e, file=sys.stderr)
+        return jsonify({"ok": False, "error": "batch_failed"}), 500
+    finally:
+        conn.close()
+
+    for session_id, student_id, display_name, etype, value, ts_iso, ts_epoch, course_id in lives:
+        update_live(session_id, student_id, display_name, etype, value, ts_iso, ts_epoch,
+                    class_id=course_id)
+
+    stored = sum(1 for r in results if r.get("event_id"))
+    return jsonify({"ok": True, "stored": stored, "results": results})
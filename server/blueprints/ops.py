@@ -0,0 +1,66 @@
+# server/blueprints/ops.py
+# ------------------------------------------------------------
+# Health/readiness probes, DB profile report and the DB-ready gate.
+# Registered for every role.
+# ------------------------------------------------------------
+
+from __future__ import annotations
+from flask import Blueprint, request, jsonify, session
+from server.services import db_profiler
+from server.services import warmup
+
+from server import core
+from server.core import now_iso
+
+bp = Blueprint("ops", __name__)
+
+# reachable before the DB is up (probes, metrics, assets)
+_DB_EXEMPT_PREFIXES = ("/api/health", "/metrics", "/static")
+
+@bp.before_app_request
+def _ensure_db_ready():
+    if core.DB_READY or request.path.startswith(_DB_EXEMPT_PREFIXES):
+        return
+    # Don't block the worker; just return 503 until the background init is done
+    resp = jsonify({"ok": False, "error": "Database not ready"})
+    resp.headers["Retry-After"] = "2"
+    return resp, 503
+
+# -------------------- API: Health  --------------------
+@bp.get("/api/health")
+def api_health():
+    """
+    Health-check endpoint so frontend JS can detect the API base.
+    Answers 503 while the DB or the models are warming so the load balancer waits;
+    /api/health/live is the plain liveness probe.
+    """
+    w = warmup.status()
+    if not warmup.is_ready() or not core.DB_READY:
+        return jsonify({"ok": False, "status": "warming", "db": core.DB_READY, "warmup": w, "ts": now_iso()}), 503
+    return jsonify({"ok": True, "status": "alive", "db": core.DB_READY, "warmup": w, "ts": now_iso()}), 200
+
+@bp.get("/api/health/live")
+def api_health_live():
+    return jsonify({"ok": True, "status": "alive", "ts": now_iso()}), 200
+
+# -------------------- API: DB profile (DB_PROFILE=1) --------------------
+@bp.get("/api/debug/db-profile")
+def api_db_profile():
+    """
+    Recent per-request SQL reports + top statements by total time.
+    Query params: route=/dashboard, n1=1 (only requests with N+1 hits),
+    limit=50, reset=1
+    """
+    if "user_id" not in session or session.get("role") != "admin":
+        return jsonify({"ok": False, "error": "admin only"}), 403
+    if not db_profiler.enabled():
+        return jsonify({"ok": False, "error": "profiling disabled (set DB_PROFILE=1)"}), 404
+
+    out = db_profiler.report(
+        route=request.args.get("route") or None,
+        only_n1=request.args.get("n1") == "1",
+        limit=request.args.get("limit", 50, type=int),
+    )
+    if request.args.get("reset") == "1":
+        db_profiler.reset()
+    return jsonify({"ok": True, **out})
@@ -0,0 +1,53 @@
+# server/blueprints/realtime.py
+# ------------------------------------------------------------
+# Socket.IO /events namespace: dashboards join session/class rooms
+# and receive batched deltas from BROADCAST. Role: web
+# ------------------------------------------------------------
+
+from __future__ import annotations
+from flask_socketio import emit, join_room, leave_room
+from server.services.broadcast import session_room, class_room, compact_delta
+
+from server.core import (
+    LIVE, pint, socketio,
+)
+
+# -------------------- Socket.IO --------------------
+@socketio.on("connect", namespace="/events")
+def on_connect_events():
+    emit("connected", {"ok": True})
+
+@socketio.on("join", namespace="/events")
+def on_join_room(data):
+    """
+    Dashboard subscribes to a session and/or class: {session_id?, class_id?}.
+    It gets one "snapshot" for a session, then batched "delta" messages:
+      {room, d: [{sid, n, st, s, t}, ...]}
+    """
+    if not isinstance(data, dict):
+        return
+    session_id = pint(data.get("session_id"))
+    class_id = str(data.get("class_id") or "").strip()
+    if not session_id and not class_id:
+        emit("error", {"ok": False, "error": "session_id or class_id required"})
+        return
+
+    if class_id:
+        join_room(class_room(class_id))
+    if session_id:
+        join_room(session_room(session_id))
+        emit("snapshot", {
+            "room": session_room(session_id),
+            "d": [compact_delta(e) for e in LIVE.snapshot(session_id)],
+        })
+
+@socketio.on("leave", namespace="/events")
+def on_leave_room(data):
+    if not isinstance(data, dict):
+        return
+    session_id = pint(data.get("session_id"))
+    class_id = str(data.get("class_id") or "").strip()
+    if session_id:
+        leave_room(session_room(session_id))
+    if class_id:
+        leave_room(class_room(class_id))
@@ -0,0 +1,3708 @@
+# server/blueprints/web.py
+# ------------------------------------------------------------
+# Pages, auth, admin, lecturer dashboards + analytics, summary and
+# enrollment APIs, /api/live. Role: web
+# ------------------------------------------------------------
+
+from __future__ import annotations
+import os
+import sys
+import json
+import csv
+import time
+import sqlite3
+import urllib.request
+import urllib.error
+from datetime import datetime, timezone, timedelta
+from collections import defaultdict
+from werkzeug.security import generate_password_hash, check_password_hash
+from itsdangerous import BadSignature, SignatureExpired
+from flask import (
+    Blueprint, request, jsonify, render_template, redirect, url_for, session, flash, make_response,
+)
+from flask_login import login_user, logout_user
+from server.services.live_state import LIVE_WINDOW_S
+
+from server.core import (
+    LIVE, LOCAL_TZ, RISK_LOW, RISK_MED, SECURITY_PASSWORD_SALT, SUPABASE_ANON_KEY,
+    SUPABASE_URL, User, compute_engagement_for_session, connect, get_serializer,
+    get_supabase_admin, get_supabase_anon, mint_next_student_id, now_iso, supabase_auth_post,
+    verify_class_token,
+)
+
+bp = Blueprint("web", __name__)
+
+# -------------------- Auth & Pages (unchanged) --------------------
+@bp.route("/")
+def index():
+    if "user_id" in session:
+        return redirect(url_for("web.dashboard"))
+    return redirect(url_for("web.login"))  
+
+# ===================== MAIN FUNCTION =====================
+@bp.route("/login", methods=["GET", "POST"])
+def login():
+    if request.method == "POST":
+        email = request.form.get("email", "").strip().lower()
+        password = request.form.get("password", "")
+
+        print(f"--> LOGIN ATTEMPT: {email}")
+
+        # -----------------------------------------
+        # A) TRY SUPABASE AUTH FIRST
+        # -----------------------------------------
+        status, data = supabase_auth_post(
+            "/auth/v1/token?grant_type=password",
+            {"email": email, "password": password},
+        )
+
+        # If Supabase says "YES", we trust it completely
+        if status == 200 and isinstance(data, dict) and data.get("access_token"):
+            print("--> SUPABASE AUTH OK")
+
+            conn = connect()
+            if not conn:
+                return render_template("login.html", error="Database connection failed")
+            
+            cur = conn.cursor()
+            row = cur.execute(
+                "SELECT id, name, email, role FROM users WHERE lower(email)=?",
+                (email,),
+            ).fetchone()
+
+            if not row:
+                conn.close()
+                return render_template("login.html", error="Account not provisioned. Please contact admin.")
+
+            # --- FIX: SYNC LOCAL PASSWORD ---
+            # Supabase accepted this password, so we update our local hash to match.
+            # This fixes the "Current password incorrect" error after a reset.
+            try:
+                new_hash = generate_password_hash(password)
+                cur.execute("UPDATE users SET pw_hash=? WHERE id=?", (new_hash, row["id"]))
+                conn.commit()
+                print(f"--> LOCAL DB SYNCED for {email}")
+            except Exception as e:
+                print(f"--> SYNC ERROR: {e}")
+
+            conn.close()
+
+            # Set session
+            session["user_id"] = row["id"]
+            session["role"] = row["role"] or "lecturer"
+            session["sb_access_token"] = data.get("access_token") # Save token for Change Password
+            session["sb_refresh_token"] = data.get("refresh_token")
+
+            user_obj = User(
+                id=row["id"],
+                name=row["name"],
+                email=row["email"],
+                role=row["role"]
+            )
+            login_user(user_obj)
+
+            if row["role"] == "admin":
+                return redirect(url_for("web.admin_dashboard"))
+            return redirect(url_for("web.dashboard"))
+
+        # -----------------------------------------
+        # B) FALLBACK TO LEGACY pw_hash (TEMP)
+        # -----------------------------------------
+        conn = connect()
+        if not conn:
+            return render_template("login.html", error="Database connection failed")
+
+        cur = conn.cursor()
+        row = cur.execute(
+            """
+            SELECT id, name, email, pw_hash,
+                   COALESCE(role, 'lecturer') AS role
+            FROM users
+            WHERE lower(email)=?
+            """,
+            (email,),
+        ).fetchone()
+        conn.close()
+
+        if row:
+            print(f"--> USER FOUND: {row['email']} (Role: {row['role']})")
+            if check_password_hash(row["pw_hash"], password):
+                print("--> LEGACY PASSWORD MATCH! Logging in...")
+
+                session["user_id"] = row["id"]
+                session["role"] = row["role"]
+
+                user_obj = User(
+                    id=row["id"],
+                    name=row["name"],
+                    email=row["email"],
+                    role=row["role"]
+                )
+                login_user(user_obj)
+
+                if row["role"] == "admin":
+                    return redirect(url_for("web.admin_dashboard"))
+                return redirect(url_for("web.dashboard"))
+
+            print("--> LEGACY PASSWORD INCORRECT")
+        else:
+            print("--> USER NOT FOUND")
+
+        return render_template("login.html", error="Invalid email or password")
+
+    return render_template("login.html")
+
+@bp.route("/signup", methods=["GET", "POST"])
+def signup():
+    # Keep GET logic simple
+    if request.method == "GET":
+        return render_template("signup.html")
+
+    # POST Logic
+    name = (request.form.get("name") or "").strip()
+    email = (request.form.get("email") or "").strip().lower()
+    password = request.form.get("password") or ""
+
+    if not (name and email and password):
+        return render_template("signup.html", error="Please fill in all required fields.")
+
+    try:
+        # ---------------------------------------------------------
+        # THE FIX: Create user in Supabase Auth
+        # ---------------------------------------------------------
+        res = get_supabase_anon().auth.sign_up({
+            "email": email,
+            "password": password,
+            "options": {
+                "data": {
+                    "full_name": name,
+                    "role": "lecturer",   # <--- The SQL Trigger reads this!
+                    "university": "UPM"
+                }
+            }
+        })
+
+        # If we get here without error, Supabase accepted it.
+        # The confirmation email is sent automatically by Supabase.
+        # Your SQL Trigger 'on_auth_user_created' will insert them into DB.
+        
+        return render_template("signup.html", success=True)
+             
+    except Exception as e:
+        # Handle Supabase errors (like "User already exists")
+        print(f"Signup Error: {e}")
+        error_msg = str(e)
+        if "already registered" in error_msg or "User already exists" in error_msg:
+            return render_template("signup.html", error="Email already registered.")
+        
+        return render_template("signup.html", error="Registration failed. Please try again.")
+    
+@bp.route("/forgot-password", methods=["GET", "POST"])
+def forgot_password():
+    if request.method == "POST":
+        email = (request.form.get("email") or "").strip().lower()
+
+        if not email:
+            return render_template("forgot_password.html", error="Please enter your email.")
+
+        # only send if email exists in your app table (optional)
+        conn = connect(); cur = conn.cursor()
+        row = cur.execute(
+            "SELECT id FROM users WHERE lower(email)=?",
+            (email,),
+        ).fetchone()
+        conn.close()
+
+        if row:
+            redirect_to = "https://hannbella-classync.hf.space/reset-password"
+            status, data = supabase_auth_post(
+                "/auth/v1/recover",
+                {"email": email, "redirect_to": redirect_to},
+            )
+            print("[SUPABASE RECOVER]", status, data)
+
+        msg = "If that email exists in our system, a reset link has been sent."
+        return render_template("forgot_password.html", message=msg)
+
+    return render_template("forgot_password.html")
+
+@bp.route("/reset-password/<token>", methods=["GET", "POST"])
+def reset_password(token):
+    s = get_serializer()
+    try:
+        email = s.loads(
+            token,
+            salt=SECURITY_PASSWORD_SALT,
+            max_age=3600,  # 1 hour
+        )
+    except SignatureExpired:
+        flash("The reset link has expired. Please request a new one.", "error")
+        return redirect(url_for("web.forgot_password"))
+    except BadSignature:
+        flash("Invalid reset link.", "error")
+        return redirect(url_for("web.forgot_password"))
+
+    if request.method == "POST":
+        password = request.form.get("password") or ""
+        confirm = request.form.get("confirm") or ""
+
+        if not password or not confirm:
+            error = "Please fill in both password fields."
+            return render_template("reset_password.html", error=error)
+
+        if password != confirm:
+            error = "Passwords do not match."
+            return render_template("reset_password.html", error=error)
+
+        pw_hash = generate_password_hash(password)
+
+        conn = connect(); cur = conn.cursor()
+        cur.execute(
+            "UPDATE users SET pw_hash=? WHERE lower(email)=?",
+            (pw_hash, email.lower()),
+        )
+        conn.commit()
+        conn.close()
+
+        flash("Password updated. You can now log in.", "success")
+        return redirect(url_for("web.login"))
+
+    # GET
+    return render_template("reset_password.html")
+
+@bp.route("/reset-password", methods=["GET"])
+def reset_password_page():
+    return render_template(
+        "reset_password.html",
+        SUPABASE_URL=os.getenv("SUPABASE_URL", ""),
+        SUPABASE_ANON_KEY=os.getenv("SUPABASE_ANON_KEY", ""),
+    )
+
+@bp.route("/logout")
+def logout():
+    logout_user()
+    session.clear()
+    return redirect(url_for("web.login"))
+
+# ===================== ADMIN – DASHBOARD =====================
+@bp.route("/admin")
+def admin_dashboard():
+    if "user_id" not in session or session.get("role") != "admin":
+        return redirect(url_for("web.login"))
+
+    # For now, you can reuse the same dashboard or create a new template later
+    return render_template("admin_dashboard.html")
+
+# ===================== ADMIN – CLASSES =====================
+@bp.route("/admin/classes")
+def admin_classes():
+    # Only allow logged-in admin
+    if "user_id" not in session or session.get("role") != "admin":
+        return redirect(url_for("web.login"))
+
+    conn = connect()
+    cur = conn.cursor()
+
+    # 🔹 Load classes + lecturer + department
+    rows = cur.execute(
+        """
+        SELECT
+          c.id          AS class_id,
+          c.name        AS class_name,
+          c.section     AS section,
+          c.platform_link,
+          c.location    AS class_location,
+          c.dept_id     AS dept_id,
+          u.id          AS lecturer_id,
+          u.name        AS lecturer_name,
+          u.email       AS lecturer_email,
+          d.name        AS dept_name
+        FROM classes c
+        LEFT JOIN users      u ON u.id = c.owner_user_id
+        LEFT JOIN department d ON d.id = c.dept_id
+        ORDER BY c.id
+        """
+    ).fetchall()
+
+    classes = []
+
+    for r in rows:
+        # 🔹 One schedule row per class (if exists)
+        sched = cur.execute(
+            """
+            SELECT
+              delivery_mode,
+              location,
+              day_of_week,
+              time_start,
+              time_end
+            FROM course_schedule
+            WHERE class_id = ?
+            ORDER BY id
+            LIMIT 1
+            """,
+            (r["class_id"],),
+        ).fetchone()
+
+        if sched:
+            raw_mode = sched["delivery_mode"] or "Google Meet"
+
+            # Text shown in table
+            if raw_mode == "Google Meet":
+                mode = "Online"
+            elif raw_mode == "Face to face":
+                mode = "Face to face"
+            else:
+                mode = raw_mode or "Online"
+
+            # Value to pre-select in the <select> when editing
+            if raw_mode == "Face to face":
+                ui_mode = "Physical"   # because your dropdown uses "Physical"
+            else:
+                ui_mode = "Online"
+
+            day_of_week = sched["day_of_week"]
+            time_start  = (sched["time_start"] or "")[:5] if sched["time_start"] else ""
+            time_end    = (sched["time_end"]   or "")[:5] if sched["time_end"]   else ""
+        else:
+            mode        = "Online"
+            ui_mode     = "Online"
+            day_of_week = None
+            time_start  = ""
+            time_end    = ""
+
+        # Location & link come from classes table
+        location = r["class_location"] or ""
+        link     = r["platform_link"] or ""
+
+        # Lecturer display: "Name (email)" or "-" if missing
+        if r["lecturer_name"]:
+            lecturer_display = r["lecturer_name"]
+            if r["lecturer_email"]:
+                lecturer_display += f" ({r['lecturer_email']})"
+        else:
+            lecturer_display = "-"
+
+        classes.append(
+            {
+                "course_code":  r["class_id"],
+                "course_name":  r["class_name"],
+                "group_name":   r["section"] or "",
+                "lecturer":     lecturer_display,
+                "lecturer_id":  r["lecturer_id"],
+                "mode":         mode,        # shown in table
+                "ui_mode":      ui_mode,     # used by <select> in Edit
+                "location":     location,
+                "link":         link,
+                "dept_name":    r["dept_name"] or "",
+                "dept_id":      r["dept_id"],
+                "day_of_week":  day_of_week,
+                "time_start":   time_start,
+                "time_end":     time_end,
+            }
+        )
+
+    # 🔹 Department + lecturer lists for the form dropdowns
+    dept_rows = cur.execute(
+        "SELECT id, name FROM department ORDER BY name"
+    ).fetchall()
+
+    lecturer_rows = cur.execute(
+        "SELECT id, name, email FROM users WHERE role = 'lecturer' ORDER BY name"
+    ).fetchall()
+
+    conn.close()
+
+    departments = [dict(d) for d in dept_rows]
+    lecturers   = [dict(l) for l in lecturer_rows]
+
+    return render_template(
+        "admin_classes.html",
+        classes=classes,
+        departments=departments,
+        lecturers=lecturers,
+    )
+
+@bp.route("/admin/create-class", methods=["POST"])
+def admin_create_class():
+    # Must be admin
+    if "user_id" not in session or session.get("role") != "admin":
+        return redirect(url_for("web.login"))
+
+    user_id = session["user_id"]
+
+    # ---- Read basic fields from form ----
+    course_code = (request.form.get("course_code") or "").strip()
+    course_name = (request.form.get("course_name") or "").strip()
+    group_name  = (request.form.get("group_name")  or "").strip()
+
+    # UI mode from dropdown: Online / Physical / Hybrid
+    ui_mode = (request.form.get("mode") or "Online").strip()
+
+    # Map UI mode -> DB delivery_mode
+    m = ui_mode.lower()
+    if m == "online":
+        db_mode = "Google Meet"
+    elif m in ("physical", "face to face"):
+        db_mode = "Face to face"
+    elif m == "hybrid":
+        # choose one base mode for hybrid
+        db_mode = "Google Meet"
+    else:
+        db_mode = "Google Meet"
+
+    # Location / link from form
+    online_link   = (request.form.get("platform_link") or "").strip()
+    room_location = (request.form.get("location") or "").strip()
+
+    # Lecturer dropdown; default to current admin if empty/invalid
+    lecturer_raw = (request.form.get("lecturer_id") or "").strip()
+    try:
+        lecturer_id = int(lecturer_raw) if lecturer_raw else user_id
+    except ValueError:
+        lecturer_id = user_id
+
+    # Department dropdown
+    dept_raw = request.form.get("dept_id")
+    dept_id = int(dept_raw) if dept_raw not in (None, "", "0") else None
+
+    # Day + time
+    day_raw    = (request.form.get("day_of_week") or "").strip()
+    time_start = (request.form.get("time_start")  or "").strip()
+    time_end   = (request.form.get("time_end")    or "").strip()
+
+    day_of_week = int(day_raw) if day_raw.isdigit() else None
+
+    # Edit flags from hidden inputs
+    is_edit       = (request.form.get("is_edit") or "").lower() == "yes"
+    edit_class_id = (request.form.get("edit_class_id") or "").strip()
+
+    if not course_code or not course_name:
+        flash("Please fill in both Course code and Course name.", "error")
+        return redirect(url_for("web.admin_classes"))
+
+    # For edit, we always use existing ID; for create, use typed code
+    class_id = edit_class_id if is_edit and edit_class_id else course_code
+
+    created_at = now_iso()
+    platform_link = online_link or None
+    location_text = room_location or None
+
+    conn = connect()
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+
+    # ---- Get lecturer email for owner_email ----
+    row_user = cur.execute(
+        "SELECT email FROM users WHERE id = ?",
+        (lecturer_id,),
+    ).fetchone()
+    owner_email = row_user["email"] if row_user else None
+
+    # ================== NEW: schedule conflict check ==================
+    conflict = None
+    # Only check when we have full schedule info
+    if lecturer_id and day_of_week is not None and time_start and time_end:
+        conflict = cur.execute(
+            """
+            SELECT cs.class_id,
+                   cs.day_of_week,
+                   cs.time_start,
+                   cs.time_end,
+                   c.name AS class_name
+            FROM course_schedule cs
+            JOIN classes c ON c.id = cs.class_id
+            WHERE c.owner_user_id = ?
+              AND cs.day_of_week = ?
+              AND cs.class_id != ?
+              AND NOT (
+                    ?::time <= cs.time_start::time
+                OR  ?::time >= cs.time_end::time
+              )
+            LIMIT 1
+            """,
+            (
+                lecturer_id,
+                day_of_week,
+                class_id,      # exclude the same class when editing
+                time_end,      # new end
+                time_start,    # new start
+            ),
+        ).fetchone()
+
+    if conflict:
+        # There is already another class overlapping this time
+        msg = (
+            f"Schedule conflict: lecturer already has "
+            f"{conflict['class_name']} "
+            f"({conflict['time_start']}–{conflict['time_end']}) "
+            f"on this day."
+        )
+        conn.close()
+        flash(msg, "error")
+        return redirect(url_for("web.admin_classes"))
+    # ================== END conflict check ============================
+
+    try:
+        if is_edit:
+            # ---------- UPDATE existing class ----------
+            cur.execute(
+                """
+                UPDATE classes
+                SET name = ?,
+                    section = ?,
+                    platform_link = ?,
+                    location = ?,
+                    owner_email = ?,
+                    owner_user_id = ?,
+                    dept_id = ?
+                WHERE id = ?
+                """,
+                (
+                    course_name,
+                    group_name,
+                    platform_link,
+                    location_text,
+                    owner_email,
+                    lecturer_id,
+                    dept_id,
+                    class_id,
+                ),
+            )
+        else:
+            # ---------- INSERT new class ----------
+            cur.execute(
+                """
+                INSERT INTO classes (
+                    id, name, section,
+                    platform_link, location,
+                    created_at, owner_email, owner_user_id, dept_id
+                )
+                VALUES (?,?,?,?,?,?,?,?,?)
+                """,
+                (
+                    class_id,
+                    course_name,
+                    group_name,
+                    platform_link,
+                    location_text,
+                    created_at,
+                    owner_email,
+                    lecturer_id,
+                    dept_id,
+                ),
+            )
+
+        # ---------- Upsert course_schedule ----------
+        sched = cur.execute(
+            "SELECT id FROM course_schedule WHERE class_id = ? LIMIT 1",
+            (class_id,),
+        ).fetchone()
+
+        if sched:
+            cur.execute(
+                """
+                UPDATE course_schedule
+                SET delivery_mode = ?,
+                    location      = ?,
+                    day_of_week   = ?,
+                    time_start    = ?,
+                    time_end      = ?
+                WHERE id = ?
+                """,
+                (
+                    db_mode,
+                    location_text,
+                    day_of_week,
+                    time_start or None,
+                    time_end or None,
+                    sched["id"],
+                ),
+            )
+        else:
+            cur.execute(
+                """
+                INSERT INTO course_schedule (
+                    class_id, delivery_mode, location,
+                    day_of_week, time_start, time_end
+                )
+                VALUES (?,?,?,?,?,?)
+                """,
+                (
+                    class_id,
+                    db_mode,
+                    location_text,
+                    day_of_week,
+                    time_start or None,
+                    time_end or None,
+                ),
+            )
+
+        conn.commit()
+
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        flash("A class with this course code already exists.", "error")
+
+    except sqlite3.OperationalError as e:
+        conn.rollback()
+        flash(f"Could not create/update class (DB schema mismatch): {e}", "error")
+
+    finally:
+        conn.close()
+
+    return redirect(url_for("web.admin_classes"))
+
+@bp.route("/admin/classes/<class_id>/delete", methods=["POST"])
+def admin_delete_class(class_id):
+    if "user_id" not in session or session.get("role") != "admin":
+        return redirect(url_for("web.login"))
+
+    conn = connect()
+    cur = conn.cursor()
+    try:
+        cur.execute("DELETE FROM course_schedule WHERE class_id = ?", (class_id,))
+        cur.execute("DELETE FROM classes WHERE id = ?", (class_id,))
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        if request.headers.get("X-Requested-With") == "XMLHttpRequest":
+            return jsonify({"success": False, "error": str(e)}), 500
+        flash("Could not delete class.", "error")
+        return redirect(url_for("web.admin_classes"))
+    finally:
+        conn.close()
+
+    if request.headers.get("X-Requested-With") == "XMLHttpRequest":
+        return jsonify({"success": True})
+    return redirect(url_for("web.admin_classes"))
+
+# ===================== ADMIN – USERS =====================
+@bp.route("/admin/manage-users")
+def admin_manage_users():
+    if "user_id" not in session or session.get("role") != "admin":
+        return redirect(url_for("web.login"))
+
+    conn = connect()
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+
+    rows = cur.execute(
+        """
+        SELECT
+          u.id,
+          u.name,
+          u.email,
+          u.role,
+          u.created_at,
+          u.pw_hash,
+          u.dept_id,
+          d.name         AS department_name,
+          d.faculty_name AS faculty_name
+        FROM users u
+        LEFT JOIN department d
+          ON d.dept_id = u.dept_id
+        ORDER BY u.id
+        """
+    ).fetchall()
+
+    users = []
+    for r in rows:
+        created = r["created_at"] or ""
+        if created:
+            created = str(created)[:10]
+
+        users.append(
+            {
+                "id": r["id"],
+                "name": r["name"],
+                "email": r["email"],
+                "role": (r["role"] or "lecturer").capitalize(),
+                "created_at": created,
+                "status": "Active",
+                "pw_hash": r["pw_hash"],
+                "dept_id": r["dept_id"],
+                "department_name": r["department_name"] or "-",
+                "faculty_name": r["faculty_name"] or "-",
+            }
+        )
+
+    dept_rows = cur.execute(
+        "SELECT dept_id, name, faculty_name FROM department ORDER BY name"
+    ).fetchall()
+
+    departments = [
+        {
+            "dept_id": d["dept_id"],
+            "name": d["name"],
+            "faculty_name": d["faculty_name"],
+        }
+        for d in dept_rows
+    ]
+
+    conn.close()
+
+    return render_template("admin_users.html", users=users, departments=departments)
+
+@bp.route("/admin/create-user", methods=["POST"])
+def admin_create_user():
+    # 1. Security Check: Only allow Admins
+    if "user_id" not in session or session.get("role") != "admin":
+        return redirect(url_for("web.login"))
+
+    # 2. Get Form Data
+    name     = (request.form.get("name") or "").strip()
+    email    = (request.form.get("email") or "").strip().lower()
+    role_raw = (request.form.get("role") or "lecturer").strip().lower()
+    password = request.form.get("password") or ""
+    dept_id  = request.form.get("department_id") or None
+    
+    # Normalize role
+    role = "admin" if role_raw == "admin" else "lecturer"
+
+    # Hidden fields for Edit Mode
+    is_edit       = (request.form.get("is_edit") or "").lower() == "yes"
+    edit_user_id  = (request.form.get("edit_user_id") or "").strip()
+
+    conn = connect()
+    conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+
+    # =========================================================
+    # CASE A: EDIT EXISTING USER (Keep using SQL Update)
+    # =========================================================
+    if is_edit and edit_user_id:
+        try:
+            user_id = int(edit_user_id)
+            
+            # If password is provided, we technically should update Auth too, 
+            # but for now, we just update the local DB reference or metadata.
+            # (To update Auth password, you need a separate supabase_admin.auth.admin.update_user_by_id call)
+            
+            query = """
+                UPDATE users
+                SET name = ?, email = ?, role = ?, dept_id = ?
+                WHERE id = ?
+            """
+            params = [name, email, role, dept_id, user_id]
+
+            # If you want to update the local pw_hash (optional backup)
+            if password:
+                new_hash = generate_password_hash(password)
+                query = """
+                    UPDATE users
+                    SET name = ?, email = ?, role = ?, dept_id = ?, pw_hash = ?
+                    WHERE id = ?
+                """
+                params = [name, email, role, dept_id, new_hash, user_id]
+
+            cur.execute(query, tuple(params))
+            conn.commit()
+            flash("User updated successfully.", "success")
+            
+        except Exception as e:
+            conn.rollback()
+            flash(f"Error updating user: {str(e)}", "error")
+        finally:
+            conn.close()
+
+        return redirect(url_for("web.admin_manage_users"))
+
+    # =========================================================
+    # CASE B: CREATE NEW USER (The New Logic!)
+    # =========================================================
+    
+    # Validate inputs
+    if not (name and email and password):
+        conn.close()
+        flash("Name, email, and password are required.", "error")
+        return redirect(url_for("web.admin_manage_users"))
+
+    try:
+        # ---------------------------------------------------------
+        # STEP 1: Create User in Supabase Auth
+        # ---------------------------------------------------------
+        # This call creates the user in the secure Auth system.
+        # The 'user_metadata' is crucial—it passes the role/name to the SQL Trigger.
+        user_attributes = {
+            "email": email,
+            "password": password,
+            "email_confirm": True, # Auto-confirm so they can login immediately
+            "user_metadata": {
+                "full_name": name,
+                "role": role,        # <--- Trigger reads this!
+                "university": "UPM",
+                "dept_id": dept_id
+            }
+        }
+        
+        # Call Supabase
+        response = get_supabase_admin().auth.admin.create_user(user_attributes)
+        
+        # If we get here, Supabase accepted the user.
+        # We DO NOT insert into SQL manually anymore. 
+        # The SQL Trigger 'on_auth_user_created' will handle the INSERT for us.
+        
+        flash(f"User {name} created successfully! (Role: {role})", "success")
+
+    except Exception as e:
+        # Catch Supabase errors (like "Email already registered")
+        error_msg = str(e)
+        print(f"Supabase Create Error: {error_msg}")
+        
+        if "already registered" in error_msg:
+             flash("That email is already registered.", "error")
+        else:
+             flash(f"Failed to create user: {error_msg}", "error")
+             
+    finally:
+        conn.close()
+
+    return redirect(url_for("web.admin_manage_users"))
+
+@bp.route("/admin/users/<int:user_id>/delete", methods=["POST"])
+def admin_delete_user(user_id):
+    if "user_id" not in session or session.get("role") != "admin":
+        return redirect(url_for("web.login"))
+
+    # (optional) don't allow deleting yourself
+    if user_id == session.get("user_id"):
+        if request.headers.get("X-Requested-With") == "XMLHttpRequest":
+            return jsonify({"success": False, "error": "You cannot delete your own account."}), 400
+        flash("You cannot delete your own admin account.", "error")
+        return redirect(url_for("web.admin_manage_users"))
+
+    conn = connect()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        if request.headers.get("X-Requested-With") == "XMLHttpRequest":
+            return jsonify({"success": False, "error": str(e)}), 500
+        flash("Could not delete user.", "error")
+        return redirect(url_for("web.admin_manage_users"))
+    finally:
+        conn.close()
+
+    if request.headers.get("X-Requested-With") == "XMLHttpRequest":
+        return jsonify({"success": True})
+    return redirect(url_for("web.admin_manage_users"))
+
+# ===================== ADMIN – DEPARTMENTS =====================
+@bp.route("/admin/manage-departments")
+def admin_departments():
+    """Admin page to view/add/edit departments."""
+    if "user_id" not in session or session.get("role") != "admin":
+        return redirect(url_for("web.login"))
+
+    conn = connect()
+    cur = conn.cursor()
+
+    # Load faculties for dropdown
+    faculty_rows = cur.execute(
+        """
+        SELECT id, faculty_id, name
+        FROM faculty
+        ORDER BY name
+        """
+    ).fetchall()
+
+    # Load departments with their faculty info
+    dept_rows = cur.execute(
+        """
+        SELECT
+          d.id,
+          d.dept_id,
+          d.name,
+          d.faculty_id,
+          COALESCE(d.faculty_name, f.name) AS faculty_name
+        FROM department d
+        LEFT JOIN faculty f
+          ON d.faculty_id = f.faculty_id
+        ORDER BY d.id ASC
+        """
+    ).fetchall()
+
+    conn.close()
+
+    faculties   = [dict(f) for f in faculty_rows]
+    departments = [dict(d) for d in dept_rows]
+
+    return render_template(
+        "admin_departments.html",
+        faculties=faculties,
+        departments=departments,
+    )
+
+
+@bp.route("/admin/create-department", methods=["POST"])
+def admin_create_department():
+    """Create or update a department from the admin form."""
+    if "user_id" not in session or session.get("role") != "admin":
+        return redirect(url_for("web.login"))
+
+    # Fields from form
+    dept_id    = (request.form.get("dept_id") or "").strip()
+    name       = (request.form.get("name") or "").strip()
+    faculty_id = (request.form.get("faculty_id") or "").strip()
+
+    # Hidden flags for edit mode
+    is_edit = (request.form.get("is_edit") or "").lower() == "yes"
+    edit_id = (request.form.get("edit_department_id") or "").strip()
+
+    if not dept_id or not name or not faculty_id:
+        flash("Department code, name and faculty are required.", "error")
+        return redirect(url_for("web.admin_departments"))
+
+    conn = connect()
+    cur = conn.cursor()
+
+    try:
+        # Resolve faculty_name from faculty table (if available)
+        row = cur.execute(
+            "SELECT name FROM faculty WHERE faculty_id = ?",
+            (faculty_id,),
+        ).fetchone()
+        faculty_name = row["name"] if row else None
+
+        if is_edit and edit_id:
+            # Update existing department
+            cur.execute(
+                """
+                UPDATE department
+                SET dept_id = ?, name = ?, faculty_id = ?, faculty_name = ?
+                WHERE id = ?
+                """,
+                (dept_id, name, faculty_id, faculty_name, edit_id),
+            )
+        else:
+            # Insert new department
+            cur.execute(
+                """
+                INSERT INTO department (dept_id, name, faculty_id, faculty_name)
+                VALUES (?, ?, ?, ?)
+                """,
+                (dept_id, name, faculty_id, faculty_name),
+            )
+
+        conn.commit()
+        flash("Department saved successfully.", "success")
+    except sqlite3.IntegrityError as e:
+        conn.rollback()
+        # Likely UNIQUE constraint on dept_id
+        flash(f"Could not save department (maybe code already used?): {e}", "error")
+    except sqlite3.Error as e:
+        conn.rollback()
+        flash(f"Database error while saving department: {e}", "error")
+    finally:
+        conn.close()
+
+    return redirect(url_for("web.admin_departments"))
+
+@bp.route("/admin/departments/<int:dept_pk>/delete", methods=["POST"])
+def admin_delete_department(dept_pk):
+    """Delete a department (if not used by any class)."""
+    if "user_id" not in session or session.get("role") != "admin":
+        return redirect(url_for("web.login"))
+
+    conn = connect()
+    cur = conn.cursor()
+
+    try:
+        # Check if any class still uses this department
+        row = cur.execute(
+            "SELECT COUNT(*) AS cnt FROM classes WHERE dept_id = ?",
+            (dept_pk,),
+        ).fetchone()
+        in_use = row["cnt"] if row else 0
+
+        if in_use:
+            msg = "Cannot delete department because some classes are linked to it."
+            if request.headers.get("X-Requested-With") == "XMLHttpRequest":
+                return jsonify({"success": False, "error": msg}), 400
+            flash(msg, "error")
+            return redirect(url_for("web.admin_departments"))
+
+        cur.execute("DELETE FROM department WHERE id = ?", (dept_pk,))
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        if request.headers.get("X-Requested-With") == "XMLHttpRequest":
+            return jsonify({"success": False, "error": str(e)}), 500
+        flash("Could not delete department.", "error")
+        return redirect(url_for("web.admin_departments"))
+    finally:
+        conn.close()
+
+    if request.headers.get("X-Requested-With") == "XMLHttpRequest":
+        return jsonify({"success": True})
+    return redirect(url_for("web.admin_departments"))
+
+# ===================== ADMIN – FACULTIES =====================
+@bp.route("/admin/faculties")
+def admin_faculties():
+    """Admin page to view/add/edit faculties."""
+    if "user_id" not in session or session.get("role") != "admin":
+        return redirect(url_for("web.login"))
+
+    conn = connect()
+    cur = conn.cursor()
+
+    # Load all faculties
+    fac_rows = cur.execute(
+        """
+        SELECT id, faculty_id, name
+        FROM faculty
+        ORDER BY id ASC
+        """
+    ).fetchall()
+
+    conn.close()
+
+    faculties = [dict(f) for f in fac_rows]
+
+    return render_template(
+        "admin_faculties.html",
+        faculties=faculties,
+    )
+
+@bp.route("/admin/create-faculty", methods=["POST"])
+def admin_create_faculty():
+    """Create or update a faculty from the admin form."""
+    if "user_id" not in session or session.get("role") != "admin":
+        return redirect(url_for("web.login"))
+
+    faculty_code = (request.form.get("faculty_id") or "").strip()
+    name         = (request.form.get("name") or "").strip()
+
+    is_edit   = (request.form.get("is_edit") or "").lower() == "yes"
+    edit_id   = (request.form.get("edit_faculty_id") or "").strip()
+
+    if not faculty_code or not name:
+        flash("Faculty code and name are required.", "error")
+        return redirect(url_for("web.admin_faculties"))
+
+    conn = connect()
+    cur = conn.cursor()
+
+    try:
+        if is_edit and edit_id:
+            # Update existing faculty
+            cur.execute(
+                """
+                UPDATE faculty
+                SET faculty_id = ?, name = ?
+                WHERE id = ?
+                """,
+                (faculty_code, name, edit_id),
+            )
+        else:
+            # Insert new faculty
+            cur.execute(
+                """
+                INSERT INTO faculty (faculty_id, name)
+                VALUES (?, ?)
+                """,
+                (faculty_code, name),
+            )
+
+        conn.commit()
+        flash("Faculty saved successfully.", "success")
+
+    except sqlite3.IntegrityError as e:
+        conn.rollback()
+        # Probably UNIQUE constraint on faculty_id
+        flash(f"Could not save faculty (maybe code already used?): {e}", "error")
+    except sqlite3.Error as e:
+        conn.rollback()
+        flash(f"Database error while saving faculty: {e}", "error")
+    finally:
+        conn.close()
+
+    return redirect(url_for("web.admin_faculties"))
+
+@bp.route("/admin/faculties/<int:faculty_pk>/delete", methods=["POST"])
+def admin_delete_faculty(faculty_pk):
+    """Delete a faculty, only if no departments use it."""
+    if "user_id" not in session or session.get("role") != "admin":
+        return redirect(url_for("web.login"))
+
+    conn = connect()
+    cur = conn.cursor()
+
+    try:
+        # First get faculty_id code for this PK
+        row_fac = cur.execute(
+            "SELECT faculty_id FROM faculty WHERE id = ?",
+            (faculty_pk,),
+        ).fetchone()
+
+        if not row_fac:
+            msg = "Faculty not found."
+            if request.headers.get("X-Requested-With") == "XMLHttpRequest":
+                return jsonify({"success": False, "error": msg}), 404
+            flash(msg, "error")
+            return redirect(url_for("web.admin_faculties"))
+
+        faculty_code = row_fac["faculty_id"]
+
+        # Check whether any department still uses this faculty_id
+        row = cur.execute(
+            "SELECT COUNT(*) AS cnt FROM department WHERE faculty_id = ?",
+            (faculty_code,),
+        ).fetchone()
+        in_use = row["cnt"] if row else 0
+
+        if in_use:
+            msg = "Cannot delete faculty because some departments are linked to it."
+            if request.headers.get("X-Requested-With") == "XMLHttpRequest":
+                return jsonify({"success": False, "error": msg}), 400
+            flash(msg, "error")
+            return redirect(url_for("web.admin_faculties"))
+
+        # Safe to delete
+        cur.execute("DELETE FROM faculty WHERE id = ?", (faculty_pk,))
+        conn.commit()
+
+    except sqlite3.Error as e:
+        conn.rollback()
+        if request.headers.get("X-Requested-With") == "XMLHttpRequest":
+            return jsonify({"success": False, "error": str(e)}), 500
+        flash("Could not delete faculty.", "error")
+        return redirect(url_for("web.admin_faculties"))
+    finally:
+        conn.close()
+
+    if request.headers.get("X-Requested-With") == "XMLHttpRequest":
+        return jsonify({"success": True})
+
+    return redirect(url_for("web.admin_faculties"))
+
+# ===================== LECTURER – DASHBOARD SECTION =====================
+@bp.route("/dashboard")
+def dashboard():
+    if "user_id" not in session:
+        return redirect(url_for("web.login"))
+    user_id = session["user_id"]
+
+    # --- ADD THESE DEFAULTS TO PREVENT CRASH ---
+    overview = {"avg_engagement": 0, "camera_on": 0, "absent_rate": 0, "at_risk": 0}
+    trend = {
+        "avg": {"dir": "flat", "delta": 0, "text": "No data"},
+        "camera": {"dir": "flat", "delta": 0, "text": "No data"},
+        "absent": {"dir": "flat", "delta": 0, "text": "No data"},
+        "risk": {"dir": "flat", "delta": 0, "text": "No data"}
+    }
+
+    conn = connect(); cur = conn.cursor()
+
+    # --- Recent classes for the table ---
+    classes = cur.execute(
+        """
+        SELECT id, name, platform_link, created_at
+        FROM classes
+        WHERE owner_user_id = ?
+        ORDER BY created_at DESC
+        """,
+        (user_id,),
+    ).fetchall()
+
+    # --- Alerts for the Alerts card ---
+    alerts = cur.execute(
+        """
+        SELECT level, course, message, note, created_at
+        FROM alerts
+        WHERE lecturer_id = ?
+        ORDER BY created_at DESC
+        LIMIT 5
+        """,
+        (user_id,),
+    ).fetchall()
+
+    # --- Notifications for the bell panel ---
+    notifications = cur.execute(
+        """
+        SELECT message, level, created_at
+        FROM notifications
+        WHERE lecturer_id = ?
+        ORDER BY created_at DESC
+        LIMIT 10
+        """,
+        (user_id,),
+    ).fetchall()
+
+    # NEW CODE (Correct - gets only this lecturer's students):
+    rows = cur.execute(
+        """
+        SELECT a.status, COUNT(*) AS cnt
+        FROM attendance a
+        JOIN sessions s ON a.session_id = s.id
+        JOIN classes c ON s.class_id = c.id
+        WHERE c.owner_user_id = ?
+        GROUP BY a.status
+        """,
+        (user_id,)
+    ).fetchall()
+
+    attendance_data = {"present": 0, "absent": 0, "late": 0}
+    total = sum(r["cnt"] for r in rows)
+
+    if total > 0:
+        for r in rows:
+            key = (r["status"] or "").lower()
+            if key in attendance_data:
+                attendance_data[key] = round(r["cnt"] * 100.0 / total)
+
+    # --- Average engagement by course (use engagement_summary) ---
+    rows_ce = cur.execute(
+        """
+        SELECT 
+          c.id AS class_id,
+          c.name AS class_name,
+          e.student_id,
+          AVG(es.engagement_score) as avg_score
+        FROM classes c
+        JOIN enrollments e ON c.id = e.class_id
+        LEFT JOIN engagement_summary es 
+               ON e.class_id = es.class_id 
+              AND e.student_id = es.student_id
+        WHERE c.owner_user_id = ?
+        GROUP BY c.id, c.name, e.student_id
+        ORDER BY c.id
+        """,
+        (user_id,),
+    ).fetchall()
+
+    # --- Python Logic using rows_ce ---
+    from collections import defaultdict
+    class_map = {} 
+    class_scores = defaultdict(list)
+
+    # Loop through rows_ce
+    for r in rows_ce:
+        cid = r["class_id"]
+        class_map[cid] = r["class_name"]
+        
+        # If avg_score is None (student never attended), treat as 0.0
+        val = float(r["avg_score"]) if r["avg_score"] is not None else 0.0
+        class_scores[cid].append(val)
+
+    course_engagement = []
+    for cid, scores_list in class_scores.items():
+        # Calculate Class Average
+        if len(scores_list) > 0:
+            final_avg = sum(scores_list) / len(scores_list)
+        else:
+            final_avg = 0.0
+            
+        course_engagement.append({
+            "id": cid,
+            "name": class_map[cid],
+            "percent": int(round(final_avg))
+        })
+
+    # Sort nicely
+    course_engagement.sort(key=lambda x: x["id"])
+    
+    # ---- Engagement Overview KPIs + week-to-week trend ----
+    from datetime import datetime, timezone, timedelta
+
+    now = datetime.now(timezone.utc)
+    this_start = (now - timedelta(days=7)).isoformat()
+    last_start_dt = now - timedelta(days=14)
+    last_start = last_start_dt.isoformat()
+    last_end = this_start
+
+    def _delta(curr, prev):
+        """Return (diff, direction: 'up'/'down'/'flat')."""
+        curr = float(curr or 0.0)
+        prev = float(prev or 0.0)
+        if prev == 0:
+            return 0.0, "flat"
+        diff = curr - prev
+        if diff > 0:
+            return diff, "up"
+        if diff < 0:
+            return diff, "down"
+        return 0.0, "flat"
+
+    # 1) Avg engagement (this week vs last week)
+    row_this = cur.execute(
+        """
+        SELECT AVG(es.engagement_score) AS avg_eng
+        FROM engagement_summary es
+        JOIN classes c ON es.class_id = c.id
+        WHERE c.owner_user_id = ?
+        AND es.created_at >= ?
+        """,
+        (user_id, this_start),
+    ).fetchone()
+    row_last = cur.execute(
+        """
+        SELECT AVG(es.engagement_score) AS avg_eng
+        FROM engagement_summary es
+        JOIN classes c ON es.class_id = c.id
+        WHERE c.owner_user_id = ?
+        AND es.created_at >= ? AND es.created_at < ?
+        """,
+        (user_id, last_start, this_start),
+    ).fetchone()
+
+    avg_this = float(row_this["avg_eng"] or 0.0)
+    avg_last = float(row_last["avg_eng"] or 0.0)
+    d_avg, dir_avg = _delta(avg_this, avg_last)
+
+    # 2) Camera on (% with at least one awake/drowsy event)
+    row_cam_this = cur.execute(
+        """
+        SELECT
+        SUM(CASE WHEN (es.awake_count + es.drowsy_count) > 0 THEN 1 ELSE 0 END) AS with_face,
+        COUNT(*) AS total_rows
+        FROM engagement_summary es
+        JOIN classes c ON es.class_id = c.id
+        WHERE c.owner_user_id = ?
+        AND es.created_at >= ?
+        """,
+        (user_id, this_start),
+    ).fetchone()
+    row_cam_last = cur.execute(
+        """
+        SELECT
+        SUM(CASE WHEN (es.awake_count + es.drowsy_count) > 0 THEN 1 ELSE 0 END) AS with_face,
+        COUNT(*) AS total_rows
+        FROM engagement_summary es
+        JOIN classes c ON es.class_id = c.id
+        WHERE c.owner_user_id = ?
+        AND es.created_at >= ? AND es.created_at < ?
+        """,
+        (user_id, last_start, this_start),
+    ).fetchone()
+
+    cam_this = (
+        100.0 * row_cam_this["with_face"] / row_cam_this["total_rows"]
+        if row_cam_this["total_rows"] else 0.0
+    )
+    cam_last = (
+        100.0 * row_cam_last["with_face"] / row_cam_last["total_rows"]
+        if row_cam_last["total_rows"] else 0.0
+    )
+    d_cam, dir_cam = _delta(cam_this, cam_last)
+
+    # 3) Absent rate (attendance, by sessions in last 7 days)
+    row_abs_this = cur.execute(
+        """
+        SELECT
+        SUM(CASE WHEN a.status='absent' THEN 1 ELSE 0 END) AS absent_cnt,
+        COUNT(*) AS total_cnt
+        FROM attendance a
+        JOIN sessions s ON a.session_id = s.id
+        JOIN classes  c ON s.class_id = c.id
+        WHERE c.owner_user_id = ?
+        AND s.start_ts >= ?
+        """,
+        (user_id, this_start),
+    ).fetchone()
+    row_abs_last = cur.execute(
+        """
+        SELECT
+        SUM(CASE WHEN a.status='absent' THEN 1 ELSE 0 END) AS absent_cnt,
+        COUNT(*) AS total_cnt
+        FROM attendance a
+        JOIN sessions s ON a.session_id = s.id
+        JOIN classes  c ON s.class_id = c.id
+        WHERE c.owner_user_id = ?
+        AND s.start_ts >= ? AND s.start_ts < ?
+        """,
+        (user_id, last_start, this_start),
+    ).fetchone()
+
+    abs_this = (
+        100.0 * row_abs_this["absent_cnt"] / row_abs_this["total_cnt"]
+        if row_abs_this["total_cnt"] else 0.0
+    )
+    abs_last = (
+        100.0 * row_abs_last["absent_cnt"] / row_abs_last["total_cnt"]
+        if row_abs_last["total_cnt"] else 0.0
+    )
+    d_abs, dir_abs = _delta(abs_this, abs_last)
+
+    # 4) At-risk students (FIX: Attendance < 80%)
+    # New logic: Checks if (Present + Late) / Total Sessions < 0.8
+
+    # --- A. THIS WEEK (Recent 7 Days) ---
+    rows_risk_this = cur.execute(
+        """
+        SELECT student_id
+        FROM attendance a
+        JOIN sessions s ON a.session_id = s.id
+        JOIN classes c ON s.class_id = c.id
+        WHERE c.owner_user_id = ?
+        AND s.start_ts >= ?
+        GROUP BY student_id
+        HAVING (SUM(CASE WHEN a.status IN ('present', 'late') THEN 1.0 ELSE 0.0 END) / COUNT(*)) < 0.8
+        """,
+        (user_id, this_start),
+    ).fetchall()
+    risk_this = len(rows_risk_this)
+
+    # --- B. LAST WEEK (Previous 7 Days) ---
+    rows_risk_last = cur.execute(
+        """
+        SELECT student_id
+        FROM attendance a
+        JOIN sessions s ON a.session_id = s.id
+        JOIN classes c ON s.class_id = c.id
+        WHERE c.owner_user_id = ?
+        AND s.start_ts >= ? AND s.start_ts < ?
+        GROUP BY student_id
+        HAVING (SUM(CASE WHEN a.status IN ('present', 'late') THEN 1.0 ELSE 0.0 END) / COUNT(*)) < 0.8
+        """,
+        (user_id, last_start, this_start),
+    ).fetchall()
+    risk_last = len(rows_risk_last)
+
+    # Calculate the trend arrow
+    d_risk, dir_risk = _delta(risk_this, risk_last)
+
+    # Main values shown in big text (this week)
+    overview = {
+        "avg_engagement": int(round(avg_this)),
+        "camera_on": int(round(cam_this)),
+        "absent_rate": int(round(abs_this)),
+        "at_risk": int(round(risk_this)),
+    }
+
+    # Trend info just for the green/red text + arrow
+    trend = {
+        "avg": {
+            "dir": dir_avg,
+            "delta": round(d_avg, 1),
+            "text": (
+                f"{d_avg:+.1f}% vs last week"
+                if dir_avg != "flat" else "No change vs last week"
+            ),
+        },
+        "camera": {
+            "dir": dir_cam,
+            "delta": round(d_cam, 1),
+            "text": (
+                f"{d_cam:+.1f}% vs last week"
+                if dir_cam != "flat" else "No change vs last week"
+            ),
+        },
+        "absent": {
+            "dir": dir_abs,
+            "delta": round(d_abs, 1),
+            "text": (
+                f"{d_abs:+.1f}% vs last week"
+                if dir_abs != "flat" else "No change vs last week"
+            ),
+        },
+        "risk": {
+            "dir": dir_risk,
+            "delta": round(d_risk, 1),
+            "text": (
+                f"{d_risk:+.1f} vs last week"
+                if dir_risk != "flat" else "No change vs last week"
+            ),
+        },
+    }
+    
+    # ----- Weekly schedule for calendar (from course_schedule) -----
+    rows_sched = cur.execute(
+        """
+        SELECT
+          cs.day_of_week,
+          cs.time_start,
+          cs.time_end,
+          cs.location,
+          cs.delivery_mode,
+          cs.class_id,
+          c.name AS class_name
+        FROM course_schedule cs
+        JOIN classes c ON cs.class_id = c.id
+        WHERE c.owner_user_id = ?
+        ORDER BY cs.day_of_week, cs.time_start
+        """,
+        (user_id,),
+    ).fetchall()
+
+    schedule_by_day = {}
+    for r in rows_sched:
+        day_key = str(r["day_of_week"])        # "1".."7"
+        t_start = (r["time_start"] or "")[:5]  # "HH:MM"
+        t_end   = (r["time_end"] or "")[:5]
+
+        schedule_by_day.setdefault(day_key, []).append(
+            {
+                "class_id": r["class_id"],
+                "class_name": r["class_name"] or r["class_id"],
+                "time_start": t_start,
+                "time_end": t_end,
+                "location": r["location"] or "",
+                "delivery_mode": r["delivery_mode"] or "",
+            }
+        )
+
+
+    conn.close()
+    # Pass both classes + alerts to the template
+    return render_template(
+        "dashboard_main.html",
+        classes=classes,
+        alerts=alerts,
+        notifications=notifications,
+        attendance_data=attendance_data,
+        course_engagement=course_engagement,
+        overview=overview,
+        trend=trend,
+        schedule_by_day=schedule_by_day
+    )
+
+@bp.post("/api/alerts/clear")
+def api_alerts_clear():
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+
+    user_id = session["user_id"]
+
+    conn = connect()
+    cur = conn.cursor()
+    # Delete all alerts for this lecturer
+    cur.execute("DELETE FROM alerts WHERE lecturer_id=?", (user_id,))
+    conn.commit()
+    conn.close()
+
+    return jsonify({"ok": True})
+
+# ===================== LECTURER – ANALYSIS SECTION =====================
+@bp.route("/lecturer/analysis")
+def lecturer_analysis():
+    if "user_id" not in session:
+        return redirect(url_for("web.login"))
+    
+    user_id = session["user_id"]
+    conn = connect()
+    cur = conn.cursor()
+
+    # ✅ FETCH NOTIFICATIONS (This was missing!)
+    notifications = cur.execute(
+        """
+        SELECT message, level, created_at
+        FROM notifications
+        WHERE lecturer_id = ?
+        ORDER BY created_at DESC
+        LIMIT 10
+        """,
+        (user_id,),
+    ).fetchall()
+
+    conn.close()
+
+    # ✅ Pass notifications to the template
+    return render_template("lecturer_analysis.html", notifications=notifications)
+
+# ===================== LECTURER – SETTINGS SECTION =====================
+@bp.route("/lecturer/settings", methods=["GET", "POST"])
+def lecturer_settings():
+    if not session.get("user_id"):
+        return redirect(url_for("web.login"))
+
+    user_id = session["user_id"]
+
+    conn = connect()
+    cur = conn.cursor()
+
+    # ---------- POST: Save department + name ----------
+    if request.method == "POST":
+        name = request.form.get("name", "").strip()
+        dept_id = request.form.get("dept_id")
+
+        cur.execute("""
+            UPDATE users
+            SET name = ?, dept_id = ?
+            WHERE id = ?
+        """, (name, dept_id, user_id))
+
+        conn.commit()
+        conn.close()
+        return redirect(url_for("web.lecturer_settings"))
+
+    # ---------- GET: Load notifications ----------
+    notifications = cur.execute("""
+        SELECT type, message, level, created_at
+        FROM notifications
+        WHERE lecturer_id = ?
+        ORDER BY created_at DESC
+        LIMIT 10
+    """, (user_id,)).fetchall()
+
+    # ---------- GET: Load departments ----------
+    departments = cur.execute("""
+        SELECT dept_id, name, faculty_name
+        FROM department
+        ORDER BY faculty_name, name
+    """).fetchall()
+
+    current_dept = cur.execute("""
+        SELECT dept_id FROM users WHERE id = ?
+    """, (user_id,)).fetchone()
+
+    current_dept_id = current_dept["dept_id"] if current_dept else None
+
+    conn.close()
+
+    return render_template(
+        "lecturer_settings.html",
+        notifications=notifications,
+        departments=departments,
+        current_dept_id=current_dept_id
+    )
+
+@bp.route("/lecturer/change-password", methods=["POST"])
+def lecturer_change_password():
+    if not session.get("user_id"):
+        return redirect(url_for("web.login"))
+
+    user_id = session["user_id"]
+
+    current_pw = request.form.get("current_password", "")
+    new_pw = request.form.get("new_password", "")
+    confirm_pw = request.form.get("confirm_password", "")
+
+    # --- 1. Basic Validation ---
+    if not current_pw or not new_pw or not confirm_pw:
+        flash("Please fill in all password fields.", "error")
+        return redirect(url_for("web.lecturer_settings"))
+
+    if new_pw != confirm_pw:
+        flash("New password and confirmation do not match.", "error")
+        return redirect(url_for("web.lecturer_settings"))
+
+    if len(new_pw) < 8:
+        flash("New password must be at least 8 characters.", "error")
+        return redirect(url_for("web.lecturer_settings"))
+
+    # --- 2. Verify Current Password (Local Check) ---
+    conn = connect()
+    cur = conn.cursor()
+
+    row = cur.execute("SELECT id, email, pw_hash FROM users WHERE id = ?", (user_id,)).fetchone()
+    if not row:
+        conn.close()
+        flash("User not found.", "error")
+        return redirect(url_for("web.lecturer_settings"))
+
+    # We check the hash locally first to ensure they know their current password
+    if not check_password_hash(row["pw_hash"], current_pw):
+        conn.close()
+        flash("Current password is incorrect.", "error")
+        return redirect(url_for("web.lecturer_settings"))
+
+    # --- 3. Update Password in Supabase (The Magic Step) ---
+    sb_token = session.get("sb_access_token")
+
+    if sb_token:
+        try:
+            url = f"{SUPABASE_URL}/auth/v1/user"
+            payload = json.dumps({"password": new_pw}).encode("utf-8")
+            
+            # We must use the USER'S token, not the Anon key, to update their own profile
+            req = urllib.request.Request(
+                url,
+                data=payload,
+                method="PUT",
+                headers={
+                    "apikey": SUPABASE_ANON_KEY,
+                    "Authorization": f"Bearer {sb_token}",
+                    "Content-Type": "application/json",
+                },
+            )
+            
+            with urllib.request.urlopen(req) as resp:
+                print(f"[Supabase] Password updated for {row['email']}")
+
+        except urllib.error.HTTPError as e:
+            # If the token expired (401), we can't update Supabase
+            print(f"[Supabase] Update failed: {e.code} {e.reason}")
+            conn.close()
+            
+            if e.code == 401:
+                flash("Your session has expired. Please log out and log in again to change your password.", "error")
+            else:
+                flash("Failed to update password in cloud system.", "error")
+            
+            return redirect(url_for("web.lecturer_settings"))
+            
+        except Exception as e:
+            print(f"[Supabase] Unexpected error: {e}")
+            conn.close()
+            flash("System error while updating password.", "error")
+            return redirect(url_for("web.lecturer_settings"))
+
+    # --- 4. Update Local DB (Keep in Sync) ---
+    # Only update local if Supabase succeeded (or if we skipped it because legacy login)
+    new_hash = generate_password_hash(new_pw)
+    cur.execute("UPDATE users SET pw_hash = ? WHERE id = ?", (new_hash, user_id))
+    conn.commit()
+    conn.close()
+
+    flash("Password updated successfully.", "success")
+    return redirect(url_for("web.lecturer_settings"))
+
+@bp.route("/api/dashboard/recent-sessions")
+def api_dashboard_recent_sessions():
+    # Must be logged in
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+
+    user_id = session["user_id"]
+
+    conn = connect(); cur = conn.cursor()
+    rows = cur.execute(
+        """
+        SELECT
+          s.id          AS session_id,
+          s.start_ts    AS start_ts,
+          s.end_ts      AS end_ts,
+          s.class_id    AS class_id,
+          COALESCE(s.platform_link, c.platform_link) AS platform_link,
+          c.name        AS class_name
+        FROM sessions s
+        JOIN classes c
+          ON s.class_id = c.id
+        WHERE c.owner_user_id = ?
+        ORDER BY s.start_ts DESC
+        LIMIT 3
+        """,
+        (user_id,),
+    ).fetchall()
+    conn.close()
+
+    sessions = []
+    for idx, r in enumerate(rows, start=1):
+        sessions.append(
+            {
+                "index": idx,                         # 1., 2., 3.
+                "session_id": r["session_id"],
+                "class_id": r["class_id"],           # e.g. CSC4400
+                "class_name": r["class_name"],       # e.g. Software Testing
+                "meet_link": r["platform_link"],     # may be None
+                "start_ts": r["start_ts"],
+                "end_ts": r["end_ts"],
+            }
+        )
+
+    return jsonify({"ok": True, "sessions": sessions})
+
+@bp.post("/api/notifications/clear")
+def api_notifications_clear():
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+
+    user_id = session["user_id"]
+
+    conn = connect(); cur = conn.cursor()
+    cur.execute("DELETE FROM notifications WHERE lecturer_id=?", (user_id,))
+    conn.commit()
+    conn.close()
+
+    return jsonify({"ok": True})
+
+# ===================== LECTURER - COURSE SECTION =====================
+@bp.route("/courses")
+def courses():
+    if "user_id" not in session:
+        return redirect(url_for("web.login"))
+    user_id = session["user_id"]
+
+    conn = connect(); cur = conn.cursor()
+
+    # ✅ Pull notifications for this lecturer
+    notifications = cur.execute(
+        """
+        SELECT message, level, created_at
+        FROM notifications
+        WHERE lecturer_id = ?
+        ORDER BY created_at DESC
+        LIMIT 10
+        """,
+        (user_id,),
+    ).fetchall()
+
+    rows = cur.execute(
+        """
+        SELECT
+            c.id,              -- class code e.g. CSC4300-1
+            c.name,            -- class name
+            c.dept_id,         -- FK to department.id
+            d.name AS dept_name
+        FROM classes c
+        LEFT JOIN department d ON c.dept_id = d.id   -- 👈 important
+        WHERE c.owner_user_id = ?
+        ORDER BY c.id
+        """,
+        (user_id,),
+    ).fetchall()
+
+    conn.close()
+
+    classes = [dict(r) for r in rows]
+
+    return render_template("courses.html", 
+                           classes=classes,
+                           notifications=notifications)
+
+# ===================== LECTURER - SUMMARY PAGE =====================
+@bp.route("/join/<class_id>")
+def join_class_page(class_id):
+    """
+    Join page for students (no login).
+    We only render HTML here. Camera + identify happen in join.js.
+    """
+    token = (request.args.get("token") or "").strip()
+
+    conn = connect()
+    cur = conn.cursor()
+    row = cur.execute(
+        "SELECT id, name FROM classes WHERE id=?",
+        (class_id,),
+    ).fetchone()
+    conn.close()
+
+    if not row:
+        return "Class not found.", 404
+
+    return render_template(
+        "join.html",
+        class_id=row["id"],
+        class_name=row["name"],
+        token=token,
+    )
+
+@bp.route("/summary")
+def summary():
+    if "user_id" not in session:
+        return redirect(url_for("web.login"))
+    class_id = request.args.get("class_id")
+    user_id = session["user_id"]
+
+    conn = connect()
+    cur = conn.cursor()
+
+    # ✅ Notifications for the bell panel
+    notifications = cur.execute(
+        """
+        SELECT message, level, created_at
+        FROM notifications
+        WHERE lecturer_id = ?
+        ORDER BY created_at DESC
+        LIMIT 10
+        """,
+        (user_id,),
+    ).fetchall()
+
+    row = cur.execute("""
+        SELECT id, name, platform_link
+        FROM classes
+        WHERE id = ?
+    """, (class_id,)).fetchone()
+
+    conn.close()
+
+    class_code = row["id"] if row else "Unknown Class"
+    class_name = row["name"] if row else ""
+    lecturer_join_link = row["platform_link"] if row and row["platform_link"] else ""
+
+    return render_template(
+        "summary.html",
+        class_code=class_code,
+        class_name=class_name,
+        lecturer_join_link=lecturer_join_link,
+        notifications = notifications
+    )
+
+@bp.route("/session/<int:session_id>")
+def session_summary(session_id):
+    conn = connect(); cur = conn.cursor()
+
+    session_row = cur.execute(
+        "SELECT id, name, start_ts, end_ts FROM sessions WHERE id=?", (session_id,)
+    ).fetchone()
+
+    events = cur.execute(
+        "SELECT student_id, type, value, ts FROM events WHERE session_id=? "
+        "ORDER BY ts ASC",
+        (session_id,),
+    ).fetchall()
+
+    conn.close()
+    return render_template("summary.html", session=session_row, events=events)
+
+@bp.route("/classync-extension")
+def classync_extension_page():
+    return render_template("student_extension.html")
+
+# ===================== LECTURER – ANALYSIS DROPDOWNS =====================
+
+@bp.get("/api/lecturer/courses")
+def api_lecturer_courses():
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+
+    user_id = session["user_id"]
+
+    conn = connect(); cur = conn.cursor()
+    rows = cur.execute(
+        """
+        SELECT id AS course_id, name AS course_name
+        FROM classes
+        WHERE owner_user_id = ?
+        ORDER BY id
+        """,
+        (user_id,),
+    ).fetchall()
+    conn.close()
+
+    return jsonify({"ok": True, "courses": [dict(r) for r in rows]})
+
+@bp.get("/api/lecturer/sessions")
+def api_lecturer_sessions():
+    """
+    API for the Analysis page dropdown.
+    PATCHED: Uses calculated 'Session 1, 2, 3' instead of Database IDs.
+    """
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+
+    user_id = session["user_id"]
+    course_id = (request.args.get("course_id") or "").strip()
+
+    conn = connect()
+    cur = conn.cursor()
+
+    # Build query parameters
+    params = [user_id]
+    where_course = ""
+    if course_id:
+        where_course = " AND s.class_id = ? "
+        params.append(course_id)
+
+    # --- SQL CHANGE: Added ROW_NUMBER() with PARTITION ---
+    # PARTITION BY s.class_id ensures that if you fetch all courses,
+    # the numbering resets for each course (e.g. CS101 Session 1, CS102 Session 1)
+    cur.execute(
+        f"""
+        SELECT 
+            s.id, 
+            s.class_id, 
+            s.start_ts, 
+            s.end_ts,
+            ROW_NUMBER() OVER (
+                PARTITION BY s.class_id 
+                ORDER BY s.start_ts ASC
+            ) as session_no
+        FROM sessions s
+        JOIN classes c ON c.id = s.class_id
+        WHERE c.owner_user_id = ?
+        {where_course}
+        ORDER BY s.start_ts DESC
+        LIMIT 80
+        """,
+        tuple(params),
+    )
+    rows = cur.fetchall()
+    conn.close()
+
+    sessions_out = []
+    default_session_id = None
+    
+    for r in rows:
+        start_ts = r["start_ts"]
+        end_ts = r["end_ts"]
+        is_open = end_ts is None
+        
+        # 1. Get the calculated number
+        sess_num = r["session_no"]
+        
+        # 2. Format Date (Local Time)
+        try:
+            if isinstance(start_ts, str):
+                dt = datetime.fromisoformat(start_ts)
+            else:
+                dt = start_ts
+            
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=timezone.utc)
+            
+            dt_local = dt.astimezone(LOCAL_TZ)
+            pretty_date = dt_local.strftime("%Y-%m-%d %H:%M")
+        except Exception:
+            pretty_date = str(start_ts).replace("T", " ")[:16]
+
+        # 3. Create Label: "Session 1 – 2025-12-26"
+        label = f"Session {sess_num} – {pretty_date}"
+        
+        if is_open:
+            label += " (live)"
+
+        sessions_out.append(
+            {
+                "id": r["id"],
+                "class_id": r["class_id"],
+                "label": label,
+                "is_open": is_open,
+                "start_ts": start_ts,
+                "end_ts": end_ts,
+            }
+        )
+
+        if default_session_id is None:
+            default_session_id = r["id"]
+        if is_open:
+            default_session_id = r["id"]
+
+    return jsonify({
+        "ok": True, 
+        "sessions": sessions_out, 
+        "default_session_id": default_session_id
+    })
+
+@bp.get("/api/lecturer/analytics/kpis")
+def api_lecturer_kpis():
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+
+    user_id = session["user_id"]
+    session_id = request.args.get("session_id", type=int)
+
+    if not session_id:
+        return jsonify({"ok": False, "error": "missing_session_id"}), 400
+
+    conn = connect()
+    cur = conn.cursor()
+
+    # Ensure this session belongs to this lecturer
+    owns = cur.execute("""
+        SELECT 1
+        FROM sessions s
+        JOIN classes c ON c.id = s.class_id
+        WHERE s.id = ? AND c.owner_user_id = ?
+    """, (session_id, user_id)).fetchone()
+
+    if not owns:
+        conn.close()
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+
+    r = cur.execute("""
+        SELECT
+          AVG(es.engagement_score) AS avg_eng,
+          COUNT(DISTINCT CASE WHEN a.status IN ('present', 'late') THEN es.student_id END) AS active_students,
+          SUM(es.drowsy_count) AS drowsy_total,
+          SUM(es.tab_away_count) AS tab_total
+        FROM engagement_summary es
+        LEFT JOIN attendance a 
+               ON es.session_id = a.session_id 
+              AND es.student_id = a.student_id
+        WHERE es.session_id = ?
+    """, (session_id,)).fetchone()
+
+    conn.close()
+
+    return jsonify({
+        "ok": True,
+        "kpis": {
+            "avg_engagement": int(round(r["avg_eng"] or 0)),
+            "students_active": int(r["active_students"] or 0),
+            "drowsy_alerts": int(r["drowsy_total"] or 0),
+            "tab_switches": int(r["tab_total"] or 0),
+        }
+    })
+
+# ===================== NEW: Attendance Drop-off Timeline =====================
+@bp.get("/api/lecturer/analytics/attendance_timeline")
+def api_attendance_timeline():
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+
+    user_id = session["user_id"]
+    session_id = request.args.get("session_id", type=int)
+    bucket_s = 60 # 1-minute buckets
+
+    if not session_id:
+        return jsonify({"ok": False, "error": "missing_session_id"}), 400
+
+    conn = connect()
+    cur = conn.cursor()
+
+    # 1. Get Class ID & Check Ownership
+    row_sess = cur.execute(
+        """
+        SELECT s.class_id 
+        FROM sessions s
+        JOIN classes c ON c.id = s.class_id
+        WHERE s.id = ? AND c.owner_user_id = ?
+        """,
+        (session_id, user_id),
+    ).fetchone()
+
+    if not row_sess:
+        conn.close()
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+
+    class_id = row_sess["class_id"]
+
+    # 2. Get TOTAL Enrolled Students (The Benchmark Line)
+    row_count = cur.execute(
+        "SELECT COUNT(*) as cnt FROM enrollments WHERE class_id=?", 
+        (class_id,)
+    ).fetchone()
+    total_enrolled = row_count["cnt"] or 0
+
+    # 3. Get Active Students per Minute
+    rows = cur.execute(
+        "SELECT ts, student_id FROM events WHERE session_id = ? ORDER BY ts ASC",
+        (session_id,),
+    ).fetchall()
+    
+    conn.close()
+
+    # Group by time bucket
+    buckets = defaultdict(set)
+    for r in rows:
+        ts_iso = r["ts"] or ""
+        try:
+            dt = datetime.fromisoformat(ts_iso.replace("Z", "+00:00"))
+            epoch = int(dt.timestamp())
+            bucket_epoch = (epoch // bucket_s) * bucket_s
+            if r["student_id"]:
+                buckets[bucket_epoch].add(r["student_id"])
+        except:
+            continue
+
+    labels = []
+    active_values = []
+    enrolled_values = [] # Constant line
+
+    sorted_keys = sorted(buckets.keys())
+    if sorted_keys:
+        base = sorted_keys[0]
+        for b in sorted_keys:
+            elapsed_min = int((b - base) / 60)
+            labels.append(f"{elapsed_min}m")
+            
+            # The Data
+            active_values.append(len(buckets[b]))
+            enrolled_values.append(total_enrolled)
+
+    return jsonify({
+        "ok": True,
+        "labels": labels,
+        "active": active_values,
+        "enrolled": enrolled_values
+    })
+
+@bp.get("/api/lecturer/analytics/engagement_over_time")
+def api_lecturer_engagement_over_time():
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+
+    user_id = session["user_id"]
+
+    session_id = (request.args.get("session_id") or "").strip()
+    if not session_id.isdigit():
+        return jsonify({"ok": False, "error": "missing_session_id"}), 400
+    session_id = int(session_id)
+
+    bucket_s = request.args.get("bucket_s", default=60, type=int)
+    if bucket_s < 10 or bucket_s > 600:
+        bucket_s = 60
+
+    conn = connect()
+    cur = conn.cursor()
+
+    # Check ownership
+    owns = cur.execute(
+        """
+        SELECT 1
+        FROM sessions s
+        JOIN classes c ON c.id = s.class_id
+        WHERE s.id = ? AND c.owner_user_id = ?
+        """,
+        (session_id, user_id),
+    ).fetchone()
+
+    if not owns:
+        conn.close()
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+
+    # Get events
+    rows = cur.execute(
+        """
+        SELECT ts, value
+        FROM events
+        WHERE session_id = ?
+        ORDER BY ts ASC
+        """,
+        (session_id,),
+    ).fetchall()
+
+    conn.close()
+
+    buckets = defaultdict(list)
+
+    for r in rows:
+        ts_iso = r["ts"] or ""
+        try:
+            dt = datetime.fromisoformat(ts_iso.replace("Z", "+00:00"))
+        except Exception:
+            continue
+
+        try:
+            v = json.loads(r["value"] or "{}")
+        except Exception:
+            v = {}
+
+        # Use state_score or score
+        metric = v.get("state_score", None)
+        if metric is None:
+            metric = v.get("score", None)
+
+        try:
+            metric = float(metric)
+        except Exception:
+            continue
+
+        epoch = int(dt.timestamp())
+        bucket_epoch = (epoch // bucket_s) * bucket_s
+        buckets[bucket_epoch].append(metric)
+
+    labels = []
+    values = []
+    
+    sorted_keys = sorted(buckets.keys())
+    if not sorted_keys:
+        return jsonify({"ok": True, "bucket_s": bucket_s, "labels": [], "values": []})
+
+    base = sorted_keys[0]
+
+    for b in sorted_keys:
+        arr = buckets[b]
+        if not arr:
+            continue
+
+        avg = sum(arr) / len(arr)
+
+        # Elapsed minutes from start
+        elapsed_min = int((b - base) / 60)
+        labels.append(f"+{elapsed_min} min")
+        values.append(round(avg, 2))
+
+    return jsonify({
+        "ok": True,
+        "bucket_s": bucket_s,
+        "labels": labels,
+        "values": values,
+    })
+
+@bp.get("/api/lecturer/analytics/engagement_by_student")
+def api_lecturer_engagement_by_student():
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+
+    user_id = session["user_id"]
+    session_id = request.args.get("session_id", type=int)
+    limit = request.args.get("limit", type=int)
+
+    if not session_id:
+        return jsonify({"ok": False, "error": "missing_session_id"}), 400
+
+    conn = connect()
+    cur = conn.cursor()
+
+    owns = cur.execute(
+        """
+        SELECT 1
+        FROM sessions s
+        JOIN classes c ON c.id = s.class_id
+        WHERE s.id = ? AND c.owner_user_id = ?
+        """,
+        (session_id, user_id),
+    ).fetchone()
+
+    if not owns:
+        conn.close()
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+
+    sql = """
+        SELECT
+          COALESCE(st.name, es.student_id) AS student_label,
+          es.engagement_score AS engagement_score
+        FROM engagement_summary es
+        LEFT JOIN students st ON st.id = es.student_id
+        WHERE es.session_id = ?
+        ORDER BY es.engagement_score DESC
+    """
+    params = [session_id]
+
+    if limit and limit > 0:
+        sql += " LIMIT ?"
+        params.append(limit)
+
+    rows = cur.execute(sql, params).fetchall()
+    conn.close()
+
+    return jsonify({
+        "ok": True,
+        "labels": [r["student_label"] for r in rows],
+        "values": [int(r["engagement_score"] or 0) for r in rows]
+    })
+
+@bp.get("/api/lecturer/analytics/state_breakdown")
+def api_lecturer_state_breakdown():
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+
+    user_id = session["user_id"]
+    session_id = request.args.get("session_id", type=int)
+    if not session_id:
+        return jsonify({"ok": False, "error": "missing_session_id"}), 400
+
+    conn = connect()
+    cur = conn.cursor()
+
+    # Ensure session belongs to lecturer
+    owns = cur.execute(
+        """
+        SELECT 1
+        FROM sessions s
+        JOIN classes c ON c.id = s.class_id
+        WHERE s.id = ? AND c.owner_user_id = ?
+        """,
+        (session_id, user_id),
+    ).fetchone()
+
+    if not owns:
+        conn.close()
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+
+    # Pull events and classify into 4 buckets
+    rows = cur.execute(
+        """
+        SELECT type, value
+        FROM events
+        WHERE session_id = ?
+        ORDER BY ts ASC
+        """,
+        (session_id,),
+    ).fetchall()
+
+    conn.close()
+
+    counts = {"Attentive": 0, "Idle": 0, "Drowsy": 0, "Tab away": 0}
+
+    for r in rows:
+        etype = (r["type"] or "").lower()
+
+        try:
+            v = json.loads(r["value"] or "{}")
+        except Exception:
+            v = {}
+
+        state = (v.get("state") or "").lower()  # e.g., "awake", "drowsy", "unknown"
+
+        # Tab focus
+        if etype == "tab_away":
+            counts["Tab away"] += 1
+            continue
+
+        # Idle (from extension raw_type)
+        if etype == "idle":
+            counts["Idle"] += 1
+            continue
+
+        # Drowsy
+        if etype == "drowsy" or state == "drowsy":
+            counts["Drowsy"] += 1
+            continue
+
+        # Awake events can include Unknown state → treat Unknown as Idle
+        if etype == "awake":
+            if state == "unknown" or state == "":
+                counts["Idle"] += 1
+            else:
+                counts["Attentive"] += 1
+            continue
+
+        # Other event types are ignored
+
+    labels = ["Attentive", "Idle", "Drowsy", "Tab away"]
+    values = [counts[l] for l in labels]
+
+    return jsonify({"ok": True, "labels": labels, "values": values})
+
+@bp.get("/api/lecturer/analytics/engagement_extremes")
+def api_lecturer_engagement_extremes():
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+
+    user_id = session["user_id"]
+    session_id = request.args.get("session_id", type=int)
+    mode = request.args.get("mode", default="low")  # low | high
+
+    if not session_id:
+        return jsonify({"ok": False, "error": "missing_session_id"}), 400
+
+    conn = connect()
+    cur = conn.cursor()
+
+    owns = cur.execute(
+        """
+        SELECT 1
+        FROM sessions s
+        JOIN classes c ON c.id = s.class_id
+        WHERE s.id = ? AND c.owner_user_id = ?
+        """,
+        (session_id, user_id),
+    ).fetchone()
+
+    if not owns:
+        conn.close()
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+
+    order = "ASC" if mode == "low" else "DESC"
+
+    rows = cur.execute(
+        f"""
+        SELECT
+          COALESCE(st.name, es.student_id) AS student_label,
+          es.engagement_score
+        FROM engagement_summary es
+        LEFT JOIN students st ON st.id = es.student_id
+        WHERE es.session_id = ?
+        ORDER BY es.engagement_score {order}
+        LIMIT 5
+        """,
+        (session_id,),
+    ).fetchall()
+
+    conn.close()
+
+    return jsonify({
+        "ok": True,
+        "labels": [r["student_label"] for r in rows],
+        "values": [int(r["engagement_score"] or 0) for r in rows]
+    })
+
+# ===================== NEW: Daily Performance Trend =====================
+@bp.get("/api/lecturer/analytics/session_trend")
+def api_session_trend():
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+
+    # We need a session_id to identify the CLASS
+    current_session_id = request.args.get("session_id", type=int)
+    if not current_session_id:
+        return jsonify({"ok": False, "error": "missing_session_id"}), 400
+
+    conn = connect()
+    cur = conn.cursor()
+
+    # 1. Find class_id from the current session
+    row_cls = cur.execute("SELECT class_id FROM sessions WHERE id=?", (current_session_id,)).fetchone()
+    if not row_cls:
+        conn.close()
+        return jsonify({"ok": False, "error": "session_not_found"}), 404
+    
+    class_id = row_cls["class_id"]
+
+    # 2. Get Daily Averages for the LAST 5 DAYS
+    #    We extract just the date part (YYYY-MM-DD) from start_ts
+    #    (Assumes start_ts is stored as ISO string in 'sessions' table)
+    rows = cur.execute(
+        """
+        SELECT 
+            SUBSTRING(s.start_ts, 1, 10) as session_date, 
+            AVG(es.engagement_score) as avg_score
+        FROM sessions s
+        JOIN engagement_summary es ON s.id = es.session_id
+        WHERE s.class_id = ?
+        GROUP BY session_date
+        ORDER BY session_date DESC
+        LIMIT 5
+        """,
+        (class_id,)
+    ).fetchall()
+
+    conn.close()
+
+    # 3. Reverse to show Oldest -> Newest (Left to Right)
+    rows.reverse()
+
+    labels = []
+    values = []
+    colors = []
+
+    from datetime import datetime
+
+    for r in rows:
+        # Format Date: "2025-12-24" -> "24 Dec"
+        date_str = r["session_date"] 
+        try:
+            dt = datetime.strptime(date_str, "%Y-%m-%d")
+            pretty_date = dt.strftime("%d %b")
+        except:
+            pretty_date = date_str
+        
+        labels.append(pretty_date)
+        
+        # Value
+        score = int(round(r["avg_score"] or 0))
+        values.append(score)
+
+        # Dynamic Color
+        if score >= 75:
+            colors.append("#34d399") # Green
+        elif score >= 50:
+            colors.append("#fbbf24") # Yellow
+        else:
+            colors.append("#f87171") # Red
+
+    return jsonify({
+        "ok": True,
+        "labels": labels,
+        "values": values,
+        "colors": colors
+    })
+
+@bp.get("/api/lecturer/analytics/risk_level_breakdown")
+def api_risk_level_breakdown():
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+
+    user_id = session["user_id"]
+    session_id = request.args.get("session_id", type=int)
+    if not session_id:
+        return jsonify({"ok": False, "error": "missing_session_id"}), 400
+
+    conn = connect()
+    cur = conn.cursor()
+
+    owns = cur.execute(
+        """
+        SELECT 1
+        FROM sessions s
+        JOIN classes c ON c.id = s.class_id
+        WHERE s.id = ? AND c.owner_user_id = ?
+        """,
+        (session_id, user_id),
+    ).fetchone()
+
+    if not owns:
+        conn.close()
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+
+    rows = cur.execute(
+        """
+        SELECT engagement_score
+        FROM engagement_summary
+        WHERE session_id = ?
+        """,
+        (session_id,),
+    ).fetchall()
+
+    conn.close()
+
+    low = medium = high = 0
+
+    for r in rows:
+        score = r["engagement_score"]
+        if score is None:
+            continue
+
+        # engagement_score is 0–100
+        eng = max(0.0, min(1.0, float(score) / 100.0))
+        risk = 1.0 - eng
+
+        if risk <= RISK_LOW:
+            low += 1
+        elif risk <= RISK_MED:
+            medium += 1
+        else:
+            high += 1
+
+    return jsonify({
+        "ok": True,
+        "labels": ["Low", "Medium", "High"],
+        "values": [low, medium, high],
+        "thresholds": {
+            "low": RISK_LOW,
+            "medium": RISK_MED
+        }
+    })
+
+# -------------------- API: Join Page (Student)--------------------
+@bp.post("/api/join/<class_id>")
+def api_join_class(class_id):
+    """
+    Called by join.js when student submits the form.
+
+    Body JSON:
+      {
+        "name": "...",
+        "email": "...",
+        "token": "...",        # optional
+        "student_id": "S001"   # optional (from /api/identify)
+      }
+    """
+    data = request.get_json(silent=True) or {}
+    name = (data.get("name") or "").strip()
+    email = (data.get("email") or "").strip().lower()
+    token = (data.get("token") or request.args.get("token") or "").strip()
+    student_id = (data.get("student_id") or "").strip()
+
+    if not name or not email:
+        return jsonify(
+            {"ok": False, "error": "Please fill in your name and email."}
+        ), 400
+
+    # Optional: enforce join_token if set in DB
+    if not verify_class_token(class_id, token):
+        return jsonify(
+            {"ok": False, "error": "Invalid or expired join link."}
+        ), 403
+
+    conn = connect()
+    cur = conn.cursor()
+
+    # --- make sure class exists, get platform_link if present ---
+    try:
+        class_row = cur.execute(
+            "SELECT id, name, platform_link FROM classes WHERE id=?",
+            (class_id,),
+        ).fetchone()
+    except sqlite3.OperationalError:
+        # fallback if platform_link column doesn't exist
+        class_row = cur.execute(
+            "SELECT id, name FROM classes WHERE id=?",
+            (class_id,),
+        ).fetchone()
+        if class_row:
+            class_row = dict(class_row)
+            class_row["platform_link"] = None
+
+    if not class_row:
+        conn.close()
+        return jsonify({"ok": False, "error": "Class not found."}), 404
+
+    sid = None
+
+    # 1) If camera already gave us a student_id, trust it (if exists)
+    if student_id:
+        row = cur.execute(
+            "SELECT id FROM students WHERE id=?",
+            (student_id,),
+        ).fetchone()
+        if row:
+            sid = row["id"]
+
+    # 2) Otherwise try reuse by email
+    if not sid and email:
+        row = cur.execute(
+            "SELECT student_id FROM enrollments WHERE email=? "
+            "ORDER BY id DESC LIMIT 1",
+            (email,),
+        ).fetchone()
+        if row:
+            sid = row["student_id"]
+
+    # 3) Otherwise try reuse by name
+    if not sid and name:
+        row = cur.execute(
+            "SELECT id FROM students WHERE name=? "
+            "ORDER BY last_seen_ts DESC LIMIT 1",
+            (name,),
+        ).fetchone()
+        if row:
+            sid = row["id"]
+
+    # 4) If still nothing, create brand new Sxxx student
+    if not sid:
+        sid = mint_next_student_id()
+        cur.execute(
+            "INSERT INTO students(id, name, embedding, last_seen_ts) "
+            "VALUES (?,?,?,?)",
+            (sid, name, None, now_iso()),
+        )
+    else:
+        # If we have an existing student but name is empty/NULL, fill it
+        cur.execute(
+            """
+            UPDATE students
+            SET name = CASE
+                         WHEN name IS NULL OR TRIM(name) = '' THEN ?
+                         ELSE name
+                       END
+            WHERE id = ?
+            """,
+            (name, sid),
+        )
+
+    # 5) Upsert into enrollments for THIS class
+    existing = cur.execute(
+        "SELECT class_id, student_id FROM enrollments WHERE class_id=? AND student_id=?",
+        (class_id, sid),
+    ).fetchone()
+
+    if existing:
+        # Update same row using composite key (class_id, student_id)
+        cur.execute(
+            """
+            UPDATE enrollments
+            SET display_name = ?, email = ?
+            WHERE class_id = ? AND student_id = ?
+            """,
+            (name, email, class_id, sid),
+        )
+    else:
+        # Insert new enrollment
+        cur.execute(
+            """
+            INSERT INTO enrollments(class_id, student_id, display_name, email)
+            VALUES(?,?,?,?)
+            """,
+            (class_id, sid, name, email),
+        )
+
+    conn.commit()
+
+    # Safe read of platform_link
+    try:
+        meet_link = class_row["platform_link"]
+    except Exception:
+        meet_link = None
+
+    conn.close()
+
+    return jsonify(
+        {
+            "ok": True,
+            "class_id": class_id,
+            "student_id": sid,
+            "redirect_url": meet_link,
+        }
+    )
+
+@bp.get("/api/student_profile")
+def api_student_profile():
+    student_id = request.args.get("student_id", "").strip()
+    class_id = request.args.get("class_id", "").strip()
+    
+    conn = connect(); cur = conn.cursor()
+    
+    # Check 1: Is already enrolled?
+    row = cur.execute(
+        "SELECT display_name, email FROM enrollments WHERE student_id=? AND class_id=?",
+        (student_id, class_id)
+    ).fetchone()
+    
+    if row:
+        conn.close()
+        return jsonify({
+            "ok": True, 
+            "exists": True, 
+            "display_name": row["display_name"], 
+            "email": row["email"]
+        })
+
+    # Check 2: Check Master Table
+    row_stu = cur.execute(
+        "SELECT name FROM students WHERE id=?",
+        (student_id,)
+    ).fetchone()
+
+    if row_stu and row_stu["name"] and row_stu["name"].strip():
+        # ✅ NEW: if not enrolled in this class yet, try reuse latest known email
+        row_any = cur.execute(
+            """
+            SELECT email
+            FROM enrollments
+            WHERE student_id=? AND email IS NOT NULL AND email <> ''
+            ORDER BY id DESC
+            LIMIT 1
+            """,
+            (student_id,)
+        ).fetchone()
+
+        conn.close()
+        return jsonify({
+            "ok": True,
+            "exists": True,  # LOCKED
+            "display_name": row_stu["name"],
+            "email": (row_any["email"] if row_any else "")
+        })
+
+    conn.close()
+    return jsonify({
+        "ok": True,
+        "exists": False,  # UNLOCKED
+        "display_name": "",
+        "email": ""
+    })
+
+# -------------------- API: Summary & Attendance--------------------
+@bp.get("/api/summary/<class_id>/hero")
+def api_summary_hero(class_id):
+    """
+    Numbers for the 3 hero cards on the class summary page:
+
+      - total_students
+      - avg_engagement
+      - current_session_attendance
+      - attendance_14w
+    """
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+
+    user_id = session["user_id"]
+
+    conn = connect()
+    cur = conn.cursor()
+
+    # 1) Make sure this class belongs to the logged-in lecturer
+    row = cur.execute(
+        """
+        SELECT id
+        FROM classes
+        WHERE id = ? AND owner_user_id = ?
+        """,
+        (class_id, user_id),
+    ).fetchone()
+
+    if not row:
+        conn.close()
+        return jsonify({"ok": False, "error": "class_not_found"}), 404
+
+    # 2) Total students (enrollments for this class)
+    row = cur.execute(
+        "SELECT COUNT(*) AS cnt FROM enrollments WHERE class_id = ?",
+        (class_id,),
+    ).fetchone()
+    total_students = int(row["cnt"] or 0)
+
+    # 3) Average engagement for this class
+    #✅ Average of each student's average (missing student = 0)
+    rows = cur.execute(
+        """
+        SELECT
+          e.student_id,
+          COALESCE(AVG(es.engagement_score), 0) AS student_avg_eng
+        FROM enrollments e
+        LEFT JOIN engagement_summary es
+          ON es.class_id = e.class_id
+         AND es.student_id = e.student_id
+        WHERE e.class_id = ?
+        GROUP BY e.student_id
+        """,
+        (class_id,),
+    ).fetchall()
+
+    if rows:
+        avg_eng_rounded = int(round(sum(float(r["student_avg_eng"] or 0) for r in rows) / len(rows)))
+    else:
+        avg_eng_rounded = 0
+
+    # 4) Overall attendance for this class (stable hero value)
+    #    ✅ present/late counts as attended
+    #    ✅ denominator = total_sessions * total_students
+    row_ts = cur.execute(
+        "SELECT COUNT(*) AS cnt FROM sessions WHERE class_id = ?",
+        (class_id,),
+    ).fetchone()
+    total_sessions_all = int(row_ts["cnt"] or 0)
+
+    current_attendance = None
+    if total_students > 0 and total_sessions_all > 0:
+        row_overall = cur.execute(
+            """
+            SELECT
+              COALESCE(SUM(CASE WHEN a.status IN ('present','late') THEN 1 ELSE 0 END), 0) AS present_cnt
+            FROM enrollments e
+            JOIN sessions s
+              ON s.class_id = e.class_id
+            LEFT JOIN attendance a
+              ON a.session_id = s.id
+             AND a.student_id = e.student_id
+            WHERE e.class_id = ?
+            """,
+            (class_id,),
+        ).fetchone()
+
+        present_cnt = int(row_overall["present_cnt"] or 0)
+        denom = total_students * total_sessions_all
+        current_attendance = int(round(100.0 * present_cnt / denom))
+
+    # 5) 14-week attendance window for this class
+    #    ✅ Average of each student's attendance rate within last 14 weeks (missing = 0)
+    now = datetime.now(timezone.utc)
+    cutoff_14w = now - timedelta(weeks=14)
+
+    row_total_14 = cur.execute(
+        """
+        SELECT COUNT(*) AS cnt
+        FROM sessions
+        WHERE class_id = ?
+          AND start_ts >= ?
+        """,
+        (class_id, cutoff_14w.isoformat()),
+    ).fetchone()
+
+    total_sessions_14 = int(row_total_14["cnt"] or 0)
+
+    attendance_14w = None
+    if total_students > 0 and total_sessions_14 > 0:
+        rows_att_14 = cur.execute(
+            """
+            SELECT
+                e.student_id,
+                COALESCE(SUM(CASE WHEN a.status IN ('present','late') THEN 1 ELSE 0 END), 0) AS present_cnt
+            FROM enrollments e
+            JOIN sessions s
+              ON s.class_id = e.class_id
+             AND s.start_ts >= ?
+            LEFT JOIN attendance a
+              ON a.session_id = s.id
+             AND a.student_id = e.student_id
+            WHERE e.class_id = ?
+            GROUP BY e.student_id
+            """,
+            (cutoff_14w.isoformat(), class_id),
+        ).fetchall()
+
+        # per student: present_cnt / total_sessions_14
+        per_student_rates = [
+            100.0 * (int(r["present_cnt"] or 0)) / total_sessions_14
+            for r in rows_att_14
+        ]
+        attendance_14w = int(round(sum(per_student_rates) / len(per_student_rates)))
+
+    conn.close()
+
+    return jsonify(
+        {
+            "ok": True,
+            "class_id": class_id,
+            "total_students": total_students,
+            "avg_engagement": avg_eng_rounded,
+            "current_session_attendance": current_attendance,
+            "attendance_14w": attendance_14w,
+        }
+    )
+
+@bp.get("/api/summary/<class_id>/sessions")
+def api_summary_sessions(class_id):
+    """
+    List sessions for a class (for the dropdown), newest first.
+    Also returns which session should be selected by default.
+    """
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+
+    user_id = session["user_id"]
+
+    conn = connect()
+    cur = conn.cursor()
+
+    # Make sure this class belongs to the logged-in lecturer
+    row = cur.execute(
+        """
+        SELECT id
+        FROM classes
+        WHERE id = ? AND owner_user_id = ?
+        """,
+        (class_id, user_id),
+    ).fetchone()
+
+    if not row:
+        conn.close()
+        return jsonify({"ok": False, "error": "class_not_found"}), 404
+
+    # --- CHANGED: SQL Query now calculates 'session_no' (1, 2, 3...) ---
+    rows = cur.execute(
+        """
+        SELECT 
+            id, 
+            name, 
+            start_ts, 
+            end_ts,
+            ROW_NUMBER() OVER (ORDER BY start_ts ASC) as session_no
+        FROM sessions
+        WHERE class_id = ?
+        ORDER BY start_ts DESC
+        LIMIT 40
+        """,
+        (class_id,),
+    ).fetchall()
+
+    sessions = []
+    default_session_id = None
+
+    for r in rows:
+        start_ts = r["start_ts"]
+        end_ts = r["end_ts"]
+        is_open = end_ts is None
+        
+        # --- CHANGED: Use the calculated number (1, 2, 3) instead of DB ID (45, 46) ---
+        sess_num = r["session_no"]
+
+        # Format date (Copying logic from your format_session_label helper)
+        try:
+            # Check if start_ts is a string or datetime object
+            if isinstance(start_ts, str):
+                dt = datetime.fromisoformat(start_ts)
+            else:
+                dt = start_ts
+                
+            # If naive (no timezone), force UTC then convert
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=timezone.utc)
+                
+            dt_local = dt.astimezone(LOCAL_TZ)
+            pretty_date = dt_local.strftime("%Y-%m-%d %H:%M")
+        except Exception:
+            pretty_date = str(start_ts).replace("T", " ")[:16]
+
+        # The new clean label
+        label = f"Session {sess_num} – {pretty_date}"
+        
+        if is_open:
+            label += " (live)"
+
+        sessions.append(
+            {
+                "id": r["id"],
+                "label": label,  # Frontend displays this string
+                "start_ts": start_ts,
+                "end_ts": end_ts,
+                "is_open": is_open,
+            }
+        )
+
+        # default: prefer live session, otherwise first (newest)
+        if default_session_id is None:
+            default_session_id = r["id"]
+        if is_open:
+            default_session_id = r["id"]
+
+    conn.close()
+
+    return jsonify(
+        {
+            "ok": True,
+            "class_id": class_id,
+            "sessions": sessions,
+            "default_session_id": default_session_id,
+        }
+    )
+
+@bp.get("/api/summary/<class_id>/session/<int:session_id>/engagement")
+def api_summary_session_engagement(class_id, session_id):
+    """
+    Per-student engagement + attendance for one session in a class.
+    Feeds the 'Student Engagement' table.
+
+    Behaviour is derived from engagement_summary (drowsy_count, tab_away_count,
+    idle_seconds) instead of raw events.
+    """
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+
+    user_id = session["user_id"]
+    conn = connect()
+    cur = conn.cursor()
+
+    # Make sure this session belongs to this class AND to this lecturer
+    row = cur.execute(
+        """
+        SELECT s.id
+        FROM sessions s
+        JOIN classes c ON s.class_id = c.id
+        WHERE s.id = ? AND s.class_id = ? AND c.owner_user_id = ?
+        """,
+        (session_id, class_id, user_id),
+    ).fetchone()
+
+    if not row:
+        conn.close()
+        return jsonify({"ok": False, "error": "not_found"}), 404
+
+    # -------- Average engagement per student across all sessions in this class
+    avg_eng_rows = cur.execute(
+        """
+        SELECT student_id, AVG(engagement_score) AS avg_eng
+        FROM engagement_summary
+        WHERE class_id = ?
+        GROUP BY student_id
+        """,
+        (class_id,),
+    ).fetchall()
+    avg_eng_by_student = {
+        r["student_id"]: (r["avg_eng"] or 0.0) for r in avg_eng_rows
+    }
+
+    # -------- Average attendance per student across ALL sessions in this class
+    # Use total sessions as denominator (not COUNT(attendance rows)),
+    # because absences usually have no row in attendance table.
+    row_total_sessions = cur.execute(
+        "SELECT COUNT(*) AS cnt FROM sessions WHERE class_id = ?",
+        (class_id,),
+    ).fetchone()
+    total_sessions = (row_total_sessions["cnt"] or 0) if row_total_sessions else 0
+
+    att_rows = cur.execute(
+        """
+        SELECT
+          a.student_id,
+          SUM(CASE WHEN a.status IN ('present','late') THEN 1 ELSE 0 END) AS attended_cnt
+        FROM attendance a
+        JOIN sessions s ON a.session_id = s.id
+        WHERE s.class_id = ?
+        GROUP BY a.student_id
+        """,
+        (class_id,),
+    ).fetchall()
+
+    attended_cnt_by_student = {r["student_id"]: (r["attended_cnt"] or 0) for r in att_rows}
+
+    avg_att_by_student = {}
+    for sid, attended_cnt in attended_cnt_by_student.items():
+        if total_sessions > 0:
+            avg_att_by_student[sid] = 100.0 * attended_cnt / total_sessions
+        else:
+            avg_att_by_student[sid] = None
+
+    # -------- Main per-enrolment row for THIS session
+    rows = cur.execute(
+        """
+        SELECT
+          e.student_id,
+          e.email,
+          COALESCE(e.display_name, st.name, e.student_id) AS student_name,
+          es.engagement_score AS session_engagement,
+          es.risk_level       AS risk_level,
+          es.drowsy_count     AS drowsy_count,
+          es.tab_away_count   AS tab_away_count,
+          es.idle_seconds     AS idle_seconds,
+          att.status          AS attendance_status
+        FROM enrollments e
+        LEFT JOIN students st
+               ON st.id = e.student_id
+        LEFT JOIN engagement_summary es
+               ON es.class_id = e.class_id
+              AND es.session_id = ?
+              AND es.student_id = e.student_id
+        LEFT JOIN attendance att
+               ON att.session_id = ?
+              AND att.student_id = e.student_id
+        WHERE e.class_id = ?
+        ORDER BY e.display_name
+        """,
+        (session_id, session_id, class_id),
+    ).fetchall()
+
+    def _behaviour_from_summary(r):
+        """Return nice multi-line HTML string for Behaviour column."""
+        drowsy = int(r["drowsy_count"] or 0)
+        tab_away = int(r["tab_away_count"] or 0)
+        idle_seconds = int(r["idle_seconds"] or 0)
+
+        # Fallback label based on risk level (when there are no counts)
+        risk_map = {"low": "On track", "medium": "Monitor", "high": "At risk"}
+        risk = (r["risk_level"] or "").lower() if r["risk_level"] else ""
+        risk_label = risk_map.get(risk)
+
+        lines = []
+
+        if drowsy > 0:
+            lines.append(f"Drowsy: {drowsy} time{'s' if drowsy != 1 else ''}")
+
+        if tab_away > 0:
+            lines.append(f"Tab away: {tab_away} time{'s' if tab_away != 1 else ''}")
+
+        # OPTIONAL: keep idle if you like, or comment this block out
+        if idle_seconds > 0:
+            if idle_seconds >= 60:
+                mins = round(idle_seconds / 60)
+                lines.append(f"Idle: ~{mins} min")
+            else:
+                lines.append(f"Idle: {idle_seconds}s")
+
+        # If we have any lines, join them with <br> for multi-line display.
+        if lines:
+            return "<br>".join(lines)
+
+        # Otherwise, show simple risk label (On track / Monitor / At risk)
+        return risk_label
+
+    result_rows = []
+    for r in rows:
+        sid = r["student_id"]
+        avg_eng = avg_eng_by_student.get(sid)
+        avg_att_pct = avg_att_by_student.get(sid)
+        
+        # If student has no attendance rows at all, they attended 0 sessions
+        if avg_att_pct is None and total_sessions > 0:
+            avg_att_pct = 0.0
+
+        behaviour_text = _behaviour_from_summary(r)
+
+        result_rows.append(
+            {
+                "student_id": sid,
+                "student_name": r["student_name"],
+                "email": r["email"],
+                "engagement_score": r["session_engagement"],
+                "risk_level": r["risk_level"],
+                "behaviour": behaviour_text,
+                "attendance_status": r["attendance_status"],
+                "average_engagement": None if avg_eng is None else round(avg_eng),
+                "average_attendance": None
+                if avg_att_pct is None
+                else round(avg_att_pct),
+            }
+        )
+
+    conn.close()
+
+    return jsonify(
+        {
+            "ok": True,
+            "class_id": class_id,
+            "session_id": session_id,
+            "rows": result_rows,
+        }
+    )
+
+@bp.get("/api/summary/<class_id>/engagement_csv")
+def api_summary_engagement_csv(class_id):
+    """
+    CSV with TWO sections:
+
+    1) SUMMARY PER STUDENT  (one row per student across all sessions)
+    2) DETAILED ROWS PER SESSION (one row per session+student)
+
+    So the lecturer only needs to download once.
+    """
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+
+    user_id = session["user_id"]
+    conn = connect()
+    cur = conn.cursor()
+
+    # Make sure this class belongs to the logged-in lecturer
+    owns = cur.execute(
+        "SELECT 1 FROM classes WHERE id = ? AND owner_user_id = ?",
+        (class_id, user_id),
+    ).fetchone()
+    if not owns:
+        conn.close()
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+
+    # ---- Fetch detailed rows ONCE ----
+    rows = cur.execute(
+        """
+        SELECT
+          es.session_id,
+          s.start_ts,
+          es.student_id,
+          COALESCE(e.display_name, st.name, es.student_id) AS student_name,
+          es.engagement_score,
+          es.risk_level,
+          es.drowsy_count,
+          es.awake_count,
+          es.tab_away_count,
+          es.idle_seconds,
+          att.status AS attendance_status
+        FROM engagement_summary es
+        JOIN sessions s
+             ON s.id = es.session_id
+        LEFT JOIN enrollments e
+               ON e.class_id = es.class_id
+              AND e.student_id = es.student_id
+        LEFT JOIN students st
+               ON st.id = e.student_id
+        LEFT JOIN attendance att
+               ON att.session_id = es.session_id
+              AND att.student_id = es.student_id
+        WHERE es.class_id = ?
+        ORDER BY es.student_id, s.start_ts
+        """,
+        (class_id,),
+    ).fetchall()
+
+    conn.close()
+
+    # ---- 1) Build summary stats per student ----
+    stats = {}  # key = student_id
+
+    for r in rows:
+        sid = r["student_id"]
+        stu = stats.setdefault(
+            sid,
+            {
+                "student_name": r["student_name"] or sid,
+                "sessions": 0,
+                "eng_sum": 0.0,
+                "eng_count": 0,
+                "sessions_below_50": 0,
+                "present": 0,
+                "late": 0,
+                "absent": 0,
+                "att_total": 0,
+            },
+        )
+
+        # engagement
+        score = r["engagement_score"]
+        if score is not None:
+            score_f = float(score)
+            stu["eng_sum"] += score_f
+            stu["eng_count"] += 1
+            stu["sessions"] += 1
+            if score_f < 50.0:
+                stu["sessions_below_50"] += 1
+
+        # attendance
+        status = (r["attendance_status"] or "").lower()
+        if status in ("present", "late", "absent"):
+            stu["att_total"] += 1
+            if status == "present":
+                stu["present"] += 1
+            elif status == "late":
+                stu["late"] += 1
+            elif status == "absent":
+                stu["absent"] += 1
+
+    # ---- 2) Write combined CSV ----
+    import io
+
+    output = io.StringIO()
+    writer = csv.writer(output)
+
+    # ===== SECTION A: SUMMARY PER STUDENT =====
+    writer.writerow(["SUMMARY PER STUDENT"])
+    writer.writerow(
+        [
+            "class_id",
+            "student_id",
+            "student_name",
+            "total_sessions",
+            "average_engagement",    # %
+            "sessions_below_50",
+            "average_attendance",    # %
+            "present_count",
+            "late_count",
+            "absent_count",
+        ]
+    )
+
+    for sid, stu in stats.items():
+        if stu["eng_count"] > 0:
+            avg_eng = stu["eng_sum"] / stu["eng_count"]
+        else:
+            avg_eng = 0.0
+
+        if stu["att_total"] > 0:
+            avg_att = 100.0 * stu["present"] / stu["att_total"]
+        else:
+            avg_att = 0.0
+
+        writer.writerow(
+            [
+                class_id,
+                sid,
+                stu["student_name"],
+                stu["sessions"],
+                f"{avg_eng:.1f}",
+                stu["sessions_below_50"],
+                f"{avg_att:.1f}",
+                stu["present"],
+                stu["late"],
+                stu["absent"],
+            ]
+        )
+
+    # blank lines between tables
+    writer.writerow([])
+    writer.writerow([])
+
+    # ===== SECTION B: DETAILED ROWS PER SESSION =====
+    writer.writerow(["DETAILED ROWS PER SESSION"])
+    writer.writerow(
+        [
+            "class_id",
+            "session_id",
+            "session_start_utc",
+            "student_id",
+            "student_name",
+            "engagement_score",
+            "risk_level",
+            "drowsy_count",
+            "awake_count",
+            "tab_away_count",
+            "idle_seconds",
+            "attendance_status",
+        ]
+    )
+
+    for r in rows:
+        writer.writerow(
+            [
+                class_id,
+                r["session_id"],
+                r["start_ts"],
+                r["student_id"],
+                r["student_name"],
+                r["engagement_score"],
+                r["risk_level"],
+                r["drowsy_count"],
+                r["awake_count"],
+                r["tab_away_count"],
+                r["idle_seconds"],
+                r["attendance_status"],
+            ]
+        )
+
+    csv_data = output.getvalue()
+    output.close()
+
+    resp = make_response(csv_data)
+    resp.headers["Content-Type"] = "text/csv; charset=utf-8"
+    resp.headers[
+        "Content-Disposition"
+    ] = f"attachment; filename=class_{class_id}_engagement_full.csv"
+    return resp
+
+@bp.post("/api/summary/<class_id>/session/<int:session_id>/attendance_override")
+def api_attendance_override(class_id, session_id):
+    """
+    Manually override attendance.status for one student in one session.
+    Body JSON: { "student_id": "...", "status": "present" | "late" | "absent" }
+
+    After updating attendance we recompute engagement_summary for this session
+    so overrides are reflected in KPIs.
+    """
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+
+    user_id = session["user_id"]
+    payload = request.get_json(silent=True) or {}
+    student_id = (payload.get("student_id") or "").strip()
+    status = (payload.get("status") or "").strip().lower()
+
+    # Disallow "late" overrides (treat as present or reject)
+    if status == "late":
+        status = "present"
+
+    if status not in ("present", "late", "absent"):
+        return jsonify({"ok": False, "error": "invalid_status"}), 400
+
+    conn = connect()
+    cur = conn.cursor()
+
+    # Check session + class belongs to this lecturer
+    row = cur.execute(
+        """
+        SELECT s.id
+        FROM sessions s
+        JOIN classes c ON s.class_id = c.id
+        WHERE s.id = ? AND s.class_id = ? AND c.owner_user_id = ?
+        """,
+        (session_id, class_id, user_id),
+    ).fetchone()
+
+    if not row:
+        conn.close()
+        return jsonify({"ok": False, "error": "not_found"}), 404
+
+    # Upsert into attendance
+    existing = cur.execute(
+        """
+        SELECT id FROM attendance
+        WHERE session_id = ? AND student_id = ?
+        """,
+        (session_id, student_id),
+    ).fetchone()
+
+    now_ts = now_iso()
+
+    if existing:
+        cur.execute(
+            "UPDATE attendance SET status=? WHERE id=?",
+            (status, existing["id"]),
+        )
+    else:
+        # first_seen_ts / last_seen_ts just set to now for manual overrides
+        cur.execute(
+            """
+            INSERT INTO attendance (session_id, student_id, status, first_seen_ts, last_seen_ts)
+            VALUES (?,?,?,?,?)
+            """,
+            (session_id, student_id, status, now_ts, now_ts),
+        )
+
+    conn.commit()
+    conn.close()
+
+    # Recompute engagement_summary so "absent=0 score" etc reflect override
+    try:
+        compute_engagement_for_session(session_id)
+    except Exception as e:
+        print("[override] recompute engagement failed:", e, file=sys.stderr)
+
+    return jsonify({"ok": True, "student_id": student_id, "status": status})
+
+@bp.patch("/api/classes/<class_id>/enrollment/<student_id>")
+def api_update_enrollment(class_id, student_id):
+    """
+    Update display_name / email for one enrollment.
+    Body: { "display_name": "...", "email": "..." }
+    """
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+
+    user_id = session["user_id"]
+    data = request.get_json(silent=True) or {}
+    display_name = data.get("display_name")
+    email = data.get("email")
+
+    conn = connect()
+    cur = conn.cursor()
+
+    # Owns this class?
+    row = cur.execute(
+        "SELECT id FROM classes WHERE id=? AND owner_user_id=?",
+        (class_id, user_id),
+    ).fetchone()
+    if not row:
+        conn.close()
+        return jsonify({"ok": False, "error": "class_not_found"}), 404
+
+    cur.execute(
+        """
+        UPDATE enrollments
+        SET display_name = COALESCE(?, display_name),
+            email        = COALESCE(?, email)
+        WHERE class_id = ? AND student_id = ?
+        """,
+        (display_name, email, class_id, student_id),
+    )
+
+    conn.commit()
+    conn.close()
+    return jsonify({"ok": True})
+
+
+@bp.delete("/api/classes/<class_id>/enrollment/<student_id>")
+def api_delete_enrollment(class_id, student_id):
+    """
+    Remove a student from a class (delete enrollment row).
+    """
+    if "user_id" not in session:
+        return jsonify({"ok": False, "error": "not_logged_in"}), 401
+
+    user_id = session["user_id"]
+
+    conn = connect()
+    cur = conn.cursor()
+
+    # Owns this class?
+    row = cur.execute(
+        "SELECT id FROM classes WHERE id=? AND owner_user_id=?",
+        (class_id, user_id),
+    ).fetchone()
+    if not row:
+        conn.close()
+        return jsonify({"ok": False, "error": "class_not_found"}), 404
+
+    cur.execute(
+        "DELETE FROM enrollments WHERE class_id=? AND student_id=?",
+        (class_id, student_id),
+    )
+
+    conn.commit()
+    conn.close()
+    return jsonify({"ok": True})
+
+# -------------------- API: Live roster --------------------
+# Default session for /api/live without session_id: the newest open one
+# (not the one with the latest event - two classes can run at once).
+# Cached briefly so dashboard polling does not hit the DB on every call.
+OPEN_SESSION_TTL_S = 2.0
+_open_session = {"id": None, "at": 0.0}
+
+
+def _newest_open_session_id(cur):
+    now = time.monotonic()
+    if now - _open_session["at"] >= OPEN_SESSION_TTL_S:
+        row = cur.execute(
+            "SELECT id FROM sessions WHERE end_ts IS NULL "
+            "ORDER BY start_ts DESC LIMIT 1"
+        ).fetchone()
+        _open_session.update(id=row["id"] if row else None, at=now)
+    return _open_session["id"]
+
+
+@bp.get("/api/live")
+def api_live():
+    """
+    Per-student rows are served from LIVE (live state table). The DB is
+    only touched to resolve the newest open session (cached for
+    OPEN_SESSION_TTL_S) and to back-fill a session LIVE does not hold,
+    or - without Redis - re-read one other processes ingest.
+    """
+    try:
+        session_id = request.args.get("session_id", type=int)
+        fresh = time.monotonic() - _open_session["at"] < OPEN_SESSION_TTL_S
+        if not session_id and fresh:
+            session_id = _open_session["id"]
+            if not session_id:
+                return jsonify({"ok": True, "students": [], "session_id": None})
+
+        if not session_id or not LIVE.is_hydrated(session_id):
+            conn = connect(); cur = conn.cursor()
+            try:
+                if not session_id:
+                    session_id = _newest_open_session_id(cur)
+                    if not session_id:
+                        return jsonify({"ok": True, "students": [], "session_id": None})
+
+                if not LIVE.is_hydrated(session_id):
+                    cutoff = datetime.now(timezone.utc) - timedelta(seconds=LIVE_WINDOW_S)
+                    rows = cur.execute(
+                        """
+                        SELECT e.student_id, e.ts, e.type, e.value, s.name
+                        FROM events e
+                        LEFT JOIN students s ON s.id = e.student_id
+                        WHERE e.session_id=? AND e.ts >= ?
+                        ORDER BY e.ts DESC
+                        """,
+                        (session_id, cutoff.isoformat()),
+                    ).fetchall()
+                    LIVE.hydrate(session_id, rows)
+            finally:
+                conn.close()
+
+        return jsonify(
+            {
+                "ok": True,
+                "students": LIVE.snapshot(session_id),
+                "session_id": session_id,
+            }
+        )
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
@@ -0,0 +1,991 @@
+# server/core.py
+# ------------------------------------------------------------
+# Shared by every role: config, DB wrapper + background init, auth user
+# loader, helpers (embeddings, attendance, engagement, live roster) and
+# the unbound socketio / BROADCAST / login_manager objects.
+# Heavy modules (numpy, cv2, vision.*, supabase) are imported lazily so the
+# worker can bind and answer /api/health before they load; check with
+#   python benchmarks/import_time.py
+# ------------------------------------------------------------
+from __future__ import annotations
+import os, sys, json, time, smtplib, logging
+import sqlite3  # Imported to keep existing code happy!
+import psycopg2 # The new Supabase driver
+import psycopg2.extras
+from psycopg2 import Error as PgError, IntegrityError as PgIntegrityError
+import urllib.request
+import urllib.error
+
+
+# --- MAGIC TRICK: Map Postgres Errors to SQLite Errors ---
+# This fixes the "sqlite3 is not defined" errors
+sqlite3.IntegrityError = PgIntegrityError
+sqlite3.Error = PgError
+
+from datetime import datetime, timezone, timedelta
+from functools import lru_cache
+from threading import Lock, Thread
+from typing import TYPE_CHECKING
+from email.message import EmailMessage
+from itsdangerous import URLSafeTimedSerializer
+
+# Make ../ (project root that contains "vision/") importable first
+PARENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PARENT_DIR not in sys.path:
+    sys.path.insert(0, PARENT_DIR)
+
+from server.services.lazy import lazy_module
+
+# Imported on first use (vision/ pulls in onnxruntime)
+np = lazy_module("numpy")
+cv2 = lazy_module("cv2")
+vision_faces = lazy_module("vision.faces")
+vision_align = lazy_module("vision.align")
+if TYPE_CHECKING:
+    from vision.auto_enrol import EmbedFactory
+    from vision.detector import Detector
+
+from flask import current_app
+from flask_socketio import SocketIO
+from flask_login import LoginManager, UserMixin
+
+from server.services.live_state import make_live_table, LIVE_WINDOW_S
+from server.services.broadcast import RoomBroadcaster, session_room, class_room, compact_delta
+from server.services import metrics
+from server.services import db_profiler
+from server.services import warmup
+from server.services.logging_setup import configure_logging
+
+configure_logging()
+log_identify = logging.getLogger("server.identify")
+log_infer = logging.getLogger("server.infer")
+
+# -------------------- Config --------------------
+# ✅ CORRECT URI (Port 5432, No Brackets)
+# Hybrid Link: Uses the AWS address (Network Safe) + Project ID Username (Tenant Safe)
+# Golden Combination: Pooler Host + Project ID Username + Transaction Port
+DB_URI = (os.getenv("DB_URI") or "").strip()
+if not DB_URI:
+    raise RuntimeError("DB_URI is not set. Add it in Hugging Face Secrets.")
+
+SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-change-this")
+SECURITY_PASSWORD_SALT = os.getenv("SECURITY_PASSWORD_SALT", "classync-reset-salt-change-this")
+
+SUPABASE_URL = (os.getenv("SUPABASE_URL") or "").strip()
+SUPABASE_ANON_KEY = (os.getenv("SUPABASE_ANON_KEY") or "").strip()
+
+if not SUPABASE_URL or not SUPABASE_ANON_KEY:
+    raise RuntimeError("SUPABASE_URL / SUPABASE_ANON_KEY not set. Add them in Hugging Face Secrets.")
+
+# --- Add this near your other config variables ---
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+# Supabase clients are created on first use (get_supabase_admin / get_supabase_anon):
+#   admin -> Service Role Key, because the Anon Key cannot create users!
+#   anon  -> ANON key, for public users signing themselves up
+_supabase_lock = Lock()
+_supabase_clients = {}
+
+# Real-time: set a message queue (redis://...) to run several workers behind
+# one port; async mode is picked by server/gunicorn.conf.py (eventlet in production).
+SOCKETIO_MESSAGE_QUEUE = (os.getenv("SOCKETIO_MESSAGE_QUEUE") or "").strip() or None
+SOCKETIO_ASYNC_MODE = (os.getenv("SOCKETIO_ASYNC_MODE") or "").strip() or None
+
+EMAIL_ADDRESS = os.environ.get("CLASSYNC_EMAIL_ADDRESS", "your_email@gmail.com")
+EMAIL_PASSWORD = os.environ.get("CLASSYNC_EMAIL_PASSWORD", "your-app-password")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_FOLDER = os.path.join(BASE_DIR, "uploads")
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+
+# Face / embedding thresholds
+SIM_THRESHOLD   = 0.60
+AMBIG_THR       = 0.45
+MERGE_WITH_EXISTING = True
+MERGE_ALPHA_NEW = 0.25
+NEW_CONFIRM_FRAMES   = 5
+NEW_CONFIRM_WINDOW_S = 6.0
+RISK_LOW = 0.30
+RISK_MED = 0.45
+
+# -------------------- RESTORED GLOBALS (Fixes "SEEN is not defined" Errors) --------------------
+SEEN = {}
+PENDING_STATE = {}
+_embed_lock = Lock()
+_detector_lock = Lock()
+_embed_factory = None
+_detector = None
+
+# Live roster (latest status per session/student), fed by the ingest path.
+# Shared through Redis when the Socket.IO message queue is Redis; otherwise
+# each worker only sees its own ingest and re-reads the rest from the DB.
+LIVE = make_live_table(SOCKETIO_MESSAGE_QUEUE or "", window_s=LIVE_WINDOW_S,
+                       sole_writer=int(os.getenv("WEB_CONCURRENCY", "1") or 1) <= 1)
+
+# -------------------- Shared app objects --------------------
+# Bound to the Flask app by create_app() in server/app.py.
+socketio = SocketIO()
+BROADCAST = RoomBroadcaster(socketio, namespace="/events")
+login_manager = LoginManager()
+login_manager.login_view = "web.login"
+
+# -------------------- Database Wrapper --------------------
+@lru_cache(maxsize=2048)
+def rewrite_sql(sql):
+    """
+    SQLite-style SQL -> Postgres, cached per statement text.
+    Returns (sql, needs_returning_id).
+    """
+    # 🔑 THIS IS THE CRITICAL LINE
+    # It fixes BOTH the ? syntax AND the rowid naming issue automatically
+    sql = sql.replace("?", "%s").replace("rowid", "id")
+    if sql.strip().upper().startswith("INSERT") and "RETURNING" not in sql.upper():
+        return sql + " RETURNING id", True
+    return sql, False
+
+class PgCursorWrapper:
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self._last_insert_id = None
+    
+    def execute(self, sql, params=()):
+        sql, needs_returning = rewrite_sql(sql)
+        
+        t0 = time.perf_counter()
+        try:
+            if needs_returning:
+                try:
+                    self.cursor.execute(sql, params)
+                    row = self.cursor.fetchone()
+                    if row: self._last_insert_id = row[0]
+                except Exception as e:
+                    raise e
+            else:
+                self.cursor.execute(sql, params)
+                self._last_insert_id = None
+        finally:
+            dt = time.perf_counter() - t0
+            metrics.db_observe(sql, dt)
+            db_profiler.record(sql, dt, getattr(self.cursor, "rowcount", None))
+        return self
+
+    @property
+    def lastrowid(self):
+        return self._last_insert_id
+    
+    def fetchone(self):
+        return self.cursor.fetchone()
+    
+    def fetchall(self):
+        return self.cursor.fetchall()
+        
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+class PgConnectionWrapper:
+    def __init__(self, conn):
+        self.conn = conn
+        self.row_factory = None 
+        
+    def cursor(self):
+        return PgCursorWrapper(self.conn.cursor())
+        
+    def commit(self):
+        self.conn.commit()
+        
+    def close(self):
+        self.conn.close()
+        
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+def connect():  
+    try:
+        raw_conn = psycopg2.connect(
+            DB_URI,
+            cursor_factory=psycopg2.extras.DictCursor,
+            connect_timeout=10,
+            keepalives=1,
+            keepalives_idle=30,
+            keepalives_interval=10,
+            keepalives_count=5,
+        )
+        return PgConnectionWrapper(raw_conn)
+    except Exception as e:
+        print(f"❌ DB Connection Failed: {e}")
+        return None
+
+def exec_retry(cur, sql, params=(), retries=3, delay=0.2):
+    return cur.execute(sql, params)
+
+def table_has_column(conn, table, col):
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT column_name FROM information_schema.columns WHERE table_name=%s AND column_name=%s",
+        (table, col)
+    )
+    return cur.fetchone() is not None
+
+def init_db():
+    print("Checking database...")
+    conn = connect()
+    if not conn:
+        raise psycopg2.OperationalError("could not connect to database")
+    cur = conn.cursor()
+
+    # Define tables
+    cur.execute("""CREATE TABLE IF NOT EXISTS users (id SERIAL PRIMARY KEY, name TEXT NOT NULL, email TEXT NOT NULL UNIQUE, university TEXT, pw_hash TEXT NOT NULL, role TEXT NOT NULL DEFAULT 'lecturer', created_at TEXT NOT NULL, dept_id TEXT)""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS students (id TEXT PRIMARY KEY, name TEXT, embedding TEXT, last_seen_ts TEXT)""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS sessions (id SERIAL PRIMARY KEY, name TEXT, start_ts TEXT NOT NULL, end_ts TEXT, class_id TEXT, platform_link TEXT)""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS events (id SERIAL PRIMARY KEY, session_id INTEGER, student_id TEXT, type TEXT, value TEXT, ts TEXT)""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS classes (id TEXT PRIMARY KEY, name TEXT NOT NULL, code TEXT, section TEXT, owner_user_id INTEGER, created_at TEXT NOT NULL, join_token TEXT, platform_link TEXT, location TEXT, dept_id INTEGER, owner_email TEXT)""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS enrollments (id SERIAL PRIMARY KEY, class_id TEXT NOT NULL, student_id TEXT NOT NULL, display_name TEXT, email TEXT, UNIQUE(class_id, student_id))""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS attendance (id SERIAL PRIMARY KEY, session_id INTEGER NOT NULL, student_id TEXT NOT NULL, status TEXT NOT NULL, first_seen_ts TEXT, last_seen_ts TEXT, UNIQUE(session_id, student_id))""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS engagement_summary (id SERIAL PRIMARY KEY, session_id INTEGER NOT NULL, class_id TEXT NOT NULL, student_id TEXT NOT NULL, drowsy_count INTEGER NOT NULL DEFAULT 0, awake_count INTEGER NOT NULL DEFAULT 0, tab_away_count INTEGER NOT NULL DEFAULT 0, idle_seconds INTEGER NOT NULL DEFAULT 0, engagement_score INTEGER NOT NULL DEFAULT 0, risk_level TEXT NOT NULL DEFAULT 'low', created_at TEXT NOT NULL, UNIQUE(session_id, student_id))""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS alerts (id SERIAL PRIMARY KEY, lecturer_id INTEGER, course TEXT, level TEXT, message TEXT, note TEXT, created_at TEXT)""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS notifications (id SERIAL PRIMARY KEY, lecturer_id INTEGER, message TEXT, level TEXT, type TEXT, created_at TEXT DEFAULT CURRENT_TIMESTAMP)""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS faculty (id SERIAL PRIMARY KEY, faculty_id TEXT UNIQUE NOT NULL, name TEXT NOT NULL)""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS department (id SERIAL PRIMARY KEY, dept_id TEXT UNIQUE NOT NULL, name TEXT NOT NULL, faculty_id TEXT, faculty_name TEXT)""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS enrol_jobs (id TEXT PRIMARY KEY, class_id TEXT NOT NULL, status TEXT NOT NULL, total INTEGER NOT NULL DEFAULT 0, done INTEGER NOT NULL DEFAULT 0, message TEXT, result TEXT, created_by INTEGER, created_at TEXT NOT NULL, updated_at TEXT)""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS course_schedule (id SERIAL PRIMARY KEY, class_id TEXT, delivery_mode TEXT, location TEXT, day_of_week INTEGER, time_start TEXT, time_end TEXT)""")
+
+    conn.commit()
+    conn.close()
+    print("✅ Database connected & initialized!")
+
+DB_READY = False
+
+def init_db_with_retry(max_tries=12, sleep_s=3):
+    global DB_READY
+    for attempt in range(1, max_tries + 1):
+        try:
+            init_db()
+            DB_READY = True
+            print(f"[db] init_db OK (attempt {attempt})")
+            return True
+        except psycopg2.OperationalError as e:
+            print(f"[db] init_db failed (attempt {attempt}/{max_tries}): {e}")
+            time.sleep(sleep_s)
+        except Exception as e:
+            print(f"[db] init_db unexpected error: {e}")
+            time.sleep(sleep_s)
+
+    DB_READY = False
+    print("[db] init_db ultimately failed, app will still run but DB endpoints may fail.")
+    return False
+
+def _db_init_task():
+    # Runs in the background so the worker binds immediately; keeps retrying
+    # (every DB_INIT_RETRY_S) after a failed round instead of giving up.
+    while True:
+        try:
+            if init_db_with_retry():
+                return
+        except Exception as e:
+            print("[db] init_db_with_retry crashed unexpectedly:", e)
+        time.sleep(int(os.getenv("DB_INIT_RETRY_S", "30")))
+
+Thread(target=_db_init_task, name="db-init", daemon=True).start()
+
+class User(UserMixin):
+    def __init__(self, id, name, email, role):
+        self.id = id
+        self.name = name
+        self.email = email
+        self.role = role
+
+@login_manager.user_loader
+def load_user(user_id):
+    # Manually fetch user from Supabase
+    conn = connect()
+    if not conn: return None
+    cur = conn.cursor()
+    
+    # Run the SQL query
+    row = cur.execute("SELECT id, name, email, role FROM users WHERE id=%s", (user_id,)).fetchone()
+    conn.close()
+    
+    if row:
+        # Return our new User object
+        return User(id=row["id"], name=row["name"], email=row["email"], role=row["role"])
+    return None
+# -------------------- Helpers: time & IDs --------------------
+def now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+def _now():
+    return time.time()
+
+def supabase_auth_post(path: str, payload: dict):
+    url = f"{SUPABASE_URL}{path}"
+    data = json.dumps(payload).encode("utf-8")
+
+    req = urllib.request.Request(
+        url,
+        data=data,
+        method="POST",
+        headers={
+            "apikey": SUPABASE_ANON_KEY,
+            "Authorization": f"Bearer {SUPABASE_ANON_KEY}",
+            "Content-Type": "application/json",
+        },
+    )
+
+    try:
+        with urllib.request.urlopen(req, timeout=20) as resp:
+            body = resp.read().decode("utf-8") or "{}"
+            return resp.getcode(), json.loads(body)
+    except urllib.error.HTTPError as e:
+        try:
+            body = e.read().decode("utf-8") or "{}"
+            return e.code, json.loads(body)
+        except Exception:
+            return e.code, {"error": str(e)}
+    except Exception as e:
+        return 0, {"error": str(e)}
+
+def mint_next_student_id():
+    conn = connect(); cur = conn.cursor()
+    row = cur.execute(
+        "SELECT id FROM students WHERE id LIKE 'S%%' "
+        "ORDER BY CAST(SUBSTRING(id from 2) AS INTEGER) DESC LIMIT 1"
+    ).fetchone()
+    next_num = (int(row["id"][1:]) + 1) if row else 1
+    sid = f"S{next_num:03d}"
+    conn.close()
+    return sid
+
+# --- JSON-safe casters ---
+def pfloat(x):
+    try:
+        return None if x is None else float(x)
+    except Exception:
+        return None
+
+def pint(x):
+    try:
+        return None if x is None else int(x)
+    except Exception:
+        return None
+
+def _safe_vec(ejson):
+    if not ejson:
+        return None
+    try:
+        v = np.asarray(json.loads(ejson), dtype=np.float32)
+        if v.ndim != 1:
+            return None
+        return v
+    except Exception:
+        return None
+
+def merge_or_replace_embedding(existing_json: str, new_vec: np.ndarray) -> str:
+    """
+    Returns a JSON string of the merged/replaced vector.
+    """
+    if not MERGE_WITH_EXISTING:
+        return json.dumps(new_vec.tolist())
+
+    old = _safe_vec(existing_json)
+    if old is None or len(old) != len(new_vec):
+        return json.dumps(new_vec.tolist())
+
+    a = float(MERGE_ALPHA_NEW)
+    merged = (1.0 - a) * old + a * new_vec
+    norm = np.linalg.norm(merged)
+    if norm > 1e-8:
+        merged = merged / norm
+    return json.dumps(merged.astype(np.float32).tolist())
+
+def merge_embedding_into(conn, student_id: str, new_vec: np.ndarray) -> None:
+    """
+    Load the existing embedding for this student, merge with new_vec using
+    merge_or_replace_embedding(), and write back to the database.
+    """
+    cur = conn.cursor()
+    row = cur.execute(
+        "SELECT embedding FROM students WHERE id=?",
+        (student_id,),
+    ).fetchone()
+
+    existing_json = row["embedding"] if row else None
+    merged_json = merge_or_replace_embedding(existing_json, new_vec)
+
+    cur.execute(
+        "UPDATE students SET embedding=? WHERE id=?",
+        (merged_json, student_id),
+    )
+    conn.commit()
+
+def verify_class_token(class_id: str, token: str) -> bool:
+    """
+    Check whether the provided token matches the join_token stored for the class.
+    If no token is set for the class, it allows join by default.
+    """
+    if not class_id:
+        return True
+
+    conn = connect()
+    cur = conn.cursor()
+    row = cur.execute(
+        "SELECT join_token FROM classes WHERE id=?", (class_id,)
+    ).fetchone()
+    conn.close()
+
+    if not row or not row["join_token"]:
+        return True
+    return token and (token == row["join_token"])
+
+# Add the churn function
+def compute_engagement_for_session(session_id):
+    """
+    Aggregate raw events + attendance into engagement_summary.
+    Refined with Safety Block and Idle Penalties.
+    """
+    try:
+        session_id = int(session_id)
+    except Exception:
+        return
+
+    conn = connect()
+    
+    # FIX 1: Start the Safety Block (try/finally)
+    try:
+        cur = conn.cursor()
+
+        # 1) Find the class_id for this session
+        row = cur.execute(
+            "SELECT class_id FROM sessions WHERE id=?",
+            (session_id,),
+        ).fetchone()
+        class_id = row["class_id"] if row else None
+        
+        if not class_id:
+            class_id = f"AUTO-{session_id}"
+        
+        # Calculate friendly Session Number (e.g., 1, 2, 3) by counting sessions for this class ordered by date
+        sess_num_row = cur.execute(
+            """
+            SELECT COUNT(*) as num 
+            FROM sessions 
+            WHERE class_id = ? 
+            AND start_ts <= (SELECT start_ts FROM sessions WHERE id = ?)
+            """, 
+            (class_id, session_id)
+        ).fetchone()
+        session_num = sess_num_row["num"] if sess_num_row else "?"
+
+        # 1b) Find the lecturer (owner) for this class
+        row_owner = cur.execute(
+            "SELECT owner_user_id FROM classes WHERE id=?",
+            (class_id,),
+        ).fetchone()
+        lecturer_id = row_owner["owner_user_id"] if row_owner else None
+
+        # 2) Get all students with attendance for this session
+        students = cur.execute(
+            "SELECT student_id, status FROM attendance WHERE session_id=?",
+            (session_id,),
+        ).fetchall()
+
+        if not students:
+            # Even if we return here, the 'finally' block below will close the connection
+            return
+
+        for st in students:
+            sid = st["student_id"]
+            status = (st["status"] or "").lower()
+
+            # 3) Count events by type
+            ev_rows = cur.execute(
+                """
+                SELECT type, COUNT(*) AS cnt
+                FROM events
+                WHERE session_id=? AND student_id=?
+                GROUP BY type
+                """,
+                (session_id, sid),
+            ).fetchall()
+
+            drowsy_count = 0
+            awake_count = 0
+            tab_away_count = 0
+
+            for ev in ev_rows:
+                et = (ev["type"] or "").lower()
+                if et == "drowsy":
+                    drowsy_count = ev["cnt"]
+                elif et == "awake":
+                    awake_count = ev["cnt"]
+                elif et == "tab_away":
+                    tab_away_count = ev["cnt"]
+
+            # --- Sum idle seconds ---
+            idle_seconds = 0
+            idle_rows = cur.execute(
+                "SELECT value FROM events WHERE session_id=? AND student_id=? AND type='idle'",
+                (session_id, sid),
+            ).fetchall()
+
+            for row2 in idle_rows:
+                try:
+                    v = json.loads(row2["value"] or "{}")
+                except Exception:
+                    continue
+
+                dur = 0
+                if isinstance(v, dict):
+                    if "duration_s" in v:
+                        try:
+                            dur = int(float(v.get("duration_s", 0)))
+                        except: dur = 0
+                    elif isinstance(v.get("raw_value"), dict) and "duration_s" in v["raw_value"]:
+                        try:
+                            dur = int(float(v["raw_value"].get("duration_s", 0)))
+                        except: dur = 0
+                
+                if dur > 0:
+                    idle_seconds += dur
+
+            # 4) Calculate Engagement Score
+            if status == "absent":
+                score = 0
+            elif status == "late":
+                score = 50 # Late students start at 50% max
+            else:
+                score = 100 # Present students start at 100%
+
+            # Only deduct points if they are NOT absent
+            if score > 0:
+                score -= drowsy_count * 2
+                score -= tab_away_count * 2
+                
+                # FIX 2: Enable Idle Penalty
+                # Lose 1 point for every 60 seconds (5 minute) of idleness
+                if idle_seconds > 0:
+                    score -= (idle_seconds // 300) * 2
+
+                # Floor the score at 0
+                if score < 0:
+                    score = 0
+
+            # 5) Map score -> risk_level
+            if score >= 80:
+                risk = "low"
+            elif score >= 50:
+                risk = "medium"
+            else:
+                risk = "high"
+
+            # 6) Upsert into engagement_summary
+            cur.execute(
+                """
+                INSERT INTO engagement_summary(
+                    session_id, class_id, student_id,
+                    drowsy_count, awake_count, tab_away_count,
+                    idle_seconds, engagement_score, risk_level, created_at
+                )
+                VALUES (?,?,?,?,?,?,?,?,?,?)
+                ON CONFLICT(session_id, student_id)
+                DO UPDATE SET
+                  drowsy_count    = excluded.drowsy_count,
+                  awake_count     = excluded.awake_count,
+                  tab_away_count  = excluded.tab_away_count,
+                  idle_seconds    = excluded.idle_seconds,
+                  engagement_score= excluded.engagement_score,
+                  risk_level      = excluded.risk_level,
+                  created_at      = excluded.created_at
+                """,
+                (
+                    session_id, class_id, sid,
+                    drowsy_count, awake_count, tab_away_count,
+                    idle_seconds, score, risk, now_iso(),
+                ),
+            )
+
+            # 7) DROWSY / ENGAGEMENT ALERT
+            if lecturer_id:
+                notif_type = None
+                notif_level = None
+
+                if risk == "high":
+                    notif_type = "drowsy_alert"
+                    notif_level = "red"
+                elif risk == "medium" and (drowsy_count >= 10 or tab_away_count >= 15):
+                    notif_type = "drowsy_alert"
+                    notif_level = "yellow"
+
+                if notif_type:
+                    msg = (
+                        f"Student {sid} is at {risk} engagement risk "
+                        f"in {class_id} (session {session_num}): "
+                        f"drowsy {drowsy_count}×, tab away {tab_away_count}×."
+                    )
+                    
+                    # Deduplicate notifications
+                    cur.execute(
+                        "DELETE FROM notifications WHERE lecturer_id=? AND type=? AND message LIKE ?",
+                        (lecturer_id, notif_type, f"Student {sid} is at %session {session_num}%")
+                    )
+                    cur.execute(
+                        "INSERT INTO notifications(lecturer_id, message, level, type) VALUES (?,?,?,?)",
+                        (lecturer_id, msg, notif_level, notif_type)
+                    )
+
+            # 8) ATTENDANCE ALERT
+            if lecturer_id:
+                att_row = cur.execute(
+                    """
+                    SELECT
+                    SUM(CASE WHEN a.status IN ('present', 'late') THEN 1 ELSE 0 END) AS present_count,
+                    SUM(CASE WHEN a.status='absent'  THEN 1 ELSE 0 END) AS absent_count
+                    FROM attendance a
+                    JOIN sessions s ON a.session_id = s.id
+                    WHERE s.class_id = ? AND a.student_id = ?
+                    """,
+                    (class_id, sid),
+                ).fetchone()
+
+                present_count = att_row["present_count"] or 0
+                absent_count  = att_row["absent_count"] or 0
+                total_sessions = present_count + absent_count
+
+                if total_sessions >= 3:
+                    attendance_rate = present_count * 100 / total_sessions
+                    notif_type2 = None
+                    notif_level2 = None
+
+                    if attendance_rate < 60:
+                        notif_type2 = "attendance_alert"
+                        notif_level2 = "red"
+                    elif attendance_rate < 80:
+                        notif_type2 = "attendance_alert"
+                        notif_level2 = "yellow"
+
+                    if notif_type2:
+                        msg2 = f"Student {sid} has low attendance in {class_id}: {attendance_rate:.0f}% over {total_sessions} sessions."
+                        
+                        cur.execute(
+                            "DELETE FROM notifications WHERE lecturer_id=? AND type=? AND message LIKE ?",
+                            (lecturer_id, notif_type2, f"Student {sid} has low attendance in {class_id}%")
+                        )
+                        cur.execute(
+                            "INSERT INTO notifications(lecturer_id, message, level, type) VALUES (?,?,?,?)",
+                            (lecturer_id, msg2, notif_level2, notif_type2)
+                        )
+
+        # 9) CLASS-LEVEL ALERTS (Outside student loop)
+        if lecturer_id and class_id:
+            try:
+                # 9a) Low engagement across sessions
+                eng_rows = cur.execute(
+                    """
+                    SELECT session_id, AVG(engagement_score) AS avg_eng
+                    FROM engagement_summary
+                    WHERE class_id = ?
+                    GROUP BY session_id
+                    ORDER BY session_id DESC LIMIT 5
+                    """,
+                    (class_id,),
+                ).fetchall()
+
+                low_sessions = 0
+                for r in eng_rows:
+                    if (r["avg_eng"] or 0.0) < 50.0:
+                        low_sessions += 1
+
+                cur.execute("DELETE FROM alerts WHERE lecturer_id=? AND course=? AND message='Student low engagement'", (lecturer_id, class_id))
+
+                if low_sessions > 0:
+                    level = "high" if low_sessions >= 3 else "medium"
+                    note_text = f"{low_sessions} session below 50%" if low_sessions == 1 else f"{low_sessions} sessions below 50%"
+                    
+                    cur.execute(
+                        "INSERT INTO alerts(lecturer_id, course, level, message, note, created_at) VALUES (?,?,?,?,?,?)",
+                        (lecturer_id, class_id, level, "Student low engagement", note_text, now_iso())
+                    )
+
+                # 9b) Attendance dropped alert
+                last_row = cur.execute(
+                    "SELECT id FROM sessions WHERE class_id = ? ORDER BY start_ts DESC LIMIT 1",
+                    (class_id,),
+                ).fetchone()
+
+                cur.execute("DELETE FROM alerts WHERE lecturer_id=? AND course=? AND message='Attendance dropped'", (lecturer_id, class_id))
+
+                if last_row:
+                    last_session_id = last_row["id"]
+                    
+                    # Calc last session rate
+                    last_att = cur.execute(
+                        "SELECT SUM(CASE WHEN status IN ('present','late') THEN 1 ELSE 0 END) as present_cnt, COUNT(*) as total_cnt FROM attendance WHERE session_id=?",
+                        (last_session_id,)
+                    ).fetchone()
+                    
+                    total_last = last_att["total_cnt"] or 0
+                    present_last = last_att["present_cnt"] or 0
+                    
+                    if total_last > 0:
+                        last_rate = 100.0 * present_last / total_last
+                        
+                        # Calc overall rate
+                        all_att = cur.execute(
+                            "SELECT SUM(CASE WHEN a.status='present' THEN 1 ELSE 0 END) as present_cnt, COUNT(*) as total_cnt FROM attendance a JOIN sessions s ON a.session_id=s.id WHERE s.class_id=?",
+                            (class_id,)
+                        ).fetchone()
+                        
+                        total_all = all_att["total_cnt"] or 0
+                        present_all = all_att["present_cnt"] or 0
+                        overall_rate = (100.0 * present_all / total_all) if total_all > 0 else last_rate
+                        
+                        drop = overall_rate - last_rate
+
+                        if last_rate < 80.0 and drop >= 10.0:
+                            level2 = "medium" if last_rate >= 60.0 else "high"
+                            note2 = f"Last session only {last_rate:.0f}%"
+                            cur.execute(
+                                "INSERT INTO alerts(lecturer_id, course, level, message, note, created_at) VALUES (?,?,?,?,?,?)",
+                                (lecturer_id, class_id, level2, "Attendance dropped", note2, now_iso())
+                            )
+            except Exception as e:
+                print(f"[alerts] failed to update alerts: {e}", file=sys.stderr)
+
+        # Success - Commit the transaction
+        conn.commit()
+
+    except Exception as e:
+        # Optional: Print error or Log it
+        print(f"Error calculating engagement: {e}", file=sys.stderr)
+        # We generally do not want to raise here if this is running in a background job, 
+        # but you can remove the try/except wrapper if you want it to crash loudly.
+        
+    finally:
+        # FIX 1 (Continued): This guarantees the connection closes
+        conn.close()
+
+# -------------------- Helpers: Auto-absent (attendance) --------------------
+def auto_mark_absent_students(session_id):
+    """
+    Finds all students enrolled in the class who have NO attendance record 
+    for this session, and inserts them as 'absent'.
+    """
+    if not session_id:
+        return
+
+    conn = connect()
+    cur = conn.cursor()
+
+    try:
+        # 1. Get the class_id for this session
+        row = cur.execute("SELECT class_id FROM sessions WHERE id=%s", (session_id,)).fetchone()
+        if not row:
+            return
+        class_id = row["class_id"]
+
+        # 2. SQL Magic: Select enrolled students NOT IN the attendance table
+        #    and insert them directly as 'absent'.
+        #    This is much faster than looping in Python.
+        ts_now = now_iso()
+        
+        cur.execute("""
+            INSERT INTO attendance (session_id, student_id, status, first_seen_ts, last_seen_ts)
+            SELECT %s, e.student_id, 'absent', %s, %s
+            FROM enrollments e
+            WHERE e.class_id = %s
+            AND e.student_id NOT IN (
+                SELECT student_id FROM attendance WHERE session_id = %s
+            )
+        """, (session_id, ts_now, ts_now, class_id, session_id))
+
+        conn.commit()
+        print(f"[Auto-Absent] Marked missing students as absent for session {session_id}")
+
+    except Exception as e:
+        print(f"[Auto-Absent] Error: {e}")
+    finally:
+        conn.close()
+
+# -------------------- Helpers: Email Verification --------------------
+def get_serializer():
+    return URLSafeTimedSerializer(current_app.config["SECRET_KEY"])
+
+
+def send_reset_email(to_email: str, reset_url: str):
+    """
+    Sends a password reset email.
+    For real deployment, set CLASSYNC_EMAIL_ADDRESS and CLASSYNC_EMAIL_PASSWORD
+    as environment variables for your Gmail/app password.
+    """
+    print("[RESET] Sending password reset link to:", to_email)
+    print("[RESET] Link:", reset_url)
+
+    # ⚠️ If you don't want real email yet, comment everything below out.
+    try:
+        msg = EmailMessage()
+        msg["Subject"] = "Classync – Reset your password"
+        msg["From"] = EMAIL_ADDRESS
+        msg["To"] = to_email
+        msg.set_content(
+            f"Hi,\n\nYou requested a password reset for your Classync account.\n"
+            f"Click the link below to set a new password (valid for 1 hour):\n\n"
+            f"{reset_url}\n\n"
+            "If you did not request this, you can ignore this email.\n"
+        )
+
+        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
+            smtp.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
+            smtp.send_message(msg)
+
+        print("[RESET] Email sent successfully.")
+    except Exception as e:
+        print("[RESET] Failed to send email:", e)
+
+# -------------------- Helpers: Supabase clients --------------------
+def _supabase_client(kind, key):
+    with _supabase_lock:
+        if kind not in _supabase_clients:
+            from supabase import create_client
+            _supabase_clients[kind] = create_client(SUPABASE_URL, key)
+        return _supabase_clients[kind]
+
+def get_supabase_admin():
+    return _supabase_client("admin", SUPABASE_SERVICE_ROLE_KEY)
+
+def get_supabase_anon():
+    return _supabase_client("anon", SUPABASE_ANON_KEY)
+
+# -------------------- Helpers: Embedding / Detector --------------------
+def get_embedder() -> EmbedFactory:
+    global _embed_factory
+    with _embed_lock:
+        if _embed_factory is None:
+            from vision.auto_enrol import EmbedFactory
+            _embed_factory = EmbedFactory()
+        return _embed_factory
+
+def get_detector() -> Detector:
+    global _detector
+    with _detector_lock:
+        if _detector is None:
+            from vision.detector import Detector
+            _detector = Detector()
+        return _detector
+
+def run_blocking(fn, *args, **kwargs):
+    """
+    Run CPU-bound model work off the event loop. Under eventlet an ONNX
+    call would otherwise freeze every socket held by this worker.
+    """
+    if socketio.async_mode == "eventlet":
+        from eventlet import tpool
+        return tpool.execute(fn, *args, **kwargs)
+    return fn(*args, **kwargs)
+
+def start_model_warmup():
+    """Load + exercise both models in the background (see server.app.start_model_warmup)."""
+    warmup.start(socketio.start_background_task, get_detector, get_embedder, run_blocking)
+
+def cos_sim(a, b):
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    denom = (np.linalg.norm(a) * np.linalg.norm(b)) + 1e-8
+    return float(np.dot(a, b) / denom)
+
+# -------------------- Time Helpers --------------------
+LOCAL_TZ = timezone(timedelta(hours=8))  # Malaysia time (UTC+8)
+
+
+def format_session_label(row):
+    """
+    Convert session start_ts (stored in UTC) to local time for display.
+    """
+    raw = row["start_ts"]
+    try:
+        dt = datetime.fromisoformat(raw)           # parse DB value
+        dt_local = dt.astimezone(LOCAL_TZ)         # convert to MY time
+        pretty = dt_local.strftime("%Y-%m-%d %H:%M")
+    except Exception:
+        # fallback if anything weird in DB
+        pretty = raw.replace("T", " ")[:16]
+
+    return f"Session {row['id']} – {pretty}"
+
+# -------------------- Classes & Attendance Helpers --------------------
+LATE_AFTER_MINUTES = 1
+
+def parse_iso(iso_str: str) -> datetime:
+    # works with "2025-12-21T13:18:13+00:00" and "Z"
+    s = (iso_str or "").replace("Z", "+00:00")
+    return datetime.fromisoformat(s)
+
+def mark_attendance_if_needed(session_id, student_id, ts_iso):
+    conn = connect()
+    cur = conn.cursor()
+
+    # already has attendance? don’t overwrite (lecturer override should stay)
+    existing = cur.execute(
+        "SELECT id, status FROM attendance WHERE session_id=? AND student_id=?",
+        (session_id, student_id),
+    ).fetchone()
+
+    if existing:
+        conn.close()
+        return
+
+    # get session start time
+    sess = cur.execute(
+        "SELECT start_ts FROM sessions WHERE id=?",
+        (session_id,),
+    ).fetchone()
+
+    # fallback: if no start_ts, mark present
+    status = "present"
+
+    try:
+        if sess and sess["start_ts"]:
+            start_dt = parse_iso(sess["start_ts"])
+            verify_dt = parse_iso(ts_iso)
+
+            late_cutoff = start_dt + timedelta(minutes=LATE_AFTER_MINUTES)
+            if verify_dt > late_cutoff:
+                status = "late"
+    except Exception:
+        status = "present"
+
+    cur.execute(
+        """
+        INSERT INTO attendance(session_id, student_id, status, first_seen_ts)
+        VALUES (?, ?, ?, ?)
+        """,
+        (session_id, student_id, status, ts_iso),
+    )
+
+    conn.commit()
+    conn.close()
+
+def get_open_session_id(conn):
+    cur = conn.cursor()
+    r = cur.execute(
+        "SELECT id FROM sessions WHERE end_ts IS NULL ORDER BY start_ts DESC LIMIT 1"
+    ).fetchone()
+    return r["id"] if r else None
+
+# -------------------- Helpers: Live roster --------------------
+def update_live(session_id, student_id, name, etype, value, ts_iso, ts_epoch, class_id=None):
+    """
+    Feed LIVE from the ingest path. Only a change of visible state is
+    queued, to the session room and the class room; BROADCAST coalesces
+    it into one batched delta per room per interval.
+    """
+    try:
+        delta = LIVE.update(session_id, student_id, name=name, etype=etype,
+                            value=value, ts_iso=ts_iso, ts_epoch=ts_epoch)
+    except Exception as e:
+        print("[live] update failed:", e, file=sys.stderr)
+        return
+    if not delta:
+        return
+    rooms = [session_room(session_id)]
+    if class_id:
+        rooms.append(class_room(class_id))
+    BROADCAST.push(rooms, student_id, compact_delta(delta))
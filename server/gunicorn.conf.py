@@ -0,0 +1,64 @@
+# server/gunicorn.conf.py
+# ------------------------------------------------------------
+# Gunicorn settings, picked by CLASSYNC_SERVER_MODE:
+#   async    -> eventlet worker: one green thread per socket, thousands of
+#               dashboard connections per worker (production default).
+#   threaded -> gthread worker with a small thread pool (old behaviour,
+#               handy for local debugging).
+#
+# More than one worker needs SOCKETIO_MESSAGE_QUEUE (e.g. redis://redis:6379/0)
+# so broadcasts reach sockets held by other workers, and clients should use
+# the websocket transport (gunicorn has no sticky sessions for long-polling).
+# ------------------------------------------------------------
+
+import os
+
+MODE = (os.getenv("CLASSYNC_SERVER_MODE") or "async").strip().lower()
+MESSAGE_QUEUE = (os.getenv("SOCKETIO_MESSAGE_QUEUE") or "").strip()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '7860')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+if workers > 1 and not MESSAGE_QUEUE:
+    print("[gunicorn] WEB_CONCURRENCY > 1 without SOCKETIO_MESSAGE_QUEUE; using 1 worker.")
+    workers = 1
+
+if MODE == "async":
+    worker_class = "eventlet"
+    worker_connections = int(os.getenv("WORKER_CONNECTIONS", "2000"))
+    os.environ.setdefault("SOCKETIO_ASYNC_MODE", "eventlet")
+else:
+    worker_class = "gthread"
+    threads = int(os.getenv("GUNICORN_THREADS", "4"))
+    os.environ.setdefault("SOCKETIO_ASYNC_MODE", "threading")
+
+
+def post_fork(server, worker):
+    # psycopg2 blocks the whole eventlet hub unless it is made green
+    if MODE != "async":
+        return
+    try:
+        from psycogreen.eventlet import patch_psycopg
+        patch_psycopg()
+    except Exception as e:
+        server.log.warning(f"[gunicorn] psycogreen not applied: {e}")
+
+
+def post_worker_init(worker):
+    # app is loaded in the worker by now; warm the models off the request path
+    try:
+        from server.app import start_model_warmup
+        start_model_warmup()
+    except Exception as e:
+        worker.log.warning(f"[gunicorn] model warm-up not started: {e}")
+
+
+def child_exit(server, worker):
+    # drop a dead worker's samples when PROMETHEUS_MULTIPROC_DIR is in use
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        try:
+            from prometheus_client import multiprocess
+            multiprocess.mark_process_dead(worker.pid)
+        except Exception:
+            pass
@@ -0,0 +1,84 @@
+# server/services/broadcast.py
+# ------------------------------------------------------------
+# Room-scoped, coalesced Socket.IO broadcasts.
+# Ingest handlers push per-student deltas; a single background task
+# flushes at most one batched "delta" per room every interval_ms, so
+# fan-out scales with interested viewers instead of total traffic.
+# ------------------------------------------------------------
+
+import os
+import sys
+from threading import Lock
+
+from server.services import metrics
+
+BROADCAST_INTERVAL_MS = int(os.getenv("BROADCAST_INTERVAL_MS", "500"))
+
+
+def session_room(session_id):
+    return f"session:{session_id}"
+
+
+def class_room(class_id):
+    return f"class:{class_id}"
+
+
+def compact_delta(entry: dict) -> dict:
+    """
+    Live-roster entry -> wire payload.
+      sid=student_id, n=name, st=status, s=state_score, t=last_seen
+    """
+    try:
+        score = round(float(entry.get("state_score") or 0.0), 3)
+    except Exception:
+        score = 0.0
+    return {
+        "sid": entry.get("student_id"),
+        "n": entry.get("name"),
+        "st": entry.get("status"),
+        "s": score,
+        "t": entry.get("last_seen"),
+    }
+
+
+class RoomBroadcaster:
+    def __init__(self, socketio, namespace="/events", event="delta",
+                 interval_ms=BROADCAST_INTERVAL_MS):
+        self.socketio = socketio
+        self.namespace = namespace
+        self.event = event
+        self.interval_s = max(0.05, interval_ms / 1000.0)
+        self._lock = Lock()
+        self._pending = {}   # room -> {key -> payload} (latest wins)
+        self._task = None
+        self.emit_count = 0
+
+    def push(self, rooms, key, payload):
+        """Queue payload for every room; a newer payload for the same key replaces it."""
+        with self._lock:
+            for room in rooms:
+                if room:
+                    self._pending.setdefault(room, {})[key] = payload
+            if self._task is None:
+                self._task = self.socketio.start_background_task(self._run)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for room, items in pending.items():
+            try:
+                self.socketio.emit(
+                    self.event,
+                    {"room": room, "d": list(items.values())},
+                    to=room,
+                    namespace=self.namespace,
+                )
+                self.emit_count += 1
+                metrics.count_emit(self.event)
+            except Exception as e:
+                print(f"[broadcast] emit to {room} failed: {e}", file=sys.stderr)
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.interval_s)
+            self.flush()
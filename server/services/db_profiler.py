@@ -0,0 +1,173 @@
+# server/services/db_profiler.py
+# ------------------------------------------------------------
+# Opt-in query profiler for PgCursorWrapper.execute.
+#   DB_PROFILE=1        profile every request
+#   DB_PROFILE=header   only requests sent with "X-DB-Profile: 1"
+#   DB_PROFILE_N1=5     same statement >= N times in one request -> flagged
+#   DB_PROFILE_KEEP=200 request reports kept in memory
+#
+# Per request we keep each normalized statement, its duration, row count
+# and call site. Repeats of one statement inside a single request are
+# reported as N+1 candidates (e.g. per-student queries in a loop).
+# ------------------------------------------------------------
+
+import os
+import re
+import sys
+import time
+import logging
+from collections import deque, defaultdict
+from threading import Lock
+
+log = logging.getLogger("server.db")
+
+MODE = (os.getenv("DB_PROFILE") or "0").strip().lower()
+N1_THRESHOLD = int(os.getenv("DB_PROFILE_N1", "5"))
+KEEP = int(os.getenv("DB_PROFILE_KEEP", "200"))
+
+_RE_WS = re.compile(r"\s+")
+_RE_STR = re.compile(r"'(?:[^']|'')*'")
+_RE_NUM = re.compile(r"\b\d+(?:\.\d+)?\b")
+
+# frames inside these files / functions are the DB plumbing, not the caller
+_SKIP_FILES = ("db_profiler.py", "metrics.py")
+_SKIP_FUNCS = {"execute", "exec_retry", "db_observe", "record"}
+
+_lock = Lock()
+_reports = deque(maxlen=KEEP)
+_totals = defaultdict(lambda: {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0})
+
+
+def enabled() -> bool:
+    return MODE in ("1", "true", "on", "header")
+
+
+def normalize(sql: str) -> str:
+    s = _RE_STR.sub("?", sql)
+    s = _RE_NUM.sub("?", s)
+    return _RE_WS.sub(" ", s).strip()
+
+
+def _call_site() -> str:
+    f = sys._getframe(2)
+    while f is not None:
+        name = os.path.basename(f.f_code.co_filename)
+        if name not in _SKIP_FILES and f.f_code.co_name not in _SKIP_FUNCS:
+            return f"{name}:{f.f_lineno} in {f.f_code.co_name}"
+        f = f.f_back
+    return "?"
+
+
+def _req_state():
+    try:
+        from flask import g, has_request_context
+        if has_request_context() and getattr(g, "_dbprof", None) is not None:
+            return g
+    except Exception:
+        pass
+    return None
+
+
+def record(sql: str, seconds: float, rowcount) -> None:
+    """Called by PgCursorWrapper.execute; cheap no-op unless this request is profiled."""
+    g = _req_state()
+    if g is None:
+        return
+    g._dbprof.append({
+        "sql": normalize(sql),
+        "ms": round(seconds * 1000.0, 3),
+        "rows": rowcount if isinstance(rowcount, int) else None,
+        "site": _call_site(),
+    })
+
+
+def _finish(route, method, status, total_s, stmts):
+    by_sql = defaultdict(list)
+    for st in stmts:
+        by_sql[st["sql"]].append(st)
+
+    n_plus_one = []
+    for sql, items in by_sql.items():
+        if len(items) >= N1_THRESHOLD:
+            n_plus_one.append({
+                "sql": sql,
+                "count": len(items),
+                "total_ms": round(sum(i["ms"] for i in items), 3),
+                "sites": sorted({i["site"] for i in items}),
+            })
+    n_plus_one.sort(key=lambda x: x["count"], reverse=True)
+
+    report = {
+        "ts": time.time(),
+        "route": route,
+        "method": method,
+        "status": status,
+        "total_ms": round(total_s * 1000.0, 3),
+        "db_ms": round(sum(st["ms"] for st in stmts), 3),
+        "statements": len(stmts),
+        "n_plus_one": n_plus_one,
+        "detail": stmts,
+    }
+    with _lock:
+        _reports.append(report)
+        for sql, items in by_sql.items():
+            t = _totals[sql]
+            t["count"] += len(items)
+            t["total_ms"] += sum(i["ms"] for i in items)
+            t["max_ms"] = max(t["max_ms"], max(i["ms"] for i in items))
+            t["rows"] += sum(i["rows"] or 0 for i in items)
+
+    for hit in n_plus_one:
+        log.warning("possible N+1", extra={"route": route, "sql": hit["sql"][:200],
+                                           "count": hit["count"], "sites": hit["sites"]})
+
+
+def report(route=None, only_n1=False, limit=50, top=20):
+    with _lock:
+        reqs = list(_reports)
+        totals = sorted(
+            ({"sql": k, **v} for k, v in _totals.items()),
+            key=lambda x: x["total_ms"], reverse=True,
+        )[:top]
+    if route:
+        reqs = [r for r in reqs if r["route"] == route]
+    if only_n1:
+        reqs = [r for r in reqs if r["n_plus_one"]]
+    return {
+        "mode": MODE,
+        "n1_threshold": N1_THRESHOLD,
+        "requests": reqs[-limit:][::-1],
+        "top_statements": totals,
+    }
+
+
+def reset():
+    with _lock:
+        _reports.clear()
+        _totals.clear()
+
+
+# ---------- Flask wiring ----------
+def init_app(app):
+    if not enabled():
+        return
+    from flask import g, request
+
+    @app.before_request
+    def _dbprof_start():
+        if MODE == "header" and request.headers.get("X-DB-Profile") != "1":
+            return
+        g._dbprof = []
+        g._dbprof_t0 = time.perf_counter()
+
+    @app.after_request
+    def _dbprof_end(resp):
+        stmts = getattr(g, "_dbprof", None)
+        if stmts is None:
+            return resp
+        g._dbprof = None
+        route = request.url_rule.rule if request.url_rule else request.path
+        if not route.startswith("/api/debug/db-profile"):
+            _finish(route, request.method, resp.status_code,
+                    time.perf_counter() - g._dbprof_t0, stmts)
+        return resp
@@ -0,0 +1,401 @@
+# server/services/enrol_bulk.py
+# ------------------------------------------------------------
+# Whole-roster enrolment behind POST /api/classes/<class_id>/enrol_bulk.
+#   parse_roster(data)      CSV -> rows {row, name, email, student_id, photos}
+#   read_photos(uploads)    zip archives and/or loose images -> {path: bytes}
+#   match_photos(rows, ..)  roster row -> its photos: the "photo" column if
+#                           given, else files / folders named after the
+#                           student_id, email or name
+#   create_job / start      enrol_jobs row + background task
+#   run_job                 decode + largest face (vision.faces), aligned
+#                           with FACE_ALIGN=1 (vision.align), and batched
+#                           ArcFace (EMBED_BATCH crops per call, off the
+#                           event loop), per-student mean embedding, then
+#                           students + enrollments written with multi-row
+#                           upserts in ONE transaction
+# Progress lives in the enrol_jobs table (not in process memory) so the
+# status poll can land on any worker / role.
+# Student ids are resolved like /api/join: given student_id, then email
+# (enrollments), then name (students; only for rows with neither), else a
+# new Sxxx.
+# ------------------------------------------------------------
+
+import io
+import os
+import csv
+import json
+import time
+import uuid
+import zipfile
+from datetime import datetime, timezone
+
+import psycopg2.extras
+
+EMBED_BATCH = 32
+MIN_FACE = 40                    # same floor as /api/identify
+MAX_ROWS = int(os.getenv("BULK_ENROL_MAX_ROWS", "2000"))
+MAX_BYTES = int(os.getenv("BULK_ENROL_MAX_MB", "200")) * 1024 * 1024   # photos, uncompressed
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+_COLUMNS = {
+    "name": ("name", "display_name", "full_name", "student_name"),
+    "email": ("email", "email_address"),
+    "student_id": ("student_id", "id", "matric", "matric_no"),
+    "photos": ("photo", "photos", "image", "images", "file"),
+}
+
+
+class BulkEnrolError(ValueError):
+    """Bad upload (roster / archive); the message is returned to the client."""
+
+
+def _now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _connect(connect):
+    conn = connect()
+    if conn is None:
+        raise RuntimeError("database unavailable")
+    return conn
+
+
+def _key(s):
+    return " ".join((s or "").strip().lower().replace("_", " ").split())
+
+
+# -------------------- parsing --------------------
+def parse_roster(data: bytes):
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = data.decode("latin-1")
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames:
+        raise BulkEnrolError("roster is empty")
+    header = {h.strip().lower(): h for h in reader.fieldnames if h}
+    cols = {k: next((header[a] for a in aliases if a in header), None) for k, aliases in _COLUMNS.items()}
+    if cols["name"] is None:
+        raise BulkEnrolError("roster needs a 'name' column")
+
+    rows = []
+    for i, rec in enumerate(reader, start=2):   # row 1 is the header
+        get = lambda k: (rec.get(cols[k]) or "").strip() if cols[k] else ""
+        name = get("name")
+        if not name:
+            continue
+        photos = [p.strip() for p in get("photos").replace("|", ";").split(";") if p.strip()]
+        rows.append({"row": i, "name": name, "email": get("email").lower(),
+                     "student_id": get("student_id"), "photos": photos})
+        if len(rows) > MAX_ROWS:
+            raise BulkEnrolError(f"too many roster rows (max {MAX_ROWS})")
+    if not rows:
+        raise BulkEnrolError("roster has no rows with a name")
+    return rows
+
+
+def read_photos(uploads):
+    """uploads: [(filename, bytes)]; zips are expanded. Returns {path: bytes}."""
+    photos, total = {}, 0
+    for filename, data in uploads:
+        if filename.lower().endswith(".zip"):
+            try:
+                zf = zipfile.ZipFile(io.BytesIO(data))
+            except zipfile.BadZipFile:
+                raise BulkEnrolError(f"{filename} is not a valid zip")
+            with zf:
+                for info in zf.infolist():
+                    base = os.path.basename(info.filename)
+                    if (info.is_dir() or base.startswith(".") or "__MACOSX" in info.filename
+                            or not base.lower().endswith(IMAGE_EXTS)):
+                        continue
+                    total += info.file_size
+                    if total > MAX_BYTES:
+                        raise BulkEnrolError(f"photos exceed {MAX_BYTES // (1024 * 1024)} MB uncompressed")
+                    photos[info.filename] = zf.read(info)
+        elif filename.lower().endswith(IMAGE_EXTS):
+            total += len(data)
+            if total > MAX_BYTES:
+                raise BulkEnrolError(f"photos exceed {MAX_BYTES // (1024 * 1024)} MB")
+            photos[filename] = data
+    return photos
+
+
+def match_photos(rows, photos):
+    """Adds row["files"] (paths into photos). Unused paths are returned."""
+    by_base, by_stem, by_folder = {}, {}, {}
+    for path in photos:
+        parts = path.replace("\\", "/").split("/")
+        base = parts[-1].lower()
+        by_base.setdefault(base, []).append(path)
+        by_stem.setdefault(_key(os.path.splitext(base)[0]), []).append(path)
+        if len(parts) > 1:
+            by_folder.setdefault(_key(parts[-2]), []).append(path)
+
+    used = set()
+    for r in rows:
+        files = []
+        if r["photos"]:
+            for p in r["photos"]:
+                files += by_base.get(os.path.basename(p.replace("\\", "/")).lower(), [])
+        else:
+            for k in (r["student_id"], r["email"], r["name"]):
+                k = _key(k)
+                if k and (k in by_folder or k in by_stem):
+                    files = by_folder.get(k, []) + by_stem.get(k, [])
+                    break
+        r["files"] = sorted(set(files))
+        used.update(r["files"])
+    return [p for p in photos if p not in used]
+
+
+# -------------------- jobs --------------------
+def create_job(connect, class_id, total, user_id):
+    job_id = uuid.uuid4().hex
+    conn = _connect(connect)
+    try:
+        now = _now_iso()
+        conn.execute(
+            "INSERT INTO enrol_jobs (id, class_id, status, total, done, created_by, created_at, updated_at) "
+            "VALUES (?,?,?,?,?,?,?,?)",
+            (job_id, class_id, "queued", int(total), 0, user_id, now, now),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return job_id
+
+
+def get_job(connect, class_id, job_id):
+    conn = _connect(connect)
+    try:
+        row = conn.execute(
+            "SELECT id, class_id, status, total, done, message, result, created_at, updated_at "
+            "FROM enrol_jobs WHERE id=? AND class_id=?",
+            (job_id, class_id),
+        ).fetchone()
+    finally:
+        conn.close()
+    if not row:
+        return None
+    job = dict(row)
+    job["result"] = json.loads(job["result"]) if job.get("result") else None
+    job["progress"] = round(job["done"] / job["total"], 3) if job["total"] else (1.0 if job["status"] == "done" else 0.0)
+    return job
+
+
+def _progress(conn, job_id, status, done=None, message=None, result=None):
+    sets, params = ["status=?", "updated_at=?"], [status, _now_iso()]
+    if done is not None:
+        sets.append("done=?"); params.append(int(done))
+    if message is not None:
+        sets.append("message=?"); params.append(message)
+    if result is not None:
+        sets.append("result=?"); params.append(json.dumps(result))
+    conn.execute(f"UPDATE enrol_jobs SET {', '.join(sets)} WHERE id=?", (*params, job_id))
+    conn.commit()
+
+
+def start(spawn, **kw):
+    """spawn(fn, **kw) starts a background task, e.g. socketio.start_background_task."""
+    spawn(run_job, **kw)
+
+
+# -------------------- pipeline --------------------
+def _prepare(items, cv2, np, faces, align):
+    """[(path, bytes)] -> [(path, face or None, error)] (decode + largest face, aligned)."""
+    out = []
+    for path, data in items:
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            out.append((path, None, "unreadable image"))
+            continue
+        bbox = faces.find_largest_face_bbox(img)
+        if not bbox:
+            out.append((path, None, "no face found"))
+            continue
+        x1, y1, x2, y2 = bbox
+        if x2 - x1 < MIN_FACE or y2 - y1 < MIN_FACE:
+            out.append((path, None, "face too small"))
+            continue
+        out.append((path, align.align_face(img, bbox, fallback=img[y1:y2, x1:x2]), None))
+    return out
+
+
+def run_job(connect, get_embedder, run_blocking, job_id, class_id, rows, photos):
+    """Background task: embed every matched photo, then upsert students + enrollments."""
+    import numpy as np
+    import cv2
+    from vision import align, faces
+
+    t0 = time.perf_counter()
+    try:
+        pconn = _connect(connect)
+    except Exception as e:
+        print(f"[enrol_bulk] {job_id} failed: {e}")
+        return
+    try:
+        _progress(pconn, job_id, "processing", done=0)
+        users = {}                  # path -> [row index]: a photo shared by rows is embedded once
+        for ri, r in enumerate(rows):
+            for path in r["files"]:
+                users.setdefault(path, []).append(ri)
+        todo = list(users)
+        embs = {}                   # row index -> [emb]
+        problems = {}               # row index -> [str]
+        embedder = get_embedder()
+        done = 0
+        for i in range(0, len(todo), EMBED_BATCH):
+            chunk = [(path, photos.pop(path, None) or b"") for path in todo[i:i + EMBED_BATCH]]
+            prepared = run_blocking(_prepare, chunk, cv2, np, faces, align)
+            ok = [p for p in prepared if p[1] is not None]
+            for path, _, err in prepared:
+                if err:
+                    for ri in users[path]:
+                        problems.setdefault(ri, []).append(f"{os.path.basename(path)}: {err}")
+            if ok:
+                results = run_blocking(embedder.embed_batch, [p[1] for p in ok])
+                for (path, _, _), res in zip(ok, results):
+                    for ri in users[path]:
+                        if res.ok:
+                            embs.setdefault(ri, []).append(res.emb)
+                        else:
+                            problems.setdefault(ri, []).append(f"{os.path.basename(path)}: embed failed")
+            done += sum(len(users[path]) for path, _ in chunk)
+            _progress(pconn, job_id, "processing", done=done)
+
+        _progress(pconn, job_id, "writing", done=done)
+        mean = {ri: np.mean(np.stack(vs), axis=0) for ri, vs in embs.items()}   # row index -> vector
+        ids, created = _write(connect, class_id, rows, mean)
+
+        report = []
+        for ri, r in enumerate(rows):
+            report.append({
+                "row": r["row"], "name": r["name"], "student_id": ids.get(ri),
+                "photos": len(r["files"]), "embedded": ri in mean,
+                **({"problems": problems[ri]} if ri in problems else {}),
+            })
+        result = {
+            "enrolled": len(ids),
+            "new_students": created,
+            "with_face": len(mean),
+            "without_photo": sum(1 for r in rows if not r["files"]),
+            "seconds": round(time.perf_counter() - t0, 1),
+            "rows": report,
+        }
+        _progress(pconn, job_id, "done", done=done, result=result,
+                  message=f"{len(ids)} enrolled, {len(mean)} with a face embedding")
+        print(f"[enrol_bulk] {job_id} class={class_id}: {result['enrolled']} enrolled "
+              f"({created} new), {len(mean)} embedded in {result['seconds']}s")
+    except Exception as e:
+        print(f"[enrol_bulk] {job_id} failed: {e}")
+        try:
+            _progress(pconn, job_id, "failed", message=str(e)[:500])
+        except Exception:
+            pass
+    finally:
+        pconn.close()
+
+
+def _write(connect, class_id, rows, mean):
+    """
+    Resolve ids and upsert everything in one transaction.
+    Rows that resolve to the same student are combined: their embeddings
+    averaged, the first name / non-empty email kept. A student found only
+    by name keeps its stored embedding (same name is not proof of the
+    same face; the roster photo is used only when it has none).
+    Returns ({row index: student_id}, number of new students).
+    """
+    import numpy as np
+
+    conn = _connect(connect)
+    try:
+        cur = conn.conn.cursor()     # raw psycopg2 cursor: execute_values wants %s SQL
+        cur.execute("LOCK TABLE students IN SHARE ROW EXCLUSIVE MODE")   # vs mint_next_student_id
+
+        given = [r["student_id"] for r in rows if r["student_id"]]
+        emails = [r["email"] for r in rows if r["email"]]
+        names = [r["name"] for r in rows if not r["email"] and not r["student_id"]]
+        cur.execute("SELECT id FROM students WHERE id = ANY(%s)", (given,))
+        existing_ids = {row[0] for row in cur.fetchall()}
+        cur.execute("SELECT DISTINCT ON (email) email, student_id FROM enrollments "
+                    "WHERE email = ANY(%s) ORDER BY email, id DESC", (emails,))
+        by_email = {row[0]: row[1] for row in cur.fetchall()}
+        cur.execute("SELECT DISTINCT ON (name) name, id FROM students "
+                    "WHERE name = ANY(%s) ORDER BY name, last_seen_ts DESC NULLS LAST", (names,))
+        by_name = {row[0]: row[1] for row in cur.fetchall()}
+        cur.execute("SELECT id FROM students WHERE id LIKE 'S%%' "
+                    "ORDER BY CAST(SUBSTRING(id from 2) AS INTEGER) DESC LIMIT 1")
+        row = cur.fetchone()
+        next_num = int(row[0][1:]) + 1 if row else 1
+
+        ids, created, now = {}, 0, _now_iso()
+        roster_by_name = {}          # name -> sid, only among rows with neither email nor student_id
+        name_only = set()            # existing students matched by name alone
+        strong = set()               # students matched / created from an id or email
+        names_by_sid, vecs_by_sid, enrollments = {}, {}, {}
+        for ri, r in enumerate(rows):
+            sid = ((r["student_id"] if r["student_id"] in existing_ids else None)
+                   or by_email.get(r["email"]))
+            if not sid and not r["email"] and not r["student_id"]:
+                sid = roster_by_name.get(r["name"])
+                if not sid and r["name"] in by_name:
+                    sid = by_name[r["name"]]
+                    name_only.add(sid)
+            if not sid:
+                sid = f"S{next_num:03d}"
+                next_num += 1
+                created += 1
+                existing_ids.add(sid)
+            ids[ri] = sid
+            if r["email"]:
+                by_email[r["email"]] = sid      # duplicate roster rows map to the same student
+                strong.add(sid)
+            elif r["student_id"]:
+                strong.add(sid)
+            else:
+                roster_by_name.setdefault(r["name"], sid)
+            names_by_sid.setdefault(sid, r["name"])
+            if ri in mean:
+                vecs_by_sid.setdefault(sid, []).append(mean[ri])
+            prev = enrollments.get(sid)
+            if prev is None or (not prev[3] and r["email"]):
+                enrollments[sid] = (class_id, sid, prev[2] if prev else r["name"], r["email"])
+
+        students, keep_stored = [], []
+        for sid, name in names_by_sid.items():
+            emb = None
+            if sid in vecs_by_sid:
+                v = np.mean(np.stack(vecs_by_sid[sid]), axis=0)
+                emb = json.dumps((v / (np.linalg.norm(v) + 1e-9)).astype(np.float32).tolist())
+            (keep_stored if sid in name_only and sid not in strong else students).append((sid, name, emb, now))
+
+        upsert = ("INSERT INTO students (id, name, embedding, last_seen_ts) VALUES %s "
+                  "ON CONFLICT (id) DO UPDATE SET "
+                  "name = CASE WHEN students.name IS NULL OR TRIM(students.name) = '' "
+                  "THEN EXCLUDED.name ELSE students.name END, ")
+        if students:
+            psycopg2.extras.execute_values(
+                cur, upsert + "embedding = COALESCE(EXCLUDED.embedding, students.embedding)",
+                students, page_size=500,
+            )
+        if keep_stored:
+            psycopg2.extras.execute_values(
+                cur, upsert + "embedding = COALESCE(students.embedding, EXCLUDED.embedding)",
+                keep_stored, page_size=500,
+            )
+        psycopg2.extras.execute_values(
+            cur,
+            "INSERT INTO enrollments (class_id, student_id, display_name, email) VALUES %s "
+            "ON CONFLICT (class_id, student_id) DO UPDATE SET "
+            "display_name = EXCLUDED.display_name, "
+            "email = COALESCE(NULLIF(EXCLUDED.email, ''), enrollments.email)",
+            list(enrollments.values()), page_size=500,
+        )
+        conn.commit()
+        return ids, created
+    except Exception:
+        conn.conn.rollback()
+        raise
+    finally:
+        conn.close()
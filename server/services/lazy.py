@@ -0,0 +1,42 @@
+# server/services/lazy.py
+# ------------------------------------------------------------
+# Deferred imports for heavy modules (numpy, cv2, vision.*, supabase).
+#   np = lazy_module("numpy")   # nothing imported yet
+#   np.asarray(...)             # first attribute access imports numpy
+# A plain proxy instead of importlib.util.LazyLoader: cv2 replaces its own
+# sys.modules entry while loading, which LazyLoader does not survive.
+# ------------------------------------------------------------
+
+import importlib
+from threading import Lock
+
+
+class LazyModule:
+    __slots__ = ("_name", "_mod", "_lock")
+
+    def __init__(self, name):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_mod", None)
+        object.__setattr__(self, "_lock", Lock())
+
+    def _load(self):
+        mod = self._mod
+        if mod is None:
+            with self._lock:
+                mod = self._mod
+                if mod is None:
+                    mod = importlib.import_module(self._name)
+                    object.__setattr__(self, "_mod", mod)
+        return mod
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._mod is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_module(name):
+    return LazyModule(name)
+
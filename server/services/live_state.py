@@ -0,0 +1,324 @@
+# server/services/live_state.py
+# ------------------------------------------------------------
+# In-process live roster: latest status per (session, student).
+# Updated on the ingest path (/api/events, /api/sighting) so that
+# /api/live is an O(students) read with no DB round-trip.
+# Without Redis the table only knows what this process ingested: a
+# session it has not written to (web role split from ingest, or one of
+# several workers) is re-read from the DB every LIVE_REFRESH_S.
+# ------------------------------------------------------------
+
+import json
+import time
+import logging
+from threading import Lock
+
+LIVE_WINDOW_S = 180
+LIVE_REFRESH_S = 5.0
+
+log = logging.getLogger("server.live")
+
+
+def status_for(etype: str) -> str:
+    """Map an events.type to the label shown in the Live Roster."""
+    t = (etype or "").lower()
+    if t == "drowsy":
+        return "Drowsy"
+    if t == "awake":
+        return "Awake"
+    if t == "tab_away":
+        return "Away"
+    # default if we only know they are in the window
+    return "Present"
+
+
+def _entry(student_id, name, etype, value, ts_iso) -> dict:
+    value = value or {}
+    return {
+        "student_id": student_id,
+        "name": name or student_id,
+        "status": status_for(etype),
+        "last_seen": ts_iso,
+        "state": (value.get("state") or "").lower(),
+        "state_score": value.get("state_score", 0.0),
+    }
+
+
+class LiveStateTable:
+    """
+    session_id -> {student_id -> entry}
+
+    Each entry keeps what /api/live returns plus the epoch time it was
+    last touched, so expiry is a simple comparison on read.
+
+    sole_writer: this process ingests every event (one worker, role
+    "all"), so a session it has written to never needs the DB again.
+    Otherwise back-filled sessions go stale after refresh_s.
+    """
+
+    def __init__(self, window_s: float = LIVE_WINDOW_S, refresh_s: float = LIVE_REFRESH_S,
+                 sole_writer: bool = True):
+        self.window_s = window_s
+        self.refresh_s = refresh_s
+        self.sole_writer = sole_writer
+        self._lock = Lock()
+        self._sessions = {}
+        self._hydrated = {}         # session -> monotonic time of the last back-fill
+        self._written = set()       # sessions updated by this process
+        self._latest_session = None  # most recently active session id
+
+    # ---------- write path ----------
+    def update(self, session_id, student_id, name=None, etype=None,
+               value=None, ts_iso=None, ts_epoch=None):
+        """
+        Record one event. Returns the new entry when the visible status
+        (or the student) changed, else None — callers push only those.
+        """
+        if not session_id or not student_id:
+            return None
+
+        now = time.time()
+        ts_epoch = float(ts_epoch) if ts_epoch is not None else now
+        entry = _entry(student_id, name, etype, value, ts_iso)
+
+        with self._lock:
+            self._latest_session = session_id
+            self._written.add(session_id)
+            students = self._sessions.setdefault(session_id, {})
+            prev = students.get(student_id)
+
+            # keep a known name if this event only carried the id
+            if prev and (not name or name == student_id):
+                entry["name"] = prev["entry"]["name"]
+
+            # out-of-order events never overwrite a newer one
+            if prev and prev["ts"] > ts_epoch:
+                return None
+
+            students[student_id] = {"ts": ts_epoch, "seen": now, "entry": entry}
+
+            expired = prev is not None and (now - prev["seen"]) > self.window_s
+            if prev is None or expired or prev["entry"]["status"] != entry["status"] \
+                    or prev["entry"]["name"] != entry["name"]:
+                return dict(entry)
+        return None
+
+    def close_session(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._hydrated.pop(session_id, None)
+            self._written.discard(session_id)
+            if self._latest_session == session_id:
+                self._latest_session = None
+
+    # ---------- read path ----------
+    def snapshot(self, session_id):
+        """Live entries for a session, dropping anything past the window."""
+        cutoff = time.time() - self.window_s
+        with self._lock:
+            students = self._sessions.get(session_id) or {}
+            for sid in [k for k, v in students.items() if v["seen"] < cutoff]:
+                students.pop(sid, None)
+            rows = sorted(students.values(), key=lambda v: v["ts"], reverse=True)
+            return [dict(v["entry"]) for v in rows]
+
+    def latest_session_id(self):
+        with self._lock:
+            return self._latest_session
+
+    def is_hydrated(self, session_id) -> bool:
+        """False when /api/live should (re-)read the session from the DB."""
+        with self._lock:
+            at = self._hydrated.get(session_id)
+            if at is None:
+                return False
+            if self.sole_writer and session_id in self._written:
+                return True
+            return time.monotonic() - at < self.refresh_s
+
+    def hydrate(self, session_id, rows):
+        """
+        Back-fill a session from the events table (after a restart, or a
+        refresh of events ingested elsewhere). rows: dicts with student_id,
+        ts, type, value, name, newest first — the shape the old /api/live
+        query returned. An entry is only replaced by a newer event.
+        """
+        now = time.time()
+        with self._lock:
+            students = self._sessions.setdefault(session_id, {})
+            done = set()
+            for r in rows:
+                sid = r["student_id"]
+                if not sid or sid in done:
+                    continue
+                done.add(sid)
+                try:
+                    val = json.loads(r["value"]) if r["value"] else {}
+                except Exception:
+                    val = {}
+                try:
+                    ts_epoch = _iso_to_epoch(r["ts"])
+                except Exception:
+                    ts_epoch = now
+                prev = students.get(sid)
+                if prev and prev["ts"] >= ts_epoch:
+                    continue
+                students[sid] = {
+                    "ts": ts_epoch,
+                    # age the entry by its event time so it still expires on schedule
+                    "seen": min(now, ts_epoch),
+                    "entry": _entry(sid, r["name"], r["type"], val, r["ts"]),
+                }
+            self._hydrated[session_id] = time.monotonic()
+
+
+# Atomic read-merge-write of one roster field (workers update the same
+# student concurrently). KEYS: hash, latest; ARGV: field, record json,
+# keep previous name (1/0), ttl, session id. Returns {stored 1/0, previous json or ""}.
+_UPDATE_LUA = """
+local raw = redis.call('HGET', KEYS[1], ARGV[1])
+local rec = ARGV[2]
+if raw then
+  local prev = cjson.decode(raw)
+  local new = cjson.decode(rec)
+  if prev.ts > new.ts then
+    return {0, raw}
+  end
+  if ARGV[3] == '1' then
+    new.entry.name = prev.entry.name
+    rec = cjson.encode(new)
+  end
+end
+redis.call('HSET', KEYS[1], ARGV[1], rec)
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[4]))
+redis.call('SET', KEYS[2], ARGV[5])
+return {1, raw or ''}
+"""
+
+
+class RedisLiveStateTable(LiveStateTable):
+    """
+    Same interface as LiveStateTable, stored in Redis hashes so every
+    gunicorn worker serves the same roster:
+      <prefix>:<session_id>   field=student_id -> {"ts","seen","entry"}
+      <prefix>:hydrated       set of back-filled sessions
+      <prefix>:latest         most recently active session id
+    update() merges with the stored entry in one Lua script, so
+    concurrent workers never lose each other's updates.
+    """
+
+    def __init__(self, client, window_s: float = LIVE_WINDOW_S, prefix: str = "classync:live"):
+        super().__init__(window_s=window_s)
+        self.r = client
+        self.prefix = prefix
+        self._update_script = client.register_script(_UPDATE_LUA)
+
+    def _key(self, session_id):
+        return f"{self.prefix}:{session_id}"
+
+    def update(self, session_id, student_id, name=None, etype=None,
+               value=None, ts_iso=None, ts_epoch=None):
+        if not session_id or not student_id:
+            return None
+
+        now = time.time()
+        ts_epoch = float(ts_epoch) if ts_epoch is not None else now
+        entry = _entry(student_id, name, etype, value, ts_iso)
+
+        keep_name = not name or name == student_id
+        stored, raw = self._update_script(
+            keys=[self._key(session_id), f"{self.prefix}:latest"],
+            args=[student_id, json.dumps({"ts": ts_epoch, "seen": now, "entry": entry}),
+                  "1" if keep_name else "0", int(self.window_s * 4), str(session_id)],
+        )
+        if not int(stored):
+            return None
+        prev = json.loads(raw) if raw else None
+        if prev and keep_name:
+            entry["name"] = prev["entry"]["name"]
+
+        expired = prev is not None and (now - prev["seen"]) > self.window_s
+        if prev is None or expired or prev["entry"]["status"] != entry["status"] \
+                or prev["entry"]["name"] != entry["name"]:
+            return dict(entry)
+        return None
+
+    def close_session(self, session_id):
+        pipe = self.r.pipeline()
+        pipe.delete(self._key(session_id))
+        pipe.srem(f"{self.prefix}:hydrated", str(session_id))
+        pipe.execute()
+        latest = self.r.get(f"{self.prefix}:latest")
+        if latest is not None and _as_str(latest) == str(session_id):
+            self.r.delete(f"{self.prefix}:latest")
+
+    def snapshot(self, session_id):
+        cutoff = time.time() - self.window_s
+        key = self._key(session_id)
+        rows, stale = [], []
+        for sid, raw in (self.r.hgetall(key) or {}).items():
+            v = json.loads(raw)
+            if v["seen"] < cutoff:
+                stale.append(sid)
+            else:
+                rows.append(v)
+        if stale:
+            self.r.hdel(key, *stale)
+        rows.sort(key=lambda v: v["ts"], reverse=True)
+        return [v["entry"] for v in rows]
+
+    def latest_session_id(self):
+        v = self.r.get(f"{self.prefix}:latest")
+        try:
+            return int(_as_str(v)) if v is not None else None
+        except ValueError:
+            return None
+
+    def is_hydrated(self, session_id) -> bool:
+        return bool(self.r.sismember(f"{self.prefix}:hydrated", str(session_id)))
+
+    def hydrate(self, session_id, rows):
+        local = LiveStateTable(window_s=self.window_s)
+        local.hydrate(session_id, rows)
+        key = self._key(session_id)
+        pipe = self.r.pipeline()
+        for sid, v in local._sessions.get(session_id, {}).items():
+            pipe.hsetnx(key, sid, json.dumps(v))
+        pipe.expire(key, int(self.window_s * 4))
+        pipe.sadd(f"{self.prefix}:hydrated", str(session_id))
+        pipe.execute()
+
+
+def make_live_table(url: str = "", window_s: float = LIVE_WINDOW_S,
+                    sole_writer: bool = True) -> LiveStateTable:
+    """
+    redis:// / rediss:// -> shared RedisLiveStateTable (multi-worker).
+    Anything else (empty, memory://, ...) -> in-process LiveStateTable;
+    sole_writer=False (several workers) makes it re-read the DB for
+    sessions other processes also write.
+    """
+    url = (url or "").strip()
+    if url.startswith(("redis://", "rediss://")):
+        try:
+            import redis
+            client = redis.Redis.from_url(url)
+            client.ping()
+            log.info("using shared Redis live state")
+            return RedisLiveStateTable(client, window_s=window_s)
+        except Exception as e:
+            log.warning("Redis live state unavailable (%s): using an in-process table, "
+                        "/api/live re-reads sessions this process does not ingest", e)
+    elif url:
+        log.warning("live state is not shared over %s (Redis only): using an in-process table, "
+                    "/api/live re-reads sessions this process does not ingest", url.split(":", 1)[0])
+    return LiveStateTable(window_s=window_s, sole_writer=sole_writer)
+
+
+def _as_str(v) -> str:
+    return v.decode("utf-8") if isinstance(v, bytes) else str(v)
+
+
+def _iso_to_epoch(ts_iso: str) -> float:
+    from datetime import datetime
+    s = (ts_iso or "").replace("Z", "+00:00")
+    return datetime.fromisoformat(s).timestamp()
@@ -0,0 +1,115 @@
+# server/services/logging_setup.py
+# ------------------------------------------------------------
+# Logging for the server process.
+#   - one JSON object per line (LOG_FORMAT=json, default) or plain text
+#   - per-logger levels: LOG_LEVEL=INFO, LOG_LEVELS="server.identify=DEBUG,vision.detector=WARNING"
+#   - DEBUG records from hot loggers (1 Hz per student) are sampled and
+#     rate-limited: LOG_DEBUG_SAMPLE=0.01, LOG_DEBUG_MAX_PER_S=5
+#   - handlers run on a QueueListener thread; the request path only
+#     does a queue put
+# ------------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from threading import Lock
+
+# loggers on the 1 Hz-per-student paths
+HOT_LOGGERS = ("server.identify", "server.infer", "vision.detector", "vision.auto_enrol")
+
+# LogRecord attributes that are not user "extra" fields
+_STD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        out = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for k, v in record.__dict__.items():
+            if k not in _STD_ATTRS and not k.startswith("_"):
+                out[k] = v
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, default=str, ensure_ascii=False)
+
+
+class HotPathFilter(logging.Filter):
+    """
+    Keep every INFO+ record. DEBUG records from HOT_LOGGERS are sampled
+    (sample ratio) and capped per logger to max_per_s.
+    """
+
+    def __init__(self, sample=0.01, max_per_s=5.0, hot=HOT_LOGGERS):
+        super().__init__()
+        self.sample = float(sample)
+        self.max_per_s = float(max_per_s)
+        self.hot = tuple(hot)
+        self._lock = Lock()
+        self._window = {}   # logger -> (second, count)
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or not record.name.startswith(self.hot):
+            return True
+        if self.sample < 1.0 and random.random() >= self.sample:
+            return False
+        sec = int(time.time())
+        with self._lock:
+            s, n = self._window.get(record.name, (sec, 0))
+            if s != sec:
+                s, n = sec, 0
+            if n >= self.max_per_s:
+                return False
+            self._window[record.name] = (s, n + 1)
+        return True
+
+
+def _parse_levels(spec):
+    levels = {}
+    for part in (spec or "").split(","):
+        if "=" in part:
+            name, lvl = part.split("=", 1)
+            levels[name.strip()] = lvl.strip().upper()
+    return levels
+
+
+def configure_logging():
+    """Idempotent; call once at startup."""
+    global _listener
+    if _listener is not None:
+        return
+
+    fmt = (os.getenv("LOG_FORMAT") or "json").lower()
+    stream = logging.StreamHandler(sys.stdout)
+    if fmt == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    q = queue.SimpleQueue()
+    qh = logging.handlers.QueueHandler(q)
+    qh.addFilter(HotPathFilter(
+        sample=os.getenv("LOG_DEBUG_SAMPLE", "0.01"),
+        max_per_s=os.getenv("LOG_DEBUG_MAX_PER_S", "5"),
+    ))
+
+    root = logging.getLogger()
+    root.handlers[:] = [qh]
+    root.setLevel((os.getenv("LOG_LEVEL") or "INFO").upper())
+    for name, lvl in _parse_levels(os.getenv("LOG_LEVELS")).items():
+        logging.getLogger(name).setLevel(lvl)
+
+    _listener = logging.handlers.QueueListener(q, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
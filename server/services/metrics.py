@@ -0,0 +1,148 @@
+# server/services/metrics.py
+# ------------------------------------------------------------
+# Prometheus metrics for capacity planning.
+#   - request latency per Flask route
+#   - DB statements + DB time per request (fed by PgCursorWrapper.execute)
+#   - model call time per model, per-stage timings (/api/identify etc.)
+#   - gallery scan size, Socket.IO emits
+# If prometheus_client is not installed every helper is a no-op and
+# /metrics answers 501, so the app never depends on it.
+#
+# Multi-worker gunicorn: set PROMETHEUS_MULTIPROC_DIR to an empty dir.
+# ------------------------------------------------------------
+
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import prometheus_client as prom
+except Exception:
+    prom = None
+
+_LAT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+if prom is not None:
+    HTTP_SECONDS = prom.Histogram(
+        "classync_http_request_seconds", "Request latency per Flask route",
+        ["route", "method", "status"], buckets=_LAT_BUCKETS)
+    DB_QUERIES = prom.Histogram(
+        "classync_db_queries_per_request", "SQL statements executed per request",
+        ["route"], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233))
+    DB_SECONDS = prom.Histogram(
+        "classync_db_seconds_per_request", "Total DB time per request",
+        ["route"], buckets=_LAT_BUCKETS)
+    DB_STATEMENT_SECONDS = prom.Histogram(
+        "classync_db_statement_seconds", "Single SQL statement time",
+        ["verb"], buckets=_STAGE_BUCKETS)
+    MODEL_SECONDS = prom.Histogram(
+        "classync_model_seconds", "Model call time (pre + ONNX run + post)",
+        ["model"], buckets=_STAGE_BUCKETS)
+    STAGE_SECONDS = prom.Histogram(
+        "classync_stage_seconds", "Per-stage time inside a route",
+        ["route", "stage"], buckets=_STAGE_BUCKETS)
+    GALLERY_SCAN = prom.Histogram(
+        "classync_gallery_scan_size", "Embeddings compared per match",
+        ["route"], buckets=(0, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000))
+    SOCKETIO_EMITS = prom.Counter(
+        "classync_socketio_emits_total", "Socket.IO emits", ["event"])
+
+
+def enabled() -> bool:
+    return prom is not None
+
+
+# ---------- per-request DB accounting ----------
+def _req_state():
+    try:
+        from flask import g, has_request_context
+        if has_request_context():
+            return g
+    except Exception:
+        pass
+    return None
+
+
+def db_observe(sql: str, seconds: float) -> None:
+    """Called by PgCursorWrapper.execute for every statement."""
+    g = _req_state()
+    if g is not None:
+        g._db_count = getattr(g, "_db_count", 0) + 1
+        g._db_seconds = getattr(g, "_db_seconds", 0.0) + seconds
+    if prom is None:
+        return
+    verb = (sql.lstrip().split(None, 1) or ["?"])[0].upper()
+    DB_STATEMENT_SECONDS.labels(verb).observe(seconds)
+
+
+# ---------- stages / models ----------
+@contextmanager
+def stage(route: str, name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        if prom is not None:
+            STAGE_SECONDS.labels(route, name).observe(time.perf_counter() - t0)
+
+
+def observe_stage(route: str, name: str, seconds: float) -> None:
+    if prom is not None:
+        STAGE_SECONDS.labels(route, name).observe(seconds)
+
+
+@contextmanager
+def model(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        if prom is not None:
+            MODEL_SECONDS.labels(name).observe(time.perf_counter() - t0)
+
+
+def gallery_scan(route: str, n: int) -> None:
+    if prom is not None:
+        GALLERY_SCAN.labels(route).observe(n)
+
+
+def count_emit(event: str, n: int = 1) -> None:
+    if prom is not None:
+        SOCKETIO_EMITS.labels(event).inc(n)
+
+
+# ---------- Flask wiring ----------
+def init_app(app):
+    from flask import g, request, Response
+
+    @app.before_request
+    def _metrics_start():
+        g._t0 = time.perf_counter()
+        g._db_count = 0
+        g._db_seconds = 0.0
+
+    @app.after_request
+    def _metrics_end(resp):
+        if prom is None or not hasattr(g, "_t0"):
+            return resp
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        if route == "/metrics" or route.startswith("/static"):
+            return resp
+        HTTP_SECONDS.labels(route, request.method, str(resp.status_code)).observe(
+            time.perf_counter() - g._t0)
+        DB_QUERIES.labels(route).observe(g._db_count)
+        DB_SECONDS.labels(route).observe(g._db_seconds)
+        return resp
+
+    @app.get("/metrics")
+    def metrics_endpoint():
+        if prom is None:
+            return Response("prometheus_client not installed\n", status=501, mimetype="text/plain")
+        if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+            from prometheus_client import multiprocess
+            registry = prom.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = prom.REGISTRY
+        return Response(prom.generate_latest(registry), mimetype=prom.CONTENT_TYPE_LATEST)
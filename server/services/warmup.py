@@ -0,0 +1,110 @@
+# server/services/warmup.py
+# ------------------------------------------------------------
+# Model warm-up after fork.
+# Loads the detector + ArcFace and runs a few dummy inferences at the
+# production input shapes (512x512 frame, 112x112 face) so the first
+# /api/infer and /api/identify of a class do not pay for session
+# creation and OpenVINO compilation.
+#   MODEL_WARMUP=1               0 = skip (models load lazily as before)
+#   MODEL_WARMUP_RUNS=2          dummy inferences per model
+#   MODEL_WARMUP_MODELS=detector,arcface
+# /api/health reports status(): cold -> warming -> ready | degraded
+# ------------------------------------------------------------
+
+import os
+import sys
+import time
+from threading import Lock
+
+FRAME_SIZE = 512   # extension sends 512x512 JPEG frames
+FACE_SIZE = 112    # ArcFace input
+
+_lock = Lock()
+_state = {"status": "cold", "started": None, "finished": None, "models": {}}
+
+
+def enabled() -> bool:
+    return (os.getenv("MODEL_WARMUP") or "1").strip().lower() not in ("0", "false", "off")
+
+
+def status() -> dict:
+    with _lock:
+        return {**_state, "models": dict(_state["models"])}
+
+
+def is_ready() -> bool:
+    """False only while a warm-up is running; cold (never started) keeps the old lazy behaviour."""
+    with _lock:
+        return _state["status"] != "warming"
+
+
+def _set(**kw):
+    with _lock:
+        _state.update(kw)
+
+
+def _set_model(name, info):
+    with _lock:
+        _state["models"][name] = info
+
+
+def _warm(name, load, infer, runs, run_blocking):
+    t0 = time.perf_counter()
+    try:
+        obj = run_blocking(load)
+        load_s = time.perf_counter() - t0
+        times = []
+        for _ in range(runs):
+            t1 = time.perf_counter()
+            run_blocking(infer, obj)
+            times.append(time.perf_counter() - t1)
+        info = {
+            "ok": True,
+            "load_ms": round(load_s * 1000.0, 1),
+            "infer_ms": [round(t * 1000.0, 1) for t in times],
+        }
+    except Exception as e:
+        info = {"ok": False, "error": str(e)}
+    _set_model(name, info)
+    print(f"[warmup] {name}: {info}")
+    return info["ok"]
+
+
+def run(get_detector, get_embedder, run_blocking=None):
+    """Blocking warm-up; normally called through start()."""
+    import numpy as np
+
+    run_blocking = run_blocking or (lambda fn, *a, **kw: fn(*a, **kw))
+    runs = max(1, int(os.getenv("MODEL_WARMUP_RUNS", "2")))
+    wanted = {m.strip() for m in (os.getenv("MODEL_WARMUP_MODELS") or "detector,arcface").split(",") if m.strip()}
+
+    _set(status="warming", started=time.time())
+    ok = True
+    if "detector" in wanted:
+        frame = np.zeros((FRAME_SIZE, FRAME_SIZE, 3), np.uint8)
+        ok &= _warm("detector", get_detector, lambda det: det.predict_states(frame), runs, run_blocking)
+    if "arcface" in wanted:
+        face = np.zeros((FACE_SIZE, FACE_SIZE, 3), np.uint8)
+        ok &= _warm("arcface", lambda: get_embedder().get_impl(), lambda impl: impl.embed(face), runs, run_blocking)
+
+    _set(status="ready" if ok else "degraded", finished=time.time())
+    print(f"[warmup] done: {status()['status']}")
+
+
+def start(spawn, get_detector, get_embedder, run_blocking=None):
+    """
+    Kick off run() once per process. spawn(fn, *args) starts a background
+    task, e.g. socketio.start_background_task (green thread under eventlet).
+    """
+    with _lock:
+        if _state["status"] != "cold":
+            return
+        if not enabled():
+            _state["status"] = "disabled"
+            return
+        _state["status"] = "warming"
+    try:
+        spawn(run, get_detector, get_embedder, run_blocking)
+    except Exception as e:
+        print(f"[warmup] could not start: {e}", file=sys.stderr)
+        _set(status="degraded")
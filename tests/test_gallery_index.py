@@ -0,0 +1,142 @@
+# tests/test_gallery_index.py
+# ------------------------------------------------------------
+# vision/gallery_index.py persistence: save/load round trip and the
+# legacy gallery.json merge.
+# ------------------------------------------------------------
+
+import json
+import os
+import time
+
+import numpy as np
+import pytest
+
+from vision.gallery_index import GalleryIndex
+
+DIM = 8
+
+
+def _vec(seed, dim=DIM):
+    v = np.random.default_rng(seed).normal(size=dim).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+def _write_legacy(path, students, age_s=0.0):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"students": [{"name": n, "emb": np.asarray(e).tolist(), "id": sid}
+                                for n, e, sid in students]}, f)
+    t = time.time() - age_s
+    os.utime(path, (t, t))
+
+
+def _make_older(path, age_s):
+    t = time.time() - age_s
+    os.utime(path, (t, t))
+
+
+@pytest.fixture
+def base(tmp_path):
+    return tmp_path / "gallery_index"
+
+
+def test_save_load_round_trip(base):
+    g = GalleryIndex(base=base, dim=DIM)
+    g.add("Ann", _vec(1), "S001")
+    g.add("Ben", _vec(2))
+    g.merge("Ann", _vec(3), alpha=0.5)
+    g.flush()
+    assert g._timer is None and not g._dirty
+
+    h = GalleryIndex.load(base)
+    assert h.names == ["Ann", "Ben"] and h.ids == ["S001", ""]
+    assert h.dim == DIM
+    np.testing.assert_allclose(h.matrix, g.matrix, atol=1e-6)
+    assert h.best(_vec(2))[1] == "Ben"
+
+
+def test_debounced_save_after_flush_reschedules(base):
+    g = GalleryIndex(base=base, dim=DIM, save_delay_s=0.05)
+    g.add("Ann", _vec(1))
+    g.flush()
+    g.add("Ben", _vec(2))
+    assert g._timer is not None
+    g._timer.join(1.0)
+    assert GalleryIndex.load(base).names == ["Ann", "Ben"]
+
+
+def test_legacy_json_is_merged_not_replacing_the_index(base, tmp_path):
+    legacy = tmp_path / "gallery.json"
+    _write_legacy(legacy, [("Ann", _vec(1), "S001"), ("Ben", _vec(2), "")], age_s=60)
+
+    g = GalleryIndex.load(base, legacy_json=legacy)
+    assert g.names == ["Ann", "Ben"]
+    assert not base.with_suffix(".json").exists()       # load() never writes
+    g.add("Cat", _vec(3))                               # run_loop auto-enrol
+    g.merge("Ann", _vec(4), alpha=0.5)                  # run_loop merge
+    ann_row = g.matrix[g.index_of("Ann")].copy()
+    g.flush()
+    _make_older(base.with_suffix(".json"), 30)
+
+    # batch_enrol rewrites gallery.json: Ben re-embedded, Dan new, Ann unchanged
+    _write_legacy(legacy, [("Ann", _vec(1), "S001"), ("Ben", _vec(5), "S002"), ("Dan", _vec(6), "")])
+    h = GalleryIndex.load(base, legacy_json=legacy)
+
+    assert h.names == ["Ann", "Ben", "Cat", "Dan"]
+    np.testing.assert_allclose(h.matrix[h.index_of("Ann")], ann_row, atol=1e-6)
+    np.testing.assert_allclose(h.matrix[h.index_of("Ben")], _vec(5), atol=1e-6)
+    assert h.ids[h.index_of("Ben")] == "S002"
+    assert h._dirty
+
+    h.flush()
+    assert GalleryIndex.load(base).names == ["Ann", "Ben", "Cat", "Dan"]
+
+
+def test_legacy_match_by_id_survives_a_rename(base, tmp_path):
+    g = GalleryIndex(base=base, dim=DIM)
+    g.add("Student_001", _vec(1), "S001")
+    g.flush()
+    _make_older(base.with_suffix(".json"), 30)
+
+    legacy = tmp_path / "gallery.json"
+    _write_legacy(legacy, [("Ann", _vec(2), "S001")])
+    h = GalleryIndex.load(base, legacy_json=legacy)
+    assert len(h) == 1
+    np.testing.assert_allclose(h.matrix[0], _vec(2), atol=1e-6)
+
+
+def test_legacy_entries_of_another_dimension_are_skipped(base, tmp_path, capsys):
+    g = GalleryIndex(base=base, dim=DIM)
+    g.add("Ann", _vec(1), "S001")
+    g.flush()
+    _make_older(base.with_suffix(".json"), 30)
+
+    legacy = tmp_path / "gallery.json"
+    _write_legacy(legacy, [("Ann", _vec(7, dim=DIM * 2), "S001"), ("Ben", _vec(8, dim=DIM * 2), ""),
+                           ("Cat", _vec(9), "")])
+    h = GalleryIndex.load(base, legacy_json=legacy)
+
+    assert h.names == ["Ann", "Cat"]
+    np.testing.assert_allclose(h.matrix[0], _vec(1), atol=1e-6)
+    assert "skipped 2" in capsys.readouterr().out
+
+
+def test_older_legacy_json_is_ignored(base, tmp_path):
+    legacy = tmp_path / "gallery.json"
+    _write_legacy(legacy, [("Ann", _vec(1), "")], age_s=60)
+    g = GalleryIndex(base=base, dim=DIM)
+    g.add("Ben", _vec(2))
+    g.flush()
+
+    assert GalleryIndex.load(base, legacy_json=legacy).names == ["Ben"]
+
+
+def test_to_json_exports_the_legacy_format(base, tmp_path):
+    g = GalleryIndex(base=base, dim=DIM)
+    g.add("Ann", _vec(1), "S001")
+    out = tmp_path / "export.json"
+    g.to_json(out)
+    g.flush()
+
+    h = GalleryIndex.load(tmp_path / "other", legacy_json=out)
+    assert h.names == ["Ann"] and h.ids == ["S001"]
+    np.testing.assert_allclose(h.matrix, g.matrix, atol=1e-6)
@@ -0,0 +1,111 @@
+# tests/test_live_state.py
+# ------------------------------------------------------------
+# RedisLiveStateTable against fakeredis (Lua included): the atomic
+# update() merge, snapshot() expiry and close_session().
+# ------------------------------------------------------------
+
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from server.services.live_state import RedisLiveStateTable
+
+
+@pytest.fixture
+def table():
+    client = fakeredis.FakeRedis()
+    try:
+        client.eval("return 1", 0)
+    except Exception:
+        pytest.skip("fakeredis without Lua support (pip install fakeredis[lua])")
+    return RedisLiveStateTable(client, window_s=180, prefix="test:live")
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+def test_update_reports_only_visible_changes(table):
+    now = time.time()
+    first = table.update(1, "S1", name="Ann", etype="awake", ts_epoch=now)
+    assert first["status"] == "Awake" and first["name"] == "Ann"
+    assert table.update(1, "S1", name="Ann", etype="awake", ts_epoch=now + 1) is None
+    assert table.update(1, "S1", name="Ann", etype="drowsy", ts_epoch=now + 2)["status"] == "Drowsy"
+
+
+def test_update_never_overwrites_a_newer_event(table):
+    now = time.time()
+    table.update(1, "S1", name="Ann", etype="drowsy", ts_epoch=now)
+    assert table.update(1, "S1", name="Ann", etype="awake", ts_epoch=now - 5) is None
+    assert [e["status"] for e in table.snapshot(1)] == ["Drowsy"]
+
+
+def test_update_keeps_known_name_for_id_only_events(table):
+    now = time.time()
+    table.update(1, "S1", name="Ann", etype="awake", ts_epoch=now)
+    table.update(1, "S1", name=None, etype="drowsy", ts_epoch=now + 1)
+    (entry,) = table.snapshot(1)
+    assert entry["name"] == "Ann" and entry["status"] == "Drowsy"
+
+
+def test_concurrent_updates_keep_the_newest_event(table):
+    base = time.time()
+    stamps = [base + i * 0.001 for i in range(200)]
+    chunks = [stamps[i::4] for i in range(4)]
+
+    def worker(chunk):
+        for ts in reversed(chunk):
+            table.update(1, "S1", name="Ann", etype="awake", value={"state_score": ts}, ts_epoch=ts)
+
+    threads = [threading.Thread(target=worker, args=(c,)) for c in chunks]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    (entry,) = table.snapshot(1)
+    assert entry["state_score"] == pytest.approx(stamps[-1])
+
+
+def test_snapshot_drops_and_deletes_expired_entries(table):
+    now = time.time()
+    table.hydrate(1, [{"student_id": "OLD", "ts": _iso(now - 600), "type": "awake",
+                       "value": None, "name": "Old"}])
+    table.update(1, "NEW", name="New", etype="awake", ts_epoch=now)
+
+    assert [e["student_id"] for e in table.snapshot(1)] == ["NEW"]
+    assert table.r.hkeys("test:live:1") == [b"NEW"]
+
+
+def test_hydrate_does_not_overwrite_live_entries(table):
+    now = time.time()
+    table.update(1, "S1", name="Ann", etype="drowsy", ts_epoch=now)
+    table.hydrate(1, [{"student_id": "S1", "ts": _iso(now - 10), "type": "awake",
+                       "value": None, "name": "Ann"}])
+    assert table.is_hydrated(1)
+    assert [e["status"] for e in table.snapshot(1)] == ["Drowsy"]
+
+
+def test_close_session_clears_roster_hydration_and_latest(table):
+    now = time.time()
+    table.hydrate(1, [])
+    table.update(1, "S1", name="Ann", etype="awake", ts_epoch=now)
+    assert table.latest_session_id() == 1
+
+    table.close_session(1)
+    assert table.snapshot(1) == []
+    assert not table.is_hydrated(1)
+    assert table.latest_session_id() is None
+    assert table.r.get("test:live:latest") is None
+
+
+def test_close_session_keeps_latest_of_another_session(table):
+    now = time.time()
+    table.update(1, "S1", name="Ann", etype="awake", ts_epoch=now)
+    table.update(2, "S2", name="Ben", etype="awake", ts_epoch=now)
+    table.close_session(1)
+    assert table.latest_session_id() == 2
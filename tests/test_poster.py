@@ -0,0 +1,122 @@
+# tests/test_poster.py
+# ------------------------------------------------------------
+# vision/poster.py against an in-process fake backend: delivery order
+# (journal before queue) and close() with a request in flight.
+# ------------------------------------------------------------
+
+import json
+import threading
+
+import pytest
+
+pytest.importorskip("requests")
+
+from vision.poster import EventPoster
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self._body = body or {}
+        self.text = json.dumps(self._body)
+
+    def json(self):
+        return self._body
+
+
+class FakeBackend:
+    """Stands in for requests.Session: records delivered events in order."""
+
+    def __init__(self):
+        self.up = True
+        self.received = []
+        self.gate = None        # threading.Event: hold requests until set
+        self.entered = threading.Event()
+
+    def post(self, url, json=None, timeout=None):
+        self.entered.set()
+        if self.gate is not None:
+            self.gate.wait(5.0)
+        if not self.up:
+            return FakeResponse(503)
+        events = json["events"]
+        self.received += [e["n"] for e in events]
+        return FakeResponse(200, {"ok": True, "results": [{"ok": True, "status": 200} for _ in events]})
+
+    def close(self):
+        pass
+
+
+def _poster(tmp_path, backend, **kw):
+    p = EventPoster("http://backend", tmp_path / "outbox", batch_max=2, flush_interval_s=0.02,
+                    backoff_base_s=0.01, backoff_max_s=0.02, **kw)
+    p.session = backend
+    return p
+
+
+def _wait_for(cond, timeout=5.0):
+    done = threading.Event()
+    for _ in range(int(timeout / 0.01)):
+        if cond():
+            return
+        done.wait(0.01)
+    raise AssertionError("timed out")
+
+
+def _journal(tmp_path):
+    out = []
+    for seg in sorted((tmp_path / "outbox").glob("*.jsonl")):
+        out += [json.loads(line)["n"] for line in seg.read_text().splitlines() if line]
+    return out
+
+
+def test_journal_from_last_run_goes_before_queued_events(tmp_path):
+    backend = FakeBackend()
+    (tmp_path / "outbox").mkdir()
+    (tmp_path / "outbox" / "1-1.jsonl").write_text("".join(json.dumps({"n": i}) + "\n" for i in range(3)))
+
+    p = _poster(tmp_path, backend)
+    for i in range(3, 6):
+        p.post({"n": i})
+    p.start()
+    p.close()
+
+    assert backend.received == [0, 1, 2, 3, 4, 5]
+    assert _journal(tmp_path) == []
+
+
+def test_order_is_kept_across_an_outage(tmp_path):
+    backend = FakeBackend()
+    backend.up = False
+    p = _poster(tmp_path, backend)
+    p.start()
+    for i in range(4):
+        p.post({"n": i})
+    _wait_for(lambda: p.stats["spilled"] >= 2 and p._failures >= 3)   # first batch journaled, replay retried
+
+    backend.up = True
+    for i in range(4, 6):
+        p.post({"n": i})
+    _wait_for(lambda: len(backend.received) >= 6)
+    p.close()
+
+    assert backend.received == [0, 1, 2, 3, 4, 5]
+    assert _journal(tmp_path) == []
+
+
+def test_close_waits_for_the_in_flight_batch_instead_of_journaling_it(tmp_path):
+    backend = FakeBackend()
+    backend.gate = threading.Event()
+    p = _poster(tmp_path, backend)
+    p.start()
+    p.post({"n": 0})
+    p.post({"n": 1})
+    assert backend.entered.wait(2.0)
+    p.post({"n": 2})
+
+    threading.Timer(0.2, backend.gate.set).start()
+    p.close(timeout=0.05)
+
+    assert backend.received == [0, 1]       # delivered once, not journaled too
+    assert _journal(tmp_path) == [2]        # the queue behind it is kept for the next start
+    assert p.stats["spilled"] == 1
@@ -0,0 +1,107 @@
+# tests/test_realtime.py
+# ------------------------------------------------------------
+# Socket.IO /events rooms (server/blueprints/realtime.py) and the
+# coalescing RoomBroadcaster, through flask_socketio's test client.
+# server.core needs its env vars; the DB is never reached.
+# ------------------------------------------------------------
+
+import os
+
+import pytest
+
+pytest.importorskip("flask_socketio")
+pytest.importorskip("psycopg2")
+
+os.environ.setdefault("DB_URI", "postgresql://test@127.0.0.1:1/test")
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:1")
+os.environ.setdefault("SUPABASE_ANON_KEY", "test")
+
+from flask import Flask
+
+from server import core
+from server.blueprints import realtime  # noqa: F401 (registers the /events handlers)
+from server.services.broadcast import RoomBroadcaster, class_room, session_room
+
+NS = "/events"
+
+
+@pytest.fixture(scope="module")
+def app():
+    app = Flask(__name__)
+    core.socketio.init_app(app, async_mode="threading")
+    return app
+
+
+@pytest.fixture
+def broadcaster():
+    # long interval: the test flushes by hand, the background task never fires
+    return RoomBroadcaster(core.socketio, namespace=NS, interval_ms=3_600_000)
+
+
+def _client(app, join=None):
+    c = core.socketio.test_client(app, namespace=NS)
+    c.get_received(NS)  # "connected"
+    if join is not None:
+        c.emit("join", join, namespace=NS)
+        c.get_received(NS)  # "snapshot" for a session
+    return c
+
+
+def _deltas(client):
+    return [m["args"][0] for m in client.get_received(NS) if m["name"] == "delta"]
+
+
+def test_delta_reaches_only_the_joined_rooms(app, broadcaster):
+    s1 = _client(app, {"session_id": 1})
+    s2 = _client(app, {"session_id": 2})
+    c1 = _client(app, {"class_id": "C1"})
+    c2 = _client(app, {"class_id": "C2"})
+
+    broadcaster.push([session_room(1), class_room("C1")], "S1", {"sid": "S1", "st": "Awake"})
+    broadcaster.flush()
+
+    assert _deltas(s1) == [{"room": "session:1", "d": [{"sid": "S1", "st": "Awake"}]}]
+    assert _deltas(c1) == [{"room": "class:C1", "d": [{"sid": "S1", "st": "Awake"}]}]
+    assert _deltas(s2) == []
+    assert _deltas(c2) == []
+
+
+def test_burst_is_coalesced_to_one_delta_per_room(app, broadcaster):
+    viewer = _client(app, {"session_id": 3})
+
+    for i in range(20):
+        broadcaster.push([session_room(3)], "S1", {"sid": "S1", "s": i})
+    broadcaster.push([session_room(3)], "S2", {"sid": "S2", "s": 0})
+    broadcaster.flush()
+
+    (delta,) = _deltas(viewer)
+    assert delta["d"] == [{"sid": "S1", "s": 19}, {"sid": "S2", "s": 0}]
+    assert broadcaster.emit_count == 1
+
+    broadcaster.flush()
+    assert _deltas(viewer) == []
+
+
+def test_leave_stops_deltas(app, broadcaster):
+    viewer = _client(app, {"session_id": 4})
+    viewer.emit("leave", {"session_id": 4}, namespace=NS)
+
+    broadcaster.push([session_room(4)], "S1", {"sid": "S1"})
+    broadcaster.flush()
+    assert _deltas(viewer) == []
+
+
+def test_join_accepts_numeric_class_id(app, broadcaster):
+    viewer = _client(app, {"class_id": 7})
+
+    broadcaster.push([class_room(7)], "S1", {"sid": "S1"})
+    broadcaster.flush()
+    assert [d["room"] for d in _deltas(viewer)] == ["class:7"]
+
+
+def test_join_ignores_non_dict_payload(app):
+    viewer = _client(app)
+    viewer.emit("join", ["session_id", 1], namespace=NS)
+    viewer.emit("join", "C1", namespace=NS)
+    assert viewer.get_received(NS) == []
+    assert viewer.is_connected(NS)
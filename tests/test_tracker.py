@@ -0,0 +1,84 @@
+# tests/test_tracker.py
+# ------------------------------------------------------------
+# vision/tracker.py: the numpy Hungarian against brute force, and
+# Tracker ids through crossing faces.
+# ------------------------------------------------------------
+
+import itertools
+
+import numpy as np
+import pytest
+
+from vision.tracker import CentroidTracker, Tracker, hungarian
+
+
+def _brute_force(cost):
+    n, m = cost.shape
+    if n <= m:
+        return min(cost[range(n), list(p)].sum() for p in itertools.permutations(range(m), n))
+    return min(cost[list(p), range(m)].sum() for p in itertools.permutations(range(n), m))
+
+
+@pytest.mark.parametrize("shape", [(1, 1), (3, 3), (4, 6), (6, 4), (5, 5)])
+def test_hungarian_finds_the_minimum_cost(shape):
+    rng = np.random.default_rng(sum(shape))
+    for _ in range(20):
+        cost = rng.uniform(0, 10, shape)
+        rows, cols = hungarian(cost)
+        assert len(rows) == min(shape)
+        assert len(set(rows.tolist())) == len(rows) and len(set(cols.tolist())) == len(cols)
+        assert list(rows) == sorted(rows)
+        assert cost[rows, cols].sum() == pytest.approx(_brute_force(cost))
+
+
+def test_hungarian_beats_greedy():
+    # greedy takes (0, 0) = 1 and is left with (1, 1) = 100
+    cost = np.array([[1.0, 2.0], [3.0, 100.0]])
+    rows, cols = hungarian(cost)
+    assert list(zip(rows.tolist(), cols.tolist())) == [(0, 1), (1, 0)]
+
+
+def test_hungarian_empty():
+    rows, cols = hungarian(np.zeros((0, 3)))
+    assert rows.size == 0 and cols.size == 0
+
+
+def _box(cx, cy, size=80):
+    h = size // 2
+    return (cx - h, cy - h, cx + h, cy + h)
+
+
+def test_crossing_faces_keep_their_ids():
+    tr = Tracker(max_dist=60, ttl=30)
+    ids = None
+    for t in range(25):
+        a = _box(100 + 20 * t, 200)      # left -> right
+        b = _box(580 - 20 * t, 210)      # right -> left, crosses a around t = 12
+        out = tr.update([a, b])
+        by_box = {box: tid for tid, box in out.items()}
+        if ids is None:
+            ids = (by_box[a], by_box[b])
+        assert (by_box[a], by_box[b]) == ids, f"ids swapped at step {t}"
+    assert len(tr) == 2
+
+
+def test_track_survives_ttl_misses_then_is_lost():
+    tr = Tracker(ttl=2)
+    (tid,) = tr.update([_box(100, 100)])
+    tr.update([])
+    tr.update([])
+    assert tr.lost == [] and len(tr) == 1
+    assert tr.update([_box(102, 100)]) == {tid: _box(102, 100)}
+    for _ in range(3):
+        tr.update([])
+    assert tr.lost == [tid] and len(tr) == 0
+
+
+def test_centroid_tracker_keeps_old_defaults():
+    tr = CentroidTracker()
+    assert tr.max_dist == 50 and tr.ttl == 0
+    (tid,) = tr.update([_box(100, 100)])
+    tr.update([])
+    assert tr.lost == [tid]
+    (new_tid,) = tr.update([_box(100, 100)])
+    assert new_tid != tid
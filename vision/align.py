@@ -0,0 +1,195 @@
+# project/vision/align.py
+# ------------------------------------------------------------
+# 5-point similarity alignment in front of ArcFace (CPU only).
+#   landmarks  YuNet (cv2.FaceDetectorYN) when vision/models/face_detection_yunet.onnx
+#              (or FACE_ALIGN_MODEL) exists: eyes, nose tip, mouth corners.
+#              Otherwise the eye cascade that ships with OpenCV on the top 60%
+#              of the face box (2 points: eyes)
+#   transform  similarity (rotation + uniform scale + shift) onto the
+#              112x112 ArcFace template: least squares (Umeyama) over the
+#              5 points, exact for 2
+#   warp       one cv2.warpAffine straight from the frame to 112x112
+# No usable landmarks -> the caller's pre-alignment input (align_face
+# fallback=...), so a hard frame never fails and is embedded exactly as
+# before. FaceAligner.stats counts paths.
+#   FACE_ALIGN=1  switches alignment on (default off). Every stored
+#                 embedding (students.embedding, the vision gallery) was
+#                 made from unaligned crops: re-enrol everyone when
+#                 switching, either way (batch_enrol.py re-embeds by
+#                 itself: its prep version follows the setting)
+# Check the effect with vision/tools/eval_alignment.py.
+# ------------------------------------------------------------
+
+from __future__ import annotations
+import os
+import threading
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+Box = Tuple[int, int, int, int]
+
+ENABLED = (os.getenv("FACE_ALIGN") or "0").strip().lower() in ("1", "true", "on")
+MODEL_PATH = os.getenv("FACE_ALIGN_MODEL") or os.path.join(
+    os.path.dirname(__file__), "models", "face_detection_yunet.onnx")
+SIZE = 112
+EYE_SEARCH_W = 224   # eye-cascade search width (px) for the upper face region
+
+# insightface arcface_dst: left eye, right eye (image left/right), nose tip, mouth corners
+ARCFACE_REF = np.array([
+    [38.2946, 51.6963],
+    [73.5318, 51.5014],
+    [56.0252, 71.7366],
+    [41.5493, 92.3655],
+    [70.7299, 92.2041],
+], np.float32)
+
+
+def similarity_transform(src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+    """2x3 similarity matrix mapping src points onto dst (Umeyama, n >= 2)."""
+    src = np.asarray(src, np.float64)
+    dst = np.asarray(dst, np.float64)
+    mu_s, mu_d = src.mean(axis=0), dst.mean(axis=0)
+    s0, d0 = src - mu_s, dst - mu_d
+    var = (s0 ** 2).sum() / len(src)
+    U, S, Vt = np.linalg.svd(d0.T @ s0 / len(src))
+    D = np.eye(2)
+    if np.linalg.det(U) * np.linalg.det(Vt) < 0:
+        D[1, 1] = -1.0
+    R = U @ D @ Vt
+    scale = float(np.trace(np.diag(S) @ D) / max(var, 1e-12))
+    t = mu_d - scale * (R @ mu_s)
+    return np.hstack([scale * R, t[:, None]]).astype(np.float32)
+
+
+def box_crop(img: np.ndarray, box: Box) -> np.ndarray:
+    """The unaligned input /api/identify always embedded: the box, clipped to the image."""
+    h, w = img.shape[:2]
+    x1, y1, x2, y2 = max(0, int(box[0])), max(0, int(box[1])), min(w, int(box[2])), min(h, int(box[3]))
+    return img[y1:y2, x1:x2]
+
+
+class FaceAligner:
+    def __init__(self, model_path: Optional[str] = MODEL_PATH, size: int = SIZE):
+        self.size = int(size)
+        self.ref = ARCFACE_REF * (self.size / 112.0)
+        self.model_path = model_path if model_path and os.path.isfile(model_path) else None
+        self.use_yunet = self.model_path is not None and hasattr(cv2, "FaceDetectorYN")
+        self._local = threading.local()     # YuNet / cascades are not safe to share across threads
+        self.stats = {"aligned5": 0, "aligned2": 0, "fallback": 0}
+
+    # ---------- landmark sources ----------
+    def _yunet(self):
+        det = getattr(self._local, "yunet", None)
+        if det is None:
+            det = self._local.yunet = cv2.FaceDetectorYN.create(self.model_path, "", (320, 320), 0.6, 0.3, 20)
+        return det
+
+    def _eyes(self):
+        c = getattr(self._local, "eyes", None)
+        if c is None:
+            c = self._local.eyes = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_eye.xml")
+        return c
+
+    def _landmarks_yunet(self, img: np.ndarray, box: Box) -> Optional[np.ndarray]:
+        x1, y1, x2, y2 = box
+        h, w = img.shape[:2]
+        mx, my = int(0.3 * (x2 - x1)), int(0.3 * (y2 - y1))
+        rx1, ry1, rx2, ry2 = max(0, x1 - mx), max(0, y1 - my), min(w, x2 + mx), min(h, y2 + my)
+        region = img[ry1:ry2, rx1:rx2]
+        if region.size == 0:
+            return None
+        det = self._yunet()
+        det.setInputSize((region.shape[1], region.shape[0]))
+        _, faces = det.detect(region)
+        if faces is None or not len(faces):
+            return None
+        best = faces[int(np.argmax(faces[:, -1]))]
+        return best[4:14].reshape(5, 2) + np.array([rx1, ry1], np.float32)
+
+    def _landmarks_eyes(self, img: np.ndarray, box: Box) -> Optional[np.ndarray]:
+        x1, y1, x2, y2 = box
+        bw, bh = x2 - x1, y2 - y1
+        top = img[max(0, y1):max(0, y1 + int(0.6 * bh)), max(0, x1):max(0, x2)]
+        if top.size == 0 or bw < 40:
+            return None
+        gray = cv2.cvtColor(top, cv2.COLOR_BGR2GRAY) if top.ndim == 3 else top
+        # search at a fixed width: cost stays a few ms whatever the face size
+        k = min(1.0, EYE_SEARCH_W / float(gray.shape[1]))
+        if k < 1.0:
+            gray = cv2.resize(gray, (EYE_SEARCH_W, max(1, int(round(gray.shape[0] * k)))), interpolation=cv2.INTER_AREA)
+        sw = gray.shape[1]
+        m = max(8, int(0.12 * sw))
+        eyes = self._eyes().detectMultiScale(gray, scaleFactor=1.1, minNeighbors=3, minSize=(m, m),
+                                             maxSize=(int(0.45 * sw), int(0.45 * sw)))
+        if len(eyes) < 2:
+            return None
+        c = np.array([(x + 0.5 * ew, y + 0.5 * eh) for (x, y, ew, eh) in eyes], np.float32) / k
+        best, best_cost = None, None
+        for i in range(len(c)):
+            for j in range(i + 1, len(c)):
+                a, b = (c[i], c[j]) if c[i][0] < c[j][0] else (c[j], c[i])
+                dx, dy = b[0] - a[0], b[1] - a[1]
+                # plausible pair: eyes 25-70% of the box apart, roughly level, one each side of the middle
+                if not (0.25 * bw <= dx <= 0.7 * bw and abs(dy) <= 0.5 * dx and a[0] < 0.5 * bw < b[0]):
+                    continue
+                cost = abs(dy) + abs(0.5 * (a[0] + b[0]) - 0.5 * bw)
+                if best_cost is None or cost < best_cost:
+                    best, best_cost = (a, b), cost
+        if best is None:
+            return None
+        return np.array(best, np.float32) + np.array([max(0, x1), max(0, y1)], np.float32)
+
+    def landmarks(self, img: np.ndarray, box: Box) -> Optional[np.ndarray]:
+        """(5, 2) from YuNet or (2, 2) eye centers, in img coords; None if not found."""
+        box = tuple(int(v) for v in box)
+        if self.use_yunet:
+            pts = self._landmarks_yunet(img, box)
+            if pts is not None:
+                return pts
+        return self._landmarks_eyes(img, box)
+
+    # ---------- alignment ----------
+    def align(self, img: np.ndarray, box: Box) -> Optional[np.ndarray]:
+        """size x size BGR face aligned for ArcFace; None when no usable landmarks."""
+        pts = self.landmarks(img, box)
+        if pts is not None:
+            M = similarity_transform(pts, self.ref[:len(pts)])
+            # reject a transform that would blow the box up / shrink it far from a plain resize
+            scale = float(np.hypot(M[0, 0], M[1, 0]))
+            naive = self.size / max(1.0, float(box[2] - box[0]))
+            if 0.5 * naive <= scale <= 2.0 * naive:
+                self.stats["aligned5" if len(pts) == 5 else "aligned2"] += 1
+                return cv2.warpAffine(img, M, (self.size, self.size), flags=cv2.INTER_LINEAR,
+                                      borderMode=cv2.BORDER_REPLICATE)
+        self.stats["fallback"] += 1
+        return None
+
+
+# --- GLOBAL INSTANCE (created on first use) ---
+_aligner: Optional[FaceAligner] = None
+_aligner_lock = threading.Lock()
+
+
+def get_aligner() -> FaceAligner:
+    global _aligner
+    if _aligner is None:
+        with _aligner_lock:
+            if _aligner is None:
+                _aligner = FaceAligner()
+                src = "YuNet 5-point" if _aligner.use_yunet else "eye cascade 2-point"
+                print(f"[align] {src} alignment ({'on' if ENABLED else 'off: FACE_ALIGN=0'})")
+    return _aligner
+
+
+def align_face(img: np.ndarray, box: Box, fallback: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    ArcFace input for the face at box: aligned, or - with FACE_ALIGN off or
+    no landmarks - fallback (default box_crop), i.e. what the caller embedded
+    before alignment existed.
+    """
+    face = get_aligner().align(img, box) if ENABLED else None
+    if face is None:
+        return fallback if fallback is not None else box_crop(img, box)
+    return face
@@ -9,7 +9,7 @@ import os
 import sys
 import time
 from dataclasses import dataclass
-from typing import Optional
+from typing import List, Optional
 import cv2
 import numpy as np
 
@@ -18,6 +18,12 @@ try:
 except Exception:
     ort = None
 
+try:
+    from vision import ort_cache, runtime_profiles
+except ImportError:  # run from inside vision/
+    import ort_cache
+    import runtime_profiles
+
 # ---------- utils ----------
 
 def l2_normalize(v: np.ndarray, eps: float = 1e-9) -> np.ndarray:
@@ -46,6 +52,9 @@ class CheapEmbedder:
         except Exception as e:
             return EmbedResult(emb=np.zeros((1024,), np.float32), ok=False, error=str(e))
 
+    def embed_batch(self, faces_bgr) -> List[EmbedResult]:
+        return [self.embed(f) for f in faces_bgr]
+
 class ArcFaceONNX:
     """Real AI Embedder (Slow to load, High Quality)"""
     name: str = "ArcFace"
@@ -57,10 +66,10 @@ class ArcFaceONNX:
         if not os.path.isfile(model_path):
             raise FileNotFoundError(f"Model not found: {model_path}")
 
-        sess_opt = ort.SessionOptions()
+        sess_opt = runtime_profiles.session_options("arcface")
         sess_opt.log_severity_level = 3
-        # Load the brain
-        self.sess = ort.InferenceSession(model_path, sess_options=sess_opt, providers=["CPUExecutionProvider"])
+        # Load the brain (optimized graph is cached on disk, see ort_cache.py)
+        self.sess = ort_cache.cpu_session(model_path, sess_opt)
 
         self.inp_name = self.sess.get_inputs()[0].name
         self.out_name = self.sess.get_outputs()[0].name
@@ -68,24 +77,37 @@ class ArcFaceONNX:
         # Detect input shape
         shape = self.sess.get_inputs()[0].shape
         self.nhwc = (len(shape) == 4 and shape[1] == 112 and shape[3] == 3)
+        # dynamic batch axis -> embed_batch runs one inference for all crops
+        self.dynamic_batch = bool(shape) and not isinstance(shape[0], int)
+
+    def _prep(self, face_bgr: np.ndarray) -> np.ndarray:
+        face_rgb = cv2.cvtColor(face_bgr, cv2.COLOR_BGR2RGB)
+        img = cv2.resize(face_rgb, (112, 112)).astype(np.float32)
+        img = (img - 127.5) / 128.0
+        return img if self.nhwc else np.transpose(img, (2, 0, 1))
 
     def embed(self, face_bgr: np.ndarray) -> EmbedResult:
         try:
-            face_rgb = cv2.cvtColor(face_bgr, cv2.COLOR_BGR2RGB)
-            img = cv2.resize(face_rgb, (112, 112)).astype(np.float32)
-            img = (img - 127.5) / 128.0
-
-            if self.nhwc:
-                blob = img[None, ...]
-            else:
-                blob = np.transpose(img, (2, 0, 1))[None, ...]
-
+            blob = self._prep(face_bgr)[None, ...]
             emb = self.sess.run([self.out_name], {self.inp_name: blob})[0]
             emb = emb.flatten().astype(np.float32)
             return EmbedResult(emb=l2_normalize(emb), ok=True)
         except Exception as e:
             return EmbedResult(emb=np.zeros((512,), np.float32), ok=False, error=str(e))
 
+    def embed_batch(self, faces_bgr) -> List[EmbedResult]:
+        """One result per crop, in order; falls back to per-crop runs for a fixed batch size of 1."""
+        if not self.dynamic_batch or len(faces_bgr) <= 1:
+            return [self.embed(f) for f in faces_bgr]
+        try:
+            blob = np.stack([self._prep(f) for f in faces_bgr])
+            embs = self.sess.run([self.out_name], {self.inp_name: blob})[0]
+            embs = embs.reshape(len(faces_bgr), -1).astype(np.float32)
+            return [EmbedResult(emb=l2_normalize(e), ok=True) for e in embs]
+        except Exception:
+            # one bad crop should not fail the whole batch
+            return [self.embed(f) for f in faces_bgr]
+
 
 class EmbedFactory:
     """
@@ -117,6 +139,9 @@ class EmbedFactory:
     def embed(self, face_bgr: np.ndarray) -> EmbedResult:
         return self.get_impl().embed(face_bgr)
 
+    def embed_batch(self, faces_bgr) -> List[EmbedResult]:
+        return self.get_impl().embed_batch(faces_bgr)
+
 # --- GLOBAL INSTANCE ---
 # This is safe now because __init__ does almost nothing.
 _factory = EmbedFactory()
@@ -1,10 +1,94 @@
 # project/vision/detector.py
 import os
+import logging
+import threading
 import numpy as np
 import cv2
 import onnxruntime as ort
 from pathlib import Path
 
+try:
+    from vision import ort_cache, runtime_profiles
+except ImportError:  # run from inside vision/
+    import ort_cache
+    import runtime_profiles
+
+log = logging.getLogger(__name__)
+
+PAD_VALUE = 114   # YOLOv8 letterbox grey
+CLASS_NAMES = ["Awake", "Drowsy"]
+
+
+class Letterbox:
+    """
+    Aspect-preserving resize + pad into a square, straight into a reusable
+    NCHW input tensor. Buffers are per thread (the server calls predict_states
+    from several worker threads), so steady state allocates nothing per frame:
+      resized  (nh, nw, 3) uint8   cv2.resize dst, reused while the frame size is unchanged
+      canvas   (S, S, 3) uint8     border filled only when the geometry changes
+      planes   3 x (S, S) uint8    cv2.split of the canvas (contiguous HWC -> CHW)
+      blob     (1, 3, S, S)        float32 (x/255 written straight into it) or
+                                   uint8 for models that normalize inside the graph
+    """
+
+    def __init__(self, size, dtype=np.float32):
+        self.size = int(size)
+        self.dtype = np.dtype(dtype)
+        self._tls = threading.local()
+
+    def _buffers(self):
+        t = self._tls
+        if not hasattr(t, "canvas"):
+            S = self.size
+            t.canvas = np.full((S, S, 3), PAD_VALUE, np.uint8)
+            t.planes = [np.empty((S, S), np.uint8) for _ in range(3)]
+            t.blob = np.empty((1, 3, S, S), self.dtype)
+            t.geom = None
+            t.resized = None
+        return t
+
+    def __call__(self, frame, out=None):
+        """
+        Returns (blob, r, dx, dy); frame px = (model px - pad) / r.
+        out: optional (3, S, S) view (one image of a batch tensor) to fill instead.
+        """
+        t = self._buffers()
+        S = self.size
+        h, w = frame.shape[:2]
+        r = min(S / h, S / w)
+        nw, nh = max(1, int(round(w * r))), max(1, int(round(h * r)))
+        dx, dy = (S - nw) // 2, (S - nh) // 2
+
+        if t.geom != (w, h):
+            t.canvas.fill(PAD_VALUE)
+            t.resized = np.empty((nh, nw, 3), np.uint8)
+            t.geom = (w, h)
+        if (nw, nh) == (w, h):
+            t.canvas[dy:dy + nh, dx:dx + nw] = frame
+        else:
+            cv2.resize(frame, (nw, nh), dst=t.resized, interpolation=cv2.INTER_LINEAR)
+            t.canvas[dy:dy + nh, dx:dx + nw] = t.resized
+
+        # planar split first: normalizing from the interleaved canvas through a
+        # transposed view is ~2x slower (strided reads)
+        dst = t.blob[0] if out is None else out
+        cv2.split(t.canvas, t.planes)
+        for c in range(3):
+            if self.dtype == np.uint8:
+                dst[c] = t.planes[c]
+            else:
+                np.multiply(t.planes[c], np.float32(1.0 / 255.0), out=dst[c])
+        return (t.blob if out is None else out), r, dx, dy
+
+    def batch(self, n):
+        """Per-thread (n, 3, S, S) tensor for batched calls (regrown only when n increases)."""
+        t = self._buffers()
+        b = getattr(t, "batch_blob", None)
+        if b is None or b.shape[0] < n:
+            b = t.batch_blob = np.empty((n, 3, self.size, self.size), self.dtype)
+        return b[:n]
+
+
 class Detector:
     def __init__(self, weights=None, base_conf=0.25, imgsz=512):
         # 1. FIXED PATHING: Tell the server exactly where the file is
@@ -31,17 +115,29 @@ class Detector:
         # 2. FIXED PROVIDER: Use OpenVINO for stability and speed on cloud CPUs
         # This matches your requirements.txt switch to onnxruntime-openvino
         try:
+            # cache_dir keeps the compiled OpenVINO blob between restarts;
+            # thread counts come from the ORT_PROFILE runtime profile
             self.session = ort.InferenceSession(
                 self.weights, 
-                providers=['OpenVINOExecutionProvider', 'CPUExecutionProvider']
+                sess_options=runtime_profiles.session_options("detector"),
+                providers=['OpenVINOExecutionProvider', 'CPUExecutionProvider'],
+                provider_options=[
+                    {**ort_cache.openvino_options(self.weights), **runtime_profiles.openvino_threads("detector")},
+                    {},
+                ],
             )
         except Exception as e:
-            print(f"[Detector] OpenVINO init failed, falling back to CPU: {e}")
-            self.session = ort.InferenceSession(self.weights, providers=['CPUExecutionProvider'])
+            log.warning(f"[Detector] OpenVINO init failed, falling back to CPU: {e}")
+            self.session = ort_cache.cpu_session(self.weights, runtime_profiles.session_options("detector"))
 
-        self.input_name = self.session.get_inputs()[0].name
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
         self.base_conf = base_conf
         self.imgsz = imgsz
+        # a graph exported with the /255 folded in takes uint8 directly
+        self.letterbox = Letterbox(imgsz, np.uint8 if inp.type == "tensor(uint8)" else np.float32)
+        # exported with dynamic=True -> one session.run for several frames
+        self.dynamic_batch = bool(inp.shape) and not isinstance(inp.shape[0], int)
         
         # Sensitivity settings
         self.th = {"Awake": 0.50, "Drowsy": 0.60}
@@ -56,23 +152,36 @@ class Detector:
 
     def predict_states(self, frame):
         """Processes frame via ONNX and returns Awake/Drowsy detections."""
-        # A. Pre-processing
+        # A. Pre-processing: letterbox into the per-thread input tensor
         h, w = frame.shape[:2]
-        img = cv2.resize(frame, (self.imgsz, self.imgsz))
-        img = img.transpose((2, 0, 1)).astype(np.float32) / 255.0
-        img = np.expand_dims(img, axis=0)
+        blob, r, dx, dy = self.letterbox(frame)
 
         # B. Run Inference
-        outputs = self.session.run(None, {self.input_name: img})
+        outputs = self.session.run(None, {self.input_name: blob})
 
         # C. Post-processing for YOLOv8
         # [batch, 4 + classes, 8400] -> [8400, 4 + classes]
-        predictions = np.squeeze(outputs[0]).T
-        
-        out = []
+        return self._postprocess(outputs[0][0].T, w, h, r, dx, dy)
+
+    def predict_states_batch(self, frames):
+        """predict_states for several frames; a single inference when the model has a dynamic batch axis."""
+        if not frames:
+            return []
+        if not self.dynamic_batch or len(frames) == 1:
+            return [self.predict_states(f) for f in frames]
+        blob = self.letterbox.batch(len(frames))
+        geo = []
+        for k, f in enumerate(frames):
+            _, r, dx, dy = self.letterbox(f, out=blob[k])
+            geo.append((f.shape[1], f.shape[0], r, dx, dy))
+        out = self.session.run(None, {self.input_name: blob})[0]
+        return [self._postprocess(out[k].T, *g) for k, g in enumerate(geo)]
+
+    def _postprocess(self, predictions, w, h, r, dx, dy):
+        """predictions: [8400, 4 + classes] in model px -> detections in frame px."""
         # 🔍 Detect number of classes from output (YOLOv8 format: 4 + num_classes)
         num_classes = predictions.shape[1] - 4
-        print("[Detector] detected num_classes:", num_classes)
+        log.debug("[Detector] detected num_classes: %d", num_classes)
 
         # ✅ Your system expects EXACTLY 2 classes: Awake, Drowsy
         if num_classes != 2:
@@ -83,28 +192,24 @@ class Detector:
                 "Export your trained awake/drowsy YOLOv8 model to ONNX and replace yolov8n.onnx."
             )
 
-        class_names = ["Awake", "Drowsy"]
+        # vectorized over all candidates: best class, base + per-class threshold
+        scores = predictions[:, 4:]
+        class_id = scores.argmax(axis=1)
+        conf = scores[np.arange(len(scores)), class_id]
+        th = np.array([self.th.get(n, self.base_conf) for n in CLASS_NAMES], np.float32)
+        keep = np.nonzero((conf > self.base_conf) & (conf >= th[class_id]))[0]
+        if not keep.size:
+            return []
 
-        for i in range(len(predictions)):
-            row = predictions[i]
-            scores = row[4:]
-            class_id = int(np.argmax(scores))
-            confidence = float(scores[class_id])
-            
-            if confidence > self.base_conf:
-                label = class_names[class_id] if class_id < len(class_names) else "Unknown"
-                
-                if confidence >= self.th.get(label, self.base_conf):
-                    x, y, w_box, h_box = row[:4]
-                    x1 = int((x - w_box/2) * (w / self.imgsz))
-                    y1 = int((y - h_box/2) * (h / self.imgsz))
-                    x2 = int((x + w_box/2) * (w / self.imgsz))
-                    y2 = int((y + h_box/2) * (h / self.imgsz))
-                    
-                    out.append({
-                        "label": label,
-                        "score": float(confidence),
-                        "xyxy": (x1, y1, x2, y2)
-                    })
-        
-        return out
\ No newline at end of file
+        # un-letterbox: remove the pad, undo the scale, clip to the frame
+        cx, cy, bw, bh = predictions[keep, :4].T
+        x1 = np.clip((cx - bw / 2 - dx) / r, 0, w).astype(int)
+        y1 = np.clip((cy - bh / 2 - dy) / r, 0, h).astype(int)
+        x2 = np.clip((cx + bw / 2 - dx) / r, 0, w).astype(int)
+        y2 = np.clip((cy + bh / 2 - dy) / r, 0, h).astype(int)
+
+        return [
+            {"label": CLASS_NAMES[c], "score": float(sc), "xyxy": (a, b, c2, d)}
+            for c, sc, a, b, c2, d in zip(class_id[keep].tolist(), conf[keep].tolist(),
+                                          x1.tolist(), y1.tolist(), x2.tolist(), y2.tolist())
+        ]
@@ -0,0 +1,62 @@
+# project/vision/faces.py
+# ------------------------------------------------------------
+# Haar face finding shared by the server (/api/identify) and tools.
+# ------------------------------------------------------------
+
+import threading
+
+import cv2
+
+_local = threading.local()
+
+
+def get_cascade():
+    """One CascadeClassifier per thread (loading the XML costs more than a detection)."""
+    c = getattr(_local, "cascade", None)
+    if c is None:
+        c = _local.cascade = cv2.CascadeClassifier(
+            cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+        )
+    return c
+
+
+def find_largest_face_bbox(img_bgr):
+    gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+    gray = cv2.equalizeHist(gray)
+
+    h, w = gray.shape[:2]
+    scale = 1.0
+    if max(h, w) < 640:
+        scale = 640.0 / max(h, w)
+        gray = cv2.resize(gray, (int(w * scale), int(h * scale)))
+
+    cascade = get_cascade()
+
+    tries = [
+        dict(scaleFactor=1.05, minNeighbors=3, minSize=(40, 40)),
+        dict(scaleFactor=1.08, minNeighbors=3, minSize=(50, 50)),
+        dict(scaleFactor=1.1, minNeighbors=4, minSize=(60, 60)),
+        dict(scaleFactor=1.2, minNeighbors=4, minSize=(70, 70)),
+    ]
+    faces = []
+    for p in tries:
+        fs = cascade.detectMultiScale(gray, **p)
+        if len(fs):
+            faces = fs
+            break
+
+    if not len(faces):
+        h, w = gray.shape[:2]
+        if max(h, w) > 900:
+            small = cv2.resize(gray, (w // 2, h // 2))
+            fs = cascade.detectMultiScale(
+                small, scaleFactor=1.05, minNeighbors=3, minSize=(30, 30)
+            )
+            if len(fs):
+                x, y, ww, hh = max(fs, key=lambda b: b[2] * b[3])
+                return int(x * 2), int(y * 2), int((x + ww) * 2), int((y + hh) * 2)
+        return None
+
+    # boxes are in the (possibly upscaled) gray frame: map back to img_bgr
+    x, y, ww, hh = max(faces, key=lambda b: b[2] * b[3])
+    return int(x / scale), int(y / scale), int((x + ww) / scale), int((y + hh) / scale)
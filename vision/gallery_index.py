@@ -0,0 +1,272 @@
+# project/vision/gallery_index.py
+# ------------------------------------------------------------
+# In-memory face gallery for the desktop run_loop.
+#   - one contiguous (n, d) float32 matrix of L2-normalized embeddings
+#     plus parallel name / id lists; matching is a single mat-vec
+#   - merges and enrolments update rows in place (amortized growth)
+#   - persistence is binary + debounced + atomic:
+#       <base>.npy   embeddings (count rows)
+#       <base>.json  {"version","dim","count","students":[{"name","id"}]}
+#     written by a timer thread save_delay_s after the first change, so
+#     the frame loop never touches the disk
+#   - the legacy gallery.json ({"students":[{"name","emb","id"}]}) is
+#     merged in when it is newer than the manifest (batch_enrol.py and
+#     enrol_from_webcam.py write it): students are matched by id, then
+#     name; a row is replaced only when its gallery.json embedding changed
+#     since the last import, so run_loop merges / auto-enrols survive.
+#     load() never writes; the merged result is saved by the next change
+#     or flush(). Export with to_json()
+# ------------------------------------------------------------
+
+from __future__ import annotations
+import os
+import json
+import hashlib
+import threading
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+MANIFEST_VERSION = 1
+
+
+def _normalize_rows(m: np.ndarray) -> np.ndarray:
+    n = np.linalg.norm(m, axis=1, keepdims=True)
+    return (m / (n + 1e-9)).astype(np.float32, copy=False)
+
+
+class GalleryIndex:
+    def __init__(self, base: Optional[Path] = None, dim: int = 512, save_delay_s: float = 2.0):
+        self.base = Path(base) if base is not None else None
+        self.dim = int(dim)
+        self.save_delay_s = float(save_delay_s)
+        self.names: List[str] = []
+        self.ids: List[str] = []
+        self._mat = np.zeros((0, self.dim), np.float32)
+        self._n = 0
+        self._name_to_idx = {}
+        self._lock = threading.RLock()
+        self._timer = None
+        self._dirty = False
+        self._legacy_src = {}   # name -> sha1 of the gallery.json embedding last imported
+
+    # ---------- construction ----------
+    @classmethod
+    def from_students(cls, students, base=None, **kw) -> "GalleryIndex":
+        students = list(students or [])
+        dim = kw.pop("dim", 512)
+        if students:
+            dim = len(students[0]["emb"])
+        g = cls(base=base, dim=dim, **kw)
+        if students:
+            embs = np.asarray([s["emb"] for s in students], dtype=np.float32)
+            g._set(embs, [s.get("name") for s in students], [s.get("id") or "" for s in students])
+        return g
+
+    @classmethod
+    def load(cls, base: Path, legacy_json: Optional[Path] = None, **kw) -> "GalleryIndex":
+        base = Path(base)
+        npy, man = base.with_suffix(".npy"), base.with_suffix(".json")
+        legacy = Path(legacy_json) if legacy_json else None
+        dim = kw.pop("dim", 512)
+
+        g = None
+        if man.exists() and npy.exists():
+            with open(man, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            embs = np.load(npy)
+            students = meta.get("students", [])
+            n = min(len(students), int(meta.get("count", len(students))), embs.shape[0])
+            g = cls(base=base, dim=int(meta.get("dim", embs.shape[1] if embs.ndim == 2 else dim)), **kw)
+            if n:
+                g._set(embs[:n], [s.get("name") for s in students[:n]], [s.get("id") or "" for s in students[:n]])
+            g._legacy_src = dict(meta.get("legacy_src") or {})
+
+        if legacy is not None and legacy.exists() and (g is None or legacy.stat().st_mtime > man.stat().st_mtime):
+            with open(legacy, "r", encoding="utf-8") as f:
+                students = json.load(f).get("students", [])
+            if g is None:
+                g = cls(base=base, dim=len(students[0]["emb"]) if students else dim, **kw)
+            added, updated = g._merge_legacy(students)
+            if added or updated:
+                print(f"[gallery] {legacy.name}: {added} new, {updated} updated students")
+        return g if g is not None else cls(base=base, dim=dim, **kw)
+
+    def _merge_legacy(self, students) -> Tuple[int, int]:
+        """Fold gallery.json students in (by id, then name); unchanged entries keep the index row."""
+        by_id = {sid: i for i, sid in enumerate(self.ids) if sid}
+        added = updated = 0
+        skipped = []
+        with self._lock:
+            for s in students:
+                name, sid = s.get("name"), s.get("id") or ""
+                v = np.asarray(s["emb"], dtype=np.float32).reshape(-1)
+                if self._n and v.size != self.dim:
+                    skipped.append(name)    # other embedder: re-enrol instead of mixing spaces
+                    continue
+                src = hashlib.sha1(v.tobytes()).hexdigest()
+                i = by_id.get(sid) if sid else None
+                if i is None:
+                    i = self._name_to_idx.get(name)
+                if i is None:
+                    self._append(name, v, sid)
+                    added += 1
+                elif self._legacy_src.get(name) != src:
+                    self._mat[i] = v / (np.linalg.norm(v) + 1e-9)
+                    if sid and not self.ids[i]:
+                        self.ids[i] = sid
+                    updated += 1
+                self._legacy_src[name] = src
+            if added or updated:
+                self._dirty = True      # persisted by the next change or flush(), never by load()
+        if skipped:
+            print(f"[gallery] WARN: skipped {len(skipped)} gallery.json students whose embedding "
+                  f"is not {self.dim}-d: {', '.join(map(str, skipped[:5]))}{' ...' if len(skipped) > 5 else ''}")
+        return added, updated
+
+    def _set(self, embs, names, ids):
+        embs = _normalize_rows(np.asarray(embs, dtype=np.float32).reshape(len(names), -1))
+        self.dim = embs.shape[1]
+        self._mat = np.ascontiguousarray(embs)
+        self._n = len(names)
+        self.names = list(names)
+        self.ids = list(ids)
+        self._name_to_idx = {nm: i for i, nm in enumerate(self.names)}
+
+    # ---------- queries ----------
+    def __len__(self) -> int:
+        return self._n
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._mat[:self._n]
+
+    def index_of(self, name: str) -> Optional[int]:
+        return self._name_to_idx.get(name)
+
+    def search(self, emb: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (indices, cosine sims), best first, in one pass over the matrix."""
+        if self._n == 0:
+            return np.zeros((0,), np.int64), np.zeros((0,), np.float32)
+        q = np.asarray(emb, dtype=np.float32).reshape(-1)
+        q = q / (np.linalg.norm(q) + 1e-9)
+        sims = self._mat[:self._n] @ q
+        k = min(k, self._n)
+        if k == 1:
+            i = int(np.argmax(sims))
+            return np.array([i]), sims[i:i + 1]
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        return top, sims[top]
+
+    def best(self, emb: np.ndarray) -> Tuple[Optional[int], Optional[str], float]:
+        """(idx, name, sim) of the nearest student, no threshold; (None, None, -1.0) when empty."""
+        idx, sims = self.search(emb, k=1)
+        if not len(idx):
+            return None, None, -1.0
+        i = int(idx[0])
+        return i, self.names[i], float(sims[0])
+
+    def next_name(self) -> str:
+        i = 1
+        while f"Student_{i:03d}" in self._name_to_idx:
+            i += 1
+        return f"Student_{i:03d}"
+
+    # ---------- updates (in place) ----------
+    def add(self, name: str, emb: np.ndarray, sid: str = "") -> int:
+        with self._lock:
+            i = self._append(name, emb, sid)
+            self._mark_dirty()
+            return i
+
+    def _append(self, name: str, emb: np.ndarray, sid: str = "") -> int:
+        v = np.asarray(emb, dtype=np.float32).reshape(-1)
+        with self._lock:
+            if self._n == 0 and self._mat.shape[1] != v.size:
+                self.dim = v.size
+                self._mat = np.zeros((0, self.dim), np.float32)
+            if self._n == self._mat.shape[0]:
+                grown = np.zeros((max(16, self._n * 2), self.dim), np.float32)
+                grown[:self._n] = self._mat[:self._n]
+                self._mat = grown
+            self._mat[self._n] = v / (np.linalg.norm(v) + 1e-9)
+            self.names.append(name)
+            self.ids.append(sid or "")
+            self._name_to_idx[name] = self._n
+            self._n += 1
+            return self._n - 1
+
+    def merge(self, name: str, emb: np.ndarray, alpha: float = 0.15) -> bool:
+        """EMA-merge emb into name's row and re-normalize; False if name is unknown."""
+        i = self._name_to_idx.get(name)
+        if i is None:
+            return False
+        v = np.asarray(emb, dtype=np.float32).reshape(-1)
+        v = v / (np.linalg.norm(v) + 1e-9)
+        with self._lock:
+            row = self._mat[i]
+            row *= (1.0 - alpha)
+            row += alpha * v
+            row /= (np.linalg.norm(row) + 1e-9)
+            self._mark_dirty()
+        return True
+
+    # ---------- persistence ----------
+    def _mark_dirty(self):
+        self._dirty = True
+        if self.base is None or self._timer is not None:
+            return
+        self._timer = threading.Timer(self.save_delay_s, self._timer_save)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _timer_save(self):
+        try:
+            self.save()
+        except Exception as e:
+            print(f"[gallery] save failed: {e}")
+
+    def save(self) -> None:
+        """Atomic write of <base>.npy + <base>.json (tmp file + os.replace)."""
+        if self.base is None:
+            return
+        with self._lock:
+            self._timer = None
+            embs = self._mat[:self._n].copy()
+            meta = {
+                "version": MANIFEST_VERSION,
+                "dim": self.dim,
+                "count": self._n,
+                "students": [{"name": n, "id": i} for n, i in zip(self.names, self.ids)],
+                "legacy_src": dict(self._legacy_src),
+            }
+            self._dirty = False
+        self.base.parent.mkdir(parents=True, exist_ok=True)
+        npy, man = self.base.with_suffix(".npy"), self.base.with_suffix(".json")
+        tmp_npy = npy.with_name(npy.name + ".tmp")
+        tmp_man = man.with_name(man.name + ".tmp")
+        with open(tmp_npy, "wb") as f:
+            np.save(f, embs)
+        with open(tmp_man, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        # embeddings first: a manifest never points past the rows on disk
+        os.replace(tmp_npy, npy)
+        os.replace(tmp_man, man)
+
+    def flush(self) -> None:
+        """Cancel the pending timer and save now if anything changed (call on exit)."""
+        with self._lock:
+            t, self._timer = self._timer, None
+        if t is not None:
+            t.cancel()
+        if self._dirty:
+            self.save()
+
+    def to_json(self, path: Path) -> None:
+        """Export in the legacy gallery.json format."""
+        data = {"students": [{"name": n, "emb": self._mat[i].tolist(), "id": sid}
+                             for i, (n, sid) in enumerate(zip(self.names, self.ids))]}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
@@ -0,0 +1,349 @@
+# project/vision/multi_stream.py
+# ------------------------------------------------------------
+# Headless multi-camera runner (lecture halls with several cameras).
+#   python vision/multi_stream.py --config streams.json
+#   python vision/multi_stream.py --source 0 --source rtsp://10.0.0.12/stream1 \
+#                                 --camera-id FRONT --camera-id BACK
+# streams.json:
+#   {"course_id": "CS101",
+#    "streams": [{"source": 0, "camera_id": "FRONT"},
+#                {"source": "rtsp://10.0.0.12/stream1", "camera_id": "BACK"},
+#                {"source": "recordings/side.mp4", "camera_id": "SIDE", "flip": false}]}
+# One process, one Detector + one ArcFace embedder + one gallery:
+#   capture   one thread per source -> LatestSlot (newest frame only)
+#   detect    main thread: newest frame of every stream that has one, ONE
+#             batched YOLO call for all of them (full frames and ROI
+#             mosaics alike), then Haar / tracker / re-id per stream
+#   embed     one thread: up to EMBED_BATCH crops from all streams, one
+#             batched ArcFace call, identity decisions per stream
+# Per stream: Tracker, IdState (votes, pending enrol, re-id), RoiScheduler.
+# Shared: the gallery + name->id map (decisions are serialized in the embed
+# thread, so two cameras cannot auto-enrol the same face twice) and the
+# event cooldown keyed by student, so a student seen by two cameras gives
+# one event per EVENT_COOLDOWN_S. No imshow; stats every STATS_EVERY_S.
+# ------------------------------------------------------------
+
+from __future__ import annotations
+import json
+import time
+import argparse
+import threading
+from collections import defaultdict
+from itertools import zip_longest
+from typing import Dict, List, Optional
+
+import cv2
+
+import run_loop as rl
+from run_loop import (IdState, decide_identity, embed_input, face_crop, iou_xyxy, sighting_for_track,
+                      sighting_payload)
+from auto_enrol import EmbedFactory
+from detector import Detector
+from gallery_index import GalleryIndex
+from pipeline import LatestSlot, DropOldestQueue, CaptureStage, StageStats, Closed
+from poster import EventPoster
+from roi import RoiScheduler, haar_rois, build_mosaic, map_mosaic
+from tracker import Tracker
+
+EMBED_BATCH = 16                 # crops per ArcFace call (all streams)
+STATS_EVERY_S = 10.0
+HAAR_KW = dict(scaleFactor=1.2, minNeighbors=5, minSize=(70, 70))
+
+
+def parse_source(src):
+    """'0' -> camera index 0; RTSP/HTTP URLs and file paths go to VideoCapture as is."""
+    if isinstance(src, int):
+        return src
+    s = str(src).strip()
+    return int(s) if s.isdigit() else s
+
+
+class Stream:
+    """One camera: capture thread + its own tracker / identity / ROI state."""
+
+    def __init__(self, idx: int, cfg: dict, course_id: str):
+        self.source = parse_source(cfg["source"])
+        self.camera_id = str(cfg.get("camera_id") or f"CAM_{idx + 1}")
+        self.course_id = str(cfg.get("course_id") or course_id)
+        self.flip = bool(cfg.get("flip", isinstance(self.source, int)))   # mirror webcams like run_loop
+        self.frames = LatestSlot(f"frames[{self.camera_id}]")
+        self.tracker = Tracker(max_dist=60, ttl=30)
+        self.ids = IdState()
+        self.roi = RoiScheduler(full_every=rl.ROI_FULL_EVERY_N, margin=rl.ROI_MARGIN)
+        self.per_track_frame_i: Dict[int, int] = defaultdict(int)
+        self.state_by_tid: Dict[int, tuple] = {}
+        self.yolo: List[dict] = []
+        self.i = 0
+        self.done = False
+        self.stats = StageStats(self.camera_id)
+        self.cap = None
+        self.capture: Optional[CaptureStage] = None
+
+    def open(self, stop: threading.Event) -> None:
+        cap = cv2.VideoCapture(self.source)
+        if isinstance(self.source, int):
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, rl.CAP_WIDTH)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, rl.CAP_HEIGHT)
+        if not cap.isOpened():
+            raise RuntimeError(f"cannot open source {self.source!r} ({self.camera_id})")
+        self.cap = cap
+        flip = (lambda f: cv2.flip(f, 1)) if self.flip else None
+        self.capture = CaptureStage(cap, self.frames, transform=flip, stop=stop)
+        self.capture.name = f"capture[{self.camera_id}]"
+
+
+class MultiStreamRunner:
+    def __init__(self, streams: List[Stream], send: bool = True):
+        self.streams = streams
+        self.stop = threading.Event()
+        self.factory = EmbedFactory()
+        self.detector = Detector()
+        self.cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+        if self.cascade.empty():
+            raise RuntimeError("haarcascade not found")
+        self.gallery = GalleryIndex.load(rl.GALLERY_INDEX, legacy_json=rl.GALLERY_JSON,
+                                         save_delay_s=rl.GALLERY_SAVE_DELAY_S)
+        self.name_to_id = dict(zip(self.gallery.names, self.gallery.ids))
+        self.embed_q = DropOldestQueue(rl.EMBED_QUEUE_MAX * max(1, len(streams)), name="embed_q")
+        self.last_event: Dict[str, float] = {}                        # identity -> ts (all cameras)
+        self.seen_by: Dict[str, Dict[str, float]] = defaultdict(dict)  # identity -> {camera_id: ts}
+        self.poster = EventPoster(rl.BACKEND_URL, rl.OUTBOX_DIR, batch_max=rl.POST_BATCH_MAX,
+                                  flush_interval_s=rl.POST_FLUSH_S) if send else None
+        self.detect_stats = StageStats("detect")
+        self.embed_stats = StageStats("embed")
+        self._embed_thread: Optional[threading.Thread] = None
+
+    # ---------- lifecycle ----------
+    def run(self) -> None:
+        impl = self.factory.get_impl()
+        print(f"[multi] {impl.name} emb_dim={impl.emb_dim} known={len(self.gallery)} "
+              f"detector batch={'dynamic' if self.detector.dynamic_batch else 1}")
+        opened = []
+        for s in self.streams:
+            try:
+                s.open(self.stop)
+                opened.append(s)
+                print(f"[multi] {s.camera_id}: {s.source!r}")
+            except RuntimeError as e:
+                print(f"[multi] skip: {e}")
+        self.streams = opened
+        if not self.streams:
+            print("[multi] no source could be opened")
+            return
+
+        if self.poster is not None:
+            self.poster.start()
+        self._embed_thread = threading.Thread(target=self._embed_loop, name="embed", daemon=True)
+        self._embed_thread.start()
+        for s in self.streams:
+            s.capture.start()
+
+        next_stats = time.monotonic() + STATS_EVERY_S
+        try:
+            while not self.stop.is_set():
+                batch = self._collect()
+                if batch is None:
+                    break   # every source ended (files)
+                if batch:
+                    self.step(batch)
+                if time.monotonic() >= next_stats:
+                    print("[multi] " + self.stats_line())
+                    next_stats += STATS_EVERY_S
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        self.stop.set()
+        for s in self.streams:
+            s.frames.close()
+        self.embed_q.close()
+        for s in self.streams:
+            if s.capture is not None:
+                s.capture.join(timeout=2.0)
+            if s.cap is not None:
+                s.cap.release()
+        if self._embed_thread is not None:
+            self._embed_thread.join(timeout=2.0)
+        self.gallery.flush()
+        if self.poster is not None:
+            self.poster.close()
+        print("[multi] " + self.stats_line())
+        multi = {k: sorted(v) for k, v in self.seen_by.items() if len(v) > 1}
+        print(f"[multi] identities seen by more than one camera: {multi}")
+
+    def stats_line(self) -> str:
+        parts = []
+        for s in self.streams:
+            snap = s.stats.snapshot()
+            parts.append(f"{s.camera_id} {snap['fps']:.1f}fps tracks={len(s.tracker)}")
+        d, e = self.detect_stats.snapshot(), self.embed_stats.snapshot()
+        parts.append(f"detect {d['p50_ms']:.0f}ms")
+        parts.append(f"embed {e['fps']:.1f}/s {e['p50_ms']:.0f}ms")
+        parts.append(f"embed_q {self.embed_q.qsize()} (drop {self.embed_q.dropped})")
+        if self.poster is not None:
+            parts.append(self.poster.stats_line())
+        return " | ".join(parts)
+
+    # ---------- detect (main thread) ----------
+    def _collect(self):
+        """Newest frame of each stream that has one (waits up to 50 ms); None once all sources ended."""
+        out = []
+        deadline = time.monotonic() + 0.05
+        while True:
+            for s in self.streams:
+                if s.done:
+                    continue
+                try:
+                    out.append((s, s.frames.get(timeout=0)))
+                except TimeoutError:
+                    pass
+                except Closed:
+                    s.done = True
+            if out or time.monotonic() >= deadline or all(s.done for s in self.streams):
+                break
+            time.sleep(0.002)
+        if not out and all(s.done for s in self.streams):
+            return None
+        return out
+
+    def step(self, batch) -> None:
+        t0 = time.perf_counter()
+        work = []                        # (stream, ts, frame, gray, rois or None for full frame)
+        yolo_in, yolo_owner = [], []     # one batched YOLO call: images + (stream, mosaic tiles)
+        for s, (frame_i, ts, frame) in batch:
+            s.i += 1
+            run_yolo = s.i % rl.YOLO_EVERY_N_FRAMES == 0
+            run_id = s.i % rl.FRAME_STRIDE == 0
+            if not (run_yolo or run_id):
+                continue
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            plan = s.roi.plan(gray, s.tracker.predicted_boxes()) if rl.ROI_DETECT else None
+            full = plan is None or plan.full
+            if run_yolo:
+                if full:
+                    yolo_in.append(frame)
+                    yolo_owner.append((s, None))
+                else:
+                    canvas, tiles = build_mosaic(frame, plan.rois, self.detector.imgsz)
+                    yolo_in.append(canvas)
+                    yolo_owner.append((s, tiles))
+            if run_id:
+                work.append((s, ts, frame, gray, None if full else plan.rois))
+
+        for (s, tiles), dets in zip(yolo_owner, self.detector.predict_states_batch(yolo_in)):
+            s.yolo = dets if tiles is None else map_mosaic(dets, tiles)
+
+        for s, ts, frame, gray, rois in work:
+            self._track(s, ts, frame, gray, rois)
+            s.stats.record(t0, time.perf_counter())
+        self.detect_stats.record(t0, time.perf_counter())
+
+    def _track(self, s: Stream, ts: float, frame, gray, rois) -> None:
+        """Haar + tracker + re-id for one stream, queue crops for embedding, post events."""
+        if rois is None:
+            faces = self.cascade.detectMultiScale(gray, **HAAR_KW)
+            boxes = [(int(x), int(y), int(x + w), int(y + h)) for (x, y, w, h) in faces]
+        else:
+            boxes = haar_rois(self.cascade, gray, rois, **HAAR_KW)
+        assigned = s.tracker.update(boxes)
+        reid_cands = s.ids.on_tracker_update(s.tracker, assigned, ts)
+        for tid in s.tracker.lost:
+            s.per_track_frame_i.pop(tid, None)
+            s.state_by_tid.pop(tid, None)
+
+        now = time.time()
+        for tid, (x1, y1, x2, y2) in assigned.items():
+            if x2 <= x1 or y2 <= y1:
+                continue
+            cands = reid_cands.get(tid)
+            every = rl.EMBED_CONFIRMED_EVERY_N_FRAMES if s.ids.confirmed(tid) else rl.EMBED_EVERY_N_FRAMES
+            s.per_track_frame_i[tid] += 1
+            if cands or s.per_track_frame_i[tid] % every == 0:
+                crop, rel = face_crop(frame, x1, y1, x2, y2)
+                self.embed_q.put((s, tid, crop, rel, (x1, y1, x2, y2), cands))
+
+            best_det, best_iou = None, 0.0
+            for det in s.yolo:
+                iou = iou_xyxy(det["xyxy"], (x1, y1, x2, y2))
+                if iou > best_iou:
+                    best_iou, best_det = iou, det
+            if best_det and best_iou >= rl.IOU_MATCH_THR:
+                s.state_by_tid[tid] = (best_det["label"], float(best_det["score"]), now)
+
+            self._event(s, tid, (x1, y1, x2, y2), s.state_by_tid.get(tid), now)
+
+    def _event(self, s: Stream, tid: int, bbox, st, now: float) -> None:
+        key, ev = sighting_for_track(s.ids, tid, bbox, st, self.name_to_id)
+        if ev["name"] == "UNKNOWN":
+            key = f"UNKNOWN@{s.camera_id}"   # unknown faces are not one person across cameras
+        else:
+            self.seen_by[key][s.camera_id] = now
+        if now - self.last_event.get(key, 0) < rl.EVENT_COOLDOWN_S:
+            return
+        self.last_event[key] = now
+        if self.poster is not None:
+            self.poster.post(sighting_payload(ts=now, course_id=s.course_id, camera_id=s.camera_id, **ev))
+
+    # ---------- embed thread ----------
+    def _embed_loop(self) -> None:
+        while not self.stop.is_set():
+            try:
+                items = [self.embed_q.get(timeout=0.25)]
+            except TimeoutError:
+                continue
+            except Closed:
+                break
+            while len(items) < EMBED_BATCH:
+                try:
+                    items.append(self.embed_q.get(timeout=0))
+                except (TimeoutError, Closed):
+                    break
+            t0 = time.perf_counter()
+            try:
+                results = self.factory.embed_batch([embed_input(it[2], it[3]) for it in items])
+                for (s, tid, crop, _, bbox, cands), res in zip(items, results):
+                    if not res.ok:
+                        continue
+                    if cands and s.ids.try_inherit(tid, res.emb, cands):
+                        continue
+                    decide_identity(s.ids, self.gallery, self.name_to_id, tid, res.emb, crop, bbox)
+            except Exception as e:
+                self.embed_stats.errors += 1
+                print(f"[embed] error: {e}")
+                continue
+            self.embed_stats.record(t0, time.perf_counter())
+
+
+# -------------------- CLI --------------------
+def load_streams(args) -> List[Stream]:
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+    else:
+        cfg = {"streams": [{"source": src, "camera_id": cam}
+                           for src, cam in zip_longest(args.source, args.camera_id[:len(args.source)])]}
+    course_id = args.course_id or cfg.get("course_id") or rl.COURSE_ID
+    return [Stream(i, sc, course_id) for i, sc in enumerate(cfg.get("streams", []))]
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Headless multi-camera vision loop")
+    ap.add_argument("--config", help="JSON file: {course_id?, streams: [{source, camera_id?, course_id?, flip?}]}")
+    ap.add_argument("--source", action="append", default=[], help="camera index, RTSP URL or video file (repeatable)")
+    ap.add_argument("--camera-id", action="append", default=[], help="camera id per --source, in order")
+    ap.add_argument("--course-id", default=None)
+    ap.add_argument("--no-backend", action="store_true", help="do not post events")
+    args = ap.parse_args(argv)
+
+    streams = load_streams(args)
+    if not streams:
+        ap.error("no streams: pass --config or at least one --source")
+    MultiStreamRunner(streams, send=rl.SEND_TO_BACKEND and not args.no_backend).run()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,148 @@
+# project/vision/ort_cache.py
+# ------------------------------------------------------------
+# Persistent on-disk caches for ONNX Runtime sessions.
+#   - CPU sessions: the graph-optimized model is written once
+#     (optimized_model_filepath) and loaded as-is on the next start
+#   - OpenVINO: compiled blobs go to the provider's cache_dir
+#
+# Layout: <root>/ort/<model stem>/<key>/{optimized.onnx, openvino/}
+#   key = sha256(.onnx bytes)[:16] + onnxruntime version + host tag, so
+#   replacing the model file or upgrading onnxruntime invalidates the
+#   entry. ORT_ENABLE_ALL output can be specific to the CPU and the ORT
+#   build, and MODEL_CACHE_DIR may be a volume shared by different hosts:
+#   the host tag hashes the machine, the CPU ISA flags and the build's
+#   providers. A new key prunes older keys of the same host only.
+#
+# Root: MODEL_CACHE_DIR (Docker: /code/cache/models), else
+# $XDG_CACHE_HOME/classync, else ~/.cache/classync. MODEL_CACHE=0 disables.
+# ------------------------------------------------------------
+
+from __future__ import annotations
+import os
+import shutil
+import hashlib
+import platform
+from functools import lru_cache
+from pathlib import Path
+
+try:
+    import onnxruntime as ort
+except Exception:
+    ort = None
+
+
+def enabled() -> bool:
+    return (os.getenv("MODEL_CACHE") or "1").strip().lower() not in ("0", "false", "off")
+
+
+def cache_root() -> Path:
+    root = os.getenv("MODEL_CACHE_DIR")
+    if not root:
+        xdg = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        root = os.path.join(xdg, "classync")
+    return Path(root)
+
+
+@lru_cache(maxsize=16)
+def _file_sha256(path: str, size: int, mtime_ns: int) -> str:
+    # size/mtime are part of the lru key so an in-place replacement re-hashes
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+@lru_cache(maxsize=1)
+def host_tag() -> str:
+    """Short hash of what the optimized graph may depend on besides the model."""
+    flags = ""
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if line.startswith(("flags", "Features")):   # x86 / ARM ISA extensions
+                    flags = " ".join(sorted(line.split(":", 1)[1].split()))
+                    break
+    except OSError:
+        flags = platform.processor()
+    providers = ",".join(ort.get_available_providers()) if ort is not None else ""
+    raw = "|".join([platform.system(), platform.machine(), flags, providers])
+    return hashlib.sha256(raw.encode()).hexdigest()[:8]
+
+
+def cache_key(model_path: str) -> str:
+    st = os.stat(model_path)
+    digest = _file_sha256(os.path.abspath(model_path), st.st_size, st.st_mtime_ns)[:16]
+    ver = getattr(ort, "__version__", "none").replace("+", "_")
+    return f"{digest}-ort{ver}-{host_tag()}"
+
+
+def _prune(model_root: Path, keep: str) -> None:
+    host = keep.rsplit("-", 1)[-1]
+    for d in model_root.iterdir():
+        # other hosts sharing the volume keep their entries (keys without a host tag predate it)
+        if d.is_dir() and d.name != keep and (d.name.endswith(f"-{host}") or d.name.count("-") == 1):
+            shutil.rmtree(d, ignore_errors=True)
+            print(f"[ort_cache] pruned stale cache {d}")
+
+
+def _model_dir(model_path: str) -> Path | None:
+    if not enabled():
+        return None
+    key = cache_key(model_path)
+    model_root = cache_root() / "ort" / Path(model_path).stem
+    d = model_root / key
+    try:
+        if not d.is_dir():
+            d.mkdir(parents=True, exist_ok=True)
+            _prune(model_root, keep=key)
+    except OSError as e:
+        print(f"[ort_cache] cache dir not writable ({d}): {e}")
+        return None
+    return d
+
+
+def cpu_session(model_path: str, sess_opt=None, providers=("CPUExecutionProvider",)):
+    """
+    InferenceSession for a CPU model. Loads the cached optimized graph when
+    one exists for this model hash, otherwise optimizes and stores it.
+    """
+    if ort is None:
+        raise RuntimeError("onnxruntime not installed")
+    sess_opt = sess_opt or ort.SessionOptions()
+    d = _model_dir(model_path)
+    if d is None:
+        return ort.InferenceSession(model_path, sess_options=sess_opt, providers=list(providers))
+
+    opt_path = d / "optimized.onnx"
+    if opt_path.is_file():
+        level = sess_opt.graph_optimization_level
+        try:
+            # already optimized: skip the optimizer passes
+            sess_opt.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+            return ort.InferenceSession(str(opt_path), sess_options=sess_opt, providers=list(providers))
+        except Exception as e:
+            print(f"[ort_cache] cached model unusable, rebuilding: {e}")
+            sess_opt.graph_optimization_level = level
+            opt_path.unlink(missing_ok=True)
+
+    # write to a per-process temp name, then rename: workers may race here
+    tmp = d / f"optimized.onnx.{os.getpid()}.tmp"
+    sess_opt.optimized_model_filepath = str(tmp)
+    sess = ort.InferenceSession(model_path, sess_options=sess_opt, providers=list(providers))
+    try:
+        if tmp.is_file():
+            os.replace(tmp, opt_path)
+    except OSError as e:
+        print(f"[ort_cache] could not store optimized model: {e}")
+    return sess
+
+
+def openvino_options(model_path: str) -> dict:
+    """Provider options for OpenVINOExecutionProvider (compiled-model cache)."""
+    d = _model_dir(model_path)
+    if d is None:
+        return {}
+    ov = d / "openvino"
+    ov.mkdir(exist_ok=True)
+    return {"cache_dir": str(ov)}
@@ -0,0 +1,197 @@
+# project/vision/pipeline.py
+# ------------------------------------------------------------
+# Small threaded-pipeline toolkit for the desktop vision loop.
+#   LatestSlot        single-slot mailbox: put() overwrites, the reader
+#                     always gets the newest item (camera -> detect,
+#                     detect -> display)
+#   DropOldestQueue   bounded FIFO; when full the oldest item is dropped
+#                     (detect -> embed)
+#   StageStats        per-stage FPS, latency p50/p95 and drop counters
+#   Stage             thread running fn(item) -> out for every input item
+#   CaptureStage      thread reading a cv2.VideoCapture into a LatestSlot
+# Each stage only ever waits on its own input, so end-to-end FPS is set
+# by the slowest stage instead of the sum of all of them.
+# ------------------------------------------------------------
+
+from __future__ import annotations
+import time
+import threading
+from collections import deque
+from typing import Any, Callable, Optional
+
+
+class Closed(Exception):
+    """Raised by get() once the channel is closed and drained."""
+
+
+class LatestSlot:
+    def __init__(self, name: str = "slot"):
+        self.name = name
+        self._cond = threading.Condition()
+        self._item = None
+        self._has = False
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item) -> None:
+        with self._cond:
+            if self._has:
+                self.dropped += 1   # reader was too slow for the previous one
+            self._item, self._has = item, True
+            self._cond.notify()
+
+    def get(self, timeout: Optional[float] = None):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._has or self._closed, timeout):
+                raise TimeoutError(self.name)
+            if not self._has:
+                raise Closed(self.name)
+            item, self._item, self._has = self._item, None, False
+            return item
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def qsize(self) -> int:
+        return 1 if self._has else 0
+
+
+class DropOldestQueue:
+    def __init__(self, maxsize: int = 8, name: str = "queue"):
+        self.name = name
+        self._q = deque()
+        self._maxsize = max(1, int(maxsize))
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item) -> None:
+        with self._cond:
+            if len(self._q) >= self._maxsize:
+                self._q.popleft()
+                self.dropped += 1
+            self._q.append(item)
+            self._cond.notify()
+
+    def get(self, timeout: Optional[float] = None):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._q or self._closed, timeout):
+                raise TimeoutError(self.name)
+            if not self._q:
+                raise Closed(self.name)
+            return self._q.popleft()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def qsize(self) -> int:
+        return len(self._q)
+
+
+class StageStats:
+    """Rolling per-stage counters (window of the last `window` items)."""
+
+    def __init__(self, name: str, window: int = 120):
+        self.name = name
+        self._lat = deque(maxlen=window)
+        self._ts = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+
+    def record(self, started: float, finished: float) -> None:
+        self._lat.append(finished - started)
+        self._ts.append(finished)
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        lat = sorted(self._lat)
+        ts = list(self._ts)
+        fps = (len(ts) - 1) / (ts[-1] - ts[0]) if len(ts) > 1 and ts[-1] > ts[0] else 0.0
+        pct = lambda p: lat[min(len(lat) - 1, int(p * len(lat)))] * 1000.0 if lat else 0.0
+        return {
+            "stage": self.name,
+            "fps": round(fps, 1),
+            "p50_ms": round(pct(0.50), 1),
+            "p95_ms": round(pct(0.95), 1),
+            "count": self.count,
+            "errors": self.errors,
+        }
+
+
+class Stage(threading.Thread):
+    """
+    Pulls from inp, calls fn(item); a non-None result is put() on out.
+    fn may also push to other channels itself (fan-out).
+    """
+
+    def __init__(self, name: str, fn: Callable[[Any], Any], inp, out=None, stop: Optional[threading.Event] = None):
+        super().__init__(name=name, daemon=True)
+        self.fn = fn
+        self.inp = inp
+        self.out = out
+        self.stop_event = stop or threading.Event()
+        self.stats = StageStats(name)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                item = self.inp.get(timeout=0.25)
+            except TimeoutError:
+                continue
+            except Closed:
+                break
+            t0 = time.perf_counter()
+            try:
+                res = self.fn(item)
+            except Exception as e:
+                self.stats.errors += 1
+                print(f"[{self.name}] error: {e}")
+                continue
+            self.stats.record(t0, time.perf_counter())
+            if res is not None and self.out is not None:
+                self.out.put(res)
+        if self.out is not None:
+            self.out.close()
+
+
+class CaptureStage(threading.Thread):
+    """Reads frames as fast as the camera delivers; only the latest is kept."""
+
+    def __init__(self, cap, out: LatestSlot, transform: Optional[Callable] = None,
+                 stop: Optional[threading.Event] = None):
+        super().__init__(name="capture", daemon=True)
+        self.cap = cap
+        self.out = out
+        self.transform = transform
+        self.stop_event = stop or threading.Event()
+        self.stats = StageStats("capture")
+        self.frame_i = 0
+
+    def run(self):
+        while not self.stop_event.is_set():
+            t0 = time.perf_counter()
+            ok, frame = self.cap.read()
+            if not ok or frame is None:
+                print("[capture] camera read failed, stopping")
+                break
+            if self.transform is not None:
+                frame = self.transform(frame)
+            self.frame_i += 1
+            self.out.put((self.frame_i, time.time(), frame))
+            self.stats.record(t0, time.perf_counter())
+        self.out.close()
+
+
+def format_stats(stages, channels=()) -> str:
+    """One-line overlay: 'capture 30.0fps | detect 15.1fps 21ms | ... | embed_q 2 (drop 5)'."""
+    parts = []
+    for st in stages:
+        s = st.stats.snapshot()
+        parts.append(f"{s['stage']} {s['fps']:.1f}fps {s['p50_ms']:.0f}ms")
+    for ch in channels:
+        parts.append(f"{ch.name} {ch.qsize()} (drop {ch.dropped})")
+    return " | ".join(parts)
@@ -0,0 +1,286 @@
+# project/vision/poster.py
+# ------------------------------------------------------------
+# Background event sender for the desktop vision loop.
+#   - post(payload) only appends to an in-memory queue (never blocks
+#     the frame loop on the network)
+#   - a sender thread batches by size / interval and POSTs to
+#     {backend}/api/events/bulk over one keep-alive requests.Session;
+#     falls back to per-event /api/events when the backend has no bulk
+#     route (404)
+#   - connection errors / 5xx: the batch goes to the on-disk journal and
+#     the sender backs off exponentially (full jitter) before retrying
+#   - journal = JSONL segments in <journal_dir>/*.jsonl; replayed (oldest
+#     first) once the backend answers again, and at the next start. The
+#     journal always goes out before the in-memory queue, so the backend
+#     receives events in the order they were posted
+#   - queue overflow and close() also spill to the journal, so events are
+#     only ever dropped when the backend rejects them (4xx); close() lets
+#     an in-flight request finish first, so no batch is both sent and
+#     journaled
+# ------------------------------------------------------------
+
+from __future__ import annotations
+import os
+import json
+import time
+import random
+import threading
+from collections import deque
+from pathlib import Path
+from typing import List
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class BackendDown(Exception):
+    """Connection error / timeout / 5xx: retry later, keep the events."""
+
+
+class EventPoster(threading.Thread):
+    def __init__(
+        self,
+        base_url: str,
+        journal_dir: Path,
+        batch_max: int = 50,
+        flush_interval_s: float = 1.0,
+        queue_max: int = 1000,
+        timeout_s: float = 3.0,
+        backoff_base_s: float = 0.5,
+        backoff_max_s: float = 30.0,
+    ):
+        super().__init__(name="poster", daemon=True)
+        self.base_url = base_url.rstrip("/")
+        self.journal_dir = Path(journal_dir)
+        self.journal_dir.mkdir(parents=True, exist_ok=True)
+        self.batch_max = max(1, int(batch_max))
+        self.flush_interval_s = float(flush_interval_s)
+        self.queue_max = max(self.batch_max, int(queue_max))
+        self.timeout_s = float(timeout_s)
+        self.backoff_base_s = float(backoff_base_s)
+        self.backoff_max_s = float(backoff_max_s)
+
+        self._q = deque()
+        self._cond = threading.Condition()
+        self._closing = False
+        self._abort = False     # close() timed out: stop after the current request
+        self._bulk = True
+        self._failures = 0
+        self._retry_at = 0.0
+        self._journal_lock = threading.Lock()
+        self._segment = None   # current append segment (Path)
+        self._journal_pending = any(self.journal_dir.glob("*.jsonl"))
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.stats = {"queued": 0, "sent": 0, "rejected": 0, "spilled": 0, "replayed": 0, "batches": 0}
+
+    # ---------- producer side (frame loop) ----------
+    def post(self, payload: dict) -> None:
+        with self._cond:
+            self._q.append(payload)
+            self.stats["queued"] += 1
+            overflow = None
+            if len(self._q) > self.queue_max:
+                # backend has been slow/down for a while: keep memory bounded
+                overflow = [self._q.popleft() for _ in range(self.batch_max)]
+            if len(self._q) >= self.batch_max:
+                self._cond.notify()
+        if overflow:
+            self._spill(overflow)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Stop the sender; whatever could not be delivered stays in the journal."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self.join(timeout=timeout)
+        if self.is_alive():
+            # mid-request: journaling its batch now would send it twice if the
+            # request lands. Stop after it (bounded by timeout_s), then spill.
+            print("[poster] waiting for the in-flight request before closing")
+            self._abort = True
+            self.join()
+        with self._cond:
+            rest, self._q = list(self._q), deque()
+        if rest:
+            self._spill(rest)
+        self.session.close()
+        print(f"[poster] closed: {self.stats_line()}")
+
+    def stats_line(self) -> str:
+        s = self.stats
+        return (f"sent {s['sent']} queued {len(self._q)} journal {self.pending_journal()} "
+                f"rejected {s['rejected']} replayed {s['replayed']}")
+
+    # ---------- sender thread ----------
+    def run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval_s
+                while not self._closing and len(self._q) < self.batch_max:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+                closing = self._closing
+
+            wait = self._retry_at - time.monotonic()
+            if wait > 0:
+                if closing:
+                    return  # backend is down: close() spills the queue
+                time.sleep(min(wait, self.flush_interval_s))
+                continue
+
+            try:
+                # journal first: it holds events older than anything queued
+                if self._journal_pending:
+                    if closing:
+                        return  # close() spills the queue behind it, replayed at next start
+                    self._replay()
+                self._drain()
+                self._failures = 0
+            except BackendDown as e:
+                if self._abort:
+                    return
+                self._failures += 1
+                delay = min(self.backoff_max_s, self.backoff_base_s * (2 ** (self._failures - 1)))
+                self._retry_at = time.monotonic() + random.uniform(0.0, delay)
+                print(f"[poster] backend unavailable ({e}); retry #{self._failures} in <= {delay:.1f}s")
+
+            if closing:
+                return
+
+    def _drain(self) -> None:
+        """
+        Send the queue batch by batch; a batch the backend did not take is
+        spilled. Stops when something was spilled meanwhile (overflow): that
+        is older than the rest of the queue, so the journal goes first.
+        """
+        while not self._abort and not self._journal_pending:
+            with self._cond:
+                batch = [self._q.popleft() for _ in range(min(self.batch_max, len(self._q)))]
+            if not batch:
+                return
+            try:
+                self._send(batch)
+            except BackendDown:
+                self._spill(batch)
+                raise
+
+    def _send(self, batch: List[dict]) -> None:
+        """Deliver one batch or raise BackendDown; 4xx rejections are counted and dropped."""
+        self.stats["batches"] += 1
+        if self._bulk:
+            r = self._request("/api/events/bulk", {"events": batch})
+            if r.status_code == 404:
+                print("[poster] no /api/events/bulk on backend, posting events one by one")
+                self._bulk = False
+            elif r.status_code == 200:
+                try:
+                    results = (r.json() or {}).get("results") or []
+                except ValueError:
+                    results = []
+                for res in results:
+                    if not res.get("ok"):
+                        self.stats["rejected"] += 1
+                        print(f"[poster] rejected {res.get('status')}: {res.get('error')}")
+                self.stats["sent"] += len(batch) - sum(1 for res in results if not res.get("ok"))
+                return
+            else:
+                self._reject(len(batch), r)
+                return
+
+        for i, ev in enumerate(batch):
+            try:
+                if self._abort:
+                    raise BackendDown("closing")
+                r = self._request("/api/events", ev)
+            except BackendDown:
+                del batch[:i]   # caller spills only what was not delivered
+                raise
+            if r.status_code == 200:
+                self.stats["sent"] += 1
+            else:
+                self._reject(1, r)
+
+    def _request(self, path: str, body) -> requests.Response:
+        try:
+            r = self.session.post(self.base_url + path, json=body, timeout=self.timeout_s)
+        except requests.RequestException as e:
+            raise BackendDown(type(e).__name__)
+        if r.status_code >= 500 or r.status_code == 429:
+            raise BackendDown(f"HTTP {r.status_code}")
+        return r
+
+    def _reject(self, n: int, r: requests.Response) -> None:
+        self.stats["rejected"] += n
+        print(f"[poster] non-200 {r.status_code}: {r.text[:160]}")
+
+    # ---------- journal ----------
+    def pending_journal(self) -> int:
+        return len(list(self.journal_dir.glob("*.jsonl")))
+
+    def _spill(self, events: List[dict]) -> None:
+        with self._journal_lock:
+            if self._segment is None:
+                self._segment = self.journal_dir / f"{time.time_ns()}-{os.getpid()}.jsonl"
+            with open(self._segment, "a", encoding="utf-8") as f:
+                for ev in events:
+                    f.write(json.dumps(ev, separators=(",", ":")) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_pending = True
+            self.stats["spilled"] += len(events)
+
+    def _replay(self) -> None:
+        """
+        Send journal segments oldest first, including ones spilled meanwhile,
+        until the journal is empty; raises BackendDown and keeps the rest on disk.
+        """
+        while not self._abort:
+            with self._journal_lock:
+                self._segment = None    # new spills go to a fresh segment
+                segments = sorted(self.journal_dir.glob("*.jsonl"))
+                if not segments:
+                    self._journal_pending = False
+                    return
+            self._replay_segments(segments)
+
+    def _replay_segments(self, segments: List[Path]) -> None:
+        for seg in segments:
+            events = []
+            with open(seg, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        try:
+                            events.append(json.loads(line))
+                        except ValueError:
+                            pass    # torn last line from a crash
+            while events:
+                if self._abort:
+                    self._rewrite(seg, events)
+                    return
+                batch = events[:self.batch_max]
+                try:
+                    self._send(batch)
+                except BackendDown:
+                    # keep the undelivered tail (batch was trimmed to what is left)
+                    self._rewrite(seg, batch + events[self.batch_max:])
+                    raise
+                self.stats["replayed"] += len(batch)
+                del events[:self.batch_max]
+            seg.unlink(missing_ok=True)
+            print(f"[poster] replayed {seg.name}")
+
+    @staticmethod
+    def _rewrite(seg: Path, events: List[dict]) -> None:
+        tmp = seg.with_name(seg.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for ev in events:
+                f.write(json.dumps(ev, separators=(",", ":")) + "\n")
+        os.replace(tmp, seg)
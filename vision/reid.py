@@ -0,0 +1,101 @@
+# project/vision/reid.py
+# ------------------------------------------------------------
+# Short-term re-identification memory for the desktop run_loop.
+# When a track with a confirmed identity goes missing (occlusion, a
+# crossing, a dropped detection) its name, score, mean embedding and
+# last box are kept for ttl_s seconds. A new track that appears near
+# one of them is embedded once; if that embedding agrees with the
+# remembered mean (cosine >= sim_min) the new track inherits the
+# identity and skips the vote window / pending-enrol buffering.
+#   remember(tid, ...)     track went missing
+#   forget(tid)            track came back under its own id
+#   candidates(box, now)   position gate for a new track (no embedding)
+#   claim(cands, emb)      embedding check; the matching entry is removed
+# Not thread-safe on its own: run_loop calls it under IdState.lock.
+# ------------------------------------------------------------
+
+from __future__ import annotations
+import math
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+Box = Tuple[int, int, int, int]
+
+
+class ReIdEntry:
+    __slots__ = ("tid", "name", "score", "emb", "box", "ts")
+
+    def __init__(self, tid: int, name: str, score: float, emb: np.ndarray, box: Box, ts: float):
+        self.tid = tid
+        self.name = name
+        self.score = score
+        self.emb = emb
+        self.box = box
+        self.ts = ts
+
+
+class ReIdMemory:
+    def __init__(self, ttl_s: float = 4.0, sim_min: float = 0.55, max_dist_px: float = 120.0,
+                 px_per_s: float = 150.0, max_entries: int = 256):
+        self.ttl_s = float(ttl_s)
+        self.sim_min = float(sim_min)
+        self.max_dist_px = float(max_dist_px)
+        self.px_per_s = float(px_per_s)          # how far someone may walk while hidden
+        self.max_entries = int(max_entries)
+        self._entries: Dict[int, ReIdEntry] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def remember(self, tid: int, name: str, score: float, emb: np.ndarray, box: Box, ts: float) -> None:
+        v = np.asarray(emb, dtype=np.float32).reshape(-1)
+        v = v / (np.linalg.norm(v) + 1e-9)
+        self._entries[tid] = ReIdEntry(tid, name, float(score), v, tuple(box), float(ts))
+        if len(self._entries) > self.max_entries:
+            oldest = min(self._entries.values(), key=lambda e: e.ts)
+            self._entries.pop(oldest.tid, None)
+
+    def forget(self, tid: int) -> None:
+        self._entries.pop(tid, None)
+
+    def expire(self, now: float) -> None:
+        for tid in [t for t, e in self._entries.items() if now - e.ts > self.ttl_s]:
+            del self._entries[tid]
+
+    def candidates(self, box: Box, now: float) -> List[ReIdEntry]:
+        """Entries a new track at `box` could be, nearest first (position + size gate only)."""
+        self.expire(now)
+        if not self._entries:
+            return []
+        x1, y1, x2, y2 = box
+        cx, cy, w = 0.5 * (x1 + x2), 0.5 * (y1 + y2), max(1, x2 - x1)
+        out = []
+        for e in self._entries.values():
+            ex1, ey1, ex2, ey2 = e.box
+            ew = max(1, ex2 - ex1)
+            if not 0.5 <= w / ew <= 2.0:
+                continue
+            d = math.hypot(cx - 0.5 * (ex1 + ex2), cy - 0.5 * (ey1 + ey2))
+            if d <= self.max_dist_px + self.px_per_s * (now - e.ts):
+                out.append((d, e))
+        out.sort(key=lambda de: de[0])
+        return [e for _, e in out]
+
+    def claim(self, cands: List[ReIdEntry], emb: np.ndarray) -> Optional[Tuple[ReIdEntry, float]]:
+        """Best candidate whose mean embedding agrees with emb; it is removed from memory."""
+        cands = [e for e in cands if e.tid in self._entries]
+        if not cands:
+            return None
+        q = np.asarray(emb, dtype=np.float32).reshape(-1)
+        q = q / (np.linalg.norm(q) + 1e-9)
+        sims = np.stack([e.emb for e in cands]) @ q
+        i = int(np.argmax(sims))
+        if float(sims[i]) < self.sim_min:
+            self.misses += 1
+            return None
+        self.hits += 1
+        e = self._entries.pop(cands[i].tid)
+        return e, float(sims[i])
@@ -0,0 +1,303 @@
+# project/vision/replay.py
+# ------------------------------------------------------------
+# Headless, deterministic replay of a recorded video through the
+# run_loop pipeline (tuning passes and benchmarks without a webcam).
+#   python vision/replay.py --source lecture.mp4 --out replay.jsonl
+#   python vision/run_loop.py --source lecture.mp4 --out replay.parquet
+# Differences from the live loop:
+#   - no threads, no frame dropping: every frame is decoded and goes
+#     through the same detect logic (YOLO cadence, ROI plan, Haar,
+#     tracker, re-id), due crops are embedded inline (one batched call)
+#     and identities decided before the next frame is read
+#   - clock = REPLAY_EPOCH + frame_index / fps for everything that is
+#     time based (vote stickiness, enrol gaps, re-id ttl, event cooldown),
+#     so two runs on the same file + gallery give the same output
+#   - runs as fast as the CPU allows, not at the video's frame rate
+#   - the gallery is loaded read-only (auto-enrols stay in memory) and
+#     nothing is posted; "event": true marks where the live loop would post
+# Output (--out):
+#   .jsonl    one line per frame: {frame, t, pass, yolo, tracks:[{tid, bbox,
+#             name, score, state, state_score, event}]}
+#   .parquet  one row per track per frame (needs pyarrow)
+#   <out>.summary.json  throughput + per-stage latency + identity counts
+# ------------------------------------------------------------
+
+from __future__ import annotations
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import cv2
+
+import run_loop as rl
+from run_loop import IdState, decide_identity, embed_input, face_crop, iou_xyxy, sighting_for_track
+from auto_enrol import EmbedFactory
+from detector import Detector
+from gallery_index import GalleryIndex
+from pipeline import StageStats
+from roi import RoiScheduler, haar_rois, yolo_mosaic
+from tracker import Tracker
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except Exception:
+    pa = pq = None
+
+REPLAY_EPOCH = 1_700_000_000.0   # replay clock origin (s); keeps ms timestamps non-zero
+HAAR_KW = dict(scaleFactor=1.2, minNeighbors=5, minSize=(70, 70))
+STATS_WINDOW = 1 << 20           # keep every sample: percentiles over the whole run
+
+
+# -------------------- output --------------------
+class JsonlSink:
+    def __init__(self, path: Path):
+        self.path = path
+        self._f = open(path, "w", encoding="utf-8")
+
+    def write(self, rec: dict) -> None:
+        self._f.write(json.dumps(rec, separators=(",", ":")) + "\n")
+
+    def close(self) -> None:
+        self._f.close()
+
+
+class ParquetSink:
+    """Flattens frame records to one row per track; written once at close()."""
+
+    def __init__(self, path: Path):
+        if pa is None:
+            raise RuntimeError("pyarrow not installed (pip install pyarrow) - use a .jsonl output")
+        self.path = path
+        self._rows: List[dict] = []
+
+    def write(self, rec: dict) -> None:
+        for tr in rec["tracks"]:
+            x1, y1, x2, y2 = tr["bbox"]
+            self._rows.append({
+                "frame": rec["frame"], "t": rec["t"], "pass": rec["pass"], "tid": tr["tid"],
+                "x1": x1, "y1": y1, "x2": x2, "y2": y2,
+                "name": tr["name"], "score": tr["score"],
+                "state": tr["state"], "state_score": tr["state_score"], "event": tr["event"],
+            })
+
+    def close(self) -> None:
+        pq.write_table(pa.Table.from_pylist(self._rows), self.path)
+
+
+def open_sink(path: Optional[str]):
+    if not path:
+        return None
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    return ParquetSink(p) if p.suffix == ".parquet" else JsonlSink(p)
+
+
+# -------------------- replay --------------------
+class Replay:
+    def __init__(self, source: str, gallery_base: Optional[Path] = None, enrol: bool = True,
+                 flip: bool = False, fps: Optional[float] = None):
+        self.source = source
+        self.flip = flip
+        self.fps_override = fps
+        self.enrol = enrol
+        self.factory = EmbedFactory()
+        self.detector = Detector()
+        self.cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+        if self.cascade.empty():
+            raise RuntimeError("haarcascade not found")
+        base = Path(gallery_base) if gallery_base else rl.GALLERY_INDEX
+        self.gallery = GalleryIndex.load(base, legacy_json=None if gallery_base else rl.GALLERY_JSON)
+        self.gallery.base = None   # read-only: enrols made during the replay are not saved
+        self.name_to_id = dict(zip(self.gallery.names, self.gallery.ids))
+        self.known_at_start = len(self.gallery)
+
+        self.tracker = Tracker(max_dist=60, ttl=30)
+        self.ids = IdState()
+        self.roi = RoiScheduler(full_every=rl.ROI_FULL_EVERY_N, margin=rl.ROI_MARGIN)
+        self.per_track_frame_i: Dict[int, int] = {}
+        self.state_by_tid: Dict[int, tuple] = {}
+        self.last_event: Dict[str, float] = {}
+        self.yolo: List[dict] = []
+        self.names_seen = set()
+        self.events = 0
+        self.stats = {k: StageStats(k, window=STATS_WINDOW) for k in ("decode", "detect", "embed", "frame")}
+
+    def run(self, sink=None, max_frames: int = 0) -> dict:
+        cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened():
+            raise RuntimeError(f"cannot open {self.source!r}")
+        fps = self.fps_override or cap.get(cv2.CAP_PROP_FPS) or float(rl.TARGET_FPS)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        impl = self.factory.get_impl()
+        print(f"[replay] {self.source} fps={fps:.2f} frames={total or '?'} {impl.name} "
+              f"known={self.known_at_start} auto_enrol={'on' if self.enrol else 'off'}")
+
+        auto_enrol, rl.AUTO_ENROL = rl.AUTO_ENROL, rl.AUTO_ENROL and self.enrol
+        frame_i = 0
+        t_start = time.perf_counter()
+        try:
+            while not max_frames or frame_i < max_frames:
+                t0 = time.perf_counter()
+                ok, frame = cap.read()
+                if not ok or frame is None:
+                    break
+                if self.flip:
+                    frame = cv2.flip(frame, 1)
+                t1 = time.perf_counter()
+                self.stats["decode"].record(t0, t1)
+                rec = self.step(frame_i, frame_i / fps, frame)
+                self.stats["frame"].record(t0, time.perf_counter())
+                if sink is not None:
+                    sink.write(rec)
+                frame_i += 1
+        except KeyboardInterrupt:
+            print("[replay] interrupted")
+        finally:
+            rl.AUTO_ENROL = auto_enrol
+            cap.release()
+            if sink is not None:
+                sink.close()
+
+        wall = time.perf_counter() - t_start
+        summary = {
+            "source": str(self.source),
+            "frames": frame_i,
+            "video_fps": round(fps, 3),
+            "video_s": round(frame_i / fps, 3),
+            "wall_s": round(wall, 3),
+            "fps": round(frame_i / wall, 2) if wall > 0 else 0.0,
+            "x_realtime": round(frame_i / fps / wall, 2) if wall > 0 else 0.0,
+            "stages": {k: {kk: v for kk, v in s.snapshot().items() if kk != "stage"}
+                       for k, s in self.stats.items()},
+            "passes": dict(self.roi.counts),
+            "tracks": self.tracker.next_id - 1,
+            "identities": sorted(self.names_seen),
+            "enrolled": len(self.gallery) - self.known_at_start,
+            "reid": {"inherited": self.ids.reid.hits, "rejected": self.ids.reid.misses},
+            "events": self.events,
+        }
+        print(f"[replay] {frame_i} frames in {wall:.1f}s = {summary['fps']:.1f} fps "
+              f"({summary['x_realtime']:.2f}x realtime)")
+        for k, s in summary["stages"].items():
+            print(f"[replay]   {k:<6} p50 {s['p50_ms']:.1f}ms p95 {s['p95_ms']:.1f}ms n={s['count']}")
+        print(f"[replay] passes {summary['passes']} tracks {summary['tracks']} "
+              f"identities {len(summary['identities'])} enrolled {summary['enrolled']} events {self.events}")
+        return summary
+
+    def step(self, frame_i: int, t: float, frame) -> dict:
+        """Detect + track + embed + decide for one frame; returns its output record."""
+        now = REPLAY_EPOCH + t
+        i = frame_i + 1                   # same cadence counters as run_loop's detect stage
+        run_yolo = i % rl.YOLO_EVERY_N_FRAMES == 0
+        run_id = i % rl.FRAME_STRIDE == 0
+        rec = {"frame": frame_i, "t": round(t, 4), "pass": "skip", "yolo": None, "tracks": []}
+        if not (run_yolo or run_id):
+            return rec
+
+        t0 = time.perf_counter()
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        plan = self.roi.plan(gray, self.tracker.predicted_boxes()) if rl.ROI_DETECT else None
+        full = plan is None or plan.full
+        rec["pass"] = "full" if full else "rois"
+        if run_yolo:
+            self.yolo = (self.detector.predict_states(frame) if full
+                         else yolo_mosaic(self.detector, frame, plan.rois, self.detector.imgsz))
+            rec["yolo"] = [{"label": d["label"], "score": round(float(d["score"]), 4),
+                            "xyxy": [int(v) for v in d["xyxy"]]} for d in self.yolo]
+        if not run_id:
+            self.stats["detect"].record(t0, time.perf_counter())
+            return rec
+
+        if full:
+            faces = self.cascade.detectMultiScale(gray, **HAAR_KW)
+            boxes = [(int(x), int(y), int(x + w), int(y + h)) for (x, y, w, h) in faces]
+        else:
+            boxes = haar_rois(self.cascade, gray, plan.rois, **HAAR_KW)
+        assigned = self.tracker.update(boxes)
+        reid_cands = self.ids.on_tracker_update(self.tracker, assigned, now)
+        for tid in self.tracker.lost:
+            self.per_track_frame_i.pop(tid, None)
+            self.state_by_tid.pop(tid, None)
+
+        due = []   # (tid, crop, rel, bbox, cands)
+        for tid, (x1, y1, x2, y2) in assigned.items():
+            if x2 <= x1 or y2 <= y1:
+                continue
+            cands = reid_cands.get(tid)
+            every = rl.EMBED_CONFIRMED_EVERY_N_FRAMES if self.ids.confirmed(tid) else rl.EMBED_EVERY_N_FRAMES
+            self.per_track_frame_i[tid] = self.per_track_frame_i.get(tid, 0) + 1
+            if cands or self.per_track_frame_i[tid] % every == 0:
+                crop, rel = face_crop(frame, x1, y1, x2, y2)
+                due.append((tid, crop, rel, (x1, y1, x2, y2), cands))
+
+            best_det, best_iou = None, 0.0
+            for det in self.yolo:
+                iou = iou_xyxy(det["xyxy"], (x1, y1, x2, y2))
+                if iou > best_iou:
+                    best_iou, best_det = iou, det
+            if best_det and best_iou >= rl.IOU_MATCH_THR:
+                self.state_by_tid[tid] = (best_det["label"], float(best_det["score"]), now)
+        t1 = time.perf_counter()
+        self.stats["detect"].record(t0, t1)
+
+        if due:
+            faces = [embed_input(crop, rel) for _, crop, rel, _, _ in due]
+            for (tid, crop, _, bbox, cands), res in zip(due, self.factory.embed_batch(faces)):
+                if not res.ok:
+                    continue
+                if cands and self.ids.try_inherit(tid, res.emb, cands, now=now):
+                    continue
+                decide_identity(self.ids, self.gallery, self.name_to_id, tid, res.emb, crop, bbox, now=now)
+            self.stats["embed"].record(t1, time.perf_counter())
+
+        for tid, bbox in assigned.items():
+            if bbox[2] <= bbox[0] or bbox[3] <= bbox[1]:
+                continue
+            key, ev = sighting_for_track(self.ids, tid, bbox, self.state_by_tid.get(tid), self.name_to_id)
+            event = now - self.last_event.get(key, 0) >= rl.EVENT_COOLDOWN_S
+            if event:
+                self.last_event[key] = now
+                self.events += 1
+            if ev["name"] != "UNKNOWN":
+                self.names_seen.add(ev["name"])
+            rec["tracks"].append({
+                "tid": int(tid), "bbox": [int(v) for v in bbox],
+                "name": ev["name"], "score": round(float(ev["score"]), 4),
+                "state": ev["state"], "state_score": round(float(ev["state_score"]), 4),
+                "event": event,
+            })
+        return rec
+
+
+# -------------------- CLI --------------------
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Deterministic headless replay of a video through the vision loop")
+    ap.add_argument("--source", required=True, help="video file")
+    ap.add_argument("--out", default=None, help="per-frame output: .jsonl or .parquet (+ <out>.summary.json)")
+    ap.add_argument("--gallery", default=None,
+                    help="gallery index base path (default: the live gallery, read-only)")
+    ap.add_argument("--no-enrol", action="store_true", help="disable auto-enrol (fixed gallery)")
+    ap.add_argument("--max-frames", type=int, default=0)
+    ap.add_argument("--fps", type=float, default=None, help="override the container frame rate for timestamps")
+    ap.add_argument("--flip", action="store_true", help="mirror frames like the live webcam loop")
+    args = ap.parse_args(argv)
+
+    if not Path(args.source).is_file():
+        ap.error(f"no such file: {args.source}")
+    sink = open_sink(args.out)   # fail on a missing pyarrow before loading the models
+    replay = Replay(args.source, gallery_base=args.gallery, enrol=not args.no_enrol,
+                    flip=args.flip, fps=args.fps)
+    summary = replay.run(sink, max_frames=args.max_frames)
+    if args.out:
+        out = Path(args.out)
+        with open(out.with_name(out.stem + ".summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"[replay] wrote {out} (+ {out.stem}.summary.json)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
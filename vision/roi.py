@@ -0,0 +1,202 @@
+# project/vision/roi.py
+# ------------------------------------------------------------
+# Adaptive region-of-interest detection for the desktop run_loop.
+#   MotionMap     frame difference on a ~80 px wide blurred copy of the
+#                 gray frame -> changed fraction + motion boxes
+#   RoiScheduler  decides per processed frame: full-frame detection, or
+#                 only expanded ROIs around the live tracks. Full frame
+#                 when there are no tracks, every full_every frames, when
+#                 motion shows up outside the ROIs (someone new walked in)
+#                 or when the ROIs would cover most of the frame anyway
+#   haar_rois     Haar on each ROI of the gray frame, boxes in frame coords
+#   yolo_mosaic   tiles the ROIs into ONE imgsz x imgsz canvas so YOLO runs
+#                 a single inference for all of them, maps boxes back
+#                 (build_mosaic / map_mosaic when the caller batches canvases)
+# A mostly static classroom then runs Haar on a few small crops and YOLO
+# on one mosaic instead of the whole frame every stride.
+# ------------------------------------------------------------
+
+from __future__ import annotations
+import math
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+Box = Tuple[int, int, int, int]
+
+
+# -------------------- boxes --------------------
+def expand_box(box: Box, margin: float, w: int, h: int) -> Box:
+    x1, y1, x2, y2 = box
+    dx, dy = int((x2 - x1) * margin), int((y2 - y1) * margin)
+    return (max(0, x1 - dx), max(0, y1 - dy), min(w, x2 + dx), min(h, y2 + dy))
+
+
+def _overlaps(a: Box, b: Box) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def merge_boxes(boxes: Sequence[Box]) -> List[Box]:
+    """Union overlapping boxes until none overlap (so no face is detected twice)."""
+    out = [tuple(b) for b in boxes]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(out)):
+            for j in range(i + 1, len(out)):
+                if _overlaps(out[i], out[j]):
+                    a, b = out[i], out.pop(j)
+                    out[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    merged = True
+                    break
+            if merged:
+                break
+    return out
+
+
+def _covered(box: Box, rois: Sequence[Box]) -> bool:
+    cx, cy = 0.5 * (box[0] + box[2]), 0.5 * (box[1] + box[3])
+    return any(r[0] <= cx <= r[2] and r[1] <= cy <= r[3] for r in rois)
+
+
+# -------------------- motion --------------------
+class MotionMap:
+    def __init__(self, width: int = 80, thresh: int = 18):
+        self.width = int(width)
+        self.thresh = int(thresh)
+        self._prev: Optional[np.ndarray] = None
+        self._kernel = np.ones((3, 3), np.uint8)
+
+    def update(self, gray: np.ndarray) -> Tuple[float, List[Box]]:
+        """(changed fraction, motion boxes in full-frame coords) vs the previous call."""
+        h, w = gray.shape[:2]
+        sw = self.width
+        sh = max(1, int(round(h * sw / w)))
+        small = cv2.GaussianBlur(cv2.resize(gray, (sw, sh), interpolation=cv2.INTER_AREA), (3, 3), 0)
+        prev, self._prev = self._prev, small
+        if prev is None or prev.shape != small.shape:
+            return 1.0, [(0, 0, w, h)]
+        mask = cv2.dilate((cv2.absdiff(small, prev) > self.thresh).astype(np.uint8), self._kernel)
+        frac = float(mask.mean())
+        if frac == 0.0:
+            return 0.0, []
+        fx, fy = w / sw, h / sh
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        boxes = []
+        for c in contours:
+            x, y, bw, bh = cv2.boundingRect(c)
+            boxes.append((int(x * fx), int(y * fy), int((x + bw) * fx), int((y + bh) * fy)))
+        return frac, boxes
+
+
+# -------------------- scheduler --------------------
+class RoiPlan:
+    __slots__ = ("full", "rois", "reason")
+
+    def __init__(self, full: bool, rois: List[Box], reason: str):
+        self.full = full
+        self.rois = rois
+        self.reason = reason
+
+
+class RoiScheduler:
+    def __init__(self, full_every: int = 15, margin: float = 0.6, max_rois: int = 9,
+                 max_coverage: float = 0.5, motion_width: int = 80, motion_thresh: int = 18,
+                 min_motion_px: int = 24):
+        self.full_every = int(full_every)
+        self.margin = float(margin)
+        self.max_rois = int(max_rois)
+        self.max_coverage = float(max_coverage)
+        self.min_motion_px = int(min_motion_px)   # ignore motion blobs smaller than this (noise)
+        self.motion = MotionMap(motion_width, motion_thresh)
+        self._since_full = 10 ** 9
+        self.counts = {"full": 0, "rois": 0}
+
+    def plan(self, gray: np.ndarray, track_boxes: Sequence[Box]) -> RoiPlan:
+        h, w = gray.shape[:2]
+        _, motion_boxes = self.motion.update(gray)
+        self._since_full += 1
+
+        reason = None
+        rois: List[Box] = []
+        if not len(track_boxes):
+            reason = "no tracks"
+        elif self._since_full >= self.full_every:
+            reason = "periodic"
+        else:
+            rois = merge_boxes([expand_box(tuple(int(v) for v in b), self.margin, w, h) for b in track_boxes])
+            area = sum((r[2] - r[0]) * (r[3] - r[1]) for r in rois)
+            if len(rois) > self.max_rois:
+                reason = "too many rois"
+            elif area > self.max_coverage * w * h:
+                reason = "coverage"
+            elif any(not _covered(m, rois) for m in motion_boxes
+                     if min(m[2] - m[0], m[3] - m[1]) >= self.min_motion_px):
+                reason = "motion"
+
+        if reason is not None:
+            self._since_full = 0
+            self.counts["full"] += 1
+            return RoiPlan(True, [], reason)
+        self.counts["rois"] += 1
+        return RoiPlan(False, rois, "rois")
+
+
+# -------------------- detection on ROIs --------------------
+def haar_rois(cascade, gray: np.ndarray, rois: Sequence[Box], **kw) -> List[Box]:
+    """cascade.detectMultiScale on each ROI; xyxy boxes in frame coords."""
+    min_w, min_h = kw.get("minSize", (0, 0))
+    out = []
+    for x1, y1, x2, y2 in rois:
+        if x2 - x1 < min_w or y2 - y1 < min_h:
+            continue
+        for (x, y, fw, fh) in cascade.detectMultiScale(gray[y1:y2, x1:x2], **kw):
+            out.append((int(x1 + x), int(y1 + y), int(x1 + x + fw), int(y1 + y + fh)))
+    return out
+
+
+def build_mosaic(frame: np.ndarray, rois: Sequence[Box], size: int = 512):
+    """
+    Each ROI is scaled (aspect kept) into a cell of a ceil(sqrt(n)) x ceil(sqrt(n))
+    grid on a size x size canvas. Returns (canvas, tiles) for map_mosaic().
+    """
+    grid = int(math.ceil(math.sqrt(max(1, len(rois)))))
+    cell = size // grid
+    canvas = np.full((size, size, 3), 114, np.uint8)
+    tiles = []   # (cx1, cy1, scale, rx1, ry1, tw, th)
+    for k, (x1, y1, x2, y2) in enumerate(rois):
+        rw, rh = x2 - x1, y2 - y1
+        if rw <= 0 or rh <= 0:
+            continue
+        s = min(cell / rw, cell / rh)
+        tw, th = max(1, int(rw * s)), max(1, int(rh * s))
+        cx1, cy1 = (k % grid) * cell, (k // grid) * cell
+        canvas[cy1:cy1 + th, cx1:cx1 + tw] = cv2.resize(frame[y1:y2, x1:x2], (tw, th),
+                                                        interpolation=cv2.INTER_AREA if s < 1 else cv2.INTER_LINEAR)
+        tiles.append((cx1, cy1, s, x1, y1, tw, th))
+    return canvas, tiles
+
+
+def map_mosaic(dets: List[dict], tiles) -> List[dict]:
+    """Detections on a mosaic canvas -> frame coords, by the cell their center falls in."""
+    out = []
+    for det in dets:
+        bx1, by1, bx2, by2 = det["xyxy"]
+        mx, my = 0.5 * (bx1 + bx2), 0.5 * (by1 + by2)
+        for cx1, cy1, s, rx1, ry1, tw, th in tiles:
+            if cx1 <= mx < cx1 + tw and cy1 <= my < cy1 + th:
+                out.append({**det, "xyxy": (
+                    int(rx1 + (max(bx1, cx1) - cx1) / s), int(ry1 + (max(by1, cy1) - cy1) / s),
+                    int(rx1 + (min(bx2, cx1 + tw) - cx1) / s), int(ry1 + (min(by2, cy1 + th) - cy1) / s),
+                )})
+                break
+    return out
+
+
+def yolo_mosaic(detector, frame: np.ndarray, rois: Sequence[Box], size: int = 512) -> List[dict]:
+    """One detector call for all ROIs of a frame (build_mosaic -> predict_states -> map_mosaic)."""
+    if not rois:
+        return []
+    canvas, tiles = build_mosaic(frame, rois, size)
+    return map_mosaic(detector.predict_states(canvas), tiles)
@@ -3,24 +3,32 @@
 # Smart Presence loop (Balanced + per-student state):
 #   - YOLOv8 Awake/Drowsy via detector.Detector.predict_states()
 #   - Haar face detect for ID pipeline (lightweight CPU)
-#   - Centroid tracker + ArcFace embeddings + 5-frame confirm enrol
+#   - ROI scheduling: full-frame YOLO/Haar only periodically or on motion,
+#     otherwise around live tracks (YOLO gets one mosaic of all ROIs)
+#   - Kalman/Hungarian tracker + ArcFace embeddings + 5-frame confirm enrol
+#   - Optional face alignment to the ArcFace template (vision/align.py, FACE_ALIGN=1)
+#   - Short-term re-id (vision/reid.py): a re-appearing face inherits its identity
 #   - Global frame stride + per-track embed throttle
 #   - Per-student state: "Student_001 | Awake 0.78"
-#   - Backend /api/sighting includes state + state_score
+#   - Backend /api/events includes state + state_score (sent in the
+#     background by vision/poster.py: batched, retried, journaled)
+#   - Threaded: capture / detect / embed / display stages (vision/pipeline.py)
 # ESC to quit
+#   python vision/run_loop.py [--source 2]                         live camera
+#   python vision/run_loop.py --source lecture.mp4 --out r.jsonl   headless replay (vision/replay.py)
 # ------------------------------------------------------------
 
 from __future__ import annotations
 import os
 import cv2
 import json
+import argparse
 import time
-import math
 import uuid
+import threading
 import numpy as np
-import requests
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Tuple, Optional
 from collections import defaultdict, deque, Counter
 
 # ======= Balanced preset knobs =======
@@ -53,9 +61,22 @@ CAP_HEIGHT = 480
 TARGET_FPS = 30
 FRAME_STRIDE = 2                 # process every 2nd frame globally
 EMBED_EVERY_N_FRAMES = 3         # per track, compute embedding every 3 processed frames
+EMBED_CONFIRMED_EVERY_N_FRAMES = 9   # ... and every 9 once the track has a confirmed identity
 YOLO_EVERY_N_FRAMES = 2          # run YOLO every 2 processed frames
 DRAW_TTL_MS = 800   # how long to keep a box/label if we skip frames (ms)
 
+# Adaptive ROI detection (vision/roi.py): between full-frame passes YOLO + Haar
+# only look at expanded boxes around live tracks
+ROI_DETECT = True
+ROI_FULL_EVERY_N = 15            # full-frame pass at least every 15 detection frames
+ROI_MARGIN = 0.6                 # ROI = track box grown by 60% per side
+
+# Short-term re-id of tracks lost to occlusion / crossings
+REID_TTL_S = 4.0                 # how long a lost identity can be inherited
+REID_SIM = 0.55                  # new track's first embedding vs the lost track's mean embedding
+REID_MAX_DIST_PX = 120           # position gate (+ REID_PX_PER_S per second hidden)
+REID_PX_PER_S = 150
+
 # Matching YOLO -> tracked face
 IOU_MATCH_THR = 0.30             # IoU threshold to attach state to a track
 
@@ -64,11 +85,25 @@ IOU_MATCH_THR = 0.30             # IoU threshold to attach state to a track
 VISION_DIR = Path(__file__).resolve().parent
 DATA_DIR = VISION_DIR / "data"
 DATA_DIR.mkdir(parents=True, exist_ok=True)
-GALLERY_JSON = DATA_DIR / "gallery.json"
+GALLERY_JSON = DATA_DIR / "gallery.json"          # legacy format, still written by enrol_from_webcam.py
+GALLERY_INDEX = DATA_DIR / "gallery_index"        # gallery_index.npy + gallery_index.json (GalleryIndex)
+GALLERY_SAVE_DELAY_S = 2.0                        # debounce for index writes
+OUTBOX_DIR = DATA_DIR / "outbox"                  # journal of events not yet accepted by the backend
+POST_BATCH_MAX = 50                               # events per /api/events/bulk request
+POST_FLUSH_S = 1.0                                # max time an event waits for a batch
 
 # ---- modules (your files) ----
 from auto_enrol import EmbedFactory            # ArcFace embedder
 from detector import Detector                  # YOLOv8 Awake/Drowsy
+from gallery_index import GalleryIndex         # vectorized matching + binary persistence
+from poster import EventPoster                 # background batching sender + on-disk journal
+from tracker import Tracker                    # Kalman + Hungarian multi-face tracker
+from reid import ReIdMemory                    # lost-track identities for re-appearing faces
+from align import align_face                    # landmark alignment for ArcFace (FACE_ALIGN=1)
+from roi import RoiScheduler, haar_rois, yolo_mosaic   # motion-gated ROI detection
+from pipeline import (                          # threaded stages + bounded channels
+    LatestSlot, DropOldestQueue, Stage, CaptureStage, StageStats, Closed, format_stats,
+)
 
 # -------------- tiny utils --------------
 def l2_normalize(v: np.ndarray, eps: float = 1e-9) -> np.ndarray:
@@ -114,8 +149,18 @@ def expand_crop_xyxy(img, x1, y1, x2, y2, margin=0.15):
     ny2 = min(h, y2 + dy)
     return nx1, ny1, nx2, ny2
 
+def face_crop(frame, x1, y1, x2, y2, margin=0.15):
+    """Expanded copy of a face box (so the frame can be dropped) + the box in crop coordinates."""
+    ex1, ey1, ex2, ey2 = expand_crop_xyxy(frame, x1, y1, x2, y2, margin=margin)
+    return frame[ey1:ey2, ex1:ex2].copy(), (x1 - ex1, y1 - ey1, x2 - ex1, y2 - ey1)
+
+def embed_input(crop, rel_box):
+    """ArcFace input for a queued crop: aligned 112x112 face, else the crop itself (as before alignment)."""
+    return align_face(crop, rel_box, fallback=crop)
+
 def merge_embedding_into(gallery, name, new_emb, alpha=0.15):
     # gallery in your current {"students":[{"name","emb","id"}]} format
+    # (the dict helpers stay for tools/benchmarks; main() uses GalleryIndex)
     new_emb = np.asarray(new_emb, dtype=np.float32)
     for s in gallery.get("students", []):
         if s.get("name") == name:
@@ -179,68 +224,6 @@ def best_match_raw(emb: np.ndarray, g: Dict) -> Tuple[Optional[int], Optional[st
             best_s, best_i, best_name = s_, i, s.get("name")
     return best_i, best_name, best_s
 
-# -------------- simple centroid tracker --------------
-class CentroidTracker:
-    def __init__(self, max_dist: float = 60.0, ttl: int = 30):
-        self.max_dist = max_dist
-        self.ttl = ttl
-        self.next_id = 1
-        self.objects: Dict[int, Tuple[int, int, int, int]] = {}
-        self.centroids: Dict[int, Tuple[float, float]] = {}
-        self.age: Dict[int, int] = {}
-
-    @staticmethod
-    def _centroid(b: Tuple[int, int, int, int]) -> Tuple[float, float]:
-        x1, y1, x2, y2 = b
-        return (0.5 * (x1 + x2), 0.5 * (y1 + y2))
-
-    def update(self, boxes: List[Tuple[int, int, int, int]]) -> Dict[int, Tuple[int, int, int, int]]:
-        if len(self.objects) == 0:
-            for b in boxes:
-                self.objects[self.next_id] = b
-                self.centroids[self.next_id] = self._centroid(b)
-                self.age[self.next_id] = self.ttl
-                self.next_id += 1
-            return dict(self.objects)
-
-        # decay age + drop stale
-        for k in list(self.age.keys()):
-            self.age[k] -= 1
-            if self.age[k] <= 0:
-                self.objects.pop(k, None)
-                self.centroids.pop(k, None)
-                self.age.pop(k, None)
-
-        # greedy nearest-centroid match
-        unmatched = set(range(len(boxes)))
-        assigned: Dict[int, Tuple[int, int, int, int]] = {}
-        for obj_id, c in list(self.centroids.items()):
-            best_j, best_d = None, 1e9
-            for j in unmatched:
-                cj = self._centroid(boxes[j])
-                d = math.hypot(cj[0] - c[0], cj[1] - c[1])
-                if d < best_d:
-                    best_d, best_j = d, j
-            if best_j is not None and best_d <= self.max_dist:
-                b = boxes[best_j]
-                assigned[obj_id] = b
-                self.objects[obj_id] = b
-                self.centroids[obj_id] = self._centroid(b)
-                self.age[obj_id] = self.ttl
-                unmatched.remove(best_j)
-
-        # new tracks
-        for j in unmatched:
-            b = boxes[j]
-            obj_id = self.next_id
-            self.next_id += 1
-            self.objects[obj_id] = b
-            self.centroids[obj_id] = self._centroid(b)
-            self.age[obj_id] = self.ttl
-            assigned[obj_id] = b
-
-        return assigned
-
 # -------------- stabilizer (5-frame confirm) --------------
 class PendingEnroll:
     def __init__(self, min_hits=ENROL_MIN_HITS, max_gap_ms=ENROL_MAX_GAP_MS,
@@ -285,6 +268,8 @@ class PendingEnroll:
         return l2_normalize(avg.astype(np.float32))
 
 # -------------- backend posting (state-aware) --------------
+POSTER: Optional[EventPoster] = None   # started in main()
+
 def post_sighting(
     name: str,
     score: float,
@@ -294,34 +279,277 @@ def post_sighting(
     state_score: float = 0.0,
     student_id: str = ""
 ):
-    if not SEND_TO_BACKEND:
+    """Queue one event for the background poster (returns immediately)."""
+    if not SEND_TO_BACKEND or POSTER is None:
         return
-    try:
-        payload = {
-            "course_id": COURSE_ID,
-            "camera_id": CAMERA_ID,
-            "name": name,
-            "student_id": student_id,  # <-- NEW
-            "score": score,
-            "bbox": {"x": bbox[0], "y": bbox[1], "w": bbox[2] - bbox[0], "h": bbox[3] - bbox[1]},
-            "ts": ts,
-        }
-        if state is not None:
-            payload["state"] = state
-            payload["state_score"] = state_score
-
-        # endpoint unified to /api/events
-        r = requests.post(f"{BACKEND_URL}/api/events", json=payload, timeout=2.0)
-        if r.status_code != 200:
-            print(f"[post] non-200 {r.status_code}: {r.text[:160]}")
-
-    except Exception as e:
-        print(f"[post] failed: {e}")
+    POSTER.post(sighting_payload(name, score, bbox, ts, state, state_score, student_id))
+
+def sighting_payload(name, score, bbox, ts, state=None, state_score=0.0, student_id="",
+                     course_id: Optional[str] = None, camera_id: Optional[str] = None) -> dict:
+    """/api/events body for one sighting (course/camera default to this loop's)."""
+    payload = {
+        "course_id": course_id or COURSE_ID,
+        "camera_id": camera_id or CAMERA_ID,
+        "name": name,
+        "student_id": student_id,
+        "score": score,
+        "bbox": {"x": bbox[0], "y": bbox[1], "w": bbox[2] - bbox[0], "h": bbox[3] - bbox[1]},
+        "ts": ts,
+    }
+    if state is not None:
+        payload["state"] = state
+        payload["state_score"] = state_score
+    return payload
+
+def sighting_for_track(ids: "IdState", tid: int, bbox: Tuple[int, int, int, int],
+                       st: Optional[Tuple[str, float, float]], name_to_id: Dict[str, str]) -> Tuple[str, dict]:
+    """(cooldown key, post_sighting kwargs) for a displayed track; key is the base name w/o similarity."""
+    base, base_score = ids.label(tid)
+    key = base.split()[0] if base != "…" else "UNKNOWN"
+    unknown = "Unknown" in key or key == "UNKNOWN"
+    cur_state, cur_state_score = (st[0], st[1]) if st else (None, 0.0)
+    return key, {
+        "name": "UNKNOWN" if unknown else key,
+        "score": 0.0 if unknown else base_score,
+        "bbox": bbox,
+        "state": cur_state,
+        "state_score": cur_state_score,
+        "student_id": "" if unknown else name_to_id.get(key, ""),
+    }
+
+# -------------- pipeline stages --------------
+# capture -> [LatestSlot] -> detect -> [DropOldestQueue] -> embed
+#                              \----> [LatestSlot] -> display (main thread: imshow)
+# detect: YOLO cadence + Haar + tracker, queues crops of tracks due for an embedding
+# embed:  ArcFace + vote/hysteresis + auto-enrol, writes IdState
+# display: composes labels from IdState, posts sightings, draws, imshow
+EMBED_QUEUE_MAX = 8              # crops waiting for ArcFace; oldest dropped when full
+SHOW_STAGE_STATS = True          # per-stage FPS/latency line on the preview
+
+class IdState:
+    """Identity decisions per track; written by the embed stage, read by display."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending_by_tid: Dict[int, PendingEnroll] = defaultdict(PendingEnroll)
+        self.last_label_by_tid: Dict[int, str] = {}
+        self.last_score_by_tid: Dict[int, float] = {}
+        self.recent_matches_by_tid: Dict[int, deque] = defaultdict(lambda: deque(maxlen=VOTE_WINDOW))  # (name, sim)
+        self.last_label_ts_by_tid: Dict[int, float] = {}   # tid -> last time we had a known label (ms)
+        self.hint_by_tid: Dict[int, str] = {}              # e.g. "NEW? (3/7)" drawn above the box
+        self.emb_by_tid: Dict[int, np.ndarray] = {}        # running mean embedding while the label is known
+        self.reid = ReIdMemory(ttl_s=REID_TTL_S, sim_min=REID_SIM,
+                               max_dist_px=REID_MAX_DIST_PX, px_per_s=REID_PX_PER_S)
+
+    def label(self, tid: int) -> Tuple[str, float]:
+        with self.lock:
+            return self.last_label_by_tid.get(tid, "…"), self.last_score_by_tid.get(tid, 0.0)
+
+    def _known(self, tid: int) -> Optional[str]:
+        label = self.last_label_by_tid.get(tid, "")
+        if not label or label == "…" or "Unknown" in label:
+            return None
+        return label.split()[0]
+
+    def confirmed(self, tid: int) -> bool:
+        """Known label held with >= RECOG_ON: the detect stage embeds it less often."""
+        with self.lock:
+            return self._known(tid) is not None and self.last_score_by_tid.get(tid, 0.0) >= RECOG_ON
+
+    def on_tracker_update(self, tracker: Tracker, assigned: Dict[int, Tuple[int, int, int, int]],
+                          now: float) -> Dict[int, list]:
+        """
+        Re-id bookkeeping after tracker.update() (detect stage). Tracks that just went
+        missing are remembered, dropped tracks are forgotten, and each new track gets
+        its re-id candidates (by position), if any.
+        """
+        with self.lock:
+            for tid in tracker.missed:
+                name, emb = self._known(tid), self.emb_by_tid.get(tid)
+                if name and emb is not None:
+                    self.reid.remember(tid, name, self.last_score_by_tid.get(tid, 0.0), emb,
+                                       tracker.last_box(tid), now)
+            for tid in tracker.lost:
+                for d in (self.pending_by_tid, self.last_label_by_tid, self.last_score_by_tid,
+                          self.recent_matches_by_tid, self.last_label_ts_by_tid, self.hint_by_tid,
+                          self.emb_by_tid):
+                    d.pop(tid, None)
+            if not len(self.reid):
+                return {}
+            new = set(tracker.new)
+            cands = {}
+            for tid, box in assigned.items():
+                if tid in new:
+                    c = self.reid.candidates(box, now)
+                    if c:
+                        cands[tid] = c
+                else:
+                    self.reid.forget(tid)   # came back under its own id
+            return cands
+
+    def try_inherit(self, tid: int, emb: np.ndarray, cands: list, now: Optional[float] = None) -> bool:
+        """First embedding of a new track agrees with a lost identity -> take it over (no voting)."""
+        now = time.time() if now is None else now
+        with self.lock:
+            hit = self.reid.claim(cands, emb)
+            if hit is None:
+                return False
+            e, sim = hit
+            self.last_label_by_tid[tid] = f"{e.name} {e.score:.2f}"
+            self.last_score_by_tid[tid] = e.score
+            self.last_label_ts_by_tid[tid] = int(now * 1000)
+            votes = self.recent_matches_by_tid[tid]
+            for _ in range(VOTE_NEED):
+                votes.append((e.name, e.score))
+            self.emb_by_tid[tid] = l2_normalize(0.8 * e.emb + 0.2 * l2_normalize(emb))
+            self.hint_by_tid.pop(tid, None)
+            return True
+
+
+def decide_identity(ids: IdState, gallery: GalleryIndex, name_to_id: Dict[str, str],
+                    tid: int, emb: np.ndarray, crop, bbox: Tuple[int, int, int, int],
+                    now: Optional[float] = None) -> None:
+    """Vote + hysteresis + duplicate guard + auto-enrol for one embedded crop (now: wall clock unless replaying)."""
+    x1, y1, x2, y2 = bbox
+    now = time.time() if now is None else now
+    now_ms = int(now * 1000)
+    xywh = xyxy_to_xywh((x1, y1, x2, y2))
+
+    with ids.lock:
+        # 1) one pass over the gallery: raw match (for de-dup) + thresholded (for display)
+        raw_idx, raw_name, raw_sim = gallery.best(emb)
+        cand_name, cand_sim = (raw_name, raw_sim) if raw_sim >= SIM_THRESHOLD else ("UNKNOWN", raw_sim)
+
+        # 2) push to vote window (keep UNKNOWN too)
+        ids.recent_matches_by_tid[tid].append((cand_name, cand_sim))
+
+        # compute majority vote over named candidates only
+        names = [n for n, s in ids.recent_matches_by_tid[tid] if n != "UNKNOWN"]
+        winner, winner_count = (None, 0)
+        if names:
+            counts = Counter(names)
+            winner, winner_count = counts.most_common(1)[0]
+
+        # average sim for the winner over the window
+        avg_sim_winner = 0.0
+        if winner:
+            sims = [s for n, s in ids.recent_matches_by_tid[tid] if n == winner]
+            avg_sim_winner = sum(sims) / max(1, len(sims))
+
+        # previous label (if any)
+        prev_label = ids.last_label_by_tid.get(tid, "")
+        prev_known = ("Unknown" not in prev_label) and (prev_label != "…") and prev_label != ""
+        prev_sim   = ids.last_score_by_tid.get(tid, 0.0)
+
+        # --- Hysteresis + vote decision ---
+        decided_name = None
+        decided_sim  = 0.0
+        ids.hint_by_tid.pop(tid, None)
+
+        # Case 1: we have a clear winner with enough votes & confidence
+        if winner and winner_count >= VOTE_NEED and avg_sim_winner >= RECOG_ON:
+            decided_name = winner
+            decided_sim  = avg_sim_winner
+            ids.last_label_ts_by_tid[tid] = now_ms
+
+        # Case 2: keep previous known label unless confidence has really dropped
+        elif prev_known and prev_sim >= RECOG_OFF:
+            decided_name = prev_label.split()[0]  # strip sim if present
+            decided_sim  = prev_sim
+
+        # Case 3: no stable ID yet → duplicate guard / auto-enrol gate / sticky fallback
+        else:
+            # (a) if raw match is already high, treat as existing (NO auto-enrol) + light merge
+            if raw_idx is not None and raw_sim >= DUPLICATE_SIM:
+                decided_name = raw_name or "Unknown"
+                decided_sim  = raw_sim
+                gallery.merge(decided_name, emb, alpha=0.15)   # in place; saved by the debounce timer
+
+            else:
+                # (b) consider auto-enrol ONLY if clearly far from any known student
+                if raw_sim < AUTO_ENROL_SIM_MAX:
+                    # quality gates (face big & sharp enough) BEFORE buffering
+                    h_face, w_face = (y2 - y1), (x2 - x1)
+                    ok_size = min(h_face, w_face) >= 120
+                    gray_face = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+                    sharp = cv2.Laplacian(gray_face, cv2.CV_64F).var()
+                    ok_sharp = sharp >= 60.0  # adjust 40–80 if needed
+
+                    if ok_size and ok_sharp:
+                        pe = ids.pending_by_tid[tid]
+                        ids.hint_by_tid[tid] = f"NEW? ({min(pe.hits+1, ENROL_MIN_HITS)}/{ENROL_MIN_HITS})"
+
+                        last_new_ms = getattr(pe, "last_new_ms", 0)
+                        if AUTO_ENROL and (now_ms - last_new_ms) >= ENROL_COOLDOWN_MS and pe.step(now_ms, xywh, emb):
+                            avg_emb = pe.averaged_embedding()
+                            if avg_emb is None or not isinstance(avg_emb, np.ndarray) or avg_emb.size == 0:
+                                avg_emb = emb.astype(np.float32)
+                            else:
+                                avg_emb = avg_emb.astype(np.float32)
+
+                            new_name = gallery.next_name()
+
+                            new_id = str(uuid.uuid4())
+                            gallery.add(new_name, avg_emb, new_id)
+                            name_to_id[new_name] = new_id            # <-- keep the map in sync
+                            pe.last_new_ms = now_ms
+                            print(f"[enrol] added {new_name} ({new_id})  (total {len(gallery)})")
+
+                            decided_name = new_name
+                            decided_sim  = 1.0
+                            pe.reset()
+                            ids.hint_by_tid.pop(tid, None)
+                        else:
+                            decided_name = "Unknown (buffering…)" if AUTO_ENROL else "Unknown"
+                            decided_sim  = 0.0
+                    else:
+                        decided_name = "Unknown"
+                        decided_sim  = 0.0
+                else:
+                    # (c) close to existing but not confident yet → sticky fallback then wait
+                    last_ts = ids.last_label_ts_by_tid.get(tid, 0.0)
+                    if last_ts and (now_ms - last_ts) <= LABEL_STICKY_MS and prev_known:
+                        decided_name = prev_label.split()[0]
+                        decided_sim  = prev_sim
+                    else:
+                        decided_name = "Unknown"
+                        decided_sim  = 0.0
+
+        # --- finalize label text (BUGFIX: ensure we actually set label_to_draw/score_to_draw) ---
+        if decided_name != "Unknown" and decided_name is not None:
+            label_to_draw = f"{decided_name} {decided_sim:.2f}"
+            score_to_draw = decided_sim
+        else:
+            label_to_draw = "Unknown (buffering…)" if AUTO_ENROL else "Unknown"
+            score_to_draw = 0.0
+
+        # remember last decision
+        ids.last_label_by_tid[tid] = label_to_draw
+        ids.last_score_by_tid[tid] = score_to_draw
+
+        # running mean embedding of a known track (what re-id compares against)
+        if "Unknown" not in label_to_draw:
+            prev = ids.emb_by_tid.get(tid)
+            ids.emb_by_tid[tid] = l2_normalize(emb) if prev is None else l2_normalize(0.8 * prev + 0.2 * l2_normalize(emb))
+
 
 # -------------- main loop --------------
-def main():
+def main(argv=None):
+    global POSTER, CAM_INDEX
+    ap = argparse.ArgumentParser(description="Smart Presence desktop loop")
+    ap.add_argument("--source", default=None,
+                    help="camera index (live, default CAM_INDEX) or a video file (headless replay, see vision/replay.py)")
+    args, rest = ap.parse_known_args(argv)
+    if args.source is not None and not args.source.isdigit():
+        from replay import main as replay_main
+        return replay_main(["--source", args.source] + rest)
+    if rest:
+        ap.error(f"unrecognized arguments (live mode): {' '.join(rest)}")
+    if args.source is not None:
+        CAM_INDEX = int(args.source)
+
     factory = EmbedFactory()
-    print(f"[run] Using {factory.impl_name} emb_dim={factory.emb_dim}")
+    impl = factory.get_impl()
+    print(f"[run] Using {impl.name} emb_dim={impl.emb_dim}")
 
     # YOLOv8 Awake/Drowsy
     yolo = Detector()  # imgsz preset inside detector.py
@@ -329,27 +557,18 @@ def main():
     # Haar for face boxes (ID pipeline)
     cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
     if cascade.empty():
-        print("[err] haarcascade not found"); return
+        print("[err] haarcascade not found"); return 1
 
-    gallery = load_gallery()
-    print(f"[run] loaded students: {len(gallery['students'])}")
+    gallery = GalleryIndex.load(GALLERY_INDEX, legacy_json=GALLERY_JSON, save_delay_s=GALLERY_SAVE_DELAY_S)
+    print(f"[run] loaded students: {len(gallery)}")
     # Build a name->id map for quick lookup when posting events
-    name_to_id = {s.get("name"): (s.get("id") or "") for s in gallery.get("students", [])}
+    name_to_id = dict(zip(gallery.names, gallery.ids))
 
-    tracker = CentroidTracker(max_dist=60, ttl=30)
+    tracker = Tracker(max_dist=60, ttl=30)
+    ids = IdState()
     last_event: Dict[str, float] = {}
-
-    # per-track stabilizers + throttles
-    pending_by_tid: Dict[int, PendingEnroll] = defaultdict(PendingEnroll)
     per_track_frame_i: Dict[int, int] = defaultdict(int)
-    last_label_by_tid: Dict[int, str] = {}
-    last_score_by_tid: Dict[int, float] = {}
-    recent_matches_by_tid: Dict[int, deque] = defaultdict(lambda: deque(maxlen=VOTE_WINDOW))  # (name, sim)
-    last_label_ts_by_tid: Dict[int, float] = {}   # tid -> last time we had a known label (ms)
-
-    # YOLO cache: all detections this cadence
-    last_yolo_dets: List[Dict] = []  # {'label','score','xyxy'}
-    state_by_tid: Dict[int, Tuple[str, float, float]] = {}  # tid -> (label, score, ts)
+    state_by_tid: Dict[int, Tuple[str, float, float]] = {}  # tid -> (label, score, ts)   (detect stage)
 
     cap = cv2.VideoCapture(CAM_INDEX)
     cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
@@ -360,264 +579,197 @@ def main():
 
     if not cap.isOpened():
         print(f"[err] Cannot open camera index {CAM_INDEX}")
-        return
+        return 1
 
     font = cv2.FONT_HERSHEY_SIMPLEX
     print("[ok] Camera opened. ESC to quit.")
-    global_frame_i = 0
-
-    draw_cache = {}  # tid -> {'bbox':(x1,y1,x2,y2), 'text':str, 'color':(B,G,R), 'ts':ms}
-
-    def draw_overlays(frame):
-        now_ms = int(time.time() * 1000)
-        stale = []
-        for tid, d in draw_cache.items():
-            if now_ms - d['ts'] > DRAW_TTL_MS:
-                stale.append(tid)
-                continue
-            x1, y1, x2, y2 = d['bbox']
-            cv2.rectangle(frame, (x1, y1), (x2, y2), d['color'], 2)
-            cv2.putText(frame, d['text'], (x1, max(20, y1 - 10)),
-                        font, 0.6, d['color'], 2, cv2.LINE_AA)
-        for tid in stale:
-            draw_cache.pop(tid, None)
 
-    while True:
-        ok, frame = cap.read()
-        if not ok:
-            break
-        frame = cv2.flip(frame, 1)
-        global_frame_i += 1
+    if SEND_TO_BACKEND:
+        POSTER = EventPoster(BACKEND_URL, OUTBOX_DIR, batch_max=POST_BATCH_MAX, flush_interval_s=POST_FLUSH_S)
+        POSTER.start()   # also replays events journaled by an earlier run
+
+    stop = threading.Event()
+    frames = LatestSlot("frames")
+    to_display = LatestSlot("display")
+    embed_q = DropOldestQueue(EMBED_QUEUE_MAX, name="embed_q")
+    det_state = {"i": 0, "yolo": []}   # processed-frame counter + YOLO cache: {'label','score','xyxy'}
+    roi_sched = RoiScheduler(full_every=ROI_FULL_EVERY_N, margin=ROI_MARGIN)
+
+    # ---- detect stage: YOLO cadence + Haar + tracker -> crops for embedding
+    def detect(item):
+        frame_i, ts, frame = item
+        det_state["i"] += 1
+        i = det_state["i"]
+
+        run_yolo = i % YOLO_EVERY_N_FRAMES == 0
+        run_id = i % FRAME_STRIDE == 0
+        if not (run_yolo or run_id):
+            return (frame_i, ts, frame, None)
+
+        # full frame or only the areas around live tracks (motion elsewhere forces full)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        plan = roi_sched.plan(gray, tracker.predicted_boxes()) if ROI_DETECT else None
+        full = plan is None or plan.full
 
-        # --- YOLO cadence: get ALL Awake/Drowsy detections (with boxes)
-        if global_frame_i % YOLO_EVERY_N_FRAMES == 0:
+        if run_yolo:
             # returns list of dicts: {'label','score','xyxy'}
-            last_yolo_dets = yolo.predict_states(frame)
+            det_state["yolo"] = yolo.predict_states(frame) if full else yolo_mosaic(yolo, frame, plan.rois, yolo.imgsz)
 
-        # ---- Frame stride: skip heavy ID work on alternate frames
-        if global_frame_i % FRAME_STRIDE != 0:
-            draw_overlays(frame)   # draw cached boxes/labels even on skipped frames
-            cv2.imshow("smart presence", frame)
-            if (cv2.waitKey(1) & 0xFF) == 27:
-                break
-            continue
-
-        # --- ID pipeline (Haar -> tracker -> embedding throttle -> enrol)
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = cascade.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=5, minSize=(70, 70))
-        boxes = [(int(x), int(y), int(x + w), int(y + h)) for (x, y, w, h) in faces]
+        # ---- Frame stride: skip heavy ID work on alternate frames (display draws cached boxes)
+        if not run_id:
+            return (frame_i, ts, frame, None)
 
+        if full:
+            faces = cascade.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=5, minSize=(70, 70))
+            boxes = [(int(x), int(y), int(x + w), int(y + h)) for (x, y, w, h) in faces]
+        else:
+            boxes = haar_rois(cascade, gray, plan.rois, scaleFactor=1.2, minNeighbors=5, minSize=(70, 70))
         assigned = tracker.update(boxes)
+        reid_cands = ids.on_tracker_update(tracker, assigned, ts)
+        for tid in tracker.lost:
+            per_track_frame_i.pop(tid, None)
+            state_by_tid.pop(tid, None)
 
         for tid, (x1, y1, x2, y2) in assigned.items():
             if x2 <= x1 or y2 <= y1:
                 continue
 
-            # Per-track embed throttle
+            # Per-track embed throttle; a new track that may be a lost identity is embedded at once
+            cands = reid_cands.get(tid)
+            every = EMBED_CONFIRMED_EVERY_N_FRAMES if ids.confirmed(tid) else EMBED_EVERY_N_FRAMES
             per_track_frame_i[tid] += 1
-            do_embed = (per_track_frame_i[tid] % EMBED_EVERY_N_FRAMES == 0)
-
-            label_to_draw = last_label_by_tid.get(tid, "…")
-            score_to_draw = last_score_by_tid.get(tid, 0.0)
-
-            if do_embed:
-                # expand crop slightly for more stable embeddings
-                ex1, ey1, ex2, ey2 = expand_crop_xyxy(frame, x1, y1, x2, y2, margin=0.15)
-                crop = frame[ey1:ey2, ex1:ex2]
-
-                # (optional) resize to 112x112 if your EmbedFactory doesn't do it internally
-                # crop = cv2.resize(crop, (112, 112), interpolation=cv2.INTER_LINEAR)
-
-                res = factory.embed(crop)
-                if res.ok:
-                    emb = res.emb  # EmbedFactory already handles model preproc
-                    now = time.time()
-                    now_ms = int(now * 1000)
-                    xywh = xyxy_to_xywh((x1, y1, x2, y2))
-
-                    # 1) get both thresholded and raw matches
-                    cand_name, cand_sim, _ = best_match(emb, gallery)         # uses SIM_THRESHOLD (for display)
-                    raw_idx,  raw_name,  raw_sim  = best_match_raw(emb, gallery)  # ignores SIM_THRESHOLD (for de-dup)
-
-                    # 2) push to vote window (keep UNKNOWN too)
-                    recent_matches_by_tid[tid].append((cand_name, cand_sim))
-
-                    # compute majority vote over named candidates only
-                    names = [n for n, s in recent_matches_by_tid[tid] if n != "UNKNOWN"]
-                    winner, winner_count = (None, 0)
-                    if names:
-                        counts = Counter(names)
-                        winner, winner_count = counts.most_common(1)[0]
-
-                    # average sim for the winner over the window
-                    avg_sim_winner = 0.0
-                    if winner:
-                        sims = [s for n, s in recent_matches_by_tid[tid] if n == winner]
-                        avg_sim_winner = sum(sims) / max(1, len(sims))
-
-                    # previous label (if any)
-                    prev_label = last_label_by_tid.get(tid, "")
-                    prev_known = ("Unknown" not in prev_label) and (prev_label != "…")
-                    prev_sim   = last_score_by_tid.get(tid, 0.0)
-
-                    # --- Hysteresis + vote decision ---
-                    decided_name = None
-                    decided_sim  = 0.0
-
-                    # Case 1: we have a clear winner with enough votes & confidence
-                    if winner and winner_count >= VOTE_NEED and avg_sim_winner >= RECOG_ON:
-                        decided_name = winner
-                        decided_sim  = avg_sim_winner
-                        last_label_ts_by_tid[tid] = now_ms
-
-                    # Case 2: keep previous known label unless confidence has really dropped
-                    elif prev_known and prev_sim >= RECOG_OFF:
-                        decided_name = prev_label.split()[0]  # strip sim if present
-                        decided_sim  = prev_sim
-
-                    # Case 3: no stable ID yet → duplicate guard / auto-enrol gate / sticky fallback
-                    else:
-                        # (a) if raw match is already high, treat as existing (NO auto-enrol) + light merge
-                        if raw_idx is not None and raw_sim >= DUPLICATE_SIM:
-                            decided_name = raw_name or "Unknown"
-                            decided_sim  = raw_sim
-                            merge_embedding_into(gallery, decided_name, emb, alpha=0.15)
-
-                        else:
-                            # (b) consider auto-enrol ONLY if clearly far from any known student
-                            if raw_sim < AUTO_ENROL_SIM_MAX:
-                                # quality gates (face big & sharp enough) BEFORE buffering
-                                h_face, w_face = (y2 - y1), (x2 - x1)
-                                ok_size = min(h_face, w_face) >= 120
-                                gray_face = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
-                                sharp = cv2.Laplacian(gray_face, cv2.CV_64F).var()
-                                ok_sharp = sharp >= 60.0  # adjust 40–80 if needed
-
-                                if ok_size and ok_sharp:
-                                    pe = pending_by_tid[tid]
-                                    cv2.putText(frame, f"NEW? ({min(pe.hits+1, ENROL_MIN_HITS)}/{ENROL_MIN_HITS})",
-                                                (x1, max(20, y1 - 34)), font, 0.6, (0, 170, 255), 2, cv2.LINE_AA)
-
-                                    last_new_ms = getattr(pe, "last_new_ms", 0)
-                                    if AUTO_ENROL and (now_ms - last_new_ms) >= ENROL_COOLDOWN_MS and pe.step(now_ms, xywh, emb):
-                                        avg_emb = pe.averaged_embedding()
-                                        if avg_emb is None or not isinstance(avg_emb, np.ndarray) or avg_emb.size == 0:
-                                            avg_emb = emb.astype(np.float32)
-                                        else:
-                                            avg_emb = avg_emb.astype(np.float32)
-
-                                        new_name = next_student_name(gallery)
-
-                                        new_id = str(uuid.uuid4())
-                                        gallery["students"].append({
-                                            "name": new_name,
-                                            "emb": [float(x) for x in avg_emb.tolist()],
-                                            "id": new_id
-                                        })
-                                        save_gallery(gallery)
-                                        name_to_id[new_name] = new_id            # <-- keep the map in sync
-                                        pe.last_new_ms = now_ms
-                                        print(f"[enrol] added {new_name} ({new_id})  (total {len(gallery['students'])})")
-
-                                        decided_name = new_name
-                                        decided_sim  = 1.0
-                                        pe.reset()
-                                    else:
-                                        decided_name = "Unknown (buffering…)" if AUTO_ENROL else "Unknown"
-                                        decided_sim  = 0.0
-                                else:
-                                    decided_name = "Unknown"
-                                    decided_sim  = 0.0
-                            else:
-                                # (c) close to existing but not confident yet → sticky fallback then wait
-                                last_ts = last_label_ts_by_tid.get(tid, 0.0)
-                                if last_ts and (now_ms - last_ts) <= LABEL_STICKY_MS and prev_known:
-                                    decided_name = prev_label.split()[0]
-                                    decided_sim  = prev_sim
-                                else:
-                                    decided_name = "Unknown"
-                                    decided_sim  = 0.0
-
-                    # --- finalize label text (BUGFIX: ensure we actually set label_to_draw/score_to_draw) ---
-                    if decided_name != "Unknown" and decided_name is not None:
-                        label_to_draw = f"{decided_name} {decided_sim:.2f}"
-                        score_to_draw = decided_sim
-                    else:
-                        label_to_draw = "Unknown (buffering…)" if AUTO_ENROL else "Unknown"
-                        score_to_draw = 0.0
-
-                    # remember last decision
-                    last_label_by_tid[tid] = label_to_draw
-                    last_score_by_tid[tid] = score_to_draw
-
+            if cands or per_track_frame_i[tid] % every == 0:
+                # expanded copy (margin for alignment, frame can be dropped); aligned on the embed thread
+                crop, rel = face_crop(frame, x1, y1, x2, y2)
+                embed_q.put((tid, crop, rel, (x1, y1, x2, y2), cands))
 
             # --- Match best YOLO detection to this track by IoU (xyxy boxes)
             best_det = None
             best_iou = 0.0
-            for det in last_yolo_dets:
+            for det in det_state["yolo"]:
                 iou = iou_xyxy(det["xyxy"], (x1, y1, x2, y2))
                 if iou > best_iou:
                     best_iou, best_det = iou, det
             if best_det and best_iou >= IOU_MATCH_THR:
                 state_by_tid[tid] = (best_det["label"], float(best_det["score"]), time.time())
 
-            # Compose final label with state
-            draw_color = (0, 170, 255)
-            base = last_label_by_tid.get(tid, label_to_draw)
-            st = state_by_tid.get(tid)
-            if st:
-                s_label, s_score, _ = st
-                if "Unknown" in base:
-                    label_draw_final = f"{base} | {s_label} {s_score:.2f}"
+        states = {tid: state_by_tid[tid] for tid in assigned if tid in state_by_tid}
+        return (frame_i, ts, frame, (assigned, states))
+
+    # ---- embed stage: ArcFace + identity decision
+    def embed(item):
+        tid, crop, rel, bbox, cands = item
+        res = factory.embed(embed_input(crop, rel))
+        if res.ok:
+            if cands and ids.try_inherit(tid, res.emb, cands):
+                return
+            decide_identity(ids, gallery, name_to_id, tid, res.emb, crop, bbox)
+
+    capture = CaptureStage(cap, frames, transform=lambda f: cv2.flip(f, 1), stop=stop)
+    detect_stage = Stage("detect", detect, frames, to_display, stop=stop)
+    embed_stage = Stage("embed", embed, embed_q, stop=stop)
+    display_stats = StageStats("display")
+    for t in (capture, detect_stage, embed_stage):
+        t.start()
+
+    draw_cache = {}  # tid -> {'bbox':(x1,y1,x2,y2), 'text':str, 'color':(B,G,R), 'ts':ms}
+
+    def draw_overlays(frame):
+        now_ms = int(time.time() * 1000)
+        stale = []
+        for tid, d in draw_cache.items():
+            if now_ms - d['ts'] > DRAW_TTL_MS:
+                stale.append(tid)
+                continue
+            x1, y1, x2, y2 = d['bbox']
+            cv2.rectangle(frame, (x1, y1), (x2, y2), d['color'], 2)
+            cv2.putText(frame, d['text'], (x1, max(20, y1 - 10)),
+                        font, 0.6, d['color'], 2, cv2.LINE_AA)
+            if d.get('hint'):
+                cv2.putText(frame, d['hint'], (x1, max(20, y1 - 34)), font, 0.6, (0, 170, 255), 2, cv2.LINE_AA)
+        for tid in stale:
+            draw_cache.pop(tid, None)
+
+    # ---- display stage (main thread: HighGUI wants imshow/waitKey here)
+    try:
+        while True:
+            try:
+                frame_i, ts, frame, tracks = to_display.get(timeout=1.0)
+            except TimeoutError:
+                continue
+            except Closed:
+                break
+            t0 = time.perf_counter()
+
+            for tid, (x1, y1, x2, y2) in (tracks[0].items() if tracks else ()):
+                if x2 <= x1 or y2 <= y1:
+                    continue
+                base, base_score = ids.label(tid)
+                with ids.lock:
+                    hint = ids.hint_by_tid.get(tid)
+
+                # Compose final label with state
+                draw_color = (0, 170, 255)
+                st = tracks[1].get(tid)
+                if st:
+                    s_label, s_score, _ = st
+                    if "Unknown" in base:
+                        label_draw_final = f"{base} | {s_label} {s_score:.2f}"
+                    else:
+                        base_name = base.split()[0]  # strip similarity if present
+                        label_draw_final = f"{base_name} | {s_label} {s_score:.2f}"
+                    if "Unknown" not in base and base != "…":
+                        draw_color = (0, 220, 0)  # recognized
                 else:
-                    base_name = base.split()[0]  # strip similarity if present
-                    label_draw_final = f"{base_name} | {s_label} {s_score:.2f}"
-                if "Unknown" not in base:
-                    draw_color = (0, 220, 0)  # recognized
-            else:
-                label_draw_final = base
-                if "Unknown" not in base:
-                    draw_color = (0, 220, 0)
-
-            # throttled backend event (when we have a label to show)
-            now = time.time()
-            key = (last_label_by_tid.get(tid, "UNKNOWN")).split()[0] # base name w/o similarity
-            sid_for_post = "" if ("Unknown" in key or key == "UNKNOWN") else name_to_id.get(key, "")
-            cur_state, cur_state_score = (None, 0.0)
-            if tid in state_by_tid:
-                cur_state, cur_state_score, _ = state_by_tid[tid]
-            if now - last_event.get(key, 0) >= EVENT_COOLDOWN_S:
-                last_event[key] = now
-                post_sighting(
-                    key if "Unknown" not in key else "UNKNOWN",
-                    last_score_by_tid.get(tid, 0.0) if "Unknown" not in key else 0.0,
-                    (x1, y1, x2, y2),
-                    now,
-                    state=cur_state,
-                    state_score=cur_state_score,
-                    student_id=sid_for_post                       # <-- NEW
-                )
-
-            # draw UI
-            draw_cache[tid] = {
-                    'bbox': (x1, y1, x2, y2),
-                    'text': label_draw_final,
-                    'color': draw_color,
-                    'ts': int(time.time() * 1000)
-                }
-
-        head = f"{factory.impl_name} emb_dim={factory.emb_dim} known={len(gallery['students'])} thr={SIM_THRESHOLD:.2f} 640x480 stride={FRAME_STRIDE} embed/track={EMBED_EVERY_N_FRAMES} yolo/{YOLO_EVERY_N_FRAMES}"
-        cv2.putText(frame, head, (12, 28), font, 0.6, (40, 200, 40), 2, cv2.LINE_AA)
-
-        draw_overlays(frame)
-
-        cv2.imshow("smart presence", frame)
-        if (cv2.waitKey(1) & 0xFF) == 27:
-            break
+                    label_draw_final = base
+                    if "Unknown" not in base and base != "…":
+                        draw_color = (0, 220, 0)
+
+                # throttled backend event (when we have a label to show)
+                now = time.time()
+                key, ev = sighting_for_track(ids, tid, (x1, y1, x2, y2), st, name_to_id)
+                if now - last_event.get(key, 0) >= EVENT_COOLDOWN_S:
+                    last_event[key] = now
+                    post_sighting(ts=now, **ev)
+
+                # draw UI
+                draw_cache[tid] = {
+                        'bbox': (x1, y1, x2, y2),
+                        'text': label_draw_final,
+                        'color': draw_color,
+                        'hint': hint,
+                        'ts': int(time.time() * 1000)
+                    }
+
+            head = f"{impl.name} emb_dim={impl.emb_dim} known={len(gallery)} thr={SIM_THRESHOLD:.2f} 640x480 stride={FRAME_STRIDE} embed/track={EMBED_EVERY_N_FRAMES} yolo/{YOLO_EVERY_N_FRAMES}"
+            cv2.putText(frame, head, (12, 28), font, 0.6, (40, 200, 40), 2, cv2.LINE_AA)
+            if SHOW_STAGE_STATS:
+                line = format_stats([capture, detect_stage, embed_stage], [embed_q])
+                line += f" | display {display_stats.snapshot()['fps']:.1f}fps"
+                cv2.putText(frame, line, (12, 52), font, 0.45, (40, 200, 40), 1, cv2.LINE_AA)
+
+            draw_overlays(frame)
 
-    cap.release()
-    cv2.destroyAllWindows()
-    print("[i] Closed.")
+            cv2.imshow("smart presence", frame)
+            display_stats.record(t0, time.perf_counter())
+            if (cv2.waitKey(1) & 0xFF) == 27:
+                break
+    finally:
+        stop.set()
+        frames.close()
+        embed_q.close()
+        for t in (capture, detect_stage, embed_stage):
+            t.join(timeout=2.0)
+        cap.release()
+        cv2.destroyAllWindows()
+        gallery.flush()
+        if POSTER is not None:
+            POSTER.close()
+            POSTER = None
+        print("[i] stage stats:", [t.stats.snapshot() for t in (capture, detect_stage, embed_stage)])
+        print(f"[i] detection passes: {roi_sched.counts}")
+        print(f"[i] re-id: inherited {ids.reid.hits}, rejected {ids.reid.misses}")
+        print("[i] Closed.")
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
@@ -0,0 +1,136 @@
+# project/vision/runtime_profiles.py
+# ------------------------------------------------------------
+# Named ONNX Runtime threading profiles, per model.
+#   ORT_PROFILE=throughput            default for every model
+#   ORT_PROFILE_DETECTOR=latency      per-model override (DETECTOR / ARCFACE)
+#   ORT_THREADS_ARCFACE=2             intra-op threads override
+#   ORT_AFFINITY_DETECTOR=0-3         pin intra-op threads to these CPUs
+#
+# Profiles:
+#   latency     - one request at a time gets every core; threads spin
+#   throughput  - few threads per session, no spinning; several requests
+#                 (gunicorn threads / tpool) run side by side without
+#                 oversubscribing the CPU
+#   shared-host - single thread, no spinning, no memory arena; for boxes
+#                 shared with other services
+#   tuned       - whatever vision/tools/tune_ort.py recorded for this host
+# ------------------------------------------------------------
+
+from __future__ import annotations
+import os
+import json
+
+try:
+    import onnxruntime as ort
+except Exception:
+    ort = None
+
+try:
+    from vision import ort_cache
+except ImportError:  # run from inside vision/
+    import ort_cache
+
+DEFAULT_PROFILE = "throughput"
+
+
+def _cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except Exception:
+        return os.cpu_count() or 1
+
+
+def _profiles() -> dict:
+    n = _cores()
+    return {
+        "latency": {"intra": n, "inter": 1, "parallel": False, "spin": True, "arena": True},
+        "throughput": {"intra": max(1, min(4, n // 2)), "inter": 1, "parallel": False, "spin": False, "arena": True},
+        "shared-host": {"intra": 1, "inter": 1, "parallel": False, "spin": False, "arena": False},
+    }
+
+
+def tuned_path():
+    return ort_cache.cache_root() / "ort_tuned.json"
+
+
+def load_tuned() -> dict:
+    try:
+        with open(tuned_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def save_tuned(model: str, settings: dict) -> None:
+    data = load_tuned()
+    data[model] = settings
+    p = tuned_path()
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, p)
+
+
+def _parse_cpus(spec: str) -> list[int]:
+    cpus = []
+    for part in (spec or "").split(","):
+        part = part.strip()
+        if "-" in part:
+            a, b = part.split("-", 1)
+            cpus.extend(range(int(a), int(b) + 1))
+        elif part:
+            cpus.append(int(part))
+    return cpus
+
+
+def resolve(model: str) -> dict:
+    """Effective settings for model ("detector" / "arcface")."""
+    key = model.upper()
+    name = (os.getenv(f"ORT_PROFILE_{key}") or os.getenv("ORT_PROFILE") or DEFAULT_PROFILE).strip().lower()
+    profiles = _profiles()
+    if name == "tuned":
+        base = {**profiles[DEFAULT_PROFILE], **load_tuned().get(model, {})}
+    else:
+        base = dict(profiles.get(name) or profiles[DEFAULT_PROFILE])
+    base["profile"] = name
+
+    threads = os.getenv(f"ORT_THREADS_{key}")
+    if threads:
+        base["intra"] = max(1, int(threads))
+    cpus = _parse_cpus(os.getenv(f"ORT_AFFINITY_{key}", ""))
+    if cpus:
+        base["affinity"] = cpus
+    return base
+
+
+def session_options(model: str, settings: dict | None = None):
+    """ort.SessionOptions carrying the profile for model."""
+    if ort is None:
+        raise RuntimeError("onnxruntime not installed")
+    s = settings or resolve(model)
+    so = ort.SessionOptions()
+    so.intra_op_num_threads = int(s["intra"])
+    so.inter_op_num_threads = int(s["inter"])
+    so.execution_mode = (ort.ExecutionMode.ORT_PARALLEL if s.get("parallel")
+                         else ort.ExecutionMode.ORT_SEQUENTIAL)
+    so.enable_cpu_mem_arena = bool(s.get("arena", True))
+    spin = "1" if s.get("spin") else "0"
+    so.add_session_config_entry("session.intra_op.allow_spinning", spin)
+    so.add_session_config_entry("session.inter_op.allow_spinning", spin)
+
+    cpus = s.get("affinity") or []
+    if cpus and so.intra_op_num_threads > 1:
+        # ORT creates intra-1 worker threads (the caller is the first one);
+        # one CPU list per worker thread, separated by ';'
+        workers = so.intra_op_num_threads - 1
+        so.add_session_config_entry(
+            "session.intra_op_thread_affinities",
+            ";".join(str(cpus[i % len(cpus)] + 1) for i in range(workers)),
+        )
+    return so
+
+
+def openvino_threads(model: str) -> dict:
+    """Matching OpenVINO EP option (the EP ignores ORT's intra-op pool)."""
+    return {"num_of_threads": str(int(resolve(model)["intra"]))}
@@ -0,0 +1,236 @@
+# project/vision/tools/eval_alignment.py
+# ------------------------------------------------------------
+# Retries-to-identify with and without face alignment (vision/align.py).
+# Replays what the extension does against /api/identify: a student's
+# frames are sent one after the other until one matches with
+# sim >= SIM_THRESHOLD. Each frame goes through the server path
+# (largest Haar face, >= 40 px), then either the plain box crop ("raw")
+# or the aligned face ("aligned"; the crop when no landmarks are found),
+# then the embedder. Both modes run regardless of FACE_ALIGN.
+#
+#   python vision/tools/eval_alignment.py --root vision/data/dataset
+#   python vision/tools/eval_alignment.py --synthetic 30 --per-student 12
+#
+# Fixture set: <root>/<student>/*.jpg (sorted; the first --enrol files of
+# each student build its gallery entry, the rest are the attempts), or
+# --synthetic N: benchmarks/fixtures cartoon faces, near-frontal enrol
+# photos and attempts with head roll up to --max-roll degrees, scale,
+# shift and lighting changes (deterministic, --seed).
+# Reported per mode:
+#   retries     frames sent before the first correct confident match
+#               (0 = first frame), mean / p50 / p90 over identified students
+#   identified  students identified within their attempts
+#   wrong       first confident match was another student (false accept)
+#   ambiguous   attempts in [AMBIG_THR, SIM_THRESHOLD): the "pending" band
+#   genuine / impostor  mean sim to the own / best other gallery entry
+#   prep_ms     crop (raw) or landmarks + warp (aligned) per face
+# Run it with vision/models/arcface.onnx present: the CHEAP fallback
+# embedder cannot tell the cartoon faces apart (impostor sim ~ genuine),
+# so without the model only the landmark hit rate and prep_ms mean much.
+# ------------------------------------------------------------
+from __future__ import annotations
+import os, sys, json, time, argparse
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from vision.align import FaceAligner, box_crop
+from vision.auto_enrol import EmbedFactory
+from vision.faces import find_largest_face_bbox
+
+# same decision values as server/core.py (not imported: that pulls in Flask + Postgres)
+SIM_THRESHOLD = 0.60
+AMBIG_THR = 0.45
+MIN_FACE = 40
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+# -------------------- fixtures --------------------
+def load_folder(root: str, min_images: int):
+    """{student: [img, ...]} from <root>/<student>/*.jpg, sorted by file name."""
+    out = {}
+    for d in sorted(Path(root).iterdir()):
+        if not d.is_dir():
+            continue
+        imgs = [cv2.imread(str(p), cv2.IMREAD_COLOR) for p in sorted(d.iterdir())
+                if p.suffix.lower() in IMAGE_EXTS]
+        imgs = [im for im in imgs if im is not None]
+        if len(imgs) >= min_images:
+            out[d.name] = imgs
+    return out
+
+
+def _perturb(img, rng, max_roll: float):
+    h, w = img.shape[:2]
+    M = cv2.getRotationMatrix2D((w / 2, h / 2), float(rng.uniform(-max_roll, max_roll)),
+                                float(rng.uniform(0.85, 1.1)))
+    M[:, 2] += rng.uniform(-0.04, 0.04, 2) * (w, h)
+    out = cv2.warpAffine(img, M, (w, h), borderMode=cv2.BORDER_REFLECT)
+    out = cv2.convertScaleAbs(out, alpha=float(rng.uniform(0.8, 1.2)), beta=float(rng.uniform(-20, 20)))
+    ok, buf = cv2.imencode(".jpg", out, [cv2.IMWRITE_JPEG_QUALITY, 50])   # extension JPEG quality
+    return cv2.imdecode(buf, cv2.IMREAD_COLOR)
+
+
+def synthetic(n: int, per_student: int, enrol: int, max_roll: float, seed: int):
+    """{student: [img, ...]}: near-frontal enrol photos first, then rolled attempts."""
+    from benchmarks.fixtures import synthetic_face_bgr
+    rng = np.random.default_rng(seed)
+    out = {}
+    for i in range(n):
+        base = synthetic_face_bgr(1000 + i)
+        out[f"S{i:03d}"] = [_perturb(base, rng, 4.0 if j < enrol else max_roll) for j in range(per_student)]
+    return out
+
+
+# -------------------- evaluation --------------------
+def detect_all(data):
+    """{student: [bbox or None]}: the /api/identify face (largest Haar box, >= MIN_FACE), found once for both modes."""
+    out = {}
+    for n, imgs in data.items():
+        boxes = []
+        for img in imgs:
+            b = find_largest_face_bbox(img)
+            boxes.append(b if b and b[2] - b[0] >= MIN_FACE and b[3] - b[1] >= MIN_FACE else None)
+        out[n] = boxes
+    return out
+
+
+def faces_for(imgs, boxes, mode: str, aligner: FaceAligner):
+    """Per image: the embedder input (None when there is no usable face) + prep ms per face."""
+    out, ms = [], []
+    for img, bbox in zip(imgs, boxes):
+        if bbox is None:
+            out.append(None)
+            continue
+        t0 = time.perf_counter()
+        face = aligner.align(img, bbox) if mode == "aligned" else None
+        out.append(face if face is not None else box_crop(img, bbox))   # no landmarks: the raw input
+        ms.append((time.perf_counter() - t0) * 1000.0)
+    return out, ms
+
+
+def embed_all(factory: EmbedFactory, faces):
+    res = factory.embed_batch([f for f in faces if f is not None]) if any(f is not None for f in faces) else []
+    it = iter(res)
+    out = []
+    for f in faces:
+        r = next(it) if f is not None else None
+        out.append(r.emb.astype(np.float32) if r is not None and r.ok else None)
+    return out
+
+
+def evaluate(data, boxes, mode: str, enrol: int, factory: EmbedFactory, aligner: FaceAligner):
+    names = sorted(data)
+    embs, prep_ms = {}, []
+    for n in names:
+        faces, ms = faces_for(data[n], boxes[n], mode, aligner)
+        embs[n] = embed_all(factory, faces)
+        prep_ms += ms
+
+    gallery, kept = [], []
+    for n in names:
+        e = [v for v in embs[n][:enrol] if v is not None]
+        if not e:
+            print(f"[eval] {mode}: {n} has no usable enrol photo, skipped")
+            continue
+        g = np.mean(e, axis=0)
+        gallery.append(g / (np.linalg.norm(g) + 1e-9))
+        kept.append(n)
+    G = np.stack(gallery)
+
+    retries, wrong, missed = [], 0, 0
+    attempts = ambiguous = 0
+    genuine, impostor = [], []
+    for gi, n in enumerate(kept):
+        outcome = None
+        for k, q in enumerate(embs[n][enrol:]):
+            attempts += 1
+            if q is None:
+                continue
+            sims = G @ (q / (np.linalg.norm(q) + 1e-9))
+            genuine.append(float(sims[gi]))
+            if len(kept) > 1:
+                impostor.append(float(np.max(np.delete(sims, gi))))
+            best = int(np.argmax(sims))
+            if AMBIG_THR <= sims[best] < SIM_THRESHOLD:
+                ambiguous += 1
+            if outcome is None and sims[best] >= SIM_THRESHOLD:
+                outcome = k if best == gi else "wrong"
+        if outcome is None:
+            missed += 1
+        elif outcome == "wrong":
+            wrong += 1
+        else:
+            retries.append(outcome)
+
+    n_st = max(1, len(kept))
+    r = np.array(retries, np.float32) if retries else np.zeros(1, np.float32)
+    return {
+        "students": len(kept),
+        "identified_pct": round(100.0 * len(retries) / n_st, 1),
+        "wrong_pct": round(100.0 * wrong / n_st, 1),
+        "missed_pct": round(100.0 * missed / n_st, 1),
+        "retries_mean": round(float(r.mean()), 2),
+        "retries_p50": float(np.percentile(r, 50)),
+        "retries_p90": float(np.percentile(r, 90)),
+        "ambiguous_pct": round(100.0 * ambiguous / max(1, attempts), 1),
+        "genuine": round(float(np.mean(genuine)), 3) if genuine else 0.0,
+        "impostor": round(float(np.mean(impostor)), 3) if impostor else 0.0,
+        "prep_ms": round(float(np.mean(prep_ms)), 2) if prep_ms else 0.0,
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--root", help="<root>/<student>/*.jpg fixture set")
+    ap.add_argument("--synthetic", type=int, default=20, help="students when --root is not given")
+    ap.add_argument("--per-student", type=int, default=12, help="synthetic images per student")
+    ap.add_argument("--max-roll", type=float, default=25.0, help="synthetic attempt head roll (deg)")
+    ap.add_argument("--enrol", type=int, default=3, help="images per student used for the gallery")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="write the summary here")
+    args = ap.parse_args()
+
+    if args.root:
+        data = load_folder(args.root, args.enrol + 1)
+        src = args.root
+    else:
+        data = synthetic(args.synthetic, args.per_student, args.enrol, args.max_roll, args.seed)
+        src = f"synthetic x{args.synthetic} (roll <= {args.max_roll:g} deg, seed {args.seed})"
+    if len(data) < 2:
+        print(f"[eval] need >= 2 students with > {args.enrol} images in {src}")
+        return 1
+
+    factory = EmbedFactory()
+    aligner = FaceAligner()
+    embedder = factory.get_impl().name
+    print(f"[eval] {src}: {len(data)} students, embedder={embedder}, "
+          f"landmarks={'YuNet 5-point' if aligner.use_yunet else 'eye cascade 2-point'}")
+
+    t0 = time.perf_counter()
+    boxes = detect_all(data)
+    found = sum(b is not None for bs in boxes.values() for b in bs)
+    print(f"[eval] faces on {found}/{sum(map(len, boxes.values()))} images ({time.perf_counter() - t0:.1f}s)")
+
+    summary = {"fixtures": src, "embedder": embedder, "sim_threshold": SIM_THRESHOLD, "ambig_thr": AMBIG_THR}
+    for mode in ("raw", "aligned"):
+        summary[mode] = evaluate(data, boxes, mode, args.enrol, factory, aligner)
+        print(f"[eval] {mode:<8}" + " ".join(f"{k}={v}" for k, v in summary[mode].items()))
+    hits = aligner.stats["aligned5"] + aligner.stats["aligned2"]
+    summary["landmark_hit_pct"] = round(100.0 * hits / max(1, hits + aligner.stats["fallback"]), 1)
+    print(f"[eval] landmarks found on {summary['landmark_hit_pct']}% of faces {aligner.stats}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"[eval] wrote {os.path.abspath(args.json)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,135 @@
+# project/vision/tools/tune_ort.py
+# ------------------------------------------------------------
+# Benchmarks ONNX Runtime thread settings for the detector and ArcFace on
+# this host and records the best per model in <cache>/ort_tuned.json.
+# Serve with ORT_PROFILE=tuned (or ORT_PROFILE_DETECTOR=tuned) afterwards.
+#
+#   python vision/tools/tune_ort.py                   # both models
+#   python vision/tools/tune_ort.py --model arcface --concurrency 4
+#
+# --concurrency N runs N callers against one session at once (gunicorn
+# threads / tpool). Candidates are ranked by throughput, then p95.
+# ------------------------------------------------------------
+from __future__ import annotations
+import os, sys, time, argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import onnxruntime as ort
+
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from vision import runtime_profiles
+
+MODELS = {
+    "detector": {
+        "paths": [Path("/code/awake_drowsy.onnx"), ROOT / "awake_drowsy.onnx"],
+        "providers": ["OpenVINOExecutionProvider", "CPUExecutionProvider"],
+        "shape": (1, 3, 512, 512),
+    },
+    "arcface": {
+        "paths": [ROOT / "vision" / "models" / "arcface.onnx"],
+        "providers": ["CPUExecutionProvider"],
+        "shape": None,  # read from the model (NHWC or NCHW 112x112)
+    },
+}
+
+
+def find_model(name):
+    for p in MODELS[name]["paths"]:
+        if p.is_file():
+            return p
+    return None
+
+
+def candidates(cores):
+    threads = sorted({1, 2, 4, cores // 2, cores} - {0})
+    threads = [t for t in threads if t <= cores]
+    out = []
+    for intra in threads:
+        for spin in (False, True):
+            out.append({"intra": intra, "inter": 1, "parallel": False, "spin": spin, "arena": True})
+    return out
+
+
+def make_input(sess, shape):
+    inp = sess.get_inputs()[0]
+    if shape is None:
+        shape = tuple(d if isinstance(d, int) else 1 for d in inp.shape)
+    return {inp.name: np.random.rand(*shape).astype(np.float32)}
+
+
+def bench(model_path, providers, shape, settings, runs, concurrency, avail):
+    so = runtime_profiles.session_options("", settings)
+    so.log_severity_level = 3
+    provs = [p for p in providers if p in avail]
+    opts = [{"num_of_threads": str(settings["intra"])} if p == "OpenVINOExecutionProvider" else {} for p in provs]
+    sess = ort.InferenceSession(str(model_path), sess_options=so, providers=provs, provider_options=opts)
+    feed = make_input(sess, shape)
+
+    for _ in range(3):
+        sess.run(None, feed)
+
+    def one(_):
+        t0 = time.perf_counter()
+        sess.run(None, feed)
+        return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        lat = list(ex.map(one, range(runs)))
+    wall = time.perf_counter() - t0
+    lat = np.asarray(lat) * 1000.0
+    return {
+        "p50_ms": round(float(np.percentile(lat, 50)), 2),
+        "p95_ms": round(float(np.percentile(lat, 95)), 2),
+        "ips": round(runs / wall, 2),
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", choices=list(MODELS) + ["all"], default="all")
+    ap.add_argument("--runs", type=int, default=50)
+    ap.add_argument("--concurrency", type=int, default=int(os.getenv("GUNICORN_THREADS", "4")))
+    ap.add_argument("--dry-run", action="store_true", help="print results, do not record")
+    args = ap.parse_args()
+
+    cores = runtime_profiles._cores()
+    avail = ort.get_available_providers()
+    names = list(MODELS) if args.model == "all" else [args.model]
+    print(f"[tune] cores={cores} concurrency={args.concurrency} providers={avail}")
+
+    for name in names:
+        path = find_model(name)
+        if path is None:
+            print(f"[tune] {name}: model file not found, skipped")
+            continue
+        results = []
+        for cand in candidates(cores):
+            try:
+                r = bench(path, MODELS[name]["providers"], MODELS[name]["shape"], cand,
+                          args.runs, args.concurrency, avail)
+            except Exception as e:
+                print(f"[tune] {name} {cand}: failed ({e})")
+                continue
+            print(f"[tune] {name} intra={cand['intra']} spin={int(cand['spin'])} -> {r}")
+            results.append((cand, r))
+        if not results:
+            continue
+        best, r = max(results, key=lambda cr: (cr[1]["ips"], -cr[1]["p95_ms"]))
+        print(f"[tune] {name}: best intra={best['intra']} spin={int(best['spin'])} {r}")
+        if not args.dry_run:
+            runtime_profiles.save_tuned(name, {**best, "measured": r, "cores": cores,
+                                               "concurrency": args.concurrency, "ts": time.time()})
+
+    if not args.dry_run:
+        print(f"[tune] recorded in {runtime_profiles.tuned_path()}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,37 +1,277 @@
 # vision/tracker.py
-import math
+# ------------------------------------------------------------
+# Multi-face tracker for the desktop vision loop.
+#   - track state lives in parallel numpy arrays (ids, Kalman mean and
+#     covariance, miss counters) instead of per-track dicts/objects
+#   - constant-velocity Kalman filter on (cx, cy, w, h): every update
+#     predicts all tracks in one batched matmul, so a face that moves
+#     or crosses another is matched against where it should be now
+#   - cost matrix = 1 - IoU(predicted, detection), with a centroid
+#     distance fallback (<= max_dist px) for small/fast boxes; built
+#     vectorized for all tracks x detections
+#   - optimal assignment (Hungarian); scipy's linear_sum_assignment is
+#     used when installed, otherwise the numpy implementation below
+#   - a track survives `ttl` updates without a detection; after each
+#     update .new / .missed / .lost list the ids that were created, went
+#     unmatched for the first time, or were dropped (for re-id bookkeeping)
+# update(boxes) -> {track_id: box} for the matched + new tracks, as before.
+# ------------------------------------------------------------
 
-class CentroidTracker:
-    def __init__(self, max_dist=50):
-        self.max_dist = max_dist
+from __future__ import annotations
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+Box = Tuple[int, int, int, int]
+
+_FORBIDDEN = 1e6   # cost of a pair outside the gates (never accepted)
+
+
+# -------------------- vectorized geometry --------------------
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU of every xyxy box in a (n,4) against every box in b (m,4) -> (n,m)."""
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    ix1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    iy1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    ix2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    iy2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    area_a = np.clip(a[:, 2] - a[:, 0], 0, None) * np.clip(a[:, 3] - a[:, 1], 0, None)
+    area_b = np.clip(b[:, 2] - b[:, 0], 0, None) * np.clip(b[:, 3] - b[:, 1], 0, None)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-8)
+
+
+def centroid_dist_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    ca = 0.5 * (a[:, :2] + a[:, 2:])
+    cb = 0.5 * (b[:, :2] + b[:, 2:])
+    d = ca[:, None, :] - cb[None, :, :]
+    return np.sqrt((d * d).sum(axis=2))
+
+
+def _xyxy_to_cxcywh(b: np.ndarray) -> np.ndarray:
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    wh = b[:, 2:] - b[:, :2]
+    return np.concatenate([b[:, :2] + 0.5 * wh, wh], axis=1)
+
+
+def _cxcywh_to_xyxy(z: np.ndarray) -> np.ndarray:
+    half = 0.5 * np.clip(z[:, 2:4], 1.0, None)
+    return np.concatenate([z[:, :2] - half, z[:, :2] + half], axis=1)
+
+
+# -------------------- assignment --------------------
+def hungarian(cost: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Minimum-cost assignment for a rectangular cost matrix (numpy only).
+    Shortest augmenting path with potentials, O(n^2 m); the inner scan over
+    columns is vectorized. Returns (rows, cols) like scipy's
+    linear_sum_assignment, rows ascending.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    if cost.size == 0:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, np.int64)     # p[j] = 1-based row matched to column j (0 = free)
+    way = np.zeros(m + 1, np.int64)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            cur = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (cur < minv[1:])
+            minv[1:][better] = cur[better]
+            way[1:][better] = j0
+            masked = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(masked)) + 1
+            delta = masked[j1 - 1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    cols = np.nonzero(p[1:])[0]
+    rows = p[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def assign(cost: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    if linear_sum_assignment is not None and cost.size:
+        return linear_sum_assignment(cost)
+    return hungarian(cost)
+
+
+# -------------------- tracker --------------------
+class Tracker:
+    """
+    Kalman + Hungarian face tracker. State per track is one row of:
+      ids (n,)   x (n,6) = cx, cy, w, h, vx, vy   P (n,6,6)   misses (n,)
+    """
+
+    __slots__ = ("max_dist", "ttl", "iou_thr", "next_id", "ids", "x", "P", "misses", "boxes",
+                 "new", "missed", "lost",
+                 "_std_pos", "_std_vel", "_std_meas")
+
+    _F = np.eye(6)
+    _F[0, 4] = _F[1, 5] = 1.0      # one update step = one time unit
+
+    def __init__(self, max_dist: float = 60.0, ttl: int = 30, iou_thr: float = 0.15,
+                 std_pos: float = 1.0 / 20, std_vel: float = 1.0 / 160, std_meas: float = 1.0 / 20):
+        self.max_dist = float(max_dist)
+        self.ttl = int(ttl)
+        self.iou_thr = float(iou_thr)
+        # noise scaled by box height (faces far from the camera move fewer px)
+        self._std_pos, self._std_vel, self._std_meas = std_pos, std_vel, std_meas
         self.next_id = 1
-        self.objects = {}  # id -> (cx, cy)
-
-    def update(self, detections):
-        # detections: list[(x1,y1,x2,y2)]
-        centers = [((x1+x2)/2, (y1+y2)/2) for x1,y1,x2,y2 in detections]
-        assigned = {}
-        used = set()
-
-        for oid, (ox, oy) in list(self.objects.items()):
-            best_j, best_d = None, 1e9
-            for j,(cx,cy) in enumerate(centers):
-                if j in used: continue
-                d = math.hypot(cx-ox, cy-oy)
-                if d < best_d:
-                    best_d, best_j = d, j
-            if best_j is not None and best_d < self.max_dist:
-                assigned[oid] = detections[best_j]
-                used.add(best_j)
-                self.objects[oid] = centers[best_j]
-            else:
-                # lost: keep for a bit or drop; we drop for simplicity
-                self.objects.pop(oid, None)
-
-        for j, det in enumerate(detections):
-            if j in used: continue
-            oid = self.next_id; self.next_id += 1
-            self.objects[oid] = centers[j]
-            assigned[oid] = det
-
-        return assigned  # dict track_id -> bbox
+        self.ids = np.zeros(0, np.int64)
+        self.x = np.zeros((0, 6))
+        self.P = np.zeros((0, 6, 6))
+        self.misses = np.zeros(0, np.int32)
+        self.boxes = np.zeros((0, 4), np.int64)   # last measured box per track
+        self.new: List[int] = []
+        self.missed: List[int] = []
+        self.lost: List[int] = []
+
+    def __len__(self) -> int:
+        return int(self.ids.size)
+
+    # ---------- Kalman ----------
+    def _predict(self) -> None:
+        if not self.ids.size:
+            return
+        h = np.clip(self.x[:, 3], 1.0, None)
+        q = np.empty((h.size, 6))
+        q[:, :4] = (self._std_pos * h)[:, None] ** 2
+        q[:, 4:] = (self._std_vel * h)[:, None] ** 2
+        F = self._F
+        self.x = self.x @ F.T
+        self.P = F @ self.P @ F.T
+        self.P[:, np.arange(6), np.arange(6)] += q
+
+    def _correct(self, rows: np.ndarray, z: np.ndarray) -> None:
+        P = self.P[rows]
+        r = (self._std_meas * np.clip(z[:, 3], 1.0, None)) ** 2
+        S = P[:, :4, :4].copy()
+        S[:, np.arange(4), np.arange(4)] += r[:, None]
+        K = P[:, :, :4] @ np.linalg.inv(S)                  # (k,6,4)
+        y = z - self.x[rows, :4]
+        self.x[rows] += (K @ y[:, :, None])[:, :, 0]
+        self.P[rows] = P - K @ P[:, :4, :]
+
+    def _spawn(self, z: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+        k = z.shape[0]
+        new_ids = np.arange(self.next_id, self.next_id + k, dtype=np.int64)
+        self.next_id += k
+        x = np.zeros((k, 6))
+        x[:, :4] = z
+        h = np.clip(z[:, 3], 1.0, None)
+        P = np.zeros((k, 6, 6))
+        d = np.empty((k, 6))
+        d[:, :4] = (2 * self._std_pos * h)[:, None] ** 2
+        d[:, 4:] = (10 * self._std_vel * h)[:, None] ** 2
+        P[:, np.arange(6), np.arange(6)] = d
+        self.ids = np.concatenate([self.ids, new_ids])
+        self.x = np.concatenate([self.x, x])
+        self.P = np.concatenate([self.P, P])
+        self.misses = np.concatenate([self.misses, np.zeros(k, np.int32)])
+        self.boxes = np.concatenate([self.boxes, boxes.astype(np.int64)])
+        return new_ids
+
+    # ---------- public ----------
+    def last_box(self, tid: int) -> Box:
+        """Last measured box of a live track."""
+        row = int(np.nonzero(self.ids == tid)[0][0])
+        return tuple(int(v) for v in self.boxes[row])
+
+    def predicted_boxes(self) -> np.ndarray:
+        """(n,4) xyxy of every live track at the current Kalman estimate."""
+        return _cxcywh_to_xyxy(self.x) if self.ids.size else np.zeros((0, 4))
+
+    def cost_matrix(self, dets: np.ndarray) -> np.ndarray:
+        """tracks x detections; pairs outside both gates cost _FORBIDDEN."""
+        pred = self.predicted_boxes()
+        iou = iou_matrix(pred, dets)
+        dist = centroid_dist_matrix(pred, dets)
+        cost = np.where(iou >= self.iou_thr, 1.0 - iou, _FORBIDDEN)
+        # centroid fallback ranks after every IoU match
+        near = (cost >= _FORBIDDEN) & (dist <= self.max_dist)
+        cost[near] = 1.0 + dist[near] / max(self.max_dist, 1e-6)
+        return cost
+
+    def update(self, boxes: Sequence[Box]) -> Dict[int, Box]:
+        dets = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        self._predict()
+
+        matched_rows = np.zeros(0, np.int64)
+        matched_dets = np.zeros(0, np.int64)
+        if self.ids.size and dets.shape[0]:
+            cost = self.cost_matrix(dets)
+            rows, cols = assign(cost)
+            ok = cost[rows, cols] < _FORBIDDEN
+            matched_rows, matched_dets = rows[ok], cols[ok]
+
+        if matched_rows.size:
+            self._correct(matched_rows, _xyxy_to_cxcywh(dets[matched_dets]))
+            self.boxes[matched_rows] = dets[matched_dets].astype(np.int64)
+
+        # age every track, then drop the ones unseen for more than ttl updates
+        self.misses += 1
+        self.misses[matched_rows] = 0
+        self.missed = self.ids[self.misses == 1].tolist()
+        keep = self.misses <= self.ttl
+        self.lost = self.ids[~keep].tolist()
+        if not keep.all():
+            self.ids, self.x, self.P = self.ids[keep], self.x[keep], self.P[keep]
+            self.misses, self.boxes = self.misses[keep], self.boxes[keep]
+            # matched rows are never dropped (misses == 0); re-index them
+            matched_rows = np.cumsum(keep)[matched_rows] - 1
+
+        assigned: Dict[int, Box] = {}
+        for r, j in zip(matched_rows.tolist(), matched_dets.tolist()):
+            assigned[int(self.ids[r])] = tuple(int(v) for v in boxes[j])
+
+        unmatched = np.setdiff1d(np.arange(dets.shape[0]), matched_dets)
+        self.new = []
+        if unmatched.size:
+            new_ids = self._spawn(_xyxy_to_cxcywh(dets[unmatched]), dets[unmatched])
+            self.new = new_ids.tolist()
+            for tid, j in zip(new_ids.tolist(), unmatched.tolist()):
+                assigned[tid] = tuple(int(v) for v in boxes[j])
+        return assigned
+
+
+class CentroidTracker(Tracker):
+    """Old name, kept for existing imports, with its old defaults: max_dist=50
+    and a track dropped on its first update without a detection (ttl=0)."""
+
+    __slots__ = ()
+
+    def __init__(self, max_dist: float = 50.0, ttl: int = 0, **kw):
+        super().__init__(max_dist=max_dist, ttl=ttl, **kw)